@@ -13,102 +13,302 @@ import socket
 import io
 import re
 import shlex
+import stat
 import hashlib
+import http.client
 import mimetypes
 import html as html_std
 import threading
+import queue
 import uuid
 import posixpath
 import secrets
+import random
 import ctypes
 import ipaddress
 from ctypes import wintypes
-from typing import List, Dict, Any, Optional, Tuple, Callable, Set
+from typing import List, Dict, Any, Optional, Tuple, Callable, Set, Iterator
 from urllib.parse import quote, urlparse, unquote
 import urllib.request
 import urllib.error
+import abc
 import atexit
 import base64
+import bisect
+import functools
 import logging
 import sqlite3
 import traceback
+import zlib
+import collections
+import heapq
+import gzip
+import codecs
+import signal
+import sys
+import importlib.util
 from fractions import Fraction
 
-from mss import mss
-from mss.tools import to_png
 try:
-    import dxcam  # type: ignore
-    DXCAM_AVAILABLE = os.name == "nt"
-    DXCAM_IMPORT_ERROR = ""
-except Exception as _dxcam_exc:
-    dxcam = None  # type: ignore
-    DXCAM_AVAILABLE = False
-    DXCAM_IMPORT_ERROR = f"{type(_dxcam_exc).__name__}: {_dxcam_exc}"
-try:
-    from PIL import Image
-    PILLOW_AVAILABLE = True
+    import brotli  # type: ignore
+    BROTLI_AVAILABLE = True
 except Exception:
-    Image = None  # type: ignore
-    PILLOW_AVAILABLE = False
-try:
-    from winpty import PtyProcess  # type: ignore
-    WINPTY_AVAILABLE = os.name == "nt"
-    WINPTY_IMPORT_ERROR = ""
-except Exception as _winpty_exc:
-    PtyProcess = None  # type: ignore
-    WINPTY_AVAILABLE = False
-    WINPTY_IMPORT_ERROR = f"{type(_winpty_exc).__name__}: {_winpty_exc}"
+    brotli = None  # type: ignore
+    BROTLI_AVAILABLE = False
+
 try:
-    import websockets  # type: ignore
-    WEBSOCKETS_AVAILABLE = True
-    WEBSOCKETS_IMPORT_ERROR = ""
-except Exception as _websockets_exc:
-    websockets = None  # type: ignore
-    WEBSOCKETS_AVAILABLE = False
-    WEBSOCKETS_IMPORT_ERROR = f"{type(_websockets_exc).__name__}: {_websockets_exc}"
+    import fcntl  # type: ignore
+except Exception:
+    fcntl = None  # type: ignore
 
 try:
-    import numpy as np  # type: ignore
-    from av import VideoFrame  # type: ignore
-    from aiortc import RTCPeerConnection, RTCSessionDescription, RTCRtpSender, VideoStreamTrack  # type: ignore
-    from aiortc.mediastreams import MediaStreamError  # type: ignore
-    from aiortc.sdp import candidate_from_sdp, candidate_to_sdp  # type: ignore
-    import aiortc.codecs.h264 as aiortc_h264  # type: ignore
-    import aiortc.codecs.vpx as aiortc_vpx  # type: ignore
-    import aiortc.rtcpeerconnection as aiortc_rtcpeerconnection  # type: ignore
-    AIORTC_AVAILABLE = True
-    AIORTC_IMPORT_ERROR = ""
-except Exception as _aiortc_exc:
-    np = None  # type: ignore
-    VideoFrame = None  # type: ignore
-    RTCPeerConnection = None  # type: ignore
-    RTCSessionDescription = None  # type: ignore
-    RTCRtpSender = None  # type: ignore
-    VideoStreamTrack = object  # type: ignore
-    MediaStreamError = Exception  # type: ignore
-    candidate_from_sdp = None  # type: ignore
-    candidate_to_sdp = None  # type: ignore
-    aiortc_h264 = None  # type: ignore
-    aiortc_vpx = None  # type: ignore
-    aiortc_rtcpeerconnection = None  # type: ignore
-    AIORTC_AVAILABLE = False
-    AIORTC_IMPORT_ERROR = f"{type(_aiortc_exc).__name__}: {_aiortc_exc}"
-
-
-def _patch_desktop_webrtc_codecs() -> None:
-    if not AIORTC_AVAILABLE or aiortc_h264 is None or aiortc_vpx is None:
+    import msvcrt  # type: ignore
+except Exception:
+    msvcrt = None  # type: ignore
+
+
+# -------------------------
+# Optional media stacks (loaded on first use)
+# -------------------------
+class _MediaStack:
+    """
+    One optional import group (Pillow, the aiortc codec stack, ...). `probe()`
+    only asks importlib whether the modules exist, so reading availability at
+    startup costs nothing. The first `load()` imports the group behind a
+    once-guard and installs its names as module globals. A failed import flips
+    the group's `*_AVAILABLE` flag off and records the error in its
+    `*_IMPORT_ERROR` global.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        modules: Tuple[str, ...],
+        loader: Callable[[], Dict[str, Any]],
+        placeholders: Dict[str, Any],
+        *,
+        flag: str,
+        error_name: str = "",
+        windows_only: bool = False,
+        namespace: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        self.name = name
+        self.modules = modules
+        self.loader = loader
+        self.placeholders = placeholders
+        self.flag = flag
+        self.error_name = error_name
+        self.windows_only = windows_only
+        self.namespace = namespace if namespace is not None else globals()
+        self.error = ""
+        self.load_ms: Optional[float] = None
+        self.loaded_at = 0.0
+        self._probed: Optional[bool] = None
+        self._exports: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+
+    def probe(self) -> bool:
+        if self._probed is None:
+            missing = ""
+            for module in self.modules:
+                try:
+                    found = module in sys.modules or importlib.util.find_spec(module) is not None
+                except (ImportError, ValueError):
+                    found = False
+                if not found:
+                    missing = module
+                    break
+            if missing:
+                self.error = f"ModuleNotFoundError: No module named '{missing}'"
+            self._probed = not missing
+        return bool(self._probed) and (os.name == "nt" or not self.windows_only)
+
+    def _publish_unlocked(self) -> None:
+        self.namespace[self.flag] = bool(self._exports is not None or (self.probe() and not self.error))
+        if self.error_name:
+            self.namespace[self.error_name] = self.error
+
+    def load(self) -> bool:
+        exports = self._exports
+        if exports is None:
+            with self._lock:
+                if self._exports is None and not self.error and self.probe():
+                    started = time.perf_counter()
+                    try:
+                        self._exports = dict(self.loader())
+                        self.loaded_at = time.time()
+                    except Exception as exc:
+                        self.error = f"{type(exc).__name__}: {exc}"
+                    self.load_ms = round((time.perf_counter() - started) * 1000.0, 1)
+                    self._publish_unlocked()
+                exports = self._exports
+            if exports is None:
+                return False
+        namespace = self.namespace
+        for key, value in exports.items():
+            # Also restores names a caller reset to the placeholder.
+            if namespace.get(key) is self.placeholders.get(key):
+                namespace[key] = value
+        return True
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "available": self._exports is not None or (self.probe() and not self.error),
+            "loaded": self._exports is not None,
+            "load_ms": self.load_ms,
+            "loaded_at": self.loaded_at or None,
+            "error": self.error,
+            "modules": list(self.modules),
+        }
+
+
+def _import_mss_stack() -> Dict[str, Any]:
+    from mss import mss as mss_factory
+    from mss.tools import to_png as mss_to_png
+    return {"mss": mss_factory, "to_png": mss_to_png}
+
+
+def _import_dxcam_stack() -> Dict[str, Any]:
+    import dxcam as dxcam_module  # type: ignore
+    return {"dxcam": dxcam_module}
+
+
+def _import_pillow_stack() -> Dict[str, Any]:
+    from PIL import Image as pil_image
+    return {"Image": pil_image}
+
+
+def _import_winpty_stack() -> Dict[str, Any]:
+    from winpty import PtyProcess as pty_process  # type: ignore
+    return {"PtyProcess": pty_process}
+
+
+def _import_websockets_stack() -> Dict[str, Any]:
+    import websockets as websockets_module  # type: ignore
+    return {"websockets": websockets_module}
+
+
+def _import_aiortc_stack() -> Dict[str, Any]:
+    import numpy as numpy_module  # type: ignore
+    from av import VideoFrame as av_video_frame  # type: ignore
+    import aiortc  # type: ignore
+    from aiortc.mediastreams import MediaStreamError as media_stream_error  # type: ignore
+    from aiortc.sdp import candidate_from_sdp as sdp_candidate_from, candidate_to_sdp as sdp_candidate_to  # type: ignore
+    import aiortc.codecs.h264 as h264_module  # type: ignore
+    import aiortc.codecs.vpx as vpx_module  # type: ignore
+    import aiortc.rtcpeerconnection as rtcpeerconnection_module  # type: ignore
+
+    _patch_desktop_webrtc_codecs(h264_module, vpx_module)
+    return {
+        "np": numpy_module,
+        "VideoFrame": av_video_frame,
+        "RTCPeerConnection": aiortc.RTCPeerConnection,
+        "RTCSessionDescription": aiortc.RTCSessionDescription,
+        "RTCRtpSender": aiortc.RTCRtpSender,
+        "VideoStreamTrack": aiortc.VideoStreamTrack,
+        "MediaStreamError": media_stream_error,
+        "candidate_from_sdp": sdp_candidate_from,
+        "candidate_to_sdp": sdp_candidate_to,
+        "aiortc_h264": h264_module,
+        "aiortc_vpx": vpx_module,
+        "aiortc_rtcpeerconnection": rtcpeerconnection_module,
+        "DesktopVideoTrack": _build_desktop_video_track_class(aiortc.VideoStreamTrack),
+    }
+
+
+mss = None  # type: ignore
+to_png = None  # type: ignore
+dxcam = None  # type: ignore
+Image = None  # type: ignore
+PtyProcess = None  # type: ignore
+websockets = None  # type: ignore
+np = None  # type: ignore
+VideoFrame = None  # type: ignore
+RTCPeerConnection = None  # type: ignore
+RTCSessionDescription = None  # type: ignore
+RTCRtpSender = None  # type: ignore
+VideoStreamTrack = object  # type: ignore
+MediaStreamError = Exception  # type: ignore
+candidate_from_sdp = None  # type: ignore
+candidate_to_sdp = None  # type: ignore
+aiortc_h264 = None  # type: ignore
+aiortc_vpx = None  # type: ignore
+aiortc_rtcpeerconnection = None  # type: ignore
+DesktopVideoTrack = None  # type: ignore
+
+MEDIA_STACKS: Dict[str, _MediaStack] = {
+    stack.name: stack
+    for stack in (
+        _MediaStack("mss", ("mss",), _import_mss_stack, {"mss": None, "to_png": None}, flag="MSS_AVAILABLE", error_name="MSS_IMPORT_ERROR"),
+        _MediaStack("dxcam", ("dxcam",), _import_dxcam_stack, {"dxcam": None}, flag="DXCAM_AVAILABLE", error_name="DXCAM_IMPORT_ERROR", windows_only=True),
+        _MediaStack("pillow", ("PIL",), _import_pillow_stack, {"Image": None}, flag="PILLOW_AVAILABLE"),
+        _MediaStack("winpty", ("winpty",), _import_winpty_stack, {"PtyProcess": None}, flag="WINPTY_AVAILABLE", error_name="WINPTY_IMPORT_ERROR", windows_only=True),
+        _MediaStack("websockets", ("websockets",), _import_websockets_stack, {"websockets": None}, flag="WEBSOCKETS_AVAILABLE", error_name="WEBSOCKETS_IMPORT_ERROR"),
+        _MediaStack(
+            "aiortc",
+            ("numpy", "av", "aiortc"),
+            _import_aiortc_stack,
+            {
+                "np": None,
+                "VideoFrame": None,
+                "RTCPeerConnection": None,
+                "RTCSessionDescription": None,
+                "RTCRtpSender": None,
+                "VideoStreamTrack": object,
+                "MediaStreamError": Exception,
+                "candidate_from_sdp": None,
+                "candidate_to_sdp": None,
+                "aiortc_h264": None,
+                "aiortc_vpx": None,
+                "aiortc_rtcpeerconnection": None,
+                "DesktopVideoTrack": None,
+            },
+            flag="AIORTC_AVAILABLE",
+            error_name="AIORTC_IMPORT_ERROR",
+        ),
+    )
+}
+MSS_AVAILABLE = MEDIA_STACKS["mss"].probe()
+MSS_IMPORT_ERROR = MEDIA_STACKS["mss"].error
+DXCAM_AVAILABLE = MEDIA_STACKS["dxcam"].probe()
+DXCAM_IMPORT_ERROR = MEDIA_STACKS["dxcam"].error
+PILLOW_AVAILABLE = MEDIA_STACKS["pillow"].probe()
+WINPTY_AVAILABLE = MEDIA_STACKS["winpty"].probe()
+WINPTY_IMPORT_ERROR = MEDIA_STACKS["winpty"].error
+WEBSOCKETS_AVAILABLE = MEDIA_STACKS["websockets"].probe()
+WEBSOCKETS_IMPORT_ERROR = MEDIA_STACKS["websockets"].error
+AIORTC_AVAILABLE = MEDIA_STACKS["aiortc"].probe()
+AIORTC_IMPORT_ERROR = MEDIA_STACKS["aiortc"].error
+
+
+def _load_media_stack(name: str, *, required: bool = False) -> bool:
+    """Import an optional stack on first use. With `required`, a missing stack raises RuntimeError."""
+    stack = MEDIA_STACKS[name]
+    if stack.load():
+        return True
+    if required:
+        raise RuntimeError(f"{name} is unavailable: {stack.error or 'not supported on this host'}")
+    return False
+
+
+def _media_stacks_snapshot() -> Dict[str, Dict[str, Any]]:
+    return {name: stack.snapshot() for name, stack in MEDIA_STACKS.items()}
+
+
+def _patch_desktop_webrtc_codecs(h264_module: Any, vpx_module: Any) -> None:
+    if h264_module is None or vpx_module is None:
         return
     try:
-        aiortc_h264.MIN_BITRATE = max(int(getattr(aiortc_h264, "MIN_BITRATE", 500000) or 500000), 1000000)
-        aiortc_h264.DEFAULT_BITRATE = max(int(getattr(aiortc_h264, "DEFAULT_BITRATE", 1000000) or 1000000), 2500000)
-        aiortc_h264.MAX_BITRATE = max(int(getattr(aiortc_h264, "MAX_BITRATE", 3000000) or 3000000), 5000000)
-        aiortc_vpx.MIN_BITRATE = max(int(getattr(aiortc_vpx, "MIN_BITRATE", 250000) or 250000), 600000)
-        aiortc_vpx.DEFAULT_BITRATE = max(int(getattr(aiortc_vpx, "DEFAULT_BITRATE", 500000) or 500000), 1800000)
-        aiortc_vpx.MAX_BITRATE = max(int(getattr(aiortc_vpx, "MAX_BITRATE", 1500000) or 1500000), 3500000)
+        h264_module.MIN_BITRATE = max(int(getattr(h264_module, "MIN_BITRATE", 500000) or 500000), 1000000)
+        h264_module.DEFAULT_BITRATE = max(int(getattr(h264_module, "DEFAULT_BITRATE", 1000000) or 1000000), 2500000)
+        h264_module.MAX_BITRATE = max(int(getattr(h264_module, "MAX_BITRATE", 3000000) or 3000000), 5000000)
+        vpx_module.MIN_BITRATE = max(int(getattr(vpx_module, "MIN_BITRATE", 250000) or 250000), 600000)
+        vpx_module.DEFAULT_BITRATE = max(int(getattr(vpx_module, "DEFAULT_BITRATE", 500000) or 500000), 1800000)
+        vpx_module.MAX_BITRATE = max(int(getattr(vpx_module, "MAX_BITRATE", 1500000) or 1500000), 3500000)
     except Exception:
         pass
 
-    encoder_cls = getattr(aiortc_h264, "H264Encoder", None)
+    encoder_cls = getattr(h264_module, "H264Encoder", None)
     if encoder_cls is None or getattr(encoder_cls, "_codrex_patched", False):
         return
 
@@ -125,8 +325,6 @@ def _patch_desktop_webrtc_codecs() -> None:
     encoder_cls._codrex_patched = True  # type: ignore[attr-defined]
 
 
-_patch_desktop_webrtc_codecs()
-
 START_TIME = time.time()
 LOGGER = logging.getLogger("codrex.remote")
 app = FastAPI(title="Codrex Remote UI", version="1.5.0")
@@ -160,6 +358,12 @@ BUILT_UI_ROOT_FILES = {
     "manifest.webmanifest",
     "sw.js",
 }
+# Built UI files up to this size are kept in memory (with their .br/.gz copies).
+ASSET_MEMORY_MAX_BYTES = int(os.environ.get("CODEX_ASSET_MEMORY_MAX_BYTES", str(2 * 1024 * 1024)) or str(2 * 1024 * 1024))
+ASSET_COMPRESS_MIN_BYTES = 1024
+ASSET_RECHECK_S = float(os.environ.get("CODEX_ASSET_RECHECK_S", "2.0") or "2.0")
+UI_ASSET_INDEX_LOCK = threading.Lock()
+UI_ASSET_INDEX: Optional["_StaticAssetIndex"] = None
 HOST_KEEP_AWAKE_ENABLED = str(os.environ.get("CODEX_HOST_KEEP_AWAKE", "1") or "1").strip().lower() not in {
     "0",
     "false",
@@ -232,14 +436,206 @@ def _built_ui_health_payload() -> Dict[str, Any]:
     }
 
 
-def _serve_built_ui_root_file(filename: str) -> FileResponse:
+class _StaticAssetIndex:
+    """
+    In-memory index of the built UI (ui/dist). Every file gets a strong ETag
+    and a Cache-Control policy up front: Vite's content-hashed assets/* and
+    workbox-* are immutable for a year, everything else (index.html, sw.js,
+    manifest, icons) revalidates. Files up to memory_max_bytes are served from
+    memory. Compressible files use the build's .br/.gz siblings when they are
+    fresh; otherwise the sibling is generated on first request and written next
+    to the file. The index is rebuilt when the build stamp (index.html and
+    assets/ mtimes) changes, checked at most every recheck_s.
+    """
+
+    IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+    REVALIDATE_CACHE_CONTROL = "no-cache"
+    COMPRESSIBLE_TYPES = {
+        "application/javascript",
+        "application/json",
+        "application/manifest+json",
+        "image/svg+xml",
+        "text/javascript",
+    }
+    SIBLING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+    def __init__(
+        self,
+        dist_dir: str,
+        *,
+        memory_max_bytes: int = ASSET_MEMORY_MAX_BYTES,
+        compress_min_bytes: int = ASSET_COMPRESS_MIN_BYTES,
+        recheck_s: float = ASSET_RECHECK_S,
+    ) -> None:
+        self.dist_dir = os.path.abspath(dist_dir)
+        self.memory_max_bytes = max(0, int(memory_max_bytes))
+        self.compress_min_bytes = max(0, int(compress_min_bytes))
+        self.recheck_s = max(0.0, float(recheck_s))
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._stamp: Optional[Tuple[int, ...]] = None
+        self._checked_at = 0.0
+        self.builds = 0
+
+    def _build_stamp(self) -> Tuple[int, ...]:
+        stamp: List[int] = []
+        for path in (os.path.join(self.dist_dir, "index.html"), os.path.join(self.dist_dir, "assets")):
+            try:
+                st = os.stat(path)
+                stamp.extend([st.st_mtime_ns, st.st_size if stat.S_ISREG(st.st_mode) else 0])
+            except OSError:
+                stamp.extend([0, 0])
+        return tuple(stamp)
+
+    def _content_type(self, rel_path: str) -> str:
+        if rel_path.endswith(".webmanifest"):
+            return "application/manifest+json"
+        guessed = mimetypes.guess_type(rel_path)[0] or "application/octet-stream"
+        return "text/javascript" if guessed == "application/javascript" else guessed
+
+    def _cache_control(self, rel_path: str) -> str:
+        if rel_path.startswith("assets/") or posixpath.basename(rel_path).startswith("workbox-"):
+            return self.IMMUTABLE_CACHE_CONTROL
+        return self.REVALIDATE_CACHE_CONTROL
+
+    def _build(self) -> Dict[str, Dict[str, Any]]:
+        entries: Dict[str, Dict[str, Any]] = {}
+        sibling_exts = tuple(self.SIBLING_SUFFIXES.values())
+        for root, _dirs, files in os.walk(self.dist_dir):
+            for name in files:
+                if name.endswith(sibling_exts) or name.endswith(".tmp"):
+                    continue
+                path = os.path.join(root, name)
+                rel_path = os.path.relpath(path, self.dist_dir).replace(os.sep, "/")
+                try:
+                    st = os.stat(path)
+                    with open(path, "rb") as fh:
+                        data = fh.read()
+                except OSError:
+                    continue
+                content_type = self._content_type(rel_path)
+                compressible = len(data) >= self.compress_min_bytes and (
+                    content_type.startswith("text/") or content_type in self.COMPRESSIBLE_TYPES
+                )
+                entries[rel_path] = {
+                    "path": path,
+                    "size": len(data),
+                    "mtime_ns": st.st_mtime_ns,
+                    "digest": hashlib.sha256(data).hexdigest()[:32],
+                    "content_type": content_type,
+                    "cache_control": self._cache_control(rel_path),
+                    "compressible": compressible,
+                    "encoded": {"identity": data if len(data) <= self.memory_max_bytes else None},
+                }
+        return entries
+
+    def _ensure_fresh(self) -> Dict[str, Dict[str, Any]]:
+        now = time.monotonic()
+        with self._lock:
+            if self._stamp is not None and now - self._checked_at < self.recheck_s:
+                return self._entries
+        stamp = self._build_stamp()
+        with self._lock:
+            self._checked_at = now
+            if stamp == self._stamp:
+                return self._entries
+        entries = self._build()
+        with self._lock:
+            self._entries = entries
+            self._stamp = stamp
+            self.builds += 1
+            return entries
+
+    def lookup(self, rel_path: str) -> Optional[Dict[str, Any]]:
+        return self._ensure_fresh().get(str(rel_path or "").lstrip("/"))
+
+    def _encoded(self, entry: Dict[str, Any], encoding: str) -> Tuple[Optional[bytes], Optional[str]]:
+        """(body, None) for an in-memory copy, or (None, path) for one served from disk."""
+        with self._lock:
+            cached = entry["encoded"].get(encoding)
+        if cached is not None:
+            return cached, None
+        if encoding == "identity":
+            return None, entry["path"]
+        sibling = entry["path"] + self.SIBLING_SUFFIXES[encoding]
+        try:
+            fresh = os.stat(sibling).st_mtime_ns >= entry["mtime_ns"]
+        except OSError:
+            fresh = False
+        if not fresh:
+            with open(entry["path"], "rb") as fh:
+                data = fh.read()
+            if encoding == "br":
+                body = brotli.compress(data, quality=11)
+            else:
+                body = gzip.compress(data, compresslevel=9, mtime=0)
+            tmp_path = f"{sibling}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+            try:
+                with open(tmp_path, "wb") as fh:
+                    fh.write(body)
+                os.replace(tmp_path, sibling)
+            except OSError:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+                # Read-only dist: keep the generated copy in memory instead.
+                with self._lock:
+                    entry["encoded"][encoding] = body
+                return body, None
+        size = os.path.getsize(sibling)
+        if size > self.memory_max_bytes:
+            return None, sibling
+        with open(sibling, "rb") as fh:
+            body = fh.read()
+        with self._lock:
+            entry["encoded"][encoding] = body
+        return body, None
+
+    def response(self, request: Request, rel_path: str) -> Response:
+        entry = self.lookup(rel_path)
+        if entry is None:
+            raise HTTPException(status_code=404, detail="asset_not_found")
+        encoding = "identity"
+        if entry["compressible"]:
+            encoding = _negotiate_content_encoding(request.headers.get("accept-encoding", ""))
+        suffix = "" if encoding == "identity" else f"-{encoding}"
+        headers = {"ETag": f'"{entry["digest"]}{suffix}"', "Cache-Control": entry["cache_control"]}
+        if entry["compressible"]:
+            headers["Vary"] = "Accept-Encoding"
+        if _etag_matches(request.headers.get("if-none-match", ""), headers["ETag"]):
+            return Response(status_code=304, headers=headers)
+        body, path = self._encoded(entry, encoding)
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        if body is None:
+            return FileResponse(path, media_type=entry["content_type"], headers=headers)
+        return Response(content=body, media_type=entry["content_type"], headers=headers)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "files": len(self._entries),
+                "builds": self.builds,
+                "memory_bytes": sum(
+                    len(body) for entry in self._entries.values() for body in entry["encoded"].values() if body is not None
+                ),
+            }
+
+
+def _ui_assets() -> _StaticAssetIndex:
+    global UI_ASSET_INDEX
+    with UI_ASSET_INDEX_LOCK:
+        if UI_ASSET_INDEX is None or UI_ASSET_INDEX.dist_dir != os.path.abspath(UI_DIST_DIR):
+            UI_ASSET_INDEX = _StaticAssetIndex(UI_DIST_DIR)
+        return UI_ASSET_INDEX
+
+
+def _serve_built_ui_root_file(filename: str, request: Request) -> Response:
     safe_name = posixpath.basename(filename or "")
     if safe_name not in BUILT_UI_ROOT_FILES and not safe_name.startswith("workbox-"):
         raise HTTPException(status_code=404, detail="asset_not_found")
-    target = os.path.join(UI_DIST_DIR, safe_name)
-    if not os.path.isfile(target):
-        raise HTTPException(status_code=404, detail="asset_not_found")
-    return FileResponse(target)
+    return _ui_assets().response(request, safe_name)
 
 
 def _built_ui_missing_response() -> HTMLResponse:
@@ -408,6 +804,255 @@ elif "xhigh" in CODEX_REASONING_EFFORT_OPTIONS:
 else:
     CODEX_DEFAULT_REASONING_EFFORT = CODEX_REASONING_EFFORT_OPTIONS[-1]
 
+# -------------------------
+# Instrumentation
+# -------------------------
+METRICS_ENABLED = str(os.environ.get("CODEX_METRICS", "1") or "1").strip().lower() not in {"0", "false", "no", "off"}
+METRICS_LATENCY_BUCKETS_S = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Label sets beyond this many per metric are folded into one "_other" series.
+METRICS_MAX_SERIES = int(os.environ.get("CODEX_METRICS_MAX_SERIES", "500") or "500")
+
+
+class _MetricsTimer:
+    __slots__ = ("_metrics", "_name", "_labels", "_started", "outcome")
+
+    def __init__(self, metrics: "_Metrics", name: str, labels: Dict[str, str]) -> None:
+        self._metrics = metrics
+        self._name = name
+        self._labels = labels
+        self._started = 0.0
+        self.outcome = "ok"
+
+    def __enter__(self) -> "_MetricsTimer":
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, tb: Any) -> bool:
+        outcome = "exception" if exc_type is not None and self.outcome == "ok" else self.outcome
+        self._metrics.observe(self._name, time.perf_counter() - self._started, outcome=outcome, **self._labels)
+        return False
+
+
+class _Metrics:
+    """
+    In-process counters, fixed-bucket latency histograms and callback gauges.
+    Recording is a dict lookup and a bisect under one lock, so it is cheap
+    enough to sit on every request and every subprocess call. Gauges are read
+    only when someone scrapes. Rendered as Prometheus text or a JSON summary
+    with bucket-interpolated percentiles.
+    """
+
+    def __init__(
+        self,
+        *,
+        buckets: Tuple[float, ...] = METRICS_LATENCY_BUCKETS_S,
+        max_series: int = METRICS_MAX_SERIES,
+        enabled: bool = True,
+    ) -> None:
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+        self.max_series = max(1, int(max_series))
+        self.enabled = bool(enabled)
+        self._lock = threading.Lock()
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._counters: Dict[str, Dict[Tuple[Tuple[str, str], ...], float]] = {}
+        self._histograms: Dict[str, Dict[Tuple[Tuple[str, str], ...], List[float]]] = {}
+        self._gauges: Dict[str, Callable[[], Any]] = {}
+
+    def describe(self, name: str, kind: str, help_text: str) -> None:
+        self._help[name] = (kind, help_text)
+
+    def _series_unlocked(self, family: Dict[Tuple[Tuple[str, str], ...], Any], labels: Dict[str, Any]) -> Tuple[Tuple[str, str], ...]:
+        key = tuple(sorted(labels.items()))
+        if key not in family and len(family) >= self.max_series:
+            return (("series", "_other"),)
+        return key
+
+    def inc(self, name: str, value: float = 1.0, **labels: Any) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            family = self._counters.setdefault(name, {})
+            key = self._series_unlocked(family, labels)
+            family[key] = family.get(key, 0.0) + value
+
+    def observe(self, name: str, seconds: float, **labels: Any) -> None:
+        if not self.enabled:
+            return
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            family = self._histograms.setdefault(name, {})
+            key = self._series_unlocked(family, labels)
+            series = family.get(key)
+            if series is None:
+                # Per-bucket counts, then +Inf, sum and count.
+                series = family[key] = [0.0] * (len(self.buckets) + 3)
+            series[index] += 1
+            series[-2] += seconds
+            series[-1] += 1
+
+    def time(self, name: str, **labels: Any) -> _MetricsTimer:
+        return _MetricsTimer(self, name, labels)
+
+    def gauge(self, name: str, help_text: str, fn: Callable[[], Any]) -> None:
+        """`fn` returns a number, or a list of `(labels, value)` pairs."""
+        self._help[name] = ("gauge", help_text)
+        self._gauges[name] = fn
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def _gauge_samples(self) -> Dict[str, List[Tuple[Dict[str, Any], float]]]:
+        out: Dict[str, List[Tuple[Dict[str, Any], float]]] = {}
+        for name, fn in list(self._gauges.items()):
+            try:
+                value = fn()
+            except Exception:
+                continue
+            if isinstance(value, (list, tuple)):
+                out[name] = [(dict(labels or {}), float(v)) for labels, v in value]
+            else:
+                out[name] = [({}, float(value or 0))]
+        return out
+
+    def _copy(self) -> Tuple[Dict[str, Dict[Any, float]], Dict[str, Dict[Any, List[float]]]]:
+        with self._lock:
+            counters = {name: dict(family) for name, family in self._counters.items()}
+            histograms = {name: {key: list(series) for key, series in family.items()} for name, family in self._histograms.items()}
+        return counters, histograms
+
+    def _quantile(self, series: List[float], q: float) -> Optional[float]:
+        total = series[-1]
+        if total <= 0:
+            return None
+        rank = q * total
+        seen = 0.0
+        lower = 0.0
+        for index, upper in enumerate(self.buckets):
+            count = series[index]
+            if count and seen + count >= rank:
+                return lower + (upper - lower) * ((rank - seen) / count)
+            seen += count
+            lower = upper
+        return self.buckets[-1]
+
+    def summary(self) -> Dict[str, Any]:
+        counters, histograms = self._copy()
+        timers: Dict[str, List[Dict[str, Any]]] = {}
+        for name, family in histograms.items():
+            rows = []
+            for key, series in family.items():
+                count = int(series[-1])
+                p50, p95, p99 = (self._quantile(series, q) for q in (0.5, 0.95, 0.99))
+                rows.append(
+                    {
+                        "labels": dict(key),
+                        "count": count,
+                        "sum_s": round(series[-2], 6),
+                        "avg_ms": round(series[-2] / count * 1000.0, 3) if count else None,
+                        "p50_ms": round(p50 * 1000.0, 3) if p50 is not None else None,
+                        "p95_ms": round(p95 * 1000.0, 3) if p95 is not None else None,
+                        "p99_ms": round(p99 * 1000.0, 3) if p99 is not None else None,
+                    }
+                )
+            rows.sort(key=lambda row: row["sum_s"], reverse=True)
+            timers[name] = rows
+        return {
+            "enabled": self.enabled,
+            "timers": timers,
+            "counters": {
+                name: [{"labels": dict(key), "value": value} for key, value in sorted(family.items())]
+                for name, family in counters.items()
+            },
+            "gauges": {
+                name: [{"labels": labels, "value": value} for labels, value in samples]
+                for name, samples in self._gauge_samples().items()
+            },
+        }
+
+    @staticmethod
+    def _label_text(labels: Any, extra: str = "") -> str:
+        parts = []
+        for k, v in (labels.items() if isinstance(labels, dict) else labels):
+            escaped = str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+            parts.append(f'{k}="{escaped}"')
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def _header(self, lines: List[str], name: str, default_kind: str) -> None:
+        kind, help_text = self._help.get(name, (default_kind, ""))
+        if help_text:
+            lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    def render_prometheus(self) -> str:
+        counters, histograms = self._copy()
+        lines: List[str] = []
+        for name in sorted(counters):
+            self._header(lines, name, "counter")
+            for key, value in sorted(counters[name].items()):
+                lines.append(f"{name}{self._label_text(key)} {value:g}")
+        for name in sorted(histograms):
+            self._header(lines, name, "histogram")
+            for key, series in sorted(histograms[name].items()):
+                cumulative = 0.0
+                for index, upper in enumerate(self.buckets):
+                    cumulative += series[index]
+                    le = 'le="%g"' % upper
+                    lines.append(f"{name}_bucket{self._label_text(key, le)} {cumulative:g}")
+                le = 'le="+Inf"'
+                lines.append(f"{name}_bucket{self._label_text(key, le)} {series[-1]:g}")
+                lines.append(f"{name}_sum{self._label_text(key)} {series[-2]:.6f}")
+                lines.append(f"{name}_count{self._label_text(key)} {series[-1]:g}")
+        for name, samples in sorted(self._gauge_samples().items()):
+            self._header(lines, name, "gauge")
+            for labels, value in samples:
+                lines.append(f"{name}{self._label_text(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = _Metrics(enabled=METRICS_ENABLED)
+METRICS.describe("codrex_http_request_seconds", "histogram", "HTTP handler latency by route template (time to response headers).")
+METRICS.describe("codrex_subprocess_seconds", "histogram", "Subprocess helper wall time by helper and outcome.")
+METRICS.describe("codrex_tmux_capture_seconds", "histogram", "tmux capture-pane wall time by capture kind.")
+METRICS.describe("codrex_desktop_encode_seconds", "histogram", "Desktop frame encode time by image format.")
+METRICS.describe("codrex_store_write_seconds", "histogram", "JSON store persist time by store.")
+METRICS.describe("codrex_telegram_call_seconds", "histogram", "Telegram Bot API call time by API method.")
+METRICS.describe("codrex_loop_control_cycle_seconds", "histogram", "Loop-control worker cycle time.")
+METRICS.describe("codrex_expiry_sweep_seconds", "histogram", "Expiry sweeper reap time per store batch.")
+METRICS.describe("codrex_host_agent_call_seconds", "histogram", "Host agent time per forwarded worker call, by method.")
+
+
+def _subprocess_outcome(result: Any) -> str:
+    code = (result or {}).get("exit_code") if isinstance(result, dict) else None
+    if code == 0:
+        return "ok"
+    if code == 124:
+        return "timeout"
+    if code == 125:
+        return "error"
+    return "nonzero"
+
+
+def _instrumented(name: str, *, outcome: Optional[Callable[[Any], str]] = None, **labels: Any) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """Time every call of the decorated function into histogram `name`."""
+
+    def decorate(fn: Callable[..., Any]) -> Callable[..., Any]:
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with METRICS.time(name, **labels) as timer:
+                result = fn(*args, **kwargs)
+                if outcome is not None:
+                    timer.outcome = outcome(result)
+                return result
+
+        return wrapper
+
+    return decorate
+
+
 # Pairing codes are short-lived one-time secrets used to authenticate a second device (phone/tablet)
 # without typing the long CODEX_AUTH_TOKEN. They are only generated by an already-authenticated client.
 PAIRING_TTL_SECONDS = int(os.environ.get("CODEX_PAIRING_TTL_SECONDS", "90"))
@@ -471,6 +1116,7 @@ def _load_trusted_devices_unlocked() -> None:
     TRUSTED_DEVICES_LOADED = True
 
 
+@_instrumented("codrex_store_write_seconds", store="trusted_devices")
 def _persist_trusted_devices_unlocked() -> None:
     devices = [
         item for item in list(TRUSTED_DEVICES_DATA.get("devices") or [])
@@ -943,7 +1589,8 @@ def _resolve_preferred_origin(
 
 
 def _compute_net_info_payload() -> Dict[str, Any]:
-    mac_info = _wake_mac_info()
+    mac_info, _mac_meta = _status_service().read("wake_mac")
+    mac_info = mac_info or {}
     lan_ip = guess_lan_ipv4()
     tailscale_ip = get_tailscale_ipv4()
     netbird_ip = get_netbird_ipv4()
@@ -994,17 +1641,267 @@ def _compute_net_info_payload() -> Dict[str, Any]:
     }
 
 
+# -------------------------
+# Background status probes
+# -------------------------
+class _StatusService:
+    """
+    Keeps the last good result of each slow host probe (PowerShell, HTTP,
+    subprocess) and refreshes it off the request path. Every probe has its own
+    TTL with jitter and runs on its own thread, so a hung probe only ages its
+    own value. Readers get the cached value at once, flagged stale when it is
+    older than twice the TTL or the latest refresh failed; only a probe that has
+    never produced a value makes its first reader wait, for at most cold_wait_s.
+    Probes that nobody has read for idle_after_s stop being refreshed.
+    """
+
+    def __init__(
+        self,
+        *,
+        cold_wait_s: float = 3.0,
+        idle_after_s: float = 300.0,
+        jitter_ratio: float = 0.1,
+    ) -> None:
+        self.cold_wait_s = max(0.0, float(cold_wait_s))
+        self.idle_after_s = max(1.0, float(idle_after_s))
+        self.jitter_ratio = min(0.5, max(0.0, float(jitter_ratio)))
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._scheduler: Optional[threading.Thread] = None
+        self._probes: Dict[str, Dict[str, Any]] = {}
+
+    def register(self, name: str, fn: Callable[[], Any], *, ttl_s: float, fallback: Any = None) -> None:
+        done = threading.Event()
+        with self._lock:
+            self._probes[name] = {
+                "fn": fn,
+                "ttl_s": max(0.1, float(ttl_s)),
+                "fallback": fallback,
+                "value": None,
+                "has_value": False,
+                "failing": False,
+                "refreshed_at": 0.0,
+                "next_due": 0.0,
+                "last_read": 0.0,
+                "refreshing": False,
+                "refresh_started": 0.0,
+                "done": done,
+                "duration_ms": None,
+                "last_error": "",
+                "last_error_at": 0.0,
+                "runs": 0,
+                "failures": 0,
+            }
+
+    def _jittered(self, ttl_s: float) -> float:
+        if self.jitter_ratio <= 0:
+            return ttl_s
+        return ttl_s * (1.0 + random.uniform(-self.jitter_ratio, self.jitter_ratio))
+
+    def _start_refresh_unlocked(self, name: str, probe: Dict[str, Any]) -> threading.Event:
+        if probe["refreshing"] or self._closed:
+            return probe["done"]
+        probe["refreshing"] = True
+        probe["refresh_started"] = time.monotonic()
+        probe["done"] = threading.Event()
+        threading.Thread(
+            target=self._run_probe,
+            args=(probe,),
+            name=f"codrex-status-{name}",
+            daemon=True,
+        ).start()
+        return probe["done"]
+
+    def _run_probe(self, probe: Dict[str, Any]) -> None:
+        started = time.monotonic()
+        value: Any = None
+        error = ""
+        try:
+            value = probe["fn"]()
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        finished = time.monotonic()
+        with self._lock:
+            probe["runs"] += 1
+            probe["duration_ms"] = round((finished - started) * 1000.0, 1)
+            probe["refreshing"] = False
+            probe["next_due"] = finished + self._jittered(probe["ttl_s"])
+            probe["failing"] = bool(error)
+            if error:
+                probe["failures"] += 1
+                probe["last_error"] = error
+                probe["last_error_at"] = time.time()
+            else:
+                probe["value"] = value
+                probe["has_value"] = True
+                probe["refreshed_at"] = finished
+            done = probe["done"]
+        done.set()
+        self._wake.set()
+
+    def _meta_unlocked(self, probe: Dict[str, Any], now: float) -> Dict[str, Any]:
+        age_s = (now - probe["refreshed_at"]) if probe["has_value"] else None
+        stale = (
+            not probe["has_value"]
+            or probe["failing"]
+            or (age_s is not None and age_s > probe["ttl_s"] * 2.0)
+        )
+        return {
+            "ttl_s": probe["ttl_s"],
+            "age_s": round(age_s, 3) if age_s is not None else None,
+            "stale": bool(stale),
+            "pending": not probe["has_value"],
+            "refreshing": bool(probe["refreshing"]),
+            "refreshing_for_s": round(now - probe["refresh_started"], 3) if probe["refreshing"] else None,
+            "next_refresh_in_s": round(max(0.0, probe["next_due"] - now), 3) if probe["runs"] else None,
+            "duration_ms": probe["duration_ms"],
+            "last_error": probe["last_error"],
+            "last_error_at": probe["last_error_at"] or None,
+            "runs": probe["runs"],
+            "failures": probe["failures"],
+        }
+
+    def read_many(self, names: List[str], *, force: bool = False) -> Dict[str, Tuple[Any, Dict[str, Any]]]:
+        self._ensure_scheduler()
+        waits: List[Tuple[threading.Event, float]] = []
+        with self._lock:
+            now = time.monotonic()
+            for name in names:
+                probe = self._probes[name]
+                probe["last_read"] = now
+                if force or not probe["has_value"]:
+                    done = self._start_refresh_unlocked(name, probe)
+                    # The cold-start budget is counted from when the refresh began,
+                    # so later readers of a still-pending probe do not wait again.
+                    waits.append((done, probe["refresh_started"] + self.cold_wait_s))
+                elif now >= probe["next_due"]:
+                    self._start_refresh_unlocked(name, probe)
+        for done, deadline in waits:
+            done.wait(max(0.0, deadline - time.monotonic()))
+        out: Dict[str, Tuple[Any, Dict[str, Any]]] = {}
+        with self._lock:
+            now = time.monotonic()
+            for name in names:
+                probe = self._probes[name]
+                value = probe["value"] if probe["has_value"] else probe["fallback"]
+                out[name] = (value, self._meta_unlocked(probe, now))
+        return out
+
+    def read(self, name: str, *, force: bool = False) -> Tuple[Any, Dict[str, Any]]:
+        return self.read_many([name], force=force)[name]
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            now = time.monotonic()
+            return {name: self._meta_unlocked(probe, now) for name, probe in self._probes.items()}
+
+    def _ensure_scheduler(self) -> None:
+        with self._lock:
+            if self._scheduler is not None or self._closed:
+                return
+            self._scheduler = threading.Thread(target=self._schedule_loop, name="codrex-status-refresh", daemon=True)
+            self._scheduler.start()
+
+    def _schedule_loop(self) -> None:
+        while True:
+            delay = 5.0
+            with self._lock:
+                if self._closed:
+                    return
+                now = time.monotonic()
+                for name, probe in self._probes.items():
+                    if not probe["last_read"] or (now - probe["last_read"]) > self.idle_after_s:
+                        continue
+                    if probe["refreshing"]:
+                        continue
+                    if now >= probe["next_due"]:
+                        self._start_refresh_unlocked(name, probe)
+                    else:
+                        delay = min(delay, probe["next_due"] - now)
+            self._wake.wait(max(0.05, delay))
+            self._wake.clear()
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+        self._wake.set()
+
+
+def _net_info_placeholder() -> Dict[str, Any]:
+    return {
+        "ok": True,
+        "lan_ip": "",
+        "tailscale_ip": "",
+        "netbird_ip": "",
+        "preferred_pair_route": _preferred_pair_route(),
+        "tailscale_available": False,
+        "tailscale_warning": "",
+        "available_origins": [],
+        "preferred_origin": "",
+        "route_provider": "",
+        "route_state": "pending",
+        "primary_mac": "",
+        "wake_candidate_macs": [],
+        "wake_supported": False,
+    }
+
+
+def _status_service() -> _StatusService:
+    global STATUS_SERVICE
+    with STATUS_SERVICE_LOCK:
+        if STATUS_SERVICE is None:
+            service = _StatusService(
+                cold_wait_s=STATUS_COLD_WAIT_S,
+                idle_after_s=STATUS_IDLE_AFTER_S,
+                jitter_ratio=STATUS_JITTER_RATIO,
+            )
+            service.register(
+                "net_info",
+                lambda: _compute_net_info_payload(),
+                ttl_s=NET_INFO_CACHE_TTL_S,
+                fallback=_net_info_placeholder(),
+            )
+            service.register(
+                "wake_mac",
+                lambda: _wake_mac_info(),
+                ttl_s=WAKE_MAC_INFO_TTL_S,
+                fallback={"primary_mac": "", "wake_candidate_macs": [], "wake_supported": False},
+            )
+            service.register(
+                "wake_local",
+                lambda: _wake_local_capabilities(),
+                ttl_s=WAKE_LOCAL_CAPABILITIES_TTL_S,
+                fallback={
+                    "wake_readiness": "partial",
+                    "wake_warning": "Wake diagnostics are still being collected.",
+                    "wake_transport_hint": "unknown",
+                    "wake_capable": False,
+                    "wake_armed": False,
+                },
+            )
+            service.register(
+                "wake_relay",
+                lambda: _wake_relay_health(),
+                ttl_s=WAKE_RELAY_HEALTH_TTL_S,
+                fallback={
+                    "configured": bool(CODEX_WAKE_RELAY_URL),
+                    "reachable": False,
+                    "detail": "relay_check_pending",
+                    "wake_surface": "telegram",
+                    "wake_command": CODEX_WAKE_TELEGRAM_COMMAND,
+                },
+            )
+            STATUS_SERVICE = service
+        return STATUS_SERVICE
+
+
 def _get_cached_net_info(force: bool = False) -> Dict[str, Any]:
-    now = time.time()
-    with NET_INFO_CACHE_LOCK:
-        cached_at = float(NET_INFO_CACHE.get("loaded_at") or 0.0)
-        cached_payload = NET_INFO_CACHE.get("payload")
-        if not force and isinstance(cached_payload, dict) and (now - cached_at) < NET_INFO_CACHE_TTL_S:
-            return dict(cached_payload)
-        payload = _compute_net_info_payload()
-        NET_INFO_CACHE["loaded_at"] = now
-        NET_INFO_CACHE["payload"] = dict(payload)
-        return payload
+    payload, meta = _status_service().read("net_info", force=force)
+    out = dict(payload or {})
+    out["stale"] = bool(meta.get("stale"))
+    out["probe"] = meta
+    return out
 
 
 def _normalize_mac_address(value: str) -> str:
@@ -1333,21 +2230,59 @@ VALID_CODEX_MODEL_RE = re.compile(r"^[A-Za-z0-9._:/-]{2,120}$")
 VALID_RESUME_ID_RE = re.compile(r"^[A-Za-z0-9_-]{8,}$")
 
 # -------------------------
-# Small in-memory run store
+# codex exec run store
 # -------------------------
-RUNS_LOCK = threading.Lock()
-RUNS: Dict[str, Dict[str, Any]] = {}
-RUNS_ORDER: List[str] = []
 MAX_RUNS_KEEP = 50
-MAX_CONCURRENT_RUNS = 2
+MAX_CONCURRENT_RUNS = max(1, int(os.environ.get("CODEX_MAX_CONCURRENT_RUNS", "2") or "2"))
+CODEX_RUNS_DIR = os.path.abspath(
+    os.environ.get("CODEX_RUNS_DIR", os.path.join(CODEX_RUNTIME_STATE_DIR, "codex-runs"))
+    or os.path.join(CODEX_RUNTIME_STATE_DIR, "codex-runs")
+)
+CODEX_RUN_TIMEOUT_S = float(os.environ.get("CODEX_RUN_TIMEOUT_S", "900") or "900")
+# Where `codex exec` runs and loop completion checks record their process
+# group id, inside the distro.
+CODEX_RUN_PGID_DIR = str(os.environ.get("CODEX_RUN_PGID_DIR", "/tmp") or "/tmp").rstrip("/") or "/tmp"
+WSL_KILL_GRACE_S = max(0.0, float(os.environ.get("CODEX_WSL_KILL_GRACE_S", "2") or "2"))
+CODEX_RUN_OUTPUT_MAX_BYTES = 200_000
+CODEX_RUN_STREAM_CHUNK_BYTES = 65536
+CODEX_RUN_STREAM_POLL_S = 0.25
+CODEX_RUN_MANAGER_LOCK = threading.Lock()
+CODEX_RUN_MANAGER: Optional["_CodexRunManager"] = None
+# -------------------------
+# /events push channel
+# -------------------------
+EVENT_SESSIONS_INTERVAL_S = float(os.environ.get("CODEX_EVENT_SESSIONS_INTERVAL_S", "2.0") or "2.0")
+EVENT_SCREEN_INTERVAL_S = float(os.environ.get("CODEX_EVENT_SCREEN_INTERVAL_S", "0.75") or "0.75")
+EVENT_RUNS_INTERVAL_S = float(os.environ.get("CODEX_EVENT_RUNS_INTERVAL_S", "2.0") or "2.0")
+EVENT_DESKTOP_TARGETS_INTERVAL_S = float(os.environ.get("CODEX_EVENT_DESKTOP_TARGETS_INTERVAL_S", "5.0") or "5.0")
+EVENT_POWER_INTERVAL_S = float(os.environ.get("CODEX_EVENT_POWER_INTERVAL_S", "10.0") or "10.0")
+EVENT_RUNTIME_INTERVAL_S = float(os.environ.get("CODEX_EVENT_RUNTIME_INTERVAL_S", "5.0") or "5.0")
+EVENT_MAX_TOPICS = 8
+# Keys that change on every producer pass without meaning the state changed.
+EVENT_VOLATILE_KEYS = {"updated_at", "last_seen_at", "ts", "age_s", "refreshing_for_s", "next_refresh_in_s", "checked_at"}
+EVENT_HUB_LOCK = threading.Lock()
+EVENT_HUB: Optional["_EventHub"] = None
 MAX_DESKTOP_TEXT = 2000
 SHOW_CURSOR_OVERLAY = os.environ.get("CODEX_SHOW_CURSOR_OVERLAY", "1").strip().lower() not in {"0", "false", "no"}
 DESKTOP_STREAM_FPS_DEFAULT = float(os.environ.get("CODEX_DESKTOP_STREAM_FPS", "3.0") or "3.0")
 DESKTOP_STREAM_PNG_LEVEL_DEFAULT = int(os.environ.get("CODEX_DESKTOP_STREAM_PNG_LEVEL", "3") or "3")
 DESKTOP_STREAM_FORMAT_DEFAULT = str(os.environ.get("CODEX_DESKTOP_STREAM_FORMAT", "png") or "png").strip().lower()
 DESKTOP_STREAM_JPEG_QUALITY_DEFAULT = int(os.environ.get("CODEX_DESKTOP_STREAM_JPEG_QUALITY", "74") or "74")
+DESKTOP_STREAM_TILE_SIZE = max(8, int(os.environ.get("CODEX_DESKTOP_STREAM_TILE_SIZE", "64") or "64"))
+DESKTOP_STREAM_IDLE_FRAMES = max(1, int(os.environ.get("CODEX_DESKTOP_STREAM_IDLE_FRAMES", "3") or "3"))
+DESKTOP_STREAM_IDLE_BACKOFF_MAX = max(1, int(os.environ.get("CODEX_DESKTOP_STREAM_IDLE_BACKOFF_MAX", "8") or "8"))
+DESKTOP_STREAM_IDLE_MAX_DELAY_S = max(0.1, float(os.environ.get("CODEX_DESKTOP_STREAM_IDLE_MAX_DELAY_S", "1.0") or "1.0"))
+DESKTOP_STREAM_IDLE_KEEPALIVE_S = max(1.0, float(os.environ.get("CODEX_DESKTOP_STREAM_IDLE_KEEPALIVE_S", "5.0") or "5.0"))
+DESKTOP_STREAM_ADAPTIVE_DEFAULT = str(os.environ.get("CODEX_DESKTOP_STREAM_ADAPTIVE", "1") or "1").strip().lower() not in {"0", "false", "no", "off"}
+DESKTOP_STREAM_ADAPTIVE_MIN_FPS = max(0.5, float(os.environ.get("CODEX_DESKTOP_STREAM_ADAPTIVE_MIN_FPS", "1.0") or "1.0"))
+DESKTOP_STREAM_ADAPTIVE_MIN_QUALITY = max(40, int(os.environ.get("CODEX_DESKTOP_STREAM_ADAPTIVE_MIN_QUALITY", "45") or "45"))
+DESKTOP_STREAM_ADAPTIVE_MAX_SCALE = min(6, int(os.environ.get("CODEX_DESKTOP_STREAM_ADAPTIVE_MAX_SCALE", "4") or "4"))
+DESKTOP_STREAM_ADAPTIVE_CONGESTION_RATIO = 0.5
+DESKTOP_STREAM_ADAPTIVE_COOLDOWN_FRAMES = 2
+DESKTOP_STREAM_ADAPTIVE_INCREASE_FRAMES = 10
+DESKTOP_STREAM_ACTIVITY_LOCK = threading.Lock()
+DESKTOP_STREAM_ACTIVITY: Dict[str, Any] = {}
 DESKTOP_WEBRTC_ENABLED = str(os.environ.get("CODEX_DESKTOP_WEBRTC", "1") or "1").strip().lower() in {"1", "true", "yes", "on"}
-DESKTOP_STREAM_PREFERRED_TRANSPORT = "webrtc" if (AIORTC_AVAILABLE and DESKTOP_WEBRTC_ENABLED) else "fallback"
 DESKTOP_STREAM_FALLBACK_TRANSPORT = "multipart_png"
 DESKTOP_WEBRTC_SESSION_LOCK = threading.Lock()
 DESKTOP_WEBRTC_SESSIONS: Dict[str, Dict[str, Any]] = {}
@@ -1360,8 +2295,33 @@ DESKTOP_DXCAM_OUTPUT_IDX = None
 DESKTOP_DXCAM_GENERATION = -1
 DESKTOP_TARGET_VIRTUAL_HINT = str(os.environ.get("CODEX_DESKTOP_VIRTUAL_TARGET_ID", "") or "").strip().lower()
 DESKTOP_TARGET_SELECTED_ID = ""
+DESKTOP_TOPOLOGY_LOCK = threading.Lock()
+DESKTOP_TOPOLOGY_CHECK_INTERVAL_S = max(
+    0.2,
+    float(os.environ.get("CODEX_DESKTOP_TOPOLOGY_CHECK_INTERVAL_S", "2.0") or "2.0"),
+)
+DESKTOP_TOPOLOGY_MAX_AGE_S = max(
+    DESKTOP_TOPOLOGY_CHECK_INTERVAL_S,
+    float(os.environ.get("CODEX_DESKTOP_TOPOLOGY_MAX_AGE_S", "60") or "60"),
+)
+# Optional override for display enumeration (returns {"windows_displays": [...], "monitors": [...]}).
+DESKTOP_TOPOLOGY_ENUMERATOR: Optional[Callable[[], Dict[str, Any]]] = None
+DESKTOP_TOPOLOGY: Dict[str, Any] = {
+    "snapshot": None,
+    "generation": 0,
+    "dirty": True,
+    "dirty_reason": "startup",
+    "signature": None,
+    "checked_at": 0.0,
+    "enumerations": 0,
+}
 WINDOWS_DPI_AWARE = False
 WINDOWS_DPI_AWARE_LOCK = threading.Lock()
+POWERSHELL_WORKER_ENABLED = str(os.environ.get("CODEX_POWERSHELL_WORKER", "1") or "1").strip().lower() not in {"0", "false", "no", "off"}
+POWERSHELL_WORKER_START_TIMEOUT_S = max(1.0, float(os.environ.get("CODEX_POWERSHELL_WORKER_START_TIMEOUT_S", "20") or "20"))
+POWERSHELL_WORKER_RETRY_AFTER_S = max(0.0, float(os.environ.get("CODEX_POWERSHELL_WORKER_RETRY_AFTER_S", "60") or "60"))
+POWERSHELL_WORKER_LOCK = threading.Lock()
+POWERSHELL_WORKERS: Dict[str, Any] = {}
 DESKTOP_WEBRTC_MAX_SESSIONS = int(os.environ.get("CODEX_DESKTOP_WEBRTC_MAX_SESSIONS", "2") or "2")
 DESKTOP_CAPTURE_BACKEND_DEFAULT = str(os.environ.get("CODEX_DESKTOP_CAPTURE_BACKEND", "auto") or "auto").strip().lower()
 DESKTOP_MODE_LOCK = threading.Lock()
@@ -1372,6 +2332,10 @@ DESKTOP_PERF_LOCK = threading.Lock()
 DESKTOP_PERF_ENABLED = str(os.environ.get("CODEX_DESKTOP_PERF_DEFAULT", "1") or "1").strip().lower() not in {"0", "false", "no", "off"}
 DESKTOP_PERF_ACTIVE = False
 DESKTOP_PERF_SNAPSHOT: Optional[Dict[str, Any]] = None
+DESKTOP_INPUT_QUEUE_MAX = max(16, int(os.environ.get("CODEX_DESKTOP_INPUT_QUEUE_MAX", "512") or "512"))
+DESKTOP_INPUT_MESSAGE_MAX_EVENTS = 256
+DESKTOP_INPUT_LOCK = threading.Lock()
+DESKTOP_INPUT_DISPATCHER: Optional["_DesktopInputDispatcher"] = None
 _cookie_secure_raw = str(os.environ.get("CODEX_COOKIE_SECURE", "auto") or "auto").strip().lower()
 if _cookie_secure_raw in {"auto", "always", "never", "on", "off", "true", "false", "1", "0", "yes", "no"}:
     CODEX_COOKIE_SECURE_MODE = _cookie_secure_raw
@@ -1395,6 +2359,11 @@ CDS_TEST = 0x00000002
 CDS_SET_PRIMARY = 0x00000010
 CDS_NORESET = 0x10000000
 DISP_CHANGE_SUCCESSFUL = 0
+SM_XVIRTUALSCREEN = 76
+SM_YVIRTUALSCREEN = 77
+SM_CXVIRTUALSCREEN = 78
+SM_CYVIRTUALSCREEN = 79
+SM_CMONITORS = 80
 DM_BITSPERPEL = 0x00040000
 DM_POSITION = 0x00000020
 DM_PELSWIDTH = 0x00080000
@@ -1477,6 +2446,148 @@ class DISPLAY_DEVICEW(ctypes.Structure):
         ("DeviceKey", wintypes.WCHAR * 128),
     ]
 
+# -------------------------
+# Controller process role
+# -------------------------
+# "single" runs everything in one process. With `--workers N` the controller
+# runs N HTTP "worker" processes plus one "agent" process that owns the host
+# singletons (tmux capture, winpty sessions, loop control, Telegram) and the
+# stream state; workers reach it over HOST_AGENT_ADDRESS.
+CONTROLLER_ROLES = ("single", "worker", "agent")
+CONTROLLER_ROLE = str(os.environ.get("CODEX_CONTROLLER_ROLE", "single") or "single").strip().lower()
+if CONTROLLER_ROLE not in CONTROLLER_ROLES:
+    CONTROLLER_ROLE = "single"
+HOST_AGENT_ADDRESS = str(os.environ.get("CODEX_HOST_AGENT_ADDRESS", "") or "").strip() or (
+    "tcp:127.0.0.1:48789" if os.name == "nt" else "unix:" + os.path.join(CODEX_RUNTIME_STATE_DIR, "host-agent.sock")
+)
+HOST_AGENT_TOKEN_FILE = os.path.abspath(
+    os.environ.get(
+        "CODEX_HOST_AGENT_TOKEN_FILE",
+        os.path.join(CODEX_RUNTIME_STATE_DIR, "host-agent.token"),
+    )
+)
+HOST_AGENT_CALL_TIMEOUT_S = max(1.0, float(os.environ.get("CODEX_HOST_AGENT_CALL_TIMEOUT_S", "60") or "60"))
+HOST_AGENT_CONNECT_TIMEOUT_S = 5.0
+HOST_AGENT_METHODS: Dict[str, Callable[..., Any]] = {}
+HOST_AGENT_CLIENT_LOCK = threading.Lock()
+HOST_AGENT_CLIENT: Optional["_HostAgentClient"] = None
+HOST_AGENT_SERVER: Optional["_HostAgentServer"] = None
+
+
+def _owns_host_singletons() -> bool:
+    return CONTROLLER_ROLE != "worker"
+
+
+def _host_agent_method(name: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """
+    Marks a function whose state lives with the host singletons. In a worker
+    process the call is forwarded to the host agent (arguments and result
+    must be JSON, HTTPException comes back as itself); in single and agent
+    roles it runs in place.
+    """
+
+    def decorator(fn: Callable[..., Any]) -> Callable[..., Any]:
+        HOST_AGENT_METHODS[name] = fn
+
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if CONTROLLER_ROLE != "worker":
+                return fn(*args, **kwargs)
+            return _host_agent_client().call(name, args, kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def _store_file_stamp(path: str) -> Tuple[int, int, int]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return (0, 0, 0)
+    return (int(st.st_mtime_ns), int(st.st_size), int(st.st_ino))
+
+
+def _store_file_lock_acquire(path: str) -> Any:
+    parent = os.path.dirname(path)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+    handle = open(path, "a+b")
+    try:
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+        elif msvcrt is not None:
+            handle.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK gives up after ten one-second retries.
+                    continue
+    except BaseException:
+        handle.close()
+        raise
+    return handle
+
+
+def _store_file_lock_release(handle: Any) -> None:
+    try:
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+        elif msvcrt is not None:
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+    finally:
+        handle.close()
+
+
+class _StoreLock:
+    """
+    The lock around one JSON store. In single mode it is a plain thread lock.
+    When several controller processes share the state dir it also holds an
+    advisory lock on `<store>.lock`, and on entry reloads the in-memory copy
+    (by clearing `loaded_flag` and calling `loader`) if another process
+    replaced the store file since this one last held the lock.
+    """
+
+    def __init__(self, path_fn: Callable[[], str], loaded_flag: str, loader: str) -> None:
+        self.path_fn = path_fn
+        self.loaded_flag = loaded_flag
+        self.loader = loader
+        self._lock = threading.Lock()
+        self._handle: Any = None
+        self._stamp: Optional[Tuple[int, int, int]] = None
+
+    def __enter__(self) -> "_StoreLock":
+        self._lock.acquire()
+        if CONTROLLER_ROLE == "single":
+            return self
+        try:
+            path = self.path_fn()
+            self._handle = _store_file_lock_acquire(path + ".lock")
+            if self._stamp is not None and globals().get(self.loaded_flag) and _store_file_stamp(path) != self._stamp:
+                globals()[self.loaded_flag] = False
+                globals()[self.loader]()
+        except BaseException:
+            self._release()
+            raise
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self._release()
+
+    def _release(self) -> None:
+        try:
+            if self._handle is not None:
+                # Still under the file lock, so this is this process's view of the file.
+                self._stamp = _store_file_stamp(self.path_fn())
+                _store_file_lock_release(self._handle)
+        finally:
+            self._handle = None
+            self._lock.release()
+
+
 # -------------------------
 # Thread transcript store
 # -------------------------
@@ -1488,7 +2599,7 @@ DEFAULT_THREADS_FILE = os.path.abspath(
     )
 )
 THREADS_FILE = DEFAULT_THREADS_FILE
-THREADS_LOCK = threading.Lock()
+THREADS_LOCK = _StoreLock(lambda: THREADS_FILE, "THREADS_LOADED", "_load_threads_store_unlocked")
 THREADS_LOADED = False
 THREADS_MAX_KEEP = int(os.environ.get("CODEX_THREADS_MAX_KEEP", "200") or "200")
 THREAD_MESSAGES_MAX_PER_THREAD = int(os.environ.get("CODEX_THREAD_MESSAGES_MAX_PER_THREAD", "240") or "240")
@@ -1509,7 +2620,7 @@ DEFAULT_SHARED_OUTBOX_FILE = os.path.abspath(
     )
 )
 SHARED_OUTBOX_FILE = DEFAULT_SHARED_OUTBOX_FILE
-SHARED_OUTBOX_LOCK = threading.Lock()
+SHARED_OUTBOX_LOCK = _StoreLock(lambda: SHARED_OUTBOX_FILE, "SHARED_OUTBOX_LOADED", "_load_shared_outbox_unlocked")
 SHARED_OUTBOX_LOADED = False
 SHARED_OUTBOX_MAX_KEEP = int(os.environ.get("CODEX_SHARED_OUTBOX_MAX_KEEP", "200") or "200")
 SHARED_OUTBOX_DEFAULT_EXPIRES_HOURS = int(os.environ.get("CODEX_SHARED_OUTBOX_DEFAULT_EXPIRES_HOURS", "24") or "24")
@@ -1529,13 +2640,17 @@ DEFAULT_SESSION_FILES_FILE = os.path.abspath(
     )
 )
 SESSION_FILES_FILE = DEFAULT_SESSION_FILES_FILE
-SESSION_FILES_LOCK = threading.Lock()
+SESSION_FILES_LOCK = _StoreLock(lambda: SESSION_FILES_FILE, "SESSION_FILES_LOADED", "_load_session_files_unlocked")
 SESSION_FILES_LOADED = False
 SESSION_FILES_MAX_KEEP = int(os.environ.get("CODEX_SESSION_FILES_MAX_KEEP", "600") or "600")
 SESSION_FILES_MAX_FILE_MB = int(os.environ.get("CODEX_SESSION_FILES_MAX_FILE_MB", "200") or "200")
 SESSION_FILES_DATA: Dict[str, Any] = {
     "items": [],
 }
+EXPIRY_SWEEP_BATCH = max(1, int(os.environ.get("CODEX_EXPIRY_SWEEP_BATCH", "256") or "256"))
+EXPIRY_SWEEP_MAX_WAIT_S = max(1.0, float(os.environ.get("CODEX_EXPIRY_SWEEP_MAX_WAIT_S", "300") or "300"))
+EXPIRY_SWEEPER_LOCK = threading.Lock()
+EXPIRY_SWEEPER: Optional["_ExpirySweeper"] = None
 DEFAULT_SESSION_NOTES_FILE = os.path.abspath(
     os.environ.get(
         "CODEX_SESSION_NOTES_FILE",
@@ -1550,6 +2665,11 @@ SESSION_NOTES_MAX_SNAPSHOT_CHARS = int(os.environ.get("CODEX_SESSION_NOTES_MAX_S
 SESSION_NOTES_DATA: Dict[str, Any] = {
     "notes": {},
 }
+SESSION_NOTES_PAGE_MAX = 200
+SESSION_NOTES_COMPACT_MIN_BYTES = int(os.environ.get("CODEX_SESSION_NOTES_COMPACT_MIN_BYTES", "262144") or "262144")
+SESSION_NOTES_COMPACT_PENDING: Set[str] = set()
+SESSION_NOTES_COMPACT_WAKE = threading.Event()
+SESSION_NOTES_COMPACTOR: Optional[threading.Thread] = None
 DEFAULT_SESSION_HISTORY_FILE = os.path.abspath(
     os.environ.get(
         "CODEX_SESSION_HISTORY_FILE",
@@ -1557,7 +2677,7 @@ DEFAULT_SESSION_HISTORY_FILE = os.path.abspath(
     )
 )
 SESSION_HISTORY_FILE = DEFAULT_SESSION_HISTORY_FILE
-SESSION_HISTORY_LOCK = threading.Lock()
+SESSION_HISTORY_LOCK = _StoreLock(lambda: SESSION_HISTORY_FILE, "SESSION_HISTORY_LOADED", "_load_session_history_unlocked")
 SESSION_HISTORY_LOADED = False
 SESSION_HISTORY_MAX_KEEP = int(os.environ.get("CODEX_SESSION_HISTORY_MAX_KEEP", "240") or "240")
 SESSION_HISTORY_DATA: Dict[str, Any] = {
@@ -1570,13 +2690,32 @@ DEFAULT_LOOP_CONTROL_FILE = os.path.abspath(
     )
 )
 LOOP_CONTROL_FILE = DEFAULT_LOOP_CONTROL_FILE
-LOOP_CONTROL_LOCK = threading.Lock()
+LOOP_CONTROL_LOCK = _StoreLock(lambda: LOOP_CONTROL_FILE, "LOOP_CONTROL_LOADED", "_load_loop_control_unlocked")
 LOOP_CONTROL_LOADED = False
 LOOP_CONTROL_POLL_INTERVAL_S = float(os.environ.get("CODEX_LOOP_CONTROL_POLL_INTERVAL_S", "3.0") or "3.0")
 LOOP_CONTROL_TELEGRAM_POLL_INTERVAL_S = float(
     os.environ.get("CODEX_LOOP_CONTROL_TELEGRAM_POLL_INTERVAL_S", "5.0") or "5.0"
 )
+LOOP_TELEGRAM_LONG_POLL_S = max(0, int(os.environ.get("CODEX_LOOP_TELEGRAM_LONG_POLL_S", "25") or "25"))
+LOOP_TELEGRAM_OFFSET_PERSIST_INTERVAL_S = max(
+    0.0,
+    float(os.environ.get("CODEX_LOOP_TELEGRAM_OFFSET_PERSIST_INTERVAL_S", "15") or "15"),
+)
+LOOP_TELEGRAM_OFFSET_STATE: Dict[str, Any] = {
+    "dirty": False,
+    "persisted_at": 0.0,
+}
 LOOP_CONTROL_CHECK_TIMEOUT_S = float(os.environ.get("CODEX_LOOP_CONTROL_CHECK_TIMEOUT_S", "900") or "900")
+LOOP_CHECK_PARALLELISM = max(1, int(os.environ.get("CODEX_LOOP_CHECK_PARALLELISM", "3") or "3"))
+LOOP_CHECK_FAIL_FAST = str(os.environ.get("CODEX_LOOP_CHECK_FAIL_FAST", "0") or "0").strip().lower() in {"1", "true", "yes", "on"}
+LOOP_CHECK_OUTPUT_HEAD_CHARS = 600
+LOOP_CHECK_OUTPUT_TAIL_CHARS = 1200
+LOOP_CHECK_JOBS_LOCK = threading.Lock()
+LOOP_CHECK_JOBS: Dict[str, Any] = {}
+# Sessions whose job thread (checks plus the follow-up) has not returned yet.
+LOOP_CHECK_ACTIVE: Set[str] = set()
+# Re-checks requested while a session's checks were still running.
+LOOP_CHECK_PENDING: Dict[str, Tuple[Any, Callable[[bool, List[Dict[str, Any]]], None]]] = {}
 LOOP_PRESET_VALUES = (
     "infinite",
     "await-reply",
@@ -1639,9 +2778,12 @@ LOOP_CONTROL_DATA: Dict[str, Any] = {
         "last_telegram_poll_at": 0,
         "last_error": "",
         "last_error_at": 0,
+        "last_telegram_error": "",
+        "last_telegram_error_at": 0,
     },
 }
 LOOP_CONTROL_WORKER_THREAD: Optional[threading.Thread] = None
+LOOP_TELEGRAM_LISTENER_THREAD: Optional[threading.Thread] = None
 APP_RUNTIME_SESSION_FILE = os.path.abspath(
     os.environ.get(
         "CODEX_APP_RUNTIME_SESSION_FILE",
@@ -1655,7 +2797,7 @@ TRUSTED_DEVICES_FILE = os.path.abspath(
         os.path.join(CODEX_RUNTIME_STATE_DIR, "trusted-devices.json"),
     )
 )
-TRUSTED_DEVICES_LOCK = threading.Lock()
+TRUSTED_DEVICES_LOCK = _StoreLock(lambda: TRUSTED_DEVICES_FILE, "TRUSTED_DEVICES_LOADED", "_load_trusted_devices_unlocked")
 TRUSTED_DEVICES_MAX_KEEP = int(os.environ.get("CODEX_TRUSTED_DEVICES_MAX_KEEP", "20") or "20")
 TRUSTED_DEVICES_DATA: Dict[str, Any] = {
     "devices": [],
@@ -1680,6 +2822,30 @@ _cleanup_legacy_privacy_lock_state()
 SESSION_STREAM_LOCK = threading.Lock()
 SESSION_STREAM_REPLAY_MAX = int(os.environ.get("CODEX_SESSION_STREAM_REPLAY_MAX", "240") or "240")
 SESSION_STREAM_STATES: Dict[str, Dict[str, Any]] = {}
+SESSION_STREAM_SEND_MAX_EVENTS = max(2, int(os.environ.get("CODEX_STREAM_SEND_MAX_EVENTS", "64") or "64"))
+SESSION_STREAM_SEND_MAX_BYTES = max(4096, int(os.environ.get("CODEX_STREAM_SEND_MAX_BYTES", str(2 * 1024 * 1024)) or str(2 * 1024 * 1024)))
+SESSION_STREAM_SEND_POLICIES = ("collapse", "drop", "disconnect")
+SESSION_STREAM_SEND_POLICY = str(os.environ.get("CODEX_STREAM_SEND_POLICY", "collapse") or "collapse").strip().lower()
+if SESSION_STREAM_SEND_POLICY not in SESSION_STREAM_SEND_POLICIES:
+    SESSION_STREAM_SEND_POLICY = "collapse"
+SESSION_STREAM_CLIENTS_LOCK = threading.Lock()
+SESSION_STREAM_CLIENTS: Dict[str, "_StreamSendQueue"] = {}
+SESSION_RECORDINGS_DIR = os.path.abspath(
+    os.environ.get(
+        "CODEX_SESSION_RECORDINGS_DIR",
+        os.path.join(CODEX_RUNTIME_STATE_DIR, "session-recordings"),
+    )
+)
+SESSION_RECORDING_CHUNK_EVENTS = int(os.environ.get("CODEX_SESSION_RECORDING_CHUNK_EVENTS", "120") or "120")
+SESSION_RECORDING_CHUNK_S = float(os.environ.get("CODEX_SESSION_RECORDING_CHUNK_S", "20") or "20")
+SESSION_RECORDING_SEGMENT_MAX_BYTES = int(float(os.environ.get("CODEX_SESSION_RECORDING_SEGMENT_MAX_MB", "4") or "4") * 1024 * 1024)
+SESSION_RECORDING_SEGMENT_MAX_S = float(os.environ.get("CODEX_SESSION_RECORDING_SEGMENT_MAX_S", "3600") or "3600")
+SESSION_RECORDING_MAX_BYTES = int(float(os.environ.get("CODEX_SESSION_RECORDING_MAX_MB", "512") or "512") * 1024 * 1024)
+SESSION_RECORDING_MAX_AGE_S = float(os.environ.get("CODEX_SESSION_RECORDING_MAX_AGE_H", "72") or "72") * 3600.0
+SESSION_RECORDING_CAPTURE_S = float(os.environ.get("CODEX_SESSION_RECORDING_CAPTURE_S", "2") or "2")
+SESSION_RECORDING_REPLAY_MAX_SPEED = 32
+SESSION_RECORDINGS_LOCK = threading.Lock()
+SESSION_RECORDINGS: Optional[Any] = None
 SESSION_RECOVERING_AFTER_S = float(os.environ.get("CODEX_SESSION_RECOVERING_AFTER_S", "20") or "20")
 SESSION_STALE_TTL_S = float(os.environ.get("CODEX_SESSION_STALE_TTL_S", "180") or "180")
 SESSION_BACKGROUND_MODE = "selected_only"
@@ -1688,12 +2854,30 @@ CODEX_HISTORY_CACHE: Dict[str, Any] = {
     "loaded_at": 0.0,
     "entries": [],
 }
-NET_INFO_CACHE_LOCK = threading.Lock()
 NET_INFO_CACHE_TTL_S = float(os.environ.get("CODEX_NET_INFO_CACHE_TTL_S", "30") or "30")
-NET_INFO_CACHE: Dict[str, Any] = {
-    "loaded_at": 0.0,
-    "payload": None,
-}
+WAKE_MAC_INFO_TTL_S = float(os.environ.get("CODEX_WAKE_MAC_INFO_TTL_S", "300") or "300")
+WAKE_LOCAL_CAPABILITIES_TTL_S = float(os.environ.get("CODEX_WAKE_LOCAL_CAPABILITIES_TTL_S", "300") or "300")
+WAKE_RELAY_HEALTH_TTL_S = float(os.environ.get("CODEX_WAKE_RELAY_HEALTH_TTL_S", "30") or "30")
+STATUS_COLD_WAIT_S = max(0.0, float(os.environ.get("CODEX_STATUS_COLD_WAIT_S", "3") or "3"))
+STATUS_IDLE_AFTER_S = max(1.0, float(os.environ.get("CODEX_STATUS_IDLE_AFTER_S", "300") or "300"))
+STATUS_JITTER_RATIO = 0.1
+STATUS_SERVICE_LOCK = threading.Lock()
+STATUS_SERVICE: Optional[Any] = None
+WSL_RUNTIME_POLL_S = max(1.0, float(os.environ.get("CODEX_WSL_RUNTIME_POLL_S", "30") or "30"))
+WSL_RUNTIME_TRANSITION_POLL_S = max(0.2, float(os.environ.get("CODEX_WSL_RUNTIME_TRANSITION_POLL_S", "1") or "1"))
+WSL_RUNTIME_TRANSITION_TIMEOUT_S = max(1.0, float(os.environ.get("CODEX_WSL_RUNTIME_TRANSITION_TIMEOUT_S", "45") or "45"))
+WSL_RUNTIME_CHANGE_HISTORY = 20
+WSL_RUNTIME_MONITOR_LOCK = threading.Lock()
+WSL_RUNTIME_MONITOR: Optional[Any] = None
+JSON_FILE_CACHE_LOCK = threading.Lock()
+JSON_FILE_CACHE_MAX_FILES = 32
+JSON_FILE_CACHE: Dict[str, Tuple[Tuple[int, int, int], Dict[str, Any]]] = {}
+FS_LIST_CACHE_LOCK = threading.Lock()
+FS_LIST_CACHE_TTL_S = float(os.environ.get("CODEX_FS_LIST_CACHE_TTL_S", "5") or "5")
+FS_LIST_CACHE_MAX_DIRS = int(os.environ.get("CODEX_FS_LIST_CACHE_MAX_DIRS", "64") or "64")
+FS_LIST_PAGE_MAX = int(os.environ.get("CODEX_FS_LIST_PAGE_MAX", "1000") or "1000")
+FS_LIST_SORT_KEYS = ("name", "mtime", "size", "kind")
+FS_LIST_CACHE: Dict[str, Dict[str, Any]] = {}
 
 # -------------------------
 # Telegram delivery (optional)
@@ -1713,6 +2897,27 @@ TELEGRAM_API_BASE = os.environ.get("CODEX_TELEGRAM_API_BASE", "https://api.teleg
 TELEGRAM_TIMEOUT_SECONDS = float(os.environ.get("CODEX_TELEGRAM_TIMEOUT_SECONDS", "30") or "30")
 TELEGRAM_MAX_FILE_MB = int(os.environ.get("CODEX_TELEGRAM_MAX_FILE_MB", "45") or "45")
 CODEX_TELEGRAM_DEFAULT_SEND = str(os.environ.get("CODEX_TELEGRAM_DEFAULT_SEND", "0") or "0").strip().lower() in {"1", "true", "yes", "on"}
+TELEGRAM_UPLOAD_CHUNK_BYTES = max(16 * 1024, int(os.environ.get("CODEX_TELEGRAM_UPLOAD_CHUNK_BYTES", "262144") or "262144"))
+TELEGRAM_SEND_QUEUE_MAX = max(1, int(os.environ.get("CODEX_TELEGRAM_SEND_QUEUE_MAX", "16") or "16"))
+TELEGRAM_SEND_MAX_ATTEMPTS = max(1, int(os.environ.get("CODEX_TELEGRAM_SEND_MAX_ATTEMPTS", "4") or "4"))
+TELEGRAM_SEND_BACKOFF_BASE_S = max(0.1, float(os.environ.get("CODEX_TELEGRAM_SEND_BACKOFF_BASE_S", "2.0") or "2.0"))
+TELEGRAM_SEND_BACKOFF_MAX_S = max(1.0, float(os.environ.get("CODEX_TELEGRAM_SEND_BACKOFF_MAX_S", "60") or "60"))
+TELEGRAM_SEND_JOBS_KEEP = max(10, int(os.environ.get("CODEX_TELEGRAM_SEND_JOBS_KEEP", "100") or "100"))
+TELEGRAM_HTTP_POOL_SIZE = max(1, int(os.environ.get("CODEX_TELEGRAM_HTTP_POOL_SIZE", "2") or "2"))
+TELEGRAM_RATE_GLOBAL_PER_S = max(1.0, float(os.environ.get("CODEX_TELEGRAM_RATE_GLOBAL_PER_S", "30") or "30"))
+TELEGRAM_RATE_CHAT_INTERVAL_S = max(0.0, float(os.environ.get("CODEX_TELEGRAM_RATE_CHAT_INTERVAL_S", "1.0") or "1.0"))
+TELEGRAM_RATE_GROUP_INTERVAL_S = max(0.0, float(os.environ.get("CODEX_TELEGRAM_RATE_GROUP_INTERVAL_S", "3.0") or "3.0"))
+TELEGRAM_MESSAGE_MAX_CHARS = 4096
+TELEGRAM_CLIENT_LOCK = threading.Lock()
+TELEGRAM_CLIENT: Optional["_TelegramBotClient"] = None
+TELEGRAM_OUTBOX_COND = threading.Condition()
+TELEGRAM_OUTBOX: List[str] = []
+TELEGRAM_OUTBOX_WORKER_THREAD: Optional[threading.Thread] = None
+TELEGRAM_SEND_LOCK = threading.Lock()
+TELEGRAM_SEND_QUEUE: "queue.Queue[str]" = queue.Queue(maxsize=TELEGRAM_SEND_QUEUE_MAX)
+TELEGRAM_SEND_JOBS: Dict[str, Dict[str, Any]] = {}
+TELEGRAM_SEND_JOBS_ORDER: List[str] = []
+TELEGRAM_SEND_WORKER_THREAD: Optional[threading.Thread] = None
 
 for _runtime_dir in (
     CODEX_RUNTIME_DIR,
@@ -1771,6 +2976,35 @@ def _read_json_file(path: str) -> Dict[str, Any]:
     return {}
 
 
+def _read_json_file_cached(path: str) -> Dict[str, Any]:
+    """
+    _read_json_file for small config files read on hot request paths: the
+    parsed dict is kept until the file's mtime, size or inode changes, so an
+    unchanged file costs one stat. Treat the result as read-only.
+    """
+    p = str(path or "").strip()
+    if not p:
+        return {}
+    try:
+        st = os.stat(p)
+    except OSError:
+        with JSON_FILE_CACHE_LOCK:
+            JSON_FILE_CACHE.pop(p, None)
+        return {}
+    key = (int(st.st_mtime_ns), int(st.st_size), int(st.st_ino))
+    with JSON_FILE_CACHE_LOCK:
+        cached = JSON_FILE_CACHE.get(p)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+    parsed = _read_json_file(p)
+    with JSON_FILE_CACHE_LOCK:
+        JSON_FILE_CACHE.pop(p, None)
+        while len(JSON_FILE_CACHE) >= JSON_FILE_CACHE_MAX_FILES:
+            JSON_FILE_CACHE.pop(next(iter(JSON_FILE_CACHE)))
+        JSON_FILE_CACHE[p] = (key, parsed)
+    return parsed
+
+
 def _write_json_file(path: str, payload: Dict[str, Any]) -> None:
     p = str(path or "").strip()
     if not p:
@@ -2039,9 +3273,12 @@ def _sort_and_trim_loop_control_unlocked() -> None:
         "last_telegram_poll_at": _coerce_ms(worker_data.get("last_telegram_poll_at"), 0),
         "last_error": str(worker_data.get("last_error") or "").strip()[:4000],
         "last_error_at": _coerce_ms(worker_data.get("last_error_at"), 0),
+        "last_telegram_error": str(worker_data.get("last_telegram_error") or "").strip()[:4000],
+        "last_telegram_error_at": _coerce_ms(worker_data.get("last_telegram_error_at"), 0),
     }
 
 
+@_instrumented("codrex_store_write_seconds", store="loop_control")
 def _persist_loop_control_unlocked() -> None:
     _sort_and_trim_loop_control_unlocked()
     payload = {
@@ -2222,6 +3459,7 @@ def _sort_and_trim_threads_unlocked() -> None:
     THREADS_DATA["messages"] = normalized_messages
 
 
+@_instrumented("codrex_store_write_seconds", store="threads")
 def _persist_threads_store_unlocked() -> None:
     _sort_and_trim_threads_unlocked()
     parent = os.path.dirname(THREADS_FILE)
@@ -2376,6 +3614,7 @@ def _sort_and_trim_session_history_unlocked() -> None:
     SESSION_HISTORY_DATA["items"] = normalized
 
 
+@_instrumented("codrex_store_write_seconds", store="session_history")
 def _persist_session_history_unlocked() -> None:
     _sort_and_trim_session_history_unlocked()
     parent = os.path.dirname(SESSION_HISTORY_FILE)
@@ -2646,8 +3885,8 @@ def _shared_item_from_raw(raw: Dict[str, Any]) -> Optional[Dict[str, Any]]:
 
 
 def _sort_and_trim_shared_outbox_unlocked() -> None:
+    # Load-time normalization only; expired items are left to the expiry sweeper.
     items = SHARED_OUTBOX_DATA.get("items") or []
-    now_ms = _now_ms()
     cleaned: List[Dict[str, Any]] = []
     seen_ids = set()
     for raw in items:
@@ -2659,16 +3898,14 @@ def _sort_and_trim_shared_outbox_unlocked() -> None:
         item_id = item["id"]
         if item_id in seen_ids:
             continue
-        if _share_expired(item, now_ms=now_ms):
-            continue
         seen_ids.add(item_id)
         cleaned.append(item)
     cleaned.sort(key=lambda x: int(x.get("created_at") or 0), reverse=True)
     SHARED_OUTBOX_DATA["items"] = cleaned[: max(1, SHARED_OUTBOX_MAX_KEEP)]
 
 
+@_instrumented("codrex_store_write_seconds", store="shared_outbox")
 def _persist_shared_outbox_unlocked() -> None:
-    _sort_and_trim_shared_outbox_unlocked()
     parent = os.path.dirname(SHARED_OUTBOX_FILE)
     if parent:
         os.makedirs(parent, exist_ok=True)
@@ -2695,11 +3932,13 @@ def _load_shared_outbox_unlocked() -> None:
     if isinstance(items, list):
         SHARED_OUTBOX_DATA["items"] = items
     _sort_and_trim_shared_outbox_unlocked()
+    _expiry_sweeper().rebuild("shared_outbox", SHARED_OUTBOX_DATA["items"])
 
 
 def _shared_outbox_snapshot_unlocked() -> Dict[str, Any]:
-    _sort_and_trim_shared_outbox_unlocked()
-    return {"items": json.loads(json.dumps(SHARED_OUTBOX_DATA.get("items") or []))}
+    now_ms = _now_ms()
+    items = [item for item in SHARED_OUTBOX_DATA.get("items") or [] if not _share_expired(item, now_ms=now_ms)]
+    return {"items": json.loads(json.dumps(items))}
 
 
 def _find_shared_item_unlocked(item_id: str) -> Optional[Dict[str, Any]]:
@@ -2817,7 +4056,9 @@ def _create_shared_outbox_item(
     with SHARED_OUTBOX_LOCK:
         _load_shared_outbox_unlocked()
         SHARED_OUTBOX_DATA["items"].insert(0, item)
+        del SHARED_OUTBOX_DATA["items"][max(1, SHARED_OUTBOX_MAX_KEEP):]
         _persist_shared_outbox_unlocked()
+        _expiry_schedule("shared_outbox", item["id"], item["expires_at"])
     return item
 
 
@@ -2926,13 +4167,15 @@ def _create_host_shared_outbox_item(
     with SHARED_OUTBOX_LOCK:
         _load_shared_outbox_unlocked()
         SHARED_OUTBOX_DATA["items"].insert(0, item)
+        del SHARED_OUTBOX_DATA["items"][max(1, SHARED_OUTBOX_MAX_KEEP):]
         _persist_shared_outbox_unlocked()
+        _expiry_schedule("shared_outbox", item["id"], item["expires_at"])
     return item
 
 
 def _sort_and_trim_session_files_unlocked() -> None:
+    # Load-time normalization only; expired items are left to the expiry sweeper.
     items = SESSION_FILES_DATA.get("items") or []
-    now_ms = _now_ms()
     cleaned: List[Dict[str, Any]] = []
     seen_ids = set()
     for raw in items:
@@ -2945,7 +4188,7 @@ def _sort_and_trim_session_files_unlocked() -> None:
         if not session_id or not VALID_NAME_RE.fullmatch(session_id):
             continue
         item_id = item["id"]
-        if item_id in seen_ids or _share_expired(item, now_ms=now_ms):
+        if item_id in seen_ids:
             continue
         seen_ids.add(item_id)
         cleaned.append(item)
@@ -2953,8 +4196,8 @@ def _sort_and_trim_session_files_unlocked() -> None:
     SESSION_FILES_DATA["items"] = cleaned[: max(1, SESSION_FILES_MAX_KEEP)]
 
 
+@_instrumented("codrex_store_write_seconds", store="session_files")
 def _persist_session_files_unlocked() -> None:
-    _sort_and_trim_session_files_unlocked()
     parent = os.path.dirname(SESSION_FILES_FILE)
     if parent:
         os.makedirs(parent, exist_ok=True)
@@ -2985,15 +4228,16 @@ def _load_session_files_unlocked() -> None:
     if isinstance(items, list):
         SESSION_FILES_DATA["items"] = items
     _sort_and_trim_session_files_unlocked()
+    _expiry_sweeper().rebuild("session_files", SESSION_FILES_DATA["items"])
 
 
 def _session_files_snapshot_unlocked(session: str) -> Dict[str, Any]:
-    _sort_and_trim_session_files_unlocked()
     session_id = session.strip()
+    now_ms = _now_ms()
     items = [
         item
         for item in (SESSION_FILES_DATA.get("items") or [])
-        if str((item or {}).get("session") or "").strip() == session_id
+        if str((item or {}).get("session") or "").strip() == session_id and not _share_expired(item, now_ms=now_ms)
     ]
     return {"items": json.loads(json.dumps(items))}
 
@@ -3077,7 +4321,9 @@ def _create_session_file_item(
     with SESSION_FILES_LOCK:
         _load_session_files_unlocked()
         SESSION_FILES_DATA["items"].insert(0, item)
+        del SESSION_FILES_DATA["items"][max(1, SESSION_FILES_MAX_KEEP):]
         _persist_session_files_unlocked()
+        _expiry_schedule("session_files", item["id"], item["expires_at"])
     return item
 
 
@@ -3117,24 +4363,251 @@ def _session_file_is_managed_upload(item: Dict[str, Any]) -> bool:
     return _path_under_root(wsl_path, _session_upload_root(session_id))
 
 
-def _compact_assistant_snapshot_text(text: str) -> str:
-    lines = [line.rstrip() for line in str(text or "").splitlines()]
-    lines = [line for line in lines if line.strip()]
-    if not lines:
-        return ""
-    tail = "\n".join(lines[-24:]).strip()
-    if len(tail) > SESSION_NOTES_MAX_SNAPSHOT_CHARS:
-        tail = tail[-SESSION_NOTES_MAX_SNAPSHOT_CHARS :]
-    return tail
+# -------------------------
+# Expiry sweeper
+# -------------------------
+class _ExpirySweeper:
+    """
+    Min-heap of (expires_at_ms, kind, item_id) for stores whose items expire.
+    Each kind registers reap(ids, now_ms), which removes the given items if
+    they are still expired and returns (items, files, bytes) reclaimed. Load
+    calls rebuild(kind, items); creates call schedule(). A daemon thread
+    sleeps until the earliest expiry (at most max_wait_s) and reaps due items
+    in batches of batch_size, one reap call per kind and batch. Entries for
+    items deleted by hand stay in the heap and are ignored when they come due.
+    """
 
+    def __init__(
+        self,
+        *,
+        batch_size: int = EXPIRY_SWEEP_BATCH,
+        max_wait_s: float = EXPIRY_SWEEP_MAX_WAIT_S,
+        clock: Callable[[], int] = _now_ms,
+    ) -> None:
+        self.batch_size = max(1, int(batch_size))
+        self.max_wait_s = max(0.01, float(max_wait_s))
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._heap: List[Tuple[int, str, str]] = []
+        self._reapers: Dict[str, Callable[[Set[str], int], Tuple[int, int, int]]] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self.sweeps = 0
+        self.batches = 0
+        self.reclaimed: Dict[str, Dict[str, int]] = {}
+        self.last_error = ""
+
+    def register(self, kind: str, reap: Callable[[Set[str], int], Tuple[int, int, int]]) -> None:
+        with self._lock:
+            self._reapers[kind] = reap
+            self.reclaimed.setdefault(kind, {"items": 0, "files": 0, "bytes": 0})
+
+    def rebuild(self, kind: str, items: List[Dict[str, Any]]) -> None:
+        entries: List[Tuple[int, str, str]] = []
+        for item in items:
+            expires_at = _coerce_ms((item or {}).get("expires_at"), 0)
+            if expires_at > 0 and item.get("id"):
+                entries.append((expires_at, kind, str(item["id"])))
+        with self._lock:
+            self._heap = [entry for entry in self._heap if entry[1] != kind] + entries
+            heapq.heapify(self._heap)
+        self._wake.set()
+
+    def schedule(self, kind: str, item_id: str, expires_at: Any) -> None:
+        expires_ms = _coerce_ms(expires_at, 0)
+        if expires_ms <= 0 or not item_id:
+            return
+        with self._lock:
+            earliest = self._heap[0][0] if self._heap else None
+            heapq.heappush(self._heap, (expires_ms, kind, str(item_id)))
+        if earliest is None or expires_ms < earliest:
+            self._wake.set()
+
+    def next_due_ms(self) -> Optional[int]:
+        with self._lock:
+            return self._heap[0][0] if self._heap else None
+
+    def _pop_due(self, now_ms: int) -> Dict[str, Set[str]]:
+        batch: Dict[str, Set[str]] = {}
+        with self._lock:
+            for _ in range(self.batch_size):
+                if not self._heap or self._heap[0][0] > now_ms:
+                    break
+                _expires_at, kind, item_id = heapq.heappop(self._heap)
+                batch.setdefault(kind, set()).add(item_id)
+        return batch
+
+    def sweep(self, now_ms: Optional[int] = None) -> Dict[str, Dict[str, int]]:
+        """Reaps everything due at now_ms; returns what was reclaimed per kind."""
+        now = int(now_ms if now_ms is not None else self.clock())
+        out: Dict[str, Dict[str, int]] = {}
+        self.sweeps += 1
+        while True:
+            batch = self._pop_due(now)
+            if not batch:
+                break
+            self.batches += 1
+            for kind, ids in batch.items():
+                reap = self._reapers.get(kind)
+                if reap is None:
+                    continue
+                with METRICS.time("codrex_expiry_sweep_seconds", kind=kind):
+                    items, files, reclaimed_bytes = reap(ids, now)
+                totals = out.setdefault(kind, {"items": 0, "files": 0, "bytes": 0})
+                with self._lock:
+                    lifetime = self.reclaimed.setdefault(kind, {"items": 0, "files": 0, "bytes": 0})
+                    for key, value in (("items", items), ("files", files), ("bytes", reclaimed_bytes)):
+                        totals[key] += value
+                        lifetime[key] += value
+                if items:
+                    METRICS.inc("codrex_expiry_reclaimed_items_total", items, kind=kind)
+                if reclaimed_bytes:
+                    METRICS.inc("codrex_expiry_reclaimed_bytes_total", reclaimed_bytes, kind=kind)
+        return out
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            scheduled: Dict[str, int] = {}
+            for _expires_at, kind, _item_id in self._heap:
+                scheduled[kind] = scheduled.get(kind, 0) + 1
+            next_due = self._heap[0][0] if self._heap else None
+            reclaimed = {kind: dict(values) for kind, values in self.reclaimed.items()}
+        return {
+            "scheduled": scheduled,
+            "next_due_ms": next_due,
+            "sweeps": self.sweeps,
+            "batches": self.batches,
+            "reclaimed": reclaimed,
+            "last_error": self.last_error,
+        }
 
-def _normalize_session_note_record(session: str, raw: Optional[Dict[str, Any]]) -> Dict[str, Any]:
-    session_id = _validate_session_name(session)
-    data = raw or {}
-    now_ms = _now_ms()
-    created_at = _coerce_ms(data.get("created_at"), now_ms)
-    updated_at = _coerce_ms(data.get("updated_at"), created_at)
-    if updated_at < created_at:
+    def start(self) -> None:
+        with self._lock:
+            if self._closed or (self._thread is not None and self._thread.is_alive()):
+                return
+            self._thread = threading.Thread(target=self._run, name="codrex-expiry-sweeper", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._closed:
+            next_due = self.next_due_ms()
+            wait_s = self.max_wait_s
+            if next_due is not None:
+                wait_s = min(wait_s, max(0.0, (next_due - self.clock()) / 1000.0))
+            if wait_s > 0:
+                self._wake.wait(wait_s)
+            self._wake.clear()
+            if self._closed:
+                return
+            try:
+                self.sweep()
+            except Exception as exc:
+                self.last_error = f"{type(exc).__name__}: {exc}"
+
+    def close(self) -> None:
+        self._closed = True
+        self._wake.set()
+
+
+def _managed_upload_bytes(path: str) -> int:
+    if os.path.isdir(path):
+        total = 0
+        for root, _dirs, files in os.walk(path):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return total
+    return os.path.getsize(path)
+
+
+def _reap_expired_shared_outbox(ids: Set[str], now_ms: int) -> Tuple[int, int, int]:
+    # Outbox items point at files the user registered or received; only the records go.
+    with SHARED_OUTBOX_LOCK:
+        _load_shared_outbox_unlocked()
+        items = SHARED_OUTBOX_DATA.get("items") or []
+        kept = [item for item in items if not (item.get("id") in ids and _share_expired(item, now_ms=now_ms))]
+        removed = len(items) - len(kept)
+        if removed:
+            SHARED_OUTBOX_DATA["items"] = kept
+            _persist_shared_outbox_unlocked()
+    return removed, 0, 0
+
+
+def _reap_expired_session_files(ids: Set[str], now_ms: int) -> Tuple[int, int, int]:
+    with SESSION_FILES_LOCK:
+        _load_session_files_unlocked()
+        items = SESSION_FILES_DATA.get("items") or []
+        kept: List[Dict[str, Any]] = []
+        expired: List[Dict[str, Any]] = []
+        for item in items:
+            if item.get("id") in ids and _share_expired(item, now_ms=now_ms):
+                expired.append(item)
+            else:
+                kept.append(item)
+        if expired:
+            SESSION_FILES_DATA["items"] = kept
+            _persist_session_files_unlocked()
+    files = 0
+    reclaimed_bytes = 0
+    for item in expired:
+        if not _session_file_is_managed_upload(item):
+            continue
+        unc = _wsl_unc_path(str(item.get("wsl_path") or ""))
+        try:
+            if not os.path.exists(unc):
+                continue
+            size = _managed_upload_bytes(unc)
+            if os.path.isdir(unc):
+                shutil.rmtree(unc)
+            else:
+                os.remove(unc)
+        except Exception:
+            continue
+        files += 1
+        reclaimed_bytes += size
+    return len(expired), files, reclaimed_bytes
+
+
+def _expiry_sweeper() -> _ExpirySweeper:
+    global EXPIRY_SWEEPER
+    with EXPIRY_SWEEPER_LOCK:
+        if EXPIRY_SWEEPER is None:
+            sweeper = _ExpirySweeper()
+            sweeper.register("shared_outbox", _reap_expired_shared_outbox)
+            sweeper.register("session_files", _reap_expired_session_files)
+            EXPIRY_SWEEPER = sweeper
+        sweeper = EXPIRY_SWEEPER
+    if _owns_host_singletons():
+        sweeper.start()
+    return sweeper
+
+
+@_host_agent_method("expiry.schedule")
+def _expiry_schedule(kind: str, item_id: str, expires_at: int) -> None:
+    _expiry_sweeper().schedule(kind, item_id, expires_at)
+
+
+def _compact_assistant_snapshot_text(text: str) -> str:
+    lines = [line.rstrip() for line in str(text or "").splitlines()]
+    lines = [line for line in lines if line.strip()]
+    if not lines:
+        return ""
+    tail = "\n".join(lines[-24:]).strip()
+    if len(tail) > SESSION_NOTES_MAX_SNAPSHOT_CHARS:
+        tail = tail[-SESSION_NOTES_MAX_SNAPSHOT_CHARS :]
+    return tail
+
+
+def _normalize_session_note_record(session: str, raw: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    session_id = _validate_session_name(session)
+    data = raw or {}
+    now_ms = _now_ms()
+    created_at = _coerce_ms(data.get("created_at"), now_ms)
+    updated_at = _coerce_ms(data.get("updated_at"), created_at)
+    if updated_at < created_at:
         updated_at = created_at
     content = str(data.get("content") or "")
     if len(content) > SESSION_NOTES_MAX_CHARS:
@@ -3149,102 +4622,691 @@ def _normalize_session_note_record(session: str, raw: Optional[Dict[str, Any]])
     }
 
 
-def _sort_and_trim_session_notes_unlocked() -> None:
-    cleaned: Dict[str, Dict[str, Any]] = {}
-    for key, value in (SESSION_NOTES_DATA.get("notes") or {}).items():
-        try:
-            session_id = _validate_session_name(key)
-        except Exception:
-            continue
-        cleaned[session_id] = _normalize_session_note_record(session_id, value if isinstance(value, dict) else {})
-    SESSION_NOTES_DATA["notes"] = cleaned
+def _session_notes_dir() -> str:
+    return os.path.splitext(SESSION_NOTES_FILE)[0] + ".d"
 
 
-def _persist_session_notes_unlocked() -> None:
-    _sort_and_trim_session_notes_unlocked()
-    parent = os.path.dirname(SESSION_NOTES_FILE)
-    if parent:
-        os.makedirs(parent, exist_ok=True)
-    payload = {"notes": SESSION_NOTES_DATA.get("notes") or {}}
-    temp_path = SESSION_NOTES_FILE + ".tmp"
-    with open(temp_path, "w", encoding="utf-8") as f:
-        json.dump(payload, f, ensure_ascii=False, indent=2)
-    os.replace(temp_path, SESSION_NOTES_FILE)
+def _session_notes_log_path(session_id: str) -> str:
+    return os.path.join(_session_notes_dir(), f"{session_id}.jsonl")
+
+
+def _session_note_segment(record: Dict[str, Any], offset: int, length: int) -> Dict[str, Any]:
+    text = str(record.get("text") or "")
+    return {
+        "seq": int(record.get("seq") or 0),
+        "at": _coerce_ms(record.get("at"), 0),
+        "offset": offset,
+        "length": length,
+        "sep": max(0, int(record.get("sep") or 0)),
+        "chars": len(text),
+        "tail_nl": min(2, len(text) - len(text.rstrip("\n"))),
+        "skip": 0,
+        "start": 0,
+    }
+
+
+def _session_note_reindex(entry: Dict[str, Any]) -> None:
+    start = 0
+    for index, segment in enumerate(entry["segments"]):
+        segment["start"] = start
+        start += segment["chars"] - (segment["skip"] if index == 0 else 0)
+    entry["chars"] = start
+    entry["live_bytes"] = sum(segment["length"] for segment in entry["segments"])
+
+
+def _scan_session_note_log(session_id: str, path: str) -> Optional[Dict[str, Any]]:
+    """
+    Rebuilds a session's index from its log. Each line is one JSON record:
+    `replace` starts the content over, `append` adds a segment whose text
+    starts with `sep` separator chars, and `trim` drops the segments before
+    `seq` plus the first `skip` chars of segment `seq`. A torn last line is
+    cut off.
+    """
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    entry: Dict[str, Any] = {
+        "session": session_id,
+        "path": path,
+        "segments": [],
+        "created_at": 0,
+        "updated_at": 0,
+        "last_response_snapshot": "",
+        "next_seq": 1,
+        "file_bytes": 0,
+    }
+    offset = 0
+    while offset < len(data):
+        end = data.find(b"\n", offset)
+        if end < 0:
+            break
+        line = data[offset:end + 1]
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        if isinstance(record, dict):
+            op = str(record.get("op") or "")
+            seq = int(record.get("seq") or 0)
+            at = _coerce_ms(record.get("at"), entry["updated_at"] or _now_ms())
+            if op == "replace":
+                entry["segments"] = [_session_note_segment(record, offset, len(line))]
+                entry["created_at"] = _coerce_ms(record.get("created_at"), entry["created_at"] or at)
+            elif op == "append":
+                entry["segments"].append(_session_note_segment(record, offset, len(line)))
+            elif op == "trim":
+                entry["segments"] = [segment for segment in entry["segments"] if segment["seq"] >= seq]
+                if entry["segments"]:
+                    entry["segments"][0]["skip"] = max(0, int(record.get("skip") or 0))
+            if "snapshot" in record:
+                entry["last_response_snapshot"] = str(record.get("snapshot") or "")
+            entry["created_at"] = entry["created_at"] or at
+            entry["updated_at"] = at
+            entry["next_seq"] = max(entry["next_seq"], seq + 1)
+        offset = end + 1
+    if offset < len(data):
+        with open(path, "r+b") as f:
+            f.truncate(offset)
+    entry["file_bytes"] = offset
+    _session_note_reindex(entry)
+    return entry
+
+
+@_instrumented("codrex_store_write_seconds", store="session_notes")
+def _append_session_note_records_unlocked(entry: Dict[str, Any], records: List[Dict[str, Any]]) -> List[Tuple[int, int]]:
+    blobs = [(json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8") for record in records]
+    os.makedirs(os.path.dirname(entry["path"]), exist_ok=True)
+    with open(entry["path"], "ab") as f:
+        f.seek(0, os.SEEK_END)
+        offset = f.tell()
+        f.write(b"".join(blobs))
+    placed = []
+    for blob in blobs:
+        placed.append((offset, len(blob)))
+        offset += len(blob)
+    entry["file_bytes"] = offset
+    return placed
+
+
+def _read_session_note_texts_unlocked(entry: Dict[str, Any], segments: List[Dict[str, Any]]) -> List[str]:
+    if not segments:
+        return []
+    first = segments[0]["offset"]
+    last = segments[-1]["offset"] + segments[-1]["length"]
+    with open(entry["path"], "rb") as f:
+        f.seek(first)
+        data = f.read(last - first)
+    head = entry["segments"][0] if entry["segments"] else None
+    texts = []
+    for segment in segments:
+        start = segment["offset"] - first
+        record = json.loads(data[start:start + segment["length"]])
+        text = str(record.get("text") or "")
+        texts.append(text[segment["skip"]:] if segment is head else text)
+    return texts
 
 
 def _load_session_notes_unlocked() -> None:
+    """
+    Notes live in one append-only log per session under session-notes.d/;
+    the index of segment boundaries is rebuilt per session on first use.
+    A legacy single-file store is split into logs once and renamed.
+    """
     global SESSION_NOTES_LOADED
     if SESSION_NOTES_LOADED:
         return
     SESSION_NOTES_LOADED = True
     SESSION_NOTES_DATA["notes"] = {}
     raw = _read_json_file(SESSION_NOTES_FILE)
-    if not isinstance(raw, dict):
+    notes = raw.get("notes") if isinstance(raw, dict) else None
+    if not isinstance(notes, dict):
         return
-    notes = raw.get("notes")
-    if isinstance(notes, dict):
-        SESSION_NOTES_DATA["notes"] = notes
-    _sort_and_trim_session_notes_unlocked()
+    for key, value in notes.items():
+        try:
+            session_id = _validate_session_name(key)
+        except Exception:
+            continue
+        if os.path.exists(_session_notes_log_path(session_id)):
+            continue
+        record = _normalize_session_note_record(session_id, value if isinstance(value, dict) else {})
+        entry = _new_session_note_entry(session_id)
+        _replace_session_note_unlocked(entry, record["content"], record["last_response_snapshot"], at=record["updated_at"], created_at=record["created_at"])
+    try:
+        os.replace(SESSION_NOTES_FILE, SESSION_NOTES_FILE + ".migrated")
+    except OSError:
+        pass
 
 
-def _get_session_note_unlocked(session: str) -> Dict[str, Any]:
-    session_id = _validate_session_name(session)
-    _sort_and_trim_session_notes_unlocked()
-    existing = (SESSION_NOTES_DATA.get("notes") or {}).get(session_id)
-    if isinstance(existing, dict):
-        return json.loads(json.dumps(existing))
-    now_ms = _now_ms()
+def _new_session_note_entry(session_id: str) -> Dict[str, Any]:
     return {
         "session": session_id,
-        "content": "",
-        "created_at": now_ms,
-        "updated_at": now_ms,
+        "path": _session_notes_log_path(session_id),
+        "segments": [],
+        "created_at": 0,
+        "updated_at": 0,
         "last_response_snapshot": "",
+        "next_seq": 1,
+        "file_bytes": 0,
+        "chars": 0,
+        "live_bytes": 0,
     }
 
 
-def _save_session_note_unlocked(session: str, content: str, last_response_snapshot: str = "") -> Dict[str, Any]:
-    session_id = _validate_session_name(session)
-    existing = _get_session_note_unlocked(session_id)
-    snapshot = _compact_assistant_snapshot_text(last_response_snapshot or existing.get("last_response_snapshot") or "")
+def _session_note_entry_unlocked(session_id: str, *, create: bool = False) -> Optional[Dict[str, Any]]:
+    notes = SESSION_NOTES_DATA.setdefault("notes", {})
+    entry = notes.get(session_id)
+    if entry is None:
+        entry = _scan_session_note_log(session_id, _session_notes_log_path(session_id))
+        if entry is None and create:
+            entry = _new_session_note_entry(session_id)
+        if entry is not None:
+            notes[session_id] = entry
+    return entry
+
+
+def _session_note_record(entry: Optional[Dict[str, Any]], session_id: str, content: str) -> Dict[str, Any]:
     now_ms = _now_ms()
-    record = {
+    return {
         "session": session_id,
-        "content": str(content or "")[:SESSION_NOTES_MAX_CHARS],
-        "created_at": existing.get("created_at") or now_ms,
-        "updated_at": now_ms,
-        "last_response_snapshot": snapshot,
+        "content": content,
+        "created_at": (entry or {}).get("created_at") or now_ms,
+        "updated_at": (entry or {}).get("updated_at") or now_ms,
+        "last_response_snapshot": (entry or {}).get("last_response_snapshot") or "",
+    }
+
+
+def _replace_session_note_unlocked(
+    entry: Dict[str, Any],
+    content: str,
+    snapshot: str,
+    *,
+    at: int,
+    created_at: int,
+) -> None:
+    record = {
+        "op": "replace",
+        "seq": entry["next_seq"],
+        "at": at,
+        "created_at": created_at,
+        "text": content,
+        "snapshot": snapshot,
+    }
+    placed = _append_session_note_records_unlocked(entry, [record])
+    entry["segments"] = [_session_note_segment(record, *placed[0])]
+    entry["next_seq"] += 1
+    entry["created_at"] = created_at
+    entry["updated_at"] = at
+    entry["last_response_snapshot"] = snapshot
+    _session_note_reindex(entry)
+    _schedule_session_note_compaction_unlocked(entry)
+
+
+def _trim_session_note_unlocked(entry: Dict[str, Any]) -> None:
+    """
+    Drops the oldest chars until the notes fit SESSION_NOTES_MAX_CHARS. Only a
+    small `trim` record is written; the dead bytes go at the next compaction.
+    """
+    excess = entry["chars"] - SESSION_NOTES_MAX_CHARS
+    if excess <= 0:
+        return
+    segments = entry["segments"]
+    while len(segments) > 1 and excess >= segments[0]["chars"] - segments[0]["skip"]:
+        excess -= segments[0]["chars"] - segments[0]["skip"]
+        segments.pop(0)
+        segments[0]["skip"] = segments[0]["sep"]
+        excess -= segments[0]["sep"]
+    if excess > 0:
+        segments[0]["skip"] += excess
+    head = segments[0]
+    _append_session_note_records_unlocked(
+        entry,
+        [{"op": "trim", "seq": head["seq"], "skip": head["skip"], "at": entry["updated_at"]}],
+    )
+    _session_note_reindex(entry)
+
+
+def _get_session_note_unlocked(session: str) -> Dict[str, Any]:
+    session_id = _validate_session_name(session)
+    entry = _session_note_entry_unlocked(session_id)
+    content = "".join(_read_session_note_texts_unlocked(entry, entry["segments"])) if entry else ""
+    return _session_note_record(entry, session_id, content)
+
+
+def _session_note_page_unlocked(session: str, *, offset: int = 0, limit: int = 0) -> Dict[str, Any]:
+    session_id = _validate_session_name(session)
+    entry = _session_note_entry_unlocked(session_id)
+    total = int((entry or {}).get("chars") or 0)
+    offset = min(max(0, int(offset or 0)), total)
+    limit = max(1, min(int(limit or 0) or SESSION_NOTES_MAX_CHARS, SESSION_NOTES_MAX_CHARS))
+    end = min(total, offset + limit)
+    content = ""
+    if entry and end > offset:
+        segments = entry["segments"]
+        starts = [segment["start"] for segment in segments]
+        first = bisect.bisect_right(starts, offset) - 1
+        last = bisect.bisect_left(starts, end)
+        window = segments[first:last]
+        text = "".join(_read_session_note_texts_unlocked(entry, window))
+        base = window[0]["start"]
+        content = text[offset - base:end - base]
+    note = _session_note_record(entry, session_id, content)
+    page = {
+        "offset": offset,
+        "limit": limit,
+        "total_chars": total,
+        "next_offset": end if end < total else None,
+    }
+    return {"notes": note, "page": page}
+
+
+def _session_note_entries_unlocked(session: str, *, cursor: str = "", limit: int = 0) -> Dict[str, Any]:
+    """
+    Segments after `cursor` (the last seq the client has). `reset` means the
+    client's copy is out of date (replaced or trimmed away) and the entries
+    start over from the first live segment.
+    """
+    session_id = _validate_session_name(session)
+    raw = str(cursor or "").strip()
+    try:
+        after = int(raw) if raw else 0
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid notes cursor.")
+    if after < 0:
+        raise HTTPException(status_code=400, detail="Invalid notes cursor.")
+    entry = _session_note_entry_unlocked(session_id)
+    segments = list((entry or {}).get("segments") or [])
+    page_size = max(1, min(int(limit or 0) or SESSION_NOTES_PAGE_MAX, SESSION_NOTES_PAGE_MAX))
+    reset = not segments or after < segments[0]["seq"]
+    pending = segments if reset else [segment for segment in segments if segment["seq"] > after]
+    window = pending[:page_size]
+    texts = _read_session_note_texts_unlocked(entry, window) if entry else []
+    entries = [
+        {"seq": segment["seq"], "at": segment["at"], "start": segment["start"], "text": text}
+        for segment, text in zip(window, texts)
+    ]
+    next_cursor = str(window[-1]["seq"]) if window else (str(segments[-1]["seq"]) if segments else "")
+    return {
+        "notes": _session_note_record(entry, session_id, ""),
+        "entries": entries,
+        "reset": bool(reset),
+        "total_chars": int((entry or {}).get("chars") or 0),
+        "next_cursor": next_cursor,
+        "has_more": len(pending) > len(window),
     }
-    SESSION_NOTES_DATA.setdefault("notes", {})[session_id] = record
-    _persist_session_notes_unlocked()
-    return json.loads(json.dumps(record))
+
+
+def _save_session_note_unlocked(session: str, content: str, last_response_snapshot: str = "") -> Dict[str, Any]:
+    session_id = _validate_session_name(session)
+    entry = _session_note_entry_unlocked(session_id, create=True)
+    snapshot = _compact_assistant_snapshot_text(last_response_snapshot or entry.get("last_response_snapshot") or "")
+    now_ms = _now_ms()
+    text = str(content or "")[:SESSION_NOTES_MAX_CHARS]
+    _replace_session_note_unlocked(entry, text, snapshot, at=now_ms, created_at=entry.get("created_at") or now_ms)
+    return _session_note_record(entry, session_id, text)
 
 
 def _append_session_note_snapshot_unlocked(session: str, snapshot: str) -> Dict[str, Any]:
+    """
+    Appends one segment to the session log; the cost does not depend on how
+    much is stored. Earlier segments are never rewritten, so the separator only
+    tops up the newlines the notes already end with. The returned record has
+    no content; read it back when it is needed.
+    """
     compact = _compact_assistant_snapshot_text(snapshot)
     if not compact:
         raise HTTPException(status_code=409, detail="No recent assistant response available to append.")
-    existing = _get_session_note_unlocked(session)
-    base = str(existing.get("content") or "").rstrip()
-    next_content = f"{base}\n\n{compact}" if base else compact
-    return _save_session_note_unlocked(session, next_content, compact)
+    session_id = _validate_session_name(session)
+    entry = _session_note_entry_unlocked(session_id, create=True)
+    if not entry["chars"]:
+        _save_session_note_unlocked(session_id, compact, compact)
+        return _session_note_record(entry, session_id, "")
+    separator = "\n\n"[:2 - entry["segments"][-1]["tail_nl"]]
+    now_ms = _now_ms()
+    record = {"op": "append", "seq": entry["next_seq"], "at": now_ms, "sep": len(separator), "text": separator + compact, "snapshot": compact}
+    placed = _append_session_note_records_unlocked(entry, [record])
+    entry["segments"].append(_session_note_segment(record, *placed[0]))
+    entry["next_seq"] += 1
+    entry["updated_at"] = now_ms
+    entry["last_response_snapshot"] = compact
+    _session_note_reindex(entry)
+    _trim_session_note_unlocked(entry)
+    _schedule_session_note_compaction_unlocked(entry)
+    return _session_note_record(entry, session_id, "")
+
+
+def _compact_session_note_unlocked(entry: Dict[str, Any]) -> int:
+    """Rewrites a session log with only its live segments; returns the bytes reclaimed."""
+    segments = entry["segments"]
+    texts = _read_session_note_texts_unlocked(entry, segments)
+    records: List[Dict[str, Any]] = []
+    for index, (segment, text) in enumerate(zip(segments, texts)):
+        if index == 0:
+            record = {"op": "replace", "seq": segment["seq"], "at": segment["at"], "created_at": entry["created_at"], "text": text}
+        else:
+            record = {"op": "append", "seq": segment["seq"], "at": segment["at"], "sep": segment["sep"], "text": text}
+        records.append(record)
+    if not records:
+        records.append({"op": "replace", "seq": entry["next_seq"] - 1, "at": entry["updated_at"], "created_at": entry["created_at"], "text": ""})
+    records[-1]["snapshot"] = entry["last_response_snapshot"]
+    blobs = [(json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8") for record in records]
+    before = entry["file_bytes"]
+    temp_path = entry["path"] + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(b"".join(blobs))
+    os.replace(temp_path, entry["path"])
+    offset = 0
+    rebuilt = []
+    for record, blob in zip(records, blobs):
+        rebuilt.append(_session_note_segment(record, offset, len(blob)))
+        offset += len(blob)
+    entry["segments"] = rebuilt if segments else []
+    entry["file_bytes"] = offset
+    _session_note_reindex(entry)
+    METRICS.inc("codrex_session_notes_compactions_total")
+    return max(0, before - offset)
+
+
+def _schedule_session_note_compaction_unlocked(entry: Dict[str, Any]) -> None:
+    global SESSION_NOTES_COMPACTOR
+    dead_bytes = entry["file_bytes"] - entry["live_bytes"]
+    if dead_bytes <= max(SESSION_NOTES_COMPACT_MIN_BYTES, entry["live_bytes"]):
+        return
+    SESSION_NOTES_COMPACT_PENDING.add(entry["session"])
+    if SESSION_NOTES_COMPACTOR is None:
+        SESSION_NOTES_COMPACTOR = threading.Thread(target=_session_notes_compactor, name="codrex-notes-compact", daemon=True)
+        SESSION_NOTES_COMPACTOR.start()
+    SESSION_NOTES_COMPACT_WAKE.set()
+
+
+def _session_notes_compactor() -> None:
+    while True:
+        SESSION_NOTES_COMPACT_WAKE.wait()
+        SESSION_NOTES_COMPACT_WAKE.clear()
+        while True:
+            with SESSION_NOTES_LOCK:
+                if not SESSION_NOTES_COMPACT_PENDING:
+                    break
+                session_id = SESSION_NOTES_COMPACT_PENDING.pop()
+                entry = (SESSION_NOTES_DATA.get("notes") or {}).get(session_id)
+                if entry is None:
+                    continue
+                try:
+                    _compact_session_note_unlocked(entry)
+                except Exception as e:
+                    print(f"Session notes compaction failed session={session_id} error={type(e).__name__}: {e}", flush=True)
+
+
+class _TelegramBotClient:
+    """
+    Shared Bot API client: keeps a small pool of HTTP/1.1 keep-alive connections to the API host
+    (so each call skips the TCP/TLS handshake) and paces outbound sends per chat and per bot.
+    `api_base` may be a plain http:// URL, which lets tests point the client at a local stub.
+    The proxy comes from the environment the way urllib resolves it (HTTPS_PROXY, NO_PROXY, ...);
+    https goes through a CONNECT tunnel.
+    """
+
+    def __init__(
+        self,
+        api_base: str,
+        token: str,
+        *,
+        timeout_s: float = TELEGRAM_TIMEOUT_SECONDS,
+        pool_size: int = TELEGRAM_HTTP_POOL_SIZE,
+        global_rate_per_s: float = TELEGRAM_RATE_GLOBAL_PER_S,
+        chat_interval_s: float = TELEGRAM_RATE_CHAT_INTERVAL_S,
+        group_interval_s: float = TELEGRAM_RATE_GROUP_INTERVAL_S,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        parsed = urlparse(str(api_base or "").strip() or "https://api.telegram.org")
+        self.api_base = str(api_base or "")
+        self.token = str(token or "")
+        self.scheme = (parsed.scheme or "https").lower()
+        self.host = parsed.hostname or "api.telegram.org"
+        self.port = parsed.port
+        self.path_prefix = (parsed.path or "").rstrip("/")
+        self.proxy = _telegram_proxy_for(self.scheme, self.host)
+        self.timeout_s = max(1.0, float(timeout_s or TELEGRAM_TIMEOUT_SECONDS))
+        self.pool_size = max(1, int(pool_size or 1))
+        self.global_interval_s = 1.0 / max(1.0, float(global_rate_per_s or 1.0))
+        self.chat_interval_s = max(0.0, float(chat_interval_s))
+        self.group_interval_s = max(0.0, float(group_interval_s))
+        self._clock = clock
+        self._sleep = sleep
+        self._pool_lock = threading.Lock()
+        self._idle: List[http.client.HTTPConnection] = []
+        self._rate_lock = threading.Lock()
+        self._next_global_at = 0.0
+        self._next_chat_at: Dict[str, float] = {}
+        # Updated under _pool_lock.
+        self.stats: Dict[str, int] = {"requests": 0, "connections_opened": 0, "connections_reused": 0}
+
+    def _new_connection(self, timeout_s: float) -> http.client.HTTPConnection:
+        # Called with _pool_lock held.
+        conn_cls = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+        self.stats["connections_opened"] += 1
+        if self.proxy is None:
+            return conn_cls(self.host, self.port, timeout=timeout_s)
+        conn = conn_cls(self.proxy["host"], self.proxy["port"], timeout=timeout_s)
+        if self.scheme == "https":
+            conn.set_tunnel(self.host, self.port, headers=self.proxy["headers"])
+        return conn
+
+    def _acquire(self, timeout_s: float) -> Tuple[http.client.HTTPConnection, bool]:
+        with self._pool_lock:
+            if self._idle:
+                conn = self._idle.pop()
+                self.stats["connections_reused"] += 1
+                conn.timeout = timeout_s
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout_s)
+                return conn, True
+            return self._new_connection(timeout_s), False
+
+    def _release(self, conn: http.client.HTTPConnection) -> None:
+        with self._pool_lock:
+            if len(self._idle) < self.pool_size:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def close(self) -> None:
+        with self._pool_lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def _chat_interval(self, chat_id: str) -> float:
+        return self.group_interval_s if str(chat_id).startswith("-") else self.chat_interval_s
+
+    def reserve_send_slot(self, chat_id: str) -> float:
+        """Reserve the next send slot for `chat_id` and return how long the caller must wait for it."""
+        with self._rate_lock:
+            now = self._clock()
+            global_start = max(now, self._next_global_at)
+            start = max(global_start, self._next_chat_at.get(chat_id, 0.0))
+            self._next_global_at = global_start + self.global_interval_s
+            self._next_chat_at[chat_id] = start + self._chat_interval(chat_id)
+            return max(0.0, start - now)
+
+    def penalize_chat(self, chat_id: str, retry_after_s: float) -> None:
+        with self._rate_lock:
+            resume_at = self._clock() + max(0.0, float(retry_after_s or 0.0))
+            self._next_chat_at[chat_id] = max(self._next_chat_at.get(chat_id, 0.0), resume_at)
+
+    def call(
+        self,
+        api_method: str,
+        *,
+        method: str = "POST",
+        query: Optional[Dict[str, Any]] = None,
+        body: Any = None,
+        content_type: str = "",
+        chat_id: str = "",
+        timeout_s: Optional[float] = None,
+    ) -> Tuple[int, str]:
+        """
+        Perform one Bot API call and return `(http_status, raw_body)`. Network failures raise.
+        When `chat_id` is set the call is paced by the per-chat and per-bot send limits.
+        """
+        if chat_id:
+            wait_s = self.reserve_send_slot(str(chat_id))
+            if wait_s > 0:
+                self._sleep(wait_s)
+        path = f"{self.path_prefix}/bot{self.token}/{api_method}"
+        if query:
+            path = f"{path}?{'&'.join(f'{k}={quote(str(v), safe=str())}' for k, v in query.items())}"
+        headers = {"Accept": "application/json", "Connection": "keep-alive"}
+        if self.proxy is not None and self.scheme == "http":
+            # A plain-http proxy takes the absolute URL instead of a tunnel.
+            netloc = self.host if self.port is None else f"{self.host}:{self.port}"
+            path = f"http://{netloc}{path}"
+            headers.update(self.proxy["headers"])
+        if body is not None:
+            headers["Content-Type"] = content_type or "application/json"
+            headers["Content-Length"] = str(len(body))
+        effective_timeout = max(1.0, float(timeout_s or self.timeout_s))
+        with self._pool_lock:
+            self.stats["requests"] += 1
+        with METRICS.time("codrex_telegram_call_seconds", method=api_method) as timer:
+            for attempt in range(2):
+                conn, reused = self._acquire(effective_timeout)
+                try:
+                    conn.request(method, path, body=body, headers=headers)
+                except (BrokenPipeError, http.client.CannotSendRequest):
+                    conn.close()
+                    # A pooled keep-alive socket the server already closed, found before
+                    # the request went out: retry once on a fresh one.
+                    if reused and attempt == 0:
+                        continue
+                    raise
+                except Exception:
+                    conn.close()
+                    raise
+                try:
+                    resp = conn.getresponse()
+                    raw = resp.read().decode("utf-8", errors="replace")
+                    status_code = int(resp.status or 0)
+                except (http.client.RemoteDisconnected, ConnectionResetError):
+                    conn.close()
+                    # The request may already have been acted on, so only a GET is repeated;
+                    # a second sendMessage/sendDocument could post twice.
+                    if reused and attempt == 0 and method == "GET":
+                        continue
+                    raise
+                except Exception:
+                    conn.close()
+                    raise
+                if resp.will_close:
+                    conn.close()
+                else:
+                    self._release(conn)
+                if status_code == 429 and chat_id:
+                    try:
+                        parsed = json.loads(raw) if raw else {}
+                        retry_after = float(((parsed or {}).get("parameters") or {}).get("retry_after") or 0)
+                    except Exception:
+                        retry_after = 0.0
+                    if retry_after > 0:
+                        self.penalize_chat(str(chat_id), retry_after)
+                timer.outcome = "ok" if status_code == 200 else f"http_{status_code}"
+                return status_code, raw
+            raise http.client.RemoteDisconnected("Telegram connection closed")
+
+
+def _telegram_proxy_for(scheme: str, host: str) -> Optional[Dict[str, Any]]:
+    proxy_url = str(urllib.request.getproxies().get(scheme) or "").strip()
+    if not proxy_url or urllib.request.proxy_bypass(host):
+        return None
+    parsed = urlparse(proxy_url if "://" in proxy_url else f"http://{proxy_url}")
+    if not parsed.hostname:
+        return None
+    headers: Dict[str, str] = {}
+    if parsed.username:
+        credentials = f"{unquote(parsed.username)}:{unquote(parsed.password or '')}"
+        headers["Proxy-Authorization"] = "Basic " + base64.b64encode(credentials.encode("utf-8")).decode("ascii")
+    return {"host": parsed.hostname, "port": parsed.port or 80, "headers": headers}
+
+
+def _telegram_client() -> "_TelegramBotClient":
+    global TELEGRAM_CLIENT
+    token = str(TELEGRAM_BOT_TOKEN or "").strip()
+    api_base = TELEGRAM_API_BASE.rstrip("/")
+    with TELEGRAM_CLIENT_LOCK:
+        client = TELEGRAM_CLIENT
+        if client is None or client.token != token or client.api_base != api_base:
+            if client is not None:
+                client.close()
+            client = _TelegramBotClient(api_base, token)
+            TELEGRAM_CLIENT = client
+        return client
+
+
+def _telegram_api_result(status_code: int, raw_body: str, rejected_detail: str) -> Dict[str, Any]:
+    try:
+        parsed = json.loads(raw_body) if raw_body else {}
+    except Exception:
+        parsed = {}
+
+    if status_code != 200:
+        detail = ""
+        retry_after = 0
+        if isinstance(parsed, dict):
+            detail = str(parsed.get("description") or "").strip()
+            parameters = parsed.get("parameters") if isinstance(parsed.get("parameters"), dict) else {}
+            retry_after = int(parameters.get("retry_after") or 0)
+        if not detail:
+            detail = f"Telegram API returned HTTP {status_code}."
+        out: Dict[str, Any] = {"ok": False, "error": "telegram_http_error", "detail": detail, "status_code": status_code}
+        if retry_after > 0:
+            out["retry_after"] = retry_after
+        return out
+
+    if not isinstance(parsed, dict) or not parsed.get("ok"):
+        detail = rejected_detail
+        if isinstance(parsed, dict):
+            detail = str(parsed.get("description") or detail)
+        return {"ok": False, "error": "telegram_api_error", "detail": detail, "status_code": status_code}
+
+    result = parsed.get("result")
+    return {"ok": True, "result": result if isinstance(result, dict) else {}}
 
 
-def _telegram_get_updates(token: str, offset: Optional[int] = None, limit: int = 20) -> Dict[str, Any]:
-    query_parts = [f"limit={max(1, min(int(limit or 20), 100))}"]
+def _telegram_get_updates(
+    token: str,
+    offset: Optional[int] = None,
+    limit: int = 20,
+    long_poll_s: int = 0,
+) -> Dict[str, Any]:
+    query: Dict[str, Any] = {"limit": max(1, min(int(limit or 20), 100))}
     if offset is not None:
         try:
-            query_parts.append(f"offset={int(offset)}")
+            query["offset"] = int(offset)
         except Exception:
             pass
-    endpoint = f"{TELEGRAM_API_BASE.rstrip('/')}/bot{token}/getUpdates?{'&'.join(query_parts)}"
-    req = urllib.request.Request(
-        endpoint,
-        method="GET",
-        headers={"Accept": "application/json"},
-    )
-    with urllib.request.urlopen(req, timeout=max(5.0, TELEGRAM_TIMEOUT_SECONDS)) as resp:
-        raw = resp.read().decode("utf-8", errors="replace")
+    long_poll_s = max(0, int(long_poll_s or 0))
+    if long_poll_s > 0:
+        query["timeout"] = long_poll_s
+    client = _telegram_client()
+    # A token other than the configured one (setup probes) gets a one-off client.
+    one_off = client.token != token
+    if one_off:
+        client = _TelegramBotClient(TELEGRAM_API_BASE.rstrip("/"), token)
+    try:
+        _status_code, raw = client.call(
+            "getUpdates",
+            method="GET",
+            query=query,
+            timeout_s=max(5.0, TELEGRAM_TIMEOUT_SECONDS) + long_poll_s,
+        )
+    finally:
+        if one_off:
+            client.close()
     try:
         parsed = json.loads(raw) if raw else {}
     except Exception:
@@ -3440,39 +5502,72 @@ def _choose_effective_mime_type(claimed_mime: str, detected_mime: str) -> str:
     return detected
 
 
-def _build_multipart_form_data(
-    fields: Dict[str, str],
-    *,
-    file_field: str,
-    file_name: str,
-    content_type: str,
-    file_bytes: bytes,
-) -> Tuple[bytes, str]:
-    boundary = f"----codrex{uuid.uuid4().hex}"
-    chunks: List[bytes] = []
-    for k, v in fields.items():
-        chunks.append(f"--{boundary}\r\n".encode("utf-8"))
-        chunks.append(f'Content-Disposition: form-data; name="{k}"\r\n\r\n'.encode("utf-8"))
-        chunks.append(str(v).encode("utf-8"))
-        chunks.append(b"\r\n")
-
-    safe_name = (file_name or "upload.bin").replace('"', "_")
-    mime = (content_type or "application/octet-stream").strip() or "application/octet-stream"
-    chunks.append(f"--{boundary}\r\n".encode("utf-8"))
-    chunks.append(
-        (
-            f'Content-Disposition: form-data; name="{file_field}"; filename="{safe_name}"\r\n'
-            f"Content-Type: {mime}\r\n\r\n"
-        ).encode("utf-8")
-    )
-    chunks.append(file_bytes)
-    chunks.append(b"\r\n")
-    chunks.append(f"--{boundary}--\r\n".encode("utf-8"))
-    body = b"".join(chunks)
-    return body, f"multipart/form-data; boundary={boundary}"
+class _MultipartFileBody:
+    """
+    Re-iterable multipart/form-data body that streams the file part from disk in chunks.
+    The total length is computed up front so urllib can send a plain Content-Length request
+    without ever holding the whole document in memory. Each iteration reopens the file, so
+    the same body can be replayed on retry.
+    """
 
+    def __init__(
+        self,
+        fields: Dict[str, str],
+        *,
+        file_field: str,
+        file_name: str,
+        content_type: str,
+        file_path: str,
+        chunk_size: int = TELEGRAM_UPLOAD_CHUNK_BYTES,
+    ) -> None:
+        self.boundary = f"----codrex{uuid.uuid4().hex}"
+        self.file_path = file_path
+        self.chunk_size = max(1024, int(chunk_size or TELEGRAM_UPLOAD_CHUNK_BYTES))
+        head: List[bytes] = []
+        for k, v in fields.items():
+            head.append(f"--{self.boundary}\r\n".encode("utf-8"))
+            head.append(f'Content-Disposition: form-data; name="{k}"\r\n\r\n'.encode("utf-8"))
+            head.append(str(v).encode("utf-8"))
+            head.append(b"\r\n")
+        safe_name = (file_name or "upload.bin").replace('"', "_")
+        mime = (content_type or "application/octet-stream").strip() or "application/octet-stream"
+        head.append(f"--{self.boundary}\r\n".encode("utf-8"))
+        head.append(
+            (
+                f'Content-Disposition: form-data; name="{file_field}"; filename="{safe_name}"\r\n'
+                f"Content-Type: {mime}\r\n\r\n"
+            ).encode("utf-8")
+        )
+        self.head = b"".join(head)
+        self.tail = f"\r\n--{self.boundary}--\r\n".encode("utf-8")
+        self.file_size = int(os.path.getsize(file_path))
+        self.content_length = len(self.head) + self.file_size + len(self.tail)
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self) -> int:
+        return self.content_length
+
+    def __iter__(self) -> Iterator[bytes]:
+        yield self.head
+        remaining = self.file_size
+        with open(self.file_path, "rb") as f:
+            while remaining > 0:
+                chunk = f.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+        if remaining > 0:
+            raise IOError(f"File shrank while uploading ({remaining} bytes missing).")
+        yield self.tail
 
-def _telegram_send_shared_item(item: Dict[str, Any], caption_override: str = "") -> Dict[str, Any]:
+
+def _telegram_check_shared_item(item: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    The checks that need no upload: token, chat id, and a readable file under
+    the size limit. Returns the error payload, or ok with chat_id, wsl_abs,
+    unc, size_bytes and the first 512 bytes (head_sample).
+    """
     token = str(TELEGRAM_BOT_TOKEN or "").strip()
     if not token:
         return {
@@ -3513,16 +5608,28 @@ def _telegram_send_shared_item(item: Dict[str, Any], caption_override: str = "")
             "max_bytes": max_bytes,
         }
 
-    file_name_raw = str(item.get("file_name") or os.path.basename(wsl_abs.rstrip("/")) or "shared.bin")
-    claimed_mime = str(item.get("mime_type") or mimetypes.guess_type(file_name_raw)[0] or "application/octet-stream")
-
     try:
         with open(unc, "rb") as f:
-            file_bytes = f.read()
+            head_sample = f.read(512)
     except Exception as e:
         return {"ok": False, "error": "telegram_read_failed", "detail": f"Could not read file: {type(e).__name__}: {e}"}
+    return {"ok": True, "chat_id": chat_id, "wsl_abs": wsl_abs, "unc": unc, "size_bytes": size_bytes, "head_sample": head_sample}
+
+
+def _telegram_send_shared_item(item: Dict[str, Any], caption_override: str = "") -> Dict[str, Any]:
+    checked = _telegram_check_shared_item(item)
+    if not checked.get("ok"):
+        return checked
+    chat_id = checked["chat_id"]
+    wsl_abs = checked["wsl_abs"]
+    unc = checked["unc"]
+    size_bytes = checked["size_bytes"]
+    head_sample = checked["head_sample"]
+
+    file_name_raw = str(item.get("file_name") or os.path.basename(wsl_abs.rstrip("/")) or "shared.bin")
+    claimed_mime = str(item.get("mime_type") or mimetypes.guess_type(file_name_raw)[0] or "application/octet-stream")
 
-    detected_mime = _detect_mime_from_bytes(file_bytes[:512])
+    detected_mime = _detect_mime_from_bytes(head_sample)
     effective_mime = _choose_effective_mime_type(claimed_mime, detected_mime)
     effective_file_name = file_name_raw
     preferred_ext = _mime_preferred_extension(effective_mime)
@@ -3532,75 +5639,45 @@ def _telegram_send_shared_item(item: Dict[str, Any], caption_override: str = "")
             effective_file_name = f"{stem or file_name_raw}{preferred_ext}"
     caption = _normalize_telegram_caption(caption_override or item.get("title") or effective_file_name)
 
-    payload, content_type = _build_multipart_form_data(
-        {
-            "chat_id": chat_id,
-            **({"caption": caption} if caption else {}),
-        },
-        file_field="document",
-        file_name=effective_file_name,
-        content_type=effective_mime,
-        file_bytes=file_bytes,
-    )
-
-    endpoint = f"{TELEGRAM_API_BASE.rstrip('/')}/bot{token}/sendDocument"
-    req = urllib.request.Request(
-        endpoint,
-        data=payload,
-        method="POST",
-        headers={
-            "Content-Type": content_type,
-            "Accept": "application/json",
-        },
-    )
+    try:
+        body = _MultipartFileBody(
+            {
+                "chat_id": chat_id,
+                **({"caption": caption} if caption else {}),
+            },
+            file_field="document",
+            file_name=effective_file_name,
+            content_type=effective_mime,
+            file_path=unc,
+        )
+    except Exception as e:
+        return {"ok": False, "error": "telegram_read_failed", "detail": f"Could not read file: {type(e).__name__}: {e}"}
 
-    status_code = 0
-    raw_body = ""
     try:
-        with urllib.request.urlopen(req, timeout=max(5.0, TELEGRAM_TIMEOUT_SECONDS)) as resp:
-            status_code = int(getattr(resp, "status", 200) or 200)
-            raw_body = resp.read().decode("utf-8", errors="replace")
-    except urllib.error.HTTPError as e:
-        status_code = int(getattr(e, "code", 0) or 0)
-        try:
-            raw_body = e.read().decode("utf-8", errors="replace")
-        except Exception:
-            raw_body = str(e)
+        status_code, raw_body = _telegram_client().call(
+            "sendDocument",
+            body=body,
+            content_type=body.content_type,
+            chat_id=chat_id,
+            timeout_s=max(5.0, TELEGRAM_TIMEOUT_SECONDS),
+        )
     except Exception as e:
         return {"ok": False, "error": "telegram_request_failed", "detail": f"Telegram request failed: {type(e).__name__}: {e}"}
 
-    try:
-        parsed = json.loads(raw_body) if raw_body else {}
-    except Exception:
-        parsed = {}
-
-    if status_code != 200:
-        detail = ""
-        if isinstance(parsed, dict):
-            detail = str(parsed.get("description") or "").strip()
-        if not detail:
-            detail = f"Telegram API returned HTTP {status_code}."
-        return {"ok": False, "error": "telegram_http_error", "detail": detail, "status_code": status_code}
-
-    if not isinstance(parsed, dict) or not parsed.get("ok"):
-        detail = "Telegram API did not accept the file."
-        if isinstance(parsed, dict):
-            detail = str(parsed.get("description") or detail)
-        return {"ok": False, "error": "telegram_api_error", "detail": detail, "status_code": status_code}
-
-    result = parsed.get("result") if isinstance(parsed, dict) else {}
-    if not isinstance(result, dict):
-        result = {}
-    return {
-        "ok": True,
-        "chat_id": chat_id,
-        "message_id": result.get("message_id"),
-        "file_name": effective_file_name,
-        "claimed_mime_type": claimed_mime,
-        "mime_type": effective_mime,
-        "mime_corrected": bool(effective_mime and effective_mime != claimed_mime),
-        "size_bytes": size_bytes,
-    }
+    api_result = _telegram_api_result(status_code, raw_body, "Telegram API did not accept the file.")
+    if not api_result.get("ok"):
+        return api_result
+    result = api_result["result"]
+    return {
+        "ok": True,
+        "chat_id": chat_id,
+        "message_id": result.get("message_id"),
+        "file_name": effective_file_name,
+        "claimed_mime_type": claimed_mime,
+        "mime_type": effective_mime,
+        "mime_corrected": bool(effective_mime and effective_mime != claimed_mime),
+        "size_bytes": size_bytes,
+    }
 
 
 def _telegram_send_text(text: str) -> Dict[str, Any]:
@@ -3622,58 +5699,25 @@ def _telegram_send_text(text: str) -> Dict[str, Any]:
     message = str(text or "").strip()
     if not message:
         return {"ok": False, "error": "telegram_empty_message", "detail": "Text is required."}
-    if len(message) > 4096:
+    if len(message) > TELEGRAM_MESSAGE_MAX_CHARS:
         return {"ok": False, "error": "telegram_message_too_long", "detail": "Text is too long for Telegram (max 4096 characters)."}
 
-    endpoint = f"{TELEGRAM_API_BASE.rstrip('/')}/bot{token}/sendMessage"
     payload = json.dumps({"chat_id": chat_id, "text": message}, ensure_ascii=False).encode("utf-8")
-    req = urllib.request.Request(
-        endpoint,
-        data=payload,
-        method="POST",
-        headers={
-            "Content-Type": "application/json",
-            "Accept": "application/json",
-        },
-    )
-
-    status_code = 0
-    raw_body = ""
     try:
-        with urllib.request.urlopen(req, timeout=max(5.0, TELEGRAM_TIMEOUT_SECONDS)) as resp:
-            status_code = int(getattr(resp, "status", 200) or 200)
-            raw_body = resp.read().decode("utf-8", errors="replace")
-    except urllib.error.HTTPError as e:
-        status_code = int(getattr(e, "code", 0) or 0)
-        try:
-            raw_body = e.read().decode("utf-8", errors="replace")
-        except Exception:
-            raw_body = str(e)
+        status_code, raw_body = _telegram_client().call(
+            "sendMessage",
+            body=payload,
+            content_type="application/json",
+            chat_id=chat_id,
+            timeout_s=max(5.0, TELEGRAM_TIMEOUT_SECONDS),
+        )
     except Exception as e:
         return {"ok": False, "error": "telegram_request_failed", "detail": f"Telegram request failed: {type(e).__name__}: {e}"}
 
-    try:
-        parsed = json.loads(raw_body) if raw_body else {}
-    except Exception:
-        parsed = {}
-
-    if status_code != 200:
-        detail = ""
-        if isinstance(parsed, dict):
-            detail = str(parsed.get("description") or "").strip()
-        if not detail:
-            detail = f"Telegram API returned HTTP {status_code}."
-        return {"ok": False, "error": "telegram_http_error", "detail": detail, "status_code": status_code}
-
-    if not isinstance(parsed, dict) or not parsed.get("ok"):
-        detail = "Telegram API did not accept the message."
-        if isinstance(parsed, dict):
-            detail = str(parsed.get("description") or detail)
-        return {"ok": False, "error": "telegram_api_error", "detail": detail, "status_code": status_code}
-
-    result = parsed.get("result") if isinstance(parsed, dict) else {}
-    if not isinstance(result, dict):
-        result = {}
+    api_result = _telegram_api_result(status_code, raw_body, "Telegram API did not accept the message.")
+    if not api_result.get("ok"):
+        return api_result
+    result = api_result["result"]
     return {
         "ok": True,
         "chat_id": chat_id,
@@ -3682,6 +5726,253 @@ def _telegram_send_text(text: str) -> Dict[str, Any]:
     }
 
 
+def _telegram_coalesce_texts(texts: List[str], max_chars: int = TELEGRAM_MESSAGE_MAX_CHARS) -> List[str]:
+    """Merge consecutive messages into as few Telegram messages as fit under `max_chars`."""
+    merged: List[str] = []
+    for raw in texts:
+        text = str(raw or "").strip()
+        if not text:
+            continue
+        if merged and len(merged[-1]) + 2 + len(text) <= max_chars:
+            merged[-1] = f"{merged[-1]}\n\n{text}"
+        else:
+            merged.append(text)
+    return merged
+
+
+def _telegram_send_text_batch(texts: List[str]) -> Dict[str, Any]:
+    messages = _telegram_coalesce_texts(texts)
+    results: List[Dict[str, Any]] = []
+    for message in messages:
+        result = _telegram_send_text(message)
+        results.append(result)
+        if not result.get("ok"):
+            return {"ok": False, "sent": len(results) - 1, "results": results, "detail": result.get("detail") or result.get("error")}
+    return {"ok": True, "sent": len(results), "results": results}
+
+
+@_host_agent_method("telegram.queue_text")
+def _telegram_queue_text(text: str) -> None:
+    """Fire-and-forget send: queue the message so bursts of replies are coalesced and paced."""
+    message = str(text or "").strip()
+    if not message:
+        return
+    with TELEGRAM_OUTBOX_COND:
+        TELEGRAM_OUTBOX.append(message)
+        TELEGRAM_OUTBOX_COND.notify()
+    _ensure_telegram_outbox_worker()
+
+
+def _telegram_flush_outbox_once(wait_s: float = 0.0) -> Dict[str, Any]:
+    with TELEGRAM_OUTBOX_COND:
+        if not TELEGRAM_OUTBOX and wait_s > 0:
+            TELEGRAM_OUTBOX_COND.wait(timeout=wait_s)
+        pending = list(TELEGRAM_OUTBOX)
+        TELEGRAM_OUTBOX.clear()
+    if not pending:
+        return {"ok": True, "sent": 0, "results": []}
+    return _telegram_send_text_batch(pending)
+
+
+def _telegram_outbox_worker() -> None:
+    while True:
+        try:
+            result = _telegram_flush_outbox_once(wait_s=30.0)
+            if not result.get("ok"):
+                LOGGER.warning("Telegram outbox send failed: %s", result.get("detail"))
+        except Exception:
+            LOGGER.exception("Telegram outbox worker failed")
+            time.sleep(1.0)
+
+
+def _ensure_telegram_outbox_worker() -> None:
+    global TELEGRAM_OUTBOX_WORKER_THREAD
+    with TELEGRAM_OUTBOX_COND:
+        existing = TELEGRAM_OUTBOX_WORKER_THREAD
+        if existing and existing.is_alive():
+            return
+        worker = threading.Thread(
+            target=_telegram_outbox_worker,
+            name="codrex-telegram-outbox",
+            daemon=True,
+        )
+        TELEGRAM_OUTBOX_WORKER_THREAD = worker
+    worker.start()
+
+
+def _telegram_send_result_retryable(result: Dict[str, Any]) -> bool:
+    error = str(result.get("error") or "")
+    if error == "telegram_request_failed":
+        return True
+    if error == "telegram_http_error":
+        status_code = int(result.get("status_code") or 0)
+        return status_code == 429 or status_code >= 500
+    return False
+
+
+def _telegram_send_backoff_s(attempt: int, result: Dict[str, Any]) -> float:
+    retry_after = float(result.get("retry_after") or 0)
+    if retry_after > 0:
+        return min(TELEGRAM_SEND_BACKOFF_MAX_S, retry_after)
+    delay = TELEGRAM_SEND_BACKOFF_BASE_S * (2 ** max(0, attempt - 1))
+    return min(TELEGRAM_SEND_BACKOFF_MAX_S, delay * (0.75 + secrets.randbelow(500) / 1000.0))
+
+
+def _public_telegram_send_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    out = {
+        "job_id": str(job.get("id") or ""),
+        "status": str(job.get("status") or ""),
+        "queued": str(job.get("status") or "") in {"queued", "retrying"},
+        "attempts": int(job.get("attempts") or 0),
+        "created_at": int(job.get("created_at") or 0),
+        "updated_at": int(job.get("updated_at") or 0),
+        "file_name": str((job.get("item") or {}).get("file_name") or ""),
+        "result": job.get("result"),
+    }
+    if out["queued"]:
+        out["queue_position"] = _telegram_send_queue_position_unlocked(out["job_id"])
+    return out
+
+
+def _telegram_send_queue_position_unlocked(job_id: str) -> int:
+    position = 0
+    for existing_id in TELEGRAM_SEND_JOBS_ORDER:
+        job = TELEGRAM_SEND_JOBS.get(existing_id) or {}
+        if str(job.get("status") or "") not in {"queued", "retrying", "sending"}:
+            continue
+        position += 1
+        if existing_id == job_id:
+            return position
+    return 0
+
+
+def _trim_telegram_send_jobs_unlocked() -> None:
+    while len(TELEGRAM_SEND_JOBS_ORDER) > TELEGRAM_SEND_JOBS_KEEP:
+        for idx, job_id in enumerate(TELEGRAM_SEND_JOBS_ORDER):
+            if str((TELEGRAM_SEND_JOBS.get(job_id) or {}).get("status") or "") in {"sent", "failed"}:
+                TELEGRAM_SEND_JOBS_ORDER.pop(idx)
+                TELEGRAM_SEND_JOBS.pop(job_id, None)
+                break
+        else:
+            return
+
+
+@_host_agent_method("telegram.enqueue_shared")
+def _telegram_enqueue_shared_item(item: Dict[str, Any], caption_override: str = "") -> Dict[str, Any]:
+    """
+    Queue a shared file for background Telegram delivery and return immediately.
+    A missing token, chat id or file fails here with the same payload a direct
+    send would return; only the upload itself is deferred.
+    """
+    checked = _telegram_check_shared_item(item)
+    if not checked.get("ok"):
+        return checked
+    job_id = f"tgj_{uuid.uuid4().hex[:12]}"
+    now = _now_ms()
+    job = {
+        "id": job_id,
+        "status": "queued",
+        "item": json.loads(json.dumps(item)),
+        "caption": str(caption_override or ""),
+        "attempts": 0,
+        "created_at": now,
+        "updated_at": now,
+        "result": None,
+    }
+    with TELEGRAM_SEND_LOCK:
+        try:
+            TELEGRAM_SEND_QUEUE.put_nowait(job_id)
+        except queue.Full:
+            return {
+                "ok": False,
+                "error": "telegram_queue_full",
+                "detail": f"Telegram send queue is full ({TELEGRAM_SEND_QUEUE_MAX} pending). Retry shortly.",
+            }
+        TELEGRAM_SEND_JOBS[job_id] = job
+        TELEGRAM_SEND_JOBS_ORDER.append(job_id)
+        _trim_telegram_send_jobs_unlocked()
+        public = _public_telegram_send_job(job)
+    _ensure_telegram_send_worker()
+    return {"ok": True, **public, "detail": "Queued for Telegram delivery."}
+
+
+@_host_agent_method("telegram.job_status")
+def _telegram_send_job_status(job_id: str) -> Optional[Dict[str, Any]]:
+    with TELEGRAM_SEND_LOCK:
+        job = TELEGRAM_SEND_JOBS.get(str(job_id or ""))
+        return _public_telegram_send_job(job) if job else None
+
+
+@_host_agent_method("telegram.queue_snapshot")
+def _telegram_send_queue_snapshot() -> Dict[str, Any]:
+    with TELEGRAM_SEND_LOCK:
+        pending = sum(
+            1
+            for job_id in TELEGRAM_SEND_JOBS_ORDER
+            if str((TELEGRAM_SEND_JOBS.get(job_id) or {}).get("status") or "") in {"queued", "retrying", "sending"}
+        )
+        return {"pending": pending, "capacity": TELEGRAM_SEND_QUEUE_MAX}
+
+
+def _telegram_process_send_job(job_id: str) -> Dict[str, Any]:
+    with TELEGRAM_SEND_LOCK:
+        job = TELEGRAM_SEND_JOBS.get(job_id)
+        if not job:
+            return {"ok": False, "error": "telegram_job_missing"}
+        item = dict(job.get("item") or {})
+        caption = str(job.get("caption") or "")
+    result: Dict[str, Any] = {}
+    for attempt in range(1, TELEGRAM_SEND_MAX_ATTEMPTS + 1):
+        with TELEGRAM_SEND_LOCK:
+            job["status"] = "sending"
+            job["attempts"] = attempt
+            job["updated_at"] = _now_ms()
+        try:
+            result = _telegram_send_shared_item(item, caption_override=caption)
+        except Exception as exc:
+            result = {"ok": False, "error": "telegram_request_failed", "detail": f"{type(exc).__name__}: {exc}"}
+        if result.get("ok") or not _telegram_send_result_retryable(result) or attempt >= TELEGRAM_SEND_MAX_ATTEMPTS:
+            break
+        with TELEGRAM_SEND_LOCK:
+            job["status"] = "retrying"
+            job["result"] = result
+            job["updated_at"] = _now_ms()
+        time.sleep(_telegram_send_backoff_s(attempt, result))
+    with TELEGRAM_SEND_LOCK:
+        job["status"] = "sent" if result.get("ok") else "failed"
+        job["result"] = result
+        job["updated_at"] = _now_ms()
+    if not result.get("ok"):
+        LOGGER.warning("Telegram send job %s failed: %s", job_id, result.get("detail") or result.get("error"))
+    return result
+
+
+def _telegram_send_worker() -> None:
+    while True:
+        job_id = TELEGRAM_SEND_QUEUE.get()
+        try:
+            _telegram_process_send_job(job_id)
+        except Exception:
+            LOGGER.exception("Telegram send worker failed on job %s", job_id)
+        finally:
+            TELEGRAM_SEND_QUEUE.task_done()
+
+
+def _ensure_telegram_send_worker() -> None:
+    global TELEGRAM_SEND_WORKER_THREAD
+    with TELEGRAM_SEND_LOCK:
+        existing = TELEGRAM_SEND_WORKER_THREAD
+        if existing and existing.is_alive():
+            return
+        worker = threading.Thread(
+            target=_telegram_send_worker,
+            name="codrex-telegram-send",
+            daemon=True,
+        )
+        TELEGRAM_SEND_WORKER_THREAD = worker
+    worker.start()
+
+
 def _loop_extract_telegram_message(update: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     if not isinstance(update, dict):
         return None
@@ -3790,22 +6081,23 @@ def _telegram_windows_mirror_header(
     return "\n".join(lines)
 
 
-def _telegram_windows_mirror_send_text(
+def _telegram_windows_mirror_text_messages(
     session: str,
     text: str,
     *,
     kind: str,
     state: str = "",
     current_command: str = "",
-) -> bool:
+) -> List[str]:
     cleaned = _telegram_windows_mirror_clean_text(text)
     if not cleaned:
-        return True
+        return []
     if kind in {"snapshot", "replace"} and len(cleaned) > TELEGRAM_WINDOWS_MIRROR_SNAPSHOT_TAIL_CHARS:
         cleaned = cleaned[-TELEGRAM_WINDOWS_MIRROR_SNAPSHOT_TAIL_CHARS:].lstrip()
         cleaned = f"[Showing the latest snapshot tail]\n\n{cleaned}"
     chunks = _telegram_windows_mirror_split_text(cleaned, TELEGRAM_WINDOWS_MIRROR_MAX_CHARS)
     total = len(chunks)
+    messages: List[str] = []
     for index, chunk in enumerate(chunks, start=1):
         header = _telegram_windows_mirror_header(
             session,
@@ -3815,20 +6107,17 @@ def _telegram_windows_mirror_send_text(
             part_index=index,
             part_total=total,
         )
-        message = f"{header}\n\n{chunk}" if chunk else header
-        result = _telegram_send_text(message)
-        if not result.get("ok"):
-            return False
-    return True
+        messages.append(f"{header}\n\n{chunk}" if chunk else header)
+    return messages
 
 
-def _telegram_windows_mirror_send_status(
+def _telegram_windows_mirror_status_message(
     session: str,
     *,
     state: str = "",
     current_command: str = "",
     detail: str = "",
-) -> bool:
+) -> str:
     header = _telegram_windows_mirror_header(
         session,
         "status",
@@ -3839,8 +6128,27 @@ def _telegram_windows_mirror_send_status(
     if detail:
         lines.append("")
         lines.append(detail)
-    result = _telegram_send_text("\n".join(lines))
-    return bool(result.get("ok"))
+    return "\n".join(lines)
+
+
+def _telegram_windows_mirror_send_text(
+    session: str,
+    text: str,
+    *,
+    kind: str,
+    state: str = "",
+    current_command: str = "",
+) -> bool:
+    messages = _telegram_windows_mirror_text_messages(
+        session,
+        text,
+        kind=kind,
+        state=state,
+        current_command=current_command,
+    )
+    if not messages:
+        return True
+    return bool(_telegram_send_text_batch(messages).get("ok"))
 
 
 def _telegram_windows_mirror_session_snapshots() -> Tuple[Dict[str, Dict[str, Any]], Dict[str, Dict[str, Any]]]:
@@ -3917,33 +6225,35 @@ def _telegram_windows_mirror_sync_session(
     aggregate_command = str(session_record.get("current_command") or "")
     aggregate_text = ""
     last_status = ""
+    # Collect every message for this sync first, then send them as one coalesced, rate-paced batch.
+    outbound: List[str] = []
     for event in events:
         event_type = str(event.get("type") or "").strip().lower()
         event_state = str(event.get("state") or aggregate_state or "").strip().lower()
         event_command = str(event.get("current_command") or aggregate_command or "").strip()
         if event_type == "status":
             if aggregate_text:
-                ok = _telegram_windows_mirror_send_text(
-                    session,
-                    aggregate_text,
-                    kind=aggregate_kind or "append",
-                    state=aggregate_state,
-                    current_command=aggregate_command,
+                outbound.extend(
+                    _telegram_windows_mirror_text_messages(
+                        session,
+                        aggregate_text,
+                        kind=aggregate_kind or "append",
+                        state=aggregate_state,
+                        current_command=aggregate_command,
+                    )
                 )
-                if not ok:
-                    return False, int(session_state.get("windows_mirror_last_seq") or 0), last_status
                 aggregate_text = ""
                 aggregate_kind = ""
             detail = str(event.get("detail") or "").strip()
             if detail or event_state:
-                ok = _telegram_windows_mirror_send_status(
-                    session,
-                    state=event_state,
-                    current_command=event_command,
-                    detail=detail or "Session status changed.",
+                outbound.append(
+                    _telegram_windows_mirror_status_message(
+                        session,
+                        state=event_state,
+                        current_command=event_command,
+                        detail=detail or "Session status changed.",
+                    )
                 )
-                if not ok:
-                    return False, int(session_state.get("windows_mirror_last_seq") or 0), last_status
                 last_status = detail[:64]
             continue
         clean_text = _telegram_windows_mirror_clean_text(str(event.get("text") or ""))
@@ -3960,15 +6270,17 @@ def _telegram_windows_mirror_sync_session(
             aggregate_state = event_state or aggregate_state
             aggregate_command = event_command or aggregate_command
     if aggregate_text:
-        ok = _telegram_windows_mirror_send_text(
-            session,
-            aggregate_text,
-            kind=aggregate_kind or "append",
-            state=aggregate_state,
-            current_command=aggregate_command,
+        outbound.extend(
+            _telegram_windows_mirror_text_messages(
+                session,
+                aggregate_text,
+                kind=aggregate_kind or "append",
+                state=aggregate_state,
+                current_command=aggregate_command,
+            )
         )
-        if not ok:
-            return False, int(session_state.get("windows_mirror_last_seq") or 0), last_status
+    if outbound and not _telegram_send_text_batch(outbound).get("ok"):
+        return False, int(session_state.get("windows_mirror_last_seq") or 0), last_status
     return True, target_seq, last_status
 
 
@@ -4172,138 +6484,527 @@ def _loop_build_error_prompt(snapshot: str, default_prompt: str, state: str) ->
     return _loop_build_continue_prompt(default_prompt, "\n".join(extra_parts))
 
 
-def _loop_run_completion_checks(cwd: str, commands: List[str]) -> Tuple[bool, List[Dict[str, Any]]]:
-    clean_cwd = str(cwd or "").strip()
-    if not clean_cwd.startswith("/"):
-        return False, [{"command": "", "exit_code": -1, "output": "", "detail": "Session cwd is unavailable."}]
-    results: List[Dict[str, Any]] = []
-    all_passed = True
-    for command in commands:
-        wrapped = f"cd {_bash_quote(clean_cwd)} && {command}"
-        run = run_wsl_bash(wrapped, timeout_s=LOOP_CONTROL_CHECK_TIMEOUT_S)
-        output = str(run.get("stdout") or "")
-        stderr = str(run.get("stderr") or "")
-        detail_parts = []
-        if output.strip():
-            detail_parts.append(output.strip())
-        if stderr.strip():
-            detail_parts.append(stderr.strip())
-        combined = _loop_limit_text("\n\n".join(detail_parts), 1800)
-        exit_code = int(run.get("exit_code") or 0)
-        if exit_code != 0:
-            all_passed = False
-        results.append(
-            {
-                "command": command,
-                "exit_code": exit_code,
-                "output": combined,
-                "detail": str(run.get("error") or "").strip(),
-            }
-        )
-    return all_passed, results
+class _LoopCheckOutput:
+    """Keeps the first head_chars and the last tail_chars of a streamed output."""
 
+    def __init__(self, head_chars: int = LOOP_CHECK_OUTPUT_HEAD_CHARS, tail_chars: int = LOOP_CHECK_OUTPUT_TAIL_CHARS) -> None:
+        self.head_chars = max(0, int(head_chars))
+        self.tail_chars = max(0, int(tail_chars))
+        self.head = ""
+        self.tail = ""
+        self.total_chars = 0
 
-def _loop_build_failed_checks_prompt(
-    default_prompt: str,
-    cwd: str,
-    results: List[Dict[str, Any]],
-) -> str:
-    lines = [
-        f"Completion checks failed in {cwd}. Fix the issues and rerun these commands until they all pass:",
-    ]
-    for item in results:
-        command = str(item.get("command") or "").strip()
-        exit_code = int(item.get("exit_code") or 0)
-        if exit_code == 0:
-            continue
-        lines.append(f"- {command} (exit {exit_code})")
-        output = str(item.get("output") or "").strip()
-        if output:
-            lines.append(_loop_limit_text(output, 800))
-    return _loop_build_continue_prompt(default_prompt, "\n".join(lines))
+    def append(self, text: str) -> None:
+        if not text:
+            return
+        self.total_chars += len(text)
+        room = self.head_chars - len(self.head)
+        if room > 0:
+            self.head += text[:room]
+            text = text[room:]
+        if text and self.tail_chars:
+            self.tail = (self.tail + text)[-self.tail_chars:]
 
+    @property
+    def omitted_chars(self) -> int:
+        return max(0, self.total_chars - len(self.head) - len(self.tail))
 
-def _loop_commit_session_state_unlocked(session: str, state: Dict[str, Any]) -> Dict[str, Any]:
-    session_id = _validate_session_name(session)
-    normalized = _normalize_loop_session_state(state, session_id)
-    sessions = LOOP_CONTROL_DATA.setdefault("sessions", {})
-    if not isinstance(sessions, dict):
-        sessions = {}
-        LOOP_CONTROL_DATA["sessions"] = sessions
-    sessions[session_id] = normalized
-    return normalized
+    def text(self) -> str:
+        omitted = self.omitted_chars
+        if not omitted:
+            return (self.head + self.tail).strip()
+        return f"{self.head.rstrip()}\n… [{omitted} chars omitted] …\n{self.tail.lstrip()}".strip()
 
 
-def _loop_set_session_action_unlocked(
-    session: str,
-    state: Dict[str, Any],
-    action: str,
-    detail: str,
-    *,
-    snapshot: str = "",
-    persist: bool = True,
-) -> Dict[str, Any]:
-    now_ms = _now_ms()
-    state["last_action"] = str(action or "").strip()[:64]
-    state["last_action_detail"] = _loop_limit_text(detail, 4000)
-    state["last_action_at"] = now_ms
-    if snapshot:
-        state["last_snapshot"] = _loop_limit_text(snapshot, 2000)
-    normalized = _loop_commit_session_state_unlocked(session, state)
-    if persist:
-        _persist_loop_control_unlocked()
-    return normalized
+def _loop_check_argv(command: str) -> List[str]:
+    return [_wsl_executable(), "-d", WSL_DISTRO, "--", "bash", "-lc", command]
 
 
-def _loop_set_global_preset_unlocked(preset: str) -> None:
-    settings = _get_loop_settings_unlocked()
-    next_preset = _normalize_loop_preset(preset)
-    settings["global_preset"] = next_preset
-    settings["updated_at"] = _now_ms()
-    sessions = LOOP_CONTROL_DATA.get("sessions") if isinstance(LOOP_CONTROL_DATA.get("sessions"), dict) else {}
-    for session, raw_state in list(sessions.items()):
-        if not isinstance(raw_state, dict):
-            continue
-        state = _normalize_loop_session_state(raw_state, session)
-        if state.get("override_mode") != "inherit":
-            continue
-        state["awaiting_reply"] = False
-        state["last_handled_fingerprint"] = ""
-        budget = _loop_budget_for_preset(next_preset)
-        state["remaining_turns"] = budget if budget is not None else None
-        _loop_commit_session_state_unlocked(session, state)
-    _persist_loop_control_unlocked()
+def _wsl_proc_starttime_command(stat_path: str) -> str:
+    # Field 22 of /proc/<pid>/stat, counted after the parenthesised comm.
+    return f"sed 's/.*) //' {stat_path} | cut -d' ' -f20"
 
 
-def _loop_set_session_override_unlocked(session: str, override_mode: str) -> Dict[str, Any]:
-    state = _get_loop_session_unlocked(session)
-    next_mode = _normalize_loop_override_mode(override_mode)
-    state["override_mode"] = next_mode
-    state["awaiting_reply"] = False
-    state["last_handled_fingerprint"] = ""
-    budget = _loop_budget_for_preset(next_mode)
-    state["remaining_turns"] = budget if budget is not None else None
-    state["last_action"] = ""
-    state["last_action_detail"] = ""
-    normalized = _loop_commit_session_state_unlocked(session, state)
-    _persist_loop_control_unlocked()
-    return normalized
+def _wsl_group_command(command: str, pgid_file: str) -> str:
+    """
+    Wraps a bash command so it runs as its own session inside the distro and
+    writes its process group id and start time to pgid_file. The launching
+    shell records its own pid in <pgid_file>.pid first, so a kill that lands
+    before the group exists still has something to aim at. taskkill /T on
+    wsl.exe does not reach processes inside WSL; _wsl_kill_process_group() does.
+    """
+    started = _wsl_proc_starttime_command("/proc/$$/stat")
+    launcher_file = f"{pgid_file}.pid"
+    inner = f"echo \"$$ $({started})\" > {_bash_quote(pgid_file)}; {command}"
+    return (
+        f"echo \"$$ $({started})\" > {_bash_quote(launcher_file)}; "
+        f"setsid -w bash -c {_bash_quote(inner)}; rc=$?; "
+        f"rm -f {_bash_quote(pgid_file)} {_bash_quote(launcher_file)}; exit $rc"
+    )
 
 
-def _loop_find_waiting_session_by_message_unlocked(message_id: int) -> str:
-    if message_id <= 0:
-        return ""
-    sessions = LOOP_CONTROL_DATA.get("sessions") if isinstance(LOOP_CONTROL_DATA.get("sessions"), dict) else {}
-    winner = ""
-    newest = 0
-    for session, raw_state in sessions.items():
-        if not isinstance(raw_state, dict):
-            continue
-        state = _normalize_loop_session_state(raw_state, session)
-        if not state.get("awaiting_reply"):
-            continue
-        if int(state.get("last_telegram_message_id") or 0) != int(message_id):
-            continue
+def _wsl_kill_process_group(
+    pgid_file: str,
+    *,
+    argv_builder: Optional[Callable[[str], List[str]]] = None,
+    grace_s: float = WSL_KILL_GRACE_S,
+) -> None:
+    """
+    TERMs the process group recorded by _wsl_group_command(), then KILLs it
+    after grace_s. When the group has not recorded itself yet, the launching
+    shell and its children are killed instead. Runs through run_wsl_bash, or
+    through argv_builder when the group was launched with a custom one. A
+    record whose process has a different start time (the file outlived a WSL
+    restart) is left alone.
+    """
+    steps = max(1, int(grace_s * 10))
+    leader_started = _wsl_proc_starttime_command('"/proc/$pg/stat"')
+    script = (
+        f"f={_bash_quote(pgid_file)}; p={_bash_quote(pgid_file + '.pid')}; "
+        'if { read -r pg started < "$f"; } 2>/dev/null && [ -n "$pg" ]; then t="-$pg"; '
+        'elif { read -r pg started < "$p"; } 2>/dev/null && [ -n "$pg" ]; then t="$pg"; '
+        'else exit 0; fi; '
+        f'[ "$({leader_started} 2>/dev/null)" = "$started" ] || {{ rm -f "$f" "$p"; exit 0; }}; '
+        '[ "$t" = "$pg" ] && pkill -TERM -P "$pg" 2>/dev/null; '
+        'kill -TERM -- "$t" 2>/dev/null; '
+        f'for _ in $(seq {steps}); do kill -0 -- "$t" 2>/dev/null || break; sleep 0.1; done; '
+        'if kill -0 -- "$t" 2>/dev/null; then '
+        '[ "$t" = "$pg" ] && pkill -KILL -P "$pg" 2>/dev/null; kill -KILL -- "$t" 2>/dev/null; fi; '
+        'rm -f "$f" "$p"; exit 0'
+    )
+    timeout_s = int(grace_s) + 15
+    if argv_builder is None:
+        run_wsl_bash(script, timeout_s=timeout_s)
+        return
+    kwargs = _wsl_run_kwargs()
+    kwargs.pop("stdin", None)
+    try:
+        subprocess.run(argv_builder(script), stdin=subprocess.DEVNULL, capture_output=True, timeout=timeout_s, **kwargs)
+    except Exception:
+        pass
+
+
+def _kill_process_tree(proc: subprocess.Popen) -> None:
+    """Kill proc and its children: the whole session on POSIX, taskkill /T on Windows."""
+    try:
+        if os.name != "nt":
+            os.killpg(proc.pid, signal.SIGKILL)
+            return
+        subprocess.run(
+            ["taskkill", "/PID", str(proc.pid), "/T", "/F"],
+            capture_output=True,
+            timeout=10,
+            creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0),
+        )
+    except Exception:
+        pass
+    try:
+        proc.kill()
+    except Exception:
+        pass
+
+
+class _LoopCheckRunner:
+    """
+    Runs completion-check commands in the session cwd, at most `parallelism`
+    at a time. Each check streams merged stdout/stderr into a head+tail buffer
+    so long test logs never sit in memory whole. With fail_fast, the first
+    failing check kills the running ones and skips those not yet started.
+    """
+
+    def __init__(
+        self,
+        cwd: str,
+        commands: List[str],
+        *,
+        parallelism: int = LOOP_CHECK_PARALLELISM,
+        fail_fast: bool = LOOP_CHECK_FAIL_FAST,
+        timeout_s: float = LOOP_CONTROL_CHECK_TIMEOUT_S,
+        argv_builder: Optional[Callable[[str], List[str]]] = None,
+    ) -> None:
+        self.cwd = str(cwd or "").strip()
+        self.parallelism = max(1, int(parallelism))
+        self.fail_fast = bool(fail_fast)
+        self.timeout_s = max(0.1, float(timeout_s))
+        self.argv_builder = argv_builder or _loop_check_argv
+        self._kill_argv_builder = argv_builder
+        self.id = uuid.uuid4().hex[:8]
+        self.started_at = 0
+        self.finished_at = 0
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+        self._procs: Dict[int, subprocess.Popen] = {}
+        self.checks: List[Dict[str, Any]] = [
+            {
+                "index": index,
+                "command": str(command or ""),
+                "state": "pending",
+                "exit_code": None,
+                "detail": "",
+                "killed": "",
+                "started_at": 0,
+                "finished_at": 0,
+                "output": _LoopCheckOutput(),
+            }
+            for index, command in enumerate(commands or [])
+        ]
+
+    def run(self) -> Tuple[bool, List[Dict[str, Any]]]:
+        if not self.cwd.startswith("/"):
+            self.started_at = self.finished_at = _now_ms()
+            return False, [{"command": "", "exit_code": -1, "output": "", "detail": "Session cwd is unavailable."}]
+        self.started_at = _now_ms()
+        pending: "queue.Queue[int]" = queue.Queue()
+        for check in self.checks:
+            pending.put(check["index"])
+        workers = [
+            threading.Thread(target=self._worker, args=(pending,), name=f"codrex-loop-check-{n}", daemon=True)
+            for n in range(min(self.parallelism, len(self.checks)))
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.finished_at = _now_ms()
+        return self.all_passed(), self.results()
+
+    def cancel(self) -> None:
+        self._cancel.set()
+        with self._lock:
+            procs = list(self._procs.items())
+            for index, _proc in procs:
+                if not self.checks[index]["killed"]:
+                    self.checks[index]["killed"] = "cancelled"
+        for index, proc in procs:
+            self._kill(index, proc)
+
+    def pgid_path(self, index: int) -> str:
+        return posixpath.join(CODEX_RUN_PGID_DIR, f"codrex-loop-check-{self.id}-{index}.pgid")
+
+    def _kill(self, index: int, proc: subprocess.Popen) -> None:
+        _wsl_kill_process_group(self.pgid_path(index), argv_builder=self._kill_argv_builder)
+        _kill_process_tree(proc)
+
+    def _worker(self, pending: "queue.Queue[int]") -> None:
+        while True:
+            try:
+                index = pending.get_nowait()
+            except queue.Empty:
+                return
+            check = self.checks[index]
+            if self._cancel.is_set():
+                with self._lock:
+                    check["state"] = "skipped"
+                    check["detail"] = "Skipped after an earlier check failed."
+                continue
+            self._run_check(check)
+            if self.fail_fast and check["state"] != "passed":
+                self.cancel()
+
+    def _expire(self, check: Dict[str, Any], proc: subprocess.Popen) -> None:
+        with self._lock:
+            if not check["killed"]:
+                check["killed"] = "timeout"
+        self._kill(check["index"], proc)
+
+    def _run_check(self, check: Dict[str, Any]) -> None:
+        wrapped = _wsl_group_command(f"cd {_bash_quote(self.cwd)} && {check['command']}", self.pgid_path(check["index"]))
+        kwargs = _wsl_run_kwargs()
+        kwargs.pop("stdin", None)
+        if os.name != "nt":
+            kwargs["start_new_session"] = True
+        with self._lock:
+            check["state"] = "running"
+            check["started_at"] = _now_ms()
+        try:
+            proc = subprocess.Popen(
+                self.argv_builder(wrapped),
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                **kwargs,
+            )
+        except Exception as e:
+            with self._lock:
+                check["state"] = "failed"
+                check["exit_code"] = 125
+                check["detail"] = f"exception: {type(e).__name__}: {e}"
+                check["finished_at"] = _now_ms()
+            return
+        with self._lock:
+            self._procs[check["index"]] = proc
+        if self._cancel.is_set():
+            with self._lock:
+                check["killed"] = "cancelled"
+            self._kill(check["index"], proc)
+        timer = threading.Timer(self.timeout_s, self._expire, args=(check, proc))
+        timer.daemon = True
+        timer.start()
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        try:
+            stream = proc.stdout
+            while stream is not None:
+                chunk = stream.read1(4096)
+                if not chunk:
+                    break
+                text = decoder.decode(chunk)
+                with self._lock:
+                    check["output"].append(text)
+            with self._lock:
+                check["output"].append(decoder.decode(b"", final=True))
+            exit_code = proc.wait()
+        finally:
+            timer.cancel()
+            try:
+                if proc.stdout is not None:
+                    proc.stdout.close()
+            except Exception:
+                pass
+        with self._lock:
+            self._procs.pop(check["index"], None)
+            check["finished_at"] = _now_ms()
+            if check["killed"] == "timeout":
+                check["state"] = "timeout"
+                check["exit_code"] = 124
+                check["detail"] = f"timeout after {self.timeout_s:g}s"
+            elif check["killed"] == "cancelled" and exit_code != 0:
+                check["state"] = "cancelled"
+                check["detail"] = "Stopped after an earlier check failed."
+            else:
+                check["exit_code"] = int(exit_code)
+                check["state"] = "passed" if exit_code == 0 else "failed"
+
+    def all_passed(self) -> bool:
+        with self._lock:
+            return all(check["state"] == "passed" for check in self.checks)
+
+    def results(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [
+                {
+                    "command": check["command"],
+                    "exit_code": check["exit_code"],
+                    "output": check["output"].text(),
+                    "detail": check["detail"],
+                    "state": check["state"],
+                }
+                for check in self.checks
+            ]
+
+    def snapshot(self) -> Dict[str, Any]:
+        now_ms = _now_ms()
+        with self._lock:
+            checks = []
+            for check in self.checks:
+                started = int(check["started_at"] or 0)
+                finished = int(check["finished_at"] or 0)
+                output: _LoopCheckOutput = check["output"]
+                recent = output.tail if output.omitted_chars else output.head + output.tail
+                checks.append(
+                    {
+                        "command": check["command"],
+                        "state": check["state"],
+                        "exit_code": check["exit_code"],
+                        "detail": check["detail"],
+                        "elapsed_ms": ((finished or now_ms) - started) if started else 0,
+                        "output_chars": output.total_chars,
+                        "output_tail": recent[-400:].strip(),
+                    }
+                )
+            states = {item["state"] for item in checks}
+        if self.finished_at:
+            state = "passed" if states <= {"passed"} else "failed"
+        elif self.started_at:
+            state = "running"
+        else:
+            state = "pending"
+        return {
+            "state": state,
+            "cwd": self.cwd,
+            "parallelism": self.parallelism,
+            "fail_fast": self.fail_fast,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "checks": checks,
+        }
+
+
+def _loop_run_completion_checks(cwd: str, commands: List[str]) -> Tuple[bool, List[Dict[str, Any]]]:
+    return _LoopCheckRunner(cwd, commands).run()
+
+
+def _loop_start_completion_checks_job(
+    session: str,
+    runner: _LoopCheckRunner,
+    on_done: Callable[[bool, List[Dict[str, Any]]], None],
+) -> bool:
+    """
+    Starts runner for session on its own thread. While an earlier job is still
+    going (its checks or its on_done follow-up) it returns False and keeps
+    runner as the session's pending re-check (replacing any older one), which
+    starts once the current job returns.
+    """
+    with LOOP_CHECK_JOBS_LOCK:
+        if session in LOOP_CHECK_ACTIVE:
+            LOOP_CHECK_PENDING[session] = (runner, on_done)
+            return False
+        LOOP_CHECK_ACTIVE.add(session)
+        LOOP_CHECK_JOBS[session] = runner
+    _loop_spawn_completion_checks_job(session, runner, on_done)
+    return True
+
+
+def _loop_spawn_completion_checks_job(
+    session: str,
+    runner: _LoopCheckRunner,
+    on_done: Callable[[bool, List[Dict[str, Any]]], None],
+) -> None:
+    # The caller has already claimed session in LOOP_CHECK_ACTIVE.
+    def _job() -> None:
+        try:
+            all_passed, results = runner.run()
+            on_done(all_passed, results)
+        except Exception as exc:
+            with LOOP_CONTROL_LOCK:
+                loop_state = _get_loop_session_unlocked(session)
+                _loop_set_session_action_unlocked(
+                    session,
+                    loop_state,
+                    "completion_checks_error",
+                    f"Completion checks crashed: {type(exc).__name__}: {exc}",
+                    persist=True,
+                )
+        finally:
+            # Hand the slot straight to the pending re-check so no other
+            # caller can slip in between this job and the next one.
+            with LOOP_CHECK_JOBS_LOCK:
+                pending = LOOP_CHECK_PENDING.pop(session, None)
+                if pending is None:
+                    LOOP_CHECK_ACTIVE.discard(session)
+                else:
+                    LOOP_CHECK_JOBS[session] = pending[0]
+            if pending is not None:
+                _loop_spawn_completion_checks_job(session, *pending)
+
+    threading.Thread(target=_job, name=f"codrex-loop-checks-{session}", daemon=True).start()
+
+
+def _loop_prune_check_jobs(live_sessions: Set[str]) -> None:
+    """Drops the last check results of sessions that no longer exist."""
+    with LOOP_CHECK_JOBS_LOCK:
+        for session in list(LOOP_CHECK_JOBS):
+            if session not in live_sessions and session not in LOOP_CHECK_ACTIVE:
+                LOOP_CHECK_JOBS.pop(session, None)
+
+
+def _loop_check_jobs_snapshot() -> Dict[str, Any]:
+    with LOOP_CHECK_JOBS_LOCK:
+        jobs = dict(LOOP_CHECK_JOBS)
+    return {session: runner.snapshot() for session, runner in jobs.items()}
+
+
+def _loop_build_failed_checks_prompt(
+    default_prompt: str,
+    cwd: str,
+    results: List[Dict[str, Any]],
+) -> str:
+    lines = [
+        f"Completion checks failed in {cwd}. Fix the issues and rerun these commands until they all pass:",
+    ]
+    for item in results:
+        command = str(item.get("command") or "").strip()
+        exit_code = int(item.get("exit_code") or 0)
+        if exit_code == 0:
+            continue
+        lines.append(f"- {command} (exit {exit_code})")
+        output = str(item.get("output") or "").strip()
+        if output:
+            # Failures usually surface at the end of the log, so keep the tail.
+            lines.append(output if len(output) <= 800 else "…" + output[-799:].lstrip())
+    return _loop_build_continue_prompt(default_prompt, "\n".join(lines))
+
+
+def _loop_commit_session_state_unlocked(session: str, state: Dict[str, Any]) -> Dict[str, Any]:
+    session_id = _validate_session_name(session)
+    normalized = _normalize_loop_session_state(state, session_id)
+    sessions = LOOP_CONTROL_DATA.setdefault("sessions", {})
+    if not isinstance(sessions, dict):
+        sessions = {}
+        LOOP_CONTROL_DATA["sessions"] = sessions
+    sessions[session_id] = normalized
+    return normalized
+
+
+def _loop_set_session_action_unlocked(
+    session: str,
+    state: Dict[str, Any],
+    action: str,
+    detail: str,
+    *,
+    snapshot: str = "",
+    persist: bool = True,
+) -> Dict[str, Any]:
+    now_ms = _now_ms()
+    state["last_action"] = str(action or "").strip()[:64]
+    state["last_action_detail"] = _loop_limit_text(detail, 4000)
+    state["last_action_at"] = now_ms
+    if snapshot:
+        state["last_snapshot"] = _loop_limit_text(snapshot, 2000)
+    normalized = _loop_commit_session_state_unlocked(session, state)
+    if persist:
+        _persist_loop_control_unlocked()
+    return normalized
+
+
+def _loop_set_global_preset_unlocked(preset: str) -> None:
+    settings = _get_loop_settings_unlocked()
+    next_preset = _normalize_loop_preset(preset)
+    settings["global_preset"] = next_preset
+    settings["updated_at"] = _now_ms()
+    sessions = LOOP_CONTROL_DATA.get("sessions") if isinstance(LOOP_CONTROL_DATA.get("sessions"), dict) else {}
+    for session, raw_state in list(sessions.items()):
+        if not isinstance(raw_state, dict):
+            continue
+        state = _normalize_loop_session_state(raw_state, session)
+        if state.get("override_mode") != "inherit":
+            continue
+        state["awaiting_reply"] = False
+        state["last_handled_fingerprint"] = ""
+        budget = _loop_budget_for_preset(next_preset)
+        state["remaining_turns"] = budget if budget is not None else None
+        _loop_commit_session_state_unlocked(session, state)
+    _persist_loop_control_unlocked()
+
+
+def _loop_set_session_override_unlocked(session: str, override_mode: str) -> Dict[str, Any]:
+    state = _get_loop_session_unlocked(session)
+    next_mode = _normalize_loop_override_mode(override_mode)
+    state["override_mode"] = next_mode
+    state["awaiting_reply"] = False
+    state["last_handled_fingerprint"] = ""
+    budget = _loop_budget_for_preset(next_mode)
+    state["remaining_turns"] = budget if budget is not None else None
+    state["last_action"] = ""
+    state["last_action_detail"] = ""
+    normalized = _loop_commit_session_state_unlocked(session, state)
+    _persist_loop_control_unlocked()
+    return normalized
+
+
+def _loop_find_waiting_session_by_message_unlocked(message_id: int) -> str:
+    if message_id <= 0:
+        return ""
+    sessions = LOOP_CONTROL_DATA.get("sessions") if isinstance(LOOP_CONTROL_DATA.get("sessions"), dict) else {}
+    winner = ""
+    newest = 0
+    for session, raw_state in sessions.items():
+        if not isinstance(raw_state, dict):
+            continue
+        state = _normalize_loop_session_state(raw_state, session)
+        if not state.get("awaiting_reply"):
+            continue
+        if int(state.get("last_telegram_message_id") or 0) != int(message_id):
+            continue
         at = int(state.get("last_notification_at") or 0)
         if at >= newest:
             newest = at
@@ -4378,13 +7079,13 @@ def _loop_handle_telegram_message(message: Dict[str, Any]) -> None:
         command_name = str(match.group(1) if match else "").strip().lower()
 
     if command_name == "help":
-        _telegram_send_text(_loop_build_help_text())
+        _telegram_queue_text(_loop_build_help_text())
         return
     if command_name == "list":
-        _telegram_send_text(_loop_build_list_text())
+        _telegram_queue_text(_loop_build_list_text())
         return
     if command_name == "status":
-        _telegram_send_text(_loop_build_status_text())
+        _telegram_queue_text(_loop_build_status_text())
         return
 
     mode_command = _parse_loop_mode_command(text)
@@ -4409,7 +7110,7 @@ def _loop_handle_telegram_message(message: Dict[str, Any]) -> None:
                     effective = str(public.get("effective_preset") or "")
                     mode_label = _format_loop_preset_label(effective) if effective else "Off"
                     response = f"{session_id}: override={public.get('override_mode')} effective={mode_label}"
-        _telegram_send_text(_loop_limit_text(response, 3500))
+        _telegram_queue_text(_loop_limit_text(response, 3500))
         return
 
     reply_command = _parse_loop_reply_command(text)
@@ -4417,7 +7118,7 @@ def _loop_handle_telegram_message(message: Dict[str, Any]) -> None:
         session, prompt_text = reply_command
         result = _loop_process_reply_message(session, prompt_text, "Telegram command")
         detail = "Reply sent." if result.get("ok") else (result.get("detail") or result.get("error") or "Reply failed.")
-        _telegram_send_text(_loop_limit_text(detail, 3500))
+        _telegram_queue_text(_loop_limit_text(detail, 3500))
         return
 
     target_session = ""
@@ -4429,7 +7130,7 @@ def _loop_handle_telegram_message(message: Dict[str, Any]) -> None:
         if not target_session:
             target_session = _loop_find_latest_waiting_session_unlocked()
     if not target_session:
-        _telegram_send_text("No Codex session is currently waiting for a Telegram reply.")
+        _telegram_queue_text("No Codex session is currently waiting for a Telegram reply.")
         return
     result = _loop_process_reply_message(target_session, text, "Telegram reply")
     detail = (
@@ -4437,10 +7138,45 @@ def _loop_handle_telegram_message(message: Dict[str, Any]) -> None:
         if result.get("ok")
         else (result.get("detail") or result.get("error") or f"Reply to {target_session} failed.")
     )
-    _telegram_send_text(_loop_limit_text(detail, 3500))
+    _telegram_queue_text(_loop_limit_text(detail, 3500))
+
+
+def _loop_note_telegram_offset_unlocked(newest: int) -> None:
+    settings = _get_loop_settings_unlocked()
+    if int(settings.get("telegram_update_offset") or 0) != newest:
+        settings["telegram_update_offset"] = newest
+        LOOP_TELEGRAM_OFFSET_STATE["dirty"] = True
+    worker = LOOP_CONTROL_DATA.setdefault("worker", {})
+    worker["last_telegram_poll_at"] = _now_ms()
+
+
+def _loop_flush_telegram_offset_unlocked(force: bool = False) -> bool:
+    # The offset lives in LOOP_CONTROL_DATA; only the disk write is batched.
+    if not LOOP_TELEGRAM_OFFSET_STATE.get("dirty"):
+        return False
+    now = time.time()
+    if not force and now - float(LOOP_TELEGRAM_OFFSET_STATE.get("persisted_at") or 0.0) < LOOP_TELEGRAM_OFFSET_PERSIST_INTERVAL_S:
+        return False
+    _persist_loop_control_unlocked()
+    LOOP_TELEGRAM_OFFSET_STATE["dirty"] = False
+    LOOP_TELEGRAM_OFFSET_STATE["persisted_at"] = now
+    return True
+
 
+def _loop_flush_telegram_offset() -> None:
+    try:
+        with LOOP_CONTROL_LOCK:
+            if LOOP_CONTROL_LOADED:
+                _loop_flush_telegram_offset_unlocked(force=True)
+    except Exception:
+        pass
 
-def _loop_poll_telegram_once() -> None:
+
+def _loop_poll_telegram_once(long_poll_s: int = 0) -> bool:
+    """
+    Run one getUpdates round (optionally long-polling) and dispatch matching chat messages.
+    Returns False when Telegram is not configured or the API rejected the call, so callers can back off.
+    """
     token = str(TELEGRAM_BOT_TOKEN or "").strip()
     chat_id = _telegram_resolve_chat_id(allow_discovery=True) if token else ""
     if not token or not chat_id:
@@ -4448,7 +7184,7 @@ def _loop_poll_telegram_once() -> None:
             _load_loop_control_unlocked()
             worker = LOOP_CONTROL_DATA.setdefault("worker", {})
             worker["last_telegram_poll_at"] = _now_ms()
-        return
+        return False
 
     with LOOP_CONTROL_LOCK:
         settings = _get_loop_settings_unlocked()
@@ -4463,16 +7199,14 @@ def _loop_poll_telegram_once() -> None:
                 if isinstance(raw, dict):
                     newest = max(newest, int(raw.get("update_id") or 0))
         with LOOP_CONTROL_LOCK:
-            settings = _get_loop_settings_unlocked()
-            settings["telegram_update_offset"] = newest
-            worker = LOOP_CONTROL_DATA.setdefault("worker", {})
-            worker["last_telegram_poll_at"] = _now_ms()
-            _persist_loop_control_unlocked()
-        return
+            _loop_note_telegram_offset_unlocked(newest)
+            _loop_flush_telegram_offset_unlocked(force=True)
+        return bool(isinstance(parsed, dict) and parsed.get("ok"))
 
-    parsed = _telegram_get_updates(token, offset=offset + 1, limit=20)
+    parsed = _telegram_get_updates(token, offset=offset + 1, limit=20, long_poll_s=long_poll_s)
     items = parsed.get("result") if isinstance(parsed, dict) else []
     newest = offset
+    dispatched = 0
     if isinstance(items, list):
         for raw in items:
             if not isinstance(raw, dict):
@@ -4484,12 +7218,31 @@ def _loop_poll_telegram_once() -> None:
             if str(message.get("chat_id") or "").strip() != chat_id:
                 continue
             _loop_handle_telegram_message(message)
+            dispatched += 1
     with LOOP_CONTROL_LOCK:
-        settings = _get_loop_settings_unlocked()
-        settings["telegram_update_offset"] = newest
-        worker = LOOP_CONTROL_DATA.setdefault("worker", {})
-        worker["last_telegram_poll_at"] = _now_ms()
-        _persist_loop_control_unlocked()
+        _loop_note_telegram_offset_unlocked(newest)
+        # Persist right away once a message was acted on so a restart does not replay it;
+        # offsets that only skip ignored updates are written in batches.
+        _loop_flush_telegram_offset_unlocked(force=dispatched > 0)
+    return bool(isinstance(parsed, dict) and parsed.get("ok"))
+
+
+def _loop_telegram_listener() -> None:
+    while True:
+        polled = False
+        error = ""
+        try:
+            polled = _loop_poll_telegram_once(long_poll_s=LOOP_TELEGRAM_LONG_POLL_S)
+        except Exception as exc:
+            error = f"{type(exc).__name__}: {exc}"
+        with LOOP_CONTROL_LOCK:
+            _load_loop_control_unlocked()
+            worker = LOOP_CONTROL_DATA.setdefault("worker", {})
+            worker["last_telegram_error"] = error
+            if error:
+                worker["last_telegram_error_at"] = _now_ms()
+        if not polled or LOOP_TELEGRAM_LONG_POLL_S <= 0:
+            time.sleep(max(1.0, LOOP_CONTROL_TELEGRAM_POLL_INTERVAL_S))
 
 
 def _loop_sync_budget_unlocked(session: str, state: Dict[str, Any], effective_preset: str, session_prompt_at_ms: int) -> None:
@@ -4509,24 +7262,105 @@ def _loop_sync_budget_unlocked(session: str, state: Dict[str, Any], effective_pr
     _loop_commit_session_state_unlocked(session, state)
 
 
-def _loop_handle_terminal_session(session_item: Dict[str, Any], session_record: Dict[str, Any]) -> None:
-    session = _validate_session_name(session_item.get("session"))
-    state_name = str(session_item.get("state") or "").strip().lower()
-    snapshot = _loop_snapshot_text_from_session_record(session_record)
-    session_prompt_at_ms = 0
-    try:
-        session_prompt_at_ms = int(float(session_record.get("last_prompt_at") or 0) * 1000)
-    except Exception:
-        session_prompt_at_ms = 0
-
+def _loop_finish_completion_checks(
+    session: str,
+    state_name: str,
+    effective_preset: str,
+    snapshot: str,
+    default_prompt: str,
+    cwd: str,
+    completion_checks: List[str],
+    all_passed: bool,
+    results: List[Dict[str, Any]],
+) -> None:
     with LOOP_CONTROL_LOCK:
-        loop_state = _get_loop_session_unlocked(session)
-        effective_preset = _effective_loop_preset_unlocked(session)
-        _loop_sync_budget_unlocked(session, loop_state, effective_preset, session_prompt_at_ms)
-        fingerprint_source = "\n".join([session, state_name, snapshot, str(session_prompt_at_ms), effective_preset])
-        fingerprint = hashlib.sha1(fingerprint_source.encode("utf-8", errors="ignore")).hexdigest()
-        if fingerprint == str(loop_state.get("last_handled_fingerprint") or ""):
-            return
+        current_preset = _effective_loop_preset_unlocked(session)
+        if current_preset != effective_preset:
+            # Loop mode was turned off or changed while the checks ran.
+            loop_state = _get_loop_session_unlocked(session)
+            _loop_set_session_action_unlocked(
+                session,
+                loop_state,
+                "completion_checks_ignored",
+                "Loop mode changed while completion checks ran; no follow-up sent.",
+                snapshot=snapshot,
+                persist=True,
+            )
+            return
+    if completion_checks and all_passed:
+        telegram_result = _telegram_send_text(
+            _loop_build_notification_text(
+                session,
+                state_name,
+                _format_loop_preset_label(effective_preset),
+                snapshot,
+                "Completion checks passed.",
+                include_reply_hint=False,
+            )
+        )
+        with LOOP_CONTROL_LOCK:
+            loop_state = _get_loop_session_unlocked(session)
+            if telegram_result.get("ok"):
+                loop_state["last_notification_at"] = _now_ms()
+            _loop_set_session_action_unlocked(
+                session,
+                loop_state,
+                "completion_checks_passed",
+                "Completion checks passed.",
+                snapshot=snapshot,
+                persist=True,
+            )
+        return
+    if not completion_checks:
+        prompt = _loop_build_continue_prompt(
+            default_prompt,
+            "Completion checks mode is enabled, but no commands are configured yet. Continue and finish the task before stopping.",
+        )
+    else:
+        prompt = _loop_build_failed_checks_prompt(
+            default_prompt,
+            cwd,
+            results,
+        )
+    send_result = _loop_send_prompt_to_session(session, prompt, auto_prompt=True)
+    with LOOP_CONTROL_LOCK:
+        loop_state = _get_loop_session_unlocked(session)
+        if send_result.get("ok"):
+            loop_state["last_continue_at"] = _now_ms()
+        _loop_set_session_action_unlocked(
+            session,
+            loop_state,
+            "completion_checks_continue",
+            (
+                "Completion checks failed; sent follow-up prompt."
+                if completion_checks
+                else "Completion checks are not configured; sent follow-up prompt."
+            )
+            if send_result.get("ok")
+            else (send_result.get("detail") or send_result.get("error") or "Follow-up prompt failed."),
+            snapshot=snapshot,
+            persist=True,
+        )
+
+
+def _loop_handle_terminal_session(session_item: Dict[str, Any], session_record: Dict[str, Any]) -> None:
+    session = _validate_session_name(session_item.get("session"))
+    state_name = str(session_item.get("state") or "").strip().lower()
+    snapshot = _loop_snapshot_text_from_session_record(session_record)
+    session_prompt_at_ms = 0
+    try:
+        session_prompt_at_ms = int(float(session_record.get("last_prompt_at") or 0) * 1000)
+    except Exception:
+        session_prompt_at_ms = 0
+
+    with LOOP_CONTROL_LOCK:
+        loop_state = _get_loop_session_unlocked(session)
+        effective_preset = _effective_loop_preset_unlocked(session)
+        _loop_sync_budget_unlocked(session, loop_state, effective_preset, session_prompt_at_ms)
+        fingerprint_source = "\n".join([session, state_name, snapshot, str(session_prompt_at_ms), effective_preset])
+        fingerprint = hashlib.sha1(fingerprint_source.encode("utf-8", errors="ignore")).hexdigest()
+        if fingerprint == str(loop_state.get("last_handled_fingerprint") or ""):
+            return
         loop_state["last_terminal_state"] = state_name
         loop_state["last_terminal_at"] = _now_ms()
         loop_state["last_snapshot"] = _loop_limit_text(snapshot, 2000)
@@ -4607,58 +7441,37 @@ def _loop_handle_terminal_session(session_item: Dict[str, Any], session_record:
         return
 
     if effective_preset == "completion-checks":
-        all_passed, results = _loop_run_completion_checks(str(session_item.get("cwd") or session_record.get("cwd") or ""), completion_checks)
-        if completion_checks and all_passed:
-            telegram_result = _telegram_send_text(
-                _loop_build_notification_text(
-                    session,
-                    state_name,
-                    _format_loop_preset_label(effective_preset),
-                    snapshot,
-                    "Completion checks passed.",
-                    include_reply_hint=False,
-                )
-            )
-            with LOOP_CONTROL_LOCK:
-                loop_state = _get_loop_session_unlocked(session)
-                if telegram_result.get("ok"):
-                    loop_state["last_notification_at"] = _now_ms()
-                _loop_set_session_action_unlocked(
-                    session,
-                    loop_state,
-                    "completion_checks_passed",
-                    "Completion checks passed.",
-                    snapshot=snapshot,
-                    persist=True,
-                )
-            return
-        if not completion_checks:
-            prompt = _loop_build_continue_prompt(
-                default_prompt,
-                "Completion checks mode is enabled, but no commands are configured yet. Continue and finish the task before stopping.",
-            )
-        else:
-            prompt = _loop_build_failed_checks_prompt(
+        cwd = str(session_item.get("cwd") or session_record.get("cwd") or "")
+
+        def finish(all_passed: bool, results: List[Dict[str, Any]]) -> None:
+            _loop_finish_completion_checks(
+                session,
+                state_name,
+                effective_preset,
+                snapshot,
                 default_prompt,
-                str(session_item.get("cwd") or session_record.get("cwd") or ""),
+                cwd,
+                completion_checks,
+                all_passed,
                 results,
             )
-        send_result = _loop_send_prompt_to_session(session, prompt, auto_prompt=True)
+
+        if not completion_checks:
+            finish(False, [])
+            return
+        # Checks run on their own thread so the loop worker keeps servicing other sessions.
+        started = _loop_start_completion_checks_job(session, _LoopCheckRunner(cwd, completion_checks), finish)
         with LOOP_CONTROL_LOCK:
             loop_state = _get_loop_session_unlocked(session)
-            if send_result.get("ok"):
-                loop_state["last_continue_at"] = _now_ms()
             _loop_set_session_action_unlocked(
                 session,
                 loop_state,
-                "completion_checks_continue",
+                "completion_checks_running" if started else "completion_checks_queued",
                 (
-                    "Completion checks failed; sent follow-up prompt."
-                    if completion_checks
-                    else "Completion checks are not configured; sent follow-up prompt."
-                )
-                if send_result.get("ok")
-                else (send_result.get("detail") or send_result.get("error") or "Follow-up prompt failed."),
+                    f"Running {len(completion_checks)} completion check(s)."
+                    if started
+                    else "Completion checks are still running; queued a re-check for this state."
+                ),
                 snapshot=snapshot,
                 persist=True,
             )
@@ -4732,8 +7545,9 @@ def _loop_handle_terminal_session(session_item: Dict[str, Any], session_record:
 
 def _loop_control_worker() -> None:
     while True:
+        cycle_started = time.perf_counter()
+        cycle_outcome = "exception"
         try:
-            _loop_poll_telegram_once()
             _telegram_windows_mirror_once()
             response = codex_sessions_live()
             sessions = response.get("sessions") if isinstance(response, dict) else []
@@ -4753,6 +7567,7 @@ def _loop_control_worker() -> None:
                 if not session:
                     continue
                 _loop_handle_terminal_session(item, session_records.get(session, {}))
+            _loop_prune_check_jobs(set(session_records))
             with LOOP_CONTROL_LOCK:
                 _load_loop_control_unlocked()
                 worker = LOOP_CONTROL_DATA.setdefault("worker", {})
@@ -4760,6 +7575,8 @@ def _loop_control_worker() -> None:
                 worker["last_cycle_at"] = _now_ms()
                 worker["last_error"] = ""
                 worker["last_error_at"] = 0
+                _loop_flush_telegram_offset_unlocked()
+            cycle_outcome = "ok"
         except Exception as exc:
             with LOOP_CONTROL_LOCK:
                 _load_loop_control_unlocked()
@@ -4768,21 +7585,35 @@ def _loop_control_worker() -> None:
                 worker["last_cycle_at"] = _now_ms()
                 worker["last_error"] = f"{type(exc).__name__}: {exc}"
                 worker["last_error_at"] = _now_ms()
+        METRICS.observe("codrex_loop_control_cycle_seconds", time.perf_counter() - cycle_started, outcome=cycle_outcome)
         time.sleep(max(1.0, LOOP_CONTROL_POLL_INTERVAL_S))
 
 
 def _ensure_loop_control_worker() -> None:
-    global LOOP_CONTROL_WORKER_THREAD
-    existing = LOOP_CONTROL_WORKER_THREAD
-    if existing and existing.is_alive():
+    global LOOP_CONTROL_WORKER_THREAD, LOOP_TELEGRAM_LISTENER_THREAD
+    if not _owns_host_singletons():
         return
-    worker = threading.Thread(
-        target=_loop_control_worker,
-        name="codrex-loop-control",
-        daemon=True,
-    )
-    LOOP_CONTROL_WORKER_THREAD = worker
-    worker.start()
+    existing = LOOP_CONTROL_WORKER_THREAD
+    if not (existing and existing.is_alive()):
+        worker = threading.Thread(
+            target=_loop_control_worker,
+            name="codrex-loop-control",
+            daemon=True,
+        )
+        LOOP_CONTROL_WORKER_THREAD = worker
+        worker.start()
+    listener = LOOP_TELEGRAM_LISTENER_THREAD
+    if not (listener and listener.is_alive()):
+        listener = threading.Thread(
+            target=_loop_telegram_listener,
+            name="codrex-loop-telegram",
+            daemon=True,
+        )
+        LOOP_TELEGRAM_LISTENER_THREAD = listener
+        listener.start()
+
+
+atexit.register(_loop_flush_telegram_offset)
 
 
 def _overlay_cursor_rgb(rgb_bytes: bytes, size: Tuple[int, int], x: int, y: int) -> bytes:
@@ -5206,6 +8037,33 @@ def _send_text_native_first(text: str, unicode_chunk_size: int = 240) -> int:
 # -------------------------
 SESSIONS_LOCK = threading.Lock()
 SESSIONS: Dict[str, Dict[str, Any]] = {}
+TMUX_CODEX_LIKE_TTL_S = float(os.environ.get("CODEX_TMUX_CODEX_LIKE_TTL_S", "15") or "15")
+TMUX_CODEX_LIKE_LOCK = threading.Lock()
+TMUX_CODEX_LIKE_CACHE: Dict[str, Tuple[bool, float]] = {}
+
+
+@_host_agent_method("sessions.merge")
+def _session_record_merge(session: str, fields: Optional[Dict[str, Any]]) -> None:
+    """Applies a worker's SESSIONS write in the agent; None drops the record."""
+    with SESSIONS_LOCK:
+        if fields is None:
+            SESSIONS.pop(session, None)
+        else:
+            SESSIONS[session] = {**SESSIONS.get(session, {}), **fields}
+
+
+def _session_record_publish(session: str, fields: Optional[Dict[str, Any]]) -> None:
+    """
+    Loop control runs in the agent and reads prompts and screen text from its
+    SESSIONS, so a worker mirrors each record it writes there as well.
+    """
+    if CONTROLLER_ROLE != "worker":
+        return
+    try:
+        _session_record_merge(session, fields)
+    except Exception as exc:
+        print(f"Session record publish failed session={session} error={type(exc).__name__}: {exc}", flush=True)
+
 WINDOWS_RUNTIME_LOCK = threading.Lock()
 WINDOWS_RUNTIME_ACTIVE = bool(WINPTY_AVAILABLE and os.name == "nt")
 WINDOWS_SUPPORTED_PROFILES = {"codex", "powershell", "cmd"}
@@ -5280,7 +8138,7 @@ def _bash_quote(s: str) -> str:
 
 
 def _windows_runtime_supported() -> bool:
-    return bool(os.name == "nt" and WINPTY_AVAILABLE and PtyProcess is not None)
+    return bool(os.name == "nt" and WINPTY_AVAILABLE and _load_media_stack("winpty"))
 
 
 def _desktop_codex_available() -> bool:
@@ -5862,7 +8720,7 @@ async def _desktop_codex_app_server_request_async(
 async def _desktop_codex_with_app_server_async(
     operation: Callable[[Any], "asyncio.Future[Dict[str, Any]] | Any"],
 ) -> Dict[str, Any]:
-    if websockets is None:
+    if not _load_media_stack("websockets"):
         raise RuntimeError("websockets is unavailable")
     server = _desktop_codex_ensure_app_server()
     url = str(server.get("url") or "").strip()
@@ -6725,6 +9583,7 @@ def _windows_session_stream_event_payload(
     return payload
 
 
+@_host_agent_method("windows.stream.publish")
 def _publish_windows_session_stream_snapshot(
     session: str,
     text: str,
@@ -6761,9 +9620,24 @@ def _publish_windows_session_stream_snapshot(
         stream_state["events"].append(event)
         if len(stream_state["events"]) > WINDOWS_SESSION_STREAM_REPLAY_MAX:
             stream_state["events"] = stream_state["events"][-WINDOWS_SESSION_STREAM_REPLAY_MAX:]
-        return dict(event)
+    _host_agent_publish("stream", event)
+    return dict(event)
+
+
+@_host_agent_method("windows.stream.seq")
+def _windows_session_stream_seq(session: str) -> int:
+    with WINDOWS_SESSION_STREAM_LOCK:
+        return int(_windows_session_stream_state_unlocked(session).get("seq") or 0)
 
 
+@_host_agent_method("windows.stream.events")
+def _windows_session_stream_events_since(session: str, since_seq: int) -> List[Dict[str, Any]]:
+    with WINDOWS_SESSION_STREAM_LOCK:
+        stream_state = _windows_session_stream_state_unlocked(session)
+        return [dict(event) for event in stream_state.get("events") or [] if int(event.get("seq") or 0) > since_seq]
+
+
+@_host_agent_method("windows.stream.replay")
 def _windows_session_stream_replay(session: str, since_seq: int) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
     with WINDOWS_SESSION_STREAM_LOCK:
         state = _windows_session_stream_state_unlocked(session)
@@ -6786,6 +9660,29 @@ def _windows_session_stream_replay(session: str, since_seq: int) -> Tuple[List[D
         return [], snapshot
 
 
+@_host_agent_method("windows.stream.resync")
+def _windows_session_stream_resync_snapshot(session: str, profile: str = "") -> Optional[Dict[str, Any]]:
+    with WINDOWS_SESSION_STREAM_LOCK:
+        state = _windows_session_stream_state_unlocked(session)
+        seq = int(state.get("seq") or 0)
+        if seq <= 0:
+            return None
+        latest = (state.get("events") or [{}])[-1]
+        return {
+            "ok": True,
+            **_windows_session_stream_event_payload(
+                session=session,
+                seq=seq,
+                event_type="snapshot",
+                text=str(state.get("last_text") or ""),
+                profile=profile,
+                detail="backpressure",
+                state=str(latest.get("state") or ""),
+                current_command=str(latest.get("current_command") or ""),
+            ),
+        }
+
+
 def _windows_session_output_trim(text: str) -> str:
     value = str(text or "")
     if len(value) <= WINDOWS_SESSION_OUTPUT_MAX_CHARS:
@@ -6880,6 +9777,20 @@ def _windows_session_entry(session: str) -> Dict[str, Any]:
         return entry
 
 
+@_host_agent_method("windows.stream.entry")
+def _windows_session_stream_entry(session: str) -> Optional[Dict[str, str]]:
+    """The screen fields the stream needs, or None once the session is gone."""
+    try:
+        entry = _windows_session_entry(session)
+    except HTTPException:
+        return None
+    return {
+        "last_text": str(entry.get("last_text") or ""),
+        "state": str(entry.get("state") or ""),
+        "current_command": str(entry.get("current_command") or ""),
+    }
+
+
 def _windows_session_finalize(session: str, reason: str = "closed") -> Optional[Dict[str, Any]]:
     session_id = _validate_session_name(session)
     now = time.time()
@@ -7137,12 +10048,239 @@ def _wsl_runtime_status_payload() -> Dict[str, Any]:
     return parsed
 
 
+class _WslRuntimeMonitor:
+    """
+    Probes the sessions runtime (the WSL distro) on a background thread and
+    serves the last result from memory. The probe runs every idle_interval_s,
+    or every transition_interval_s while a start/stop is in flight, until the
+    state reaches the target or transition_timeout_s passes. Every change of
+    state is kept in a short history and handed to on_change. probe and clock
+    are injectable so the cadence can be driven without wsl.exe, and
+    background=False keeps the thread off so tests drive every probe.
+    """
+
+    def __init__(
+        self,
+        probe: Callable[[], Dict[str, Any]],
+        *,
+        idle_interval_s: float = WSL_RUNTIME_POLL_S,
+        transition_interval_s: float = WSL_RUNTIME_TRANSITION_POLL_S,
+        transition_timeout_s: float = WSL_RUNTIME_TRANSITION_TIMEOUT_S,
+        history: int = WSL_RUNTIME_CHANGE_HISTORY,
+        on_change: Optional[Callable[[Dict[str, Any]], None]] = None,
+        clock: Callable[[], float] = time.monotonic,
+        background: bool = True,
+    ) -> None:
+        self.probe = probe
+        self.idle_interval_s = max(0.01, float(idle_interval_s))
+        self.transition_interval_s = max(0.01, float(transition_interval_s))
+        self.transition_timeout_s = max(0.01, float(transition_timeout_s))
+        self.history = max(1, int(history))
+        self.on_change = on_change
+        self.clock = clock
+        self.background = bool(background)
+        self._lock = threading.Lock()
+        self._inflight: Optional[threading.Event] = None
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+        self._status: Optional[Dict[str, Any]] = None
+        self._checked_at = 0.0
+        self._checked_at_ms = 0
+        # The first read probes in the foreground; the thread's first run waits a full interval.
+        self._next_due = self.clock() + self.idle_interval_s
+        self._transition: Optional[Dict[str, Any]] = None
+        self._changes: List[Dict[str, Any]] = []
+        self._probes = 0
+        self._failures = 0
+        self._last_error = ""
+        self._duration_ms: Optional[float] = None
+
+    def _interval_unlocked(self) -> float:
+        return self.transition_interval_s if self._transition is not None else self.idle_interval_s
+
+    def due_in(self) -> float:
+        with self._lock:
+            return max(0.0, self._next_due - self.clock())
+
+    def poll(self) -> Dict[str, Any]:
+        """Run the probe now; callers that arrive while it runs wait for that run's result."""
+        with self._lock:
+            inflight = self._inflight
+            if inflight is None:
+                self._inflight = threading.Event()
+        if inflight is not None:
+            inflight.wait()
+            return self.status_nowait()
+        change: Optional[Dict[str, Any]] = None
+        try:
+            started = self.clock()
+            status: Optional[Dict[str, Any]] = None
+            error = ""
+            try:
+                status = dict(self.probe() or {})
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            change = self._record(status, error, started)
+        finally:
+            with self._lock:
+                done, self._inflight = self._inflight, None
+            if done is not None:
+                done.set()
+        if change is not None and self.on_change is not None:
+            try:
+                self.on_change(change)
+            except Exception:
+                pass
+        return self.status_nowait()
+
+    def _record(self, status: Optional[Dict[str, Any]], error: str, started: float) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            now = self.clock()
+            self._probes += 1
+            self._duration_ms = round((now - started) * 1000.0, 1)
+            change: Optional[Dict[str, Any]] = None
+            current = ""
+            if error:
+                self._failures += 1
+                self._last_error = error
+            else:
+                previous = str((self._status or {}).get("state") or "")
+                current = str((status or {}).get("state") or "")
+                self._status = status
+                self._checked_at = now
+                self._checked_at_ms = _now_ms()
+                if previous != current:
+                    change = {
+                        "from": previous or None,
+                        "to": current,
+                        "detail": str((status or {}).get("detail") or ""),
+                        "at": self._checked_at_ms,
+                        "transition": (self._transition or {}).get("label", ""),
+                    }
+                    self._changes.append(change)
+                    del self._changes[:-self.history]
+            transition = self._transition
+            if transition is not None and (
+                current == transition["target"] or now >= transition["deadline"]
+            ):
+                self._transition = None
+            self._next_due = now + self._interval_unlocked()
+        return change
+
+    def begin_transition(self, target_state: str) -> None:
+        """Poll at the fast cadence until the distro reports target_state."""
+        label = "starting" if target_state == "running" else "stopping"
+        with self._lock:
+            now = self.clock()
+            self._transition = {"target": target_state, "label": label, "deadline": now + self.transition_timeout_s}
+            self._next_due = min(self._next_due, now + self.transition_interval_s)
+        self._wake.set()
+
+    def cancel_transition(self) -> None:
+        with self._lock:
+            self._transition = None
+            self._next_due = min(self._next_due, self.clock() + self.idle_interval_s)
+
+    def status_nowait(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self._status or {})
+            out["checked_at"] = self._checked_at_ms or None
+            out["age_s"] = round(max(0.0, self.clock() - self._checked_at), 3) if self._checked_at_ms else None
+            out["transition"] = (self._transition or {}).get("label", "")
+            return out
+
+    def status(self, *, force: bool = False) -> Dict[str, Any]:
+        """The cached status; only the first read (or a forced one) waits for the probe."""
+        self._ensure_thread()
+        with self._lock:
+            cold = self._status is None
+        if force or cold:
+            return self.poll()
+        return self.status_nowait()
+
+    def changes(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(change) for change in self._changes]
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": str((self._status or {}).get("state") or ""),
+                "transition": (self._transition or {}).get("label", ""),
+                "interval_s": self._interval_unlocked(),
+                "next_probe_in_s": round(max(0.0, self._next_due - self.clock()), 3) if self._probes else None,
+                "probes": self._probes,
+                "failures": self._failures,
+                "last_error": self._last_error,
+                "duration_ms": self._duration_ms,
+                "changes": [dict(change) for change in self._changes],
+            }
+
+    def _ensure_thread(self) -> None:
+        with self._lock:
+            if self._thread is not None or self._closed or not self.background:
+                return
+            self._thread = threading.Thread(target=self._run, name="codrex-wsl-runtime", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                if self._closed:
+                    return
+            delay = self.due_in()
+            if delay <= 0:
+                self.poll()
+                continue
+            self._wake.wait(delay)
+            self._wake.clear()
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+        self._wake.set()
+
+
+def _wsl_runtime_changed(change: Dict[str, Any]) -> None:
+    METRICS.inc("codrex_wsl_runtime_changes_total", to=change.get("to") or "unknown")
+    if change.get("from"):
+        print(
+            f"WSL runtime {WSL_DISTRO}: {change.get('from')} -> {change.get('to')} ({change.get('detail')})",
+            flush=True,
+        )
+    _event_hub_poke("runtime")
+
+
+def _wsl_runtime_monitor() -> _WslRuntimeMonitor:
+    global WSL_RUNTIME_MONITOR
+    with WSL_RUNTIME_MONITOR_LOCK:
+        if WSL_RUNTIME_MONITOR is None:
+            if not _owns_host_singletons():
+                # One probe thread per host; workers read it through the agent.
+                raise RuntimeError("The WSL runtime monitor is owned by the host agent.")
+            WSL_RUNTIME_MONITOR = _WslRuntimeMonitor(
+                lambda: _wsl_runtime_status_payload(),
+                on_change=_wsl_runtime_changed,
+            )
+        return WSL_RUNTIME_MONITOR
+
+
+@_host_agent_method("runtime.wsl_status")
+def _wsl_runtime_status(force: bool = False) -> Dict[str, Any]:
+    monitor = _wsl_runtime_monitor()
+    return {**monitor.status(force=force), "changes": monitor.changes()}
+
+
+@_host_agent_method("runtime.wsl_start")
 def _start_wsl_runtime() -> Dict[str, Any]:
-    status = _wsl_runtime_status_payload()
+    monitor = _wsl_runtime_monitor()
+    status = monitor.status(force=True)
     if status.get("state") == "running":
         return {"ok": True, **status}
     if status.get("state") == "missing":
         return {"ok": False, **status}
+    monitor.begin_transition("running")
     try:
         result = subprocess.run(
             [_wsl_executable(), "-d", WSL_DISTRO, "--", "bash", "-lc", "tmux start-server >/dev/null 2>&1 || true; printf ready"],
@@ -7154,6 +10292,7 @@ def _start_wsl_runtime() -> Dict[str, Any]:
             **_wsl_run_kwargs(),
         )
     except Exception as exc:
+        monitor.cancel_transition()
         return {
             "ok": False,
             "state": "unknown",
@@ -7162,19 +10301,22 @@ def _start_wsl_runtime() -> Dict[str, Any]:
             "can_stop": False,
             "distro": WSL_DISTRO,
         }
-    fresh = _wsl_runtime_status_payload()
+    fresh = monitor.status(force=True)
     return {
         "ok": bool(result.returncode == 0 and fresh.get("state") == "running"),
         **fresh,
     }
 
 
+@_host_agent_method("runtime.wsl_stop")
 def _stop_wsl_runtime() -> Dict[str, Any]:
-    status = _wsl_runtime_status_payload()
+    monitor = _wsl_runtime_monitor()
+    status = monitor.status(force=True)
     if status.get("state") == "stopped":
         return {"ok": True, **status}
     if status.get("state") == "missing":
         return {"ok": False, **status}
+    monitor.begin_transition("stopped")
     try:
         result = subprocess.run(
             [_wsl_executable(), "--terminate", WSL_DISTRO],
@@ -7186,6 +10328,7 @@ def _stop_wsl_runtime() -> Dict[str, Any]:
             **_wsl_run_kwargs(),
         )
     except Exception as exc:
+        monitor.cancel_transition()
         return {
             "ok": False,
             "state": "unknown",
@@ -7194,36 +10337,47 @@ def _stop_wsl_runtime() -> Dict[str, Any]:
             "can_stop": True,
             "distro": WSL_DISTRO,
         }
-    fresh = _wsl_runtime_status_payload()
+    fresh = monitor.status(force=True)
     return {
         "ok": bool(result.returncode == 0 and fresh.get("state") == "stopped"),
         **fresh,
     }
 
 
-def run_wsl_bash(command: str, timeout_s: int = 30) -> Dict[str, Any]:
+def _decode_process_output(value: Any) -> str:
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors="replace")
+    return str(value or "")
+
+
+@_instrumented("codrex_subprocess_seconds", outcome=_subprocess_outcome, helper="wsl_bash")
+def run_wsl_bash(command: str, timeout_s: int = 30, input_bytes: Optional[bytes] = None) -> Dict[str, Any]:
     args = [_wsl_executable(), "-d", WSL_DISTRO, "--", "bash", "-lc", command]
     max_attempts = 2 if os.name == "nt" else 1
     attempt = 0
     while attempt < max_attempts:
         attempt += 1
         try:
+            run_kwargs = _wsl_run_kwargs()
+            if input_bytes is not None:
+                # Binary stdin keeps the payload byte-exact (no CRLF translation on Windows).
+                run_kwargs.pop("stdin", None)
+                run_kwargs["input"] = input_bytes
+            else:
+                run_kwargs.update(text=True, encoding="utf-8", errors="replace")
             p = subprocess.run(
                 args,
                 capture_output=True,
-                text=True,
-                encoding="utf-8",
-                errors="replace",
                 timeout=timeout_s,
-                **_wsl_run_kwargs(),
+                **run_kwargs,
             )
             if os.name == "nt" and _is_windows_interrupt(p.returncode) and attempt < max_attempts:
                 time.sleep(0.2)
                 continue
             result = {
                 "exit_code": p.returncode,
-                "stdout": (p.stdout or "").rstrip(),
-                "stderr": (p.stderr or "").rstrip(),
+                "stdout": _decode_process_output(p.stdout).rstrip(),
+                "stderr": _decode_process_output(p.stderr).rstrip(),
                 "attempts": attempt,
             }
             if os.name == "nt" and _is_windows_interrupt(p.returncode):
@@ -7445,7 +10599,7 @@ def _desktop_stream_transport_payload() -> Dict[str, Any]:
     else:
         detail = "WebRTC fallback active."
     return {
-        "desktop_stream_transport": DESKTOP_STREAM_PREFERRED_TRANSPORT,
+        "desktop_stream_transport": "webrtc" if (AIORTC_AVAILABLE and DESKTOP_WEBRTC_ENABLED) else "fallback",
         "desktop_stream_fallback": DESKTOP_STREAM_FALLBACK_TRANSPORT,
         "desktop_webrtc_available": bool(AIORTC_AVAILABLE),
         "desktop_webrtc_enabled": bool(DESKTOP_WEBRTC_ENABLED and AIORTC_AVAILABLE),
@@ -8007,6 +11161,10 @@ def _browser_entry_for_path(wsl_path: str) -> Dict[str, Any]:
     unc = _wsl_unc_path(wsl_path)
     is_dir = os.path.isdir(unc)
     stat_result = os.stat(unc)
+    return _browser_entry_from_stat(wsl_path, is_dir, stat_result)
+
+
+def _browser_entry_from_stat(wsl_path: str, is_dir: bool, stat_result: Any) -> Dict[str, Any]:
     return {
         "name": os.path.basename(wsl_path.rstrip("/")) or wsl_path,
         "kind": "directory" if is_dir else "file",
@@ -8018,28 +11176,113 @@ def _browser_entry_for_path(wsl_path: str) -> Dict[str, Any]:
     }
 
 
-def _list_browser_entries(root_id: str, relative_path: str = "") -> Dict[str, Any]:
+def _scan_browser_directory(current_wsl_path: str, current_unc: str) -> List[Dict[str, Any]]:
+    # One scandir pass returns type + stat data from the directory listing itself, so we do not
+    # pay a separate isdir/stat round-trip per child over the \\wsl$ 9P bridge.
+    items: List[Dict[str, Any]] = []
+    with os.scandir(current_unc) as it:
+        for entry in it:
+            child_wsl = _norm_posix(posixpath.join(current_wsl_path, entry.name))
+            try:
+                is_dir = entry.is_dir()
+                stat_result = entry.stat()
+            except Exception:
+                continue
+            items.append(_browser_entry_from_stat(child_wsl, is_dir, stat_result))
+    items.sort(key=lambda item: str(item["name"]).lower())
+    return items
+
+
+def _cached_browser_directory_entries(current_wsl_path: str, current_unc: str, dir_mtime_ns: int) -> List[Dict[str, Any]]:
+    now = time.time()
+    with FS_LIST_CACHE_LOCK:
+        cached = FS_LIST_CACHE.get(current_wsl_path)
+        if (
+            cached
+            and int(cached.get("dir_mtime_ns") or 0) == dir_mtime_ns
+            and (now - float(cached.get("loaded_at") or 0.0)) < FS_LIST_CACHE_TTL_S
+        ):
+            return list(cached.get("items") or [])
+    items = _scan_browser_directory(current_wsl_path, current_unc)
+    with FS_LIST_CACHE_LOCK:
+        FS_LIST_CACHE[current_wsl_path] = {
+            "loaded_at": now,
+            "dir_mtime_ns": dir_mtime_ns,
+            "items": list(items),
+        }
+        while len(FS_LIST_CACHE) > max(1, FS_LIST_CACHE_MAX_DIRS):
+            oldest = min(FS_LIST_CACHE, key=lambda key: float(FS_LIST_CACHE[key].get("loaded_at") or 0.0))
+            FS_LIST_CACHE.pop(oldest, None)
+    return items
+
+
+def _sort_browser_entries(items: List[Dict[str, Any]], sort: str = "name", order: str = "asc") -> List[Dict[str, Any]]:
+    reverse = str(order or "").strip().lower() == "desc"
+    if sort == "mtime":
+        key: Callable[[Dict[str, Any]], Any] = lambda item: (int(item.get("mtime") or 0), str(item["name"]).lower())
+    elif sort == "size":
+        key = lambda item: (int(item.get("size_bytes") or 0), str(item["name"]).lower())
+    elif sort == "kind":
+        key = lambda item: (0 if item.get("kind") == "directory" else 1, str(item["name"]).lower())
+    else:
+        return list(reversed(items)) if reverse else list(items)
+    return sorted(items, key=key, reverse=reverse)
+
+
+def _parse_browser_cursor(cursor: str) -> int:
+    raw = str(cursor or "").strip()
+    if not raw:
+        return 0
+    try:
+        offset = int(raw)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid browse cursor.")
+    if offset < 0:
+        raise HTTPException(status_code=400, detail="Invalid browse cursor.")
+    return offset
+
+
+def _list_browser_entries(
+    root_id: str,
+    relative_path: str = "",
+    *,
+    sort: str = "name",
+    order: str = "asc",
+    cursor: str = "",
+    limit: int = 0,
+) -> Dict[str, Any]:
     root = _resolve_browser_root(root_id)
     current_wsl_path = _resolve_browser_path(root_id, relative_path)
     current_unc = _wsl_unc_path(current_wsl_path)
-    if not os.path.exists(current_unc):
+    try:
+        dir_stat = os.stat(current_unc)
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Browse path not found.")
-    if not os.path.isdir(current_unc):
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Could not list directory: {type(e).__name__}: {e}")
+    if not stat.S_ISDIR(dir_stat.st_mode):
         raise HTTPException(status_code=400, detail="Browse path is not a directory.")
 
-    items: List[Dict[str, Any]] = []
+    normalized_sort = str(sort or "name").strip().lower() or "name"
+    if normalized_sort not in FS_LIST_SORT_KEYS:
+        raise HTTPException(status_code=400, detail=f"Unsupported sort. Use one of: {', '.join(FS_LIST_SORT_KEYS)}.")
+    normalized_order = "desc" if str(order or "").strip().lower() == "desc" else "asc"
     try:
-        names = sorted(os.listdir(current_unc), key=lambda value: value.lower())
+        entries = _cached_browser_directory_entries(current_wsl_path, current_unc, int(dir_stat.st_mtime_ns))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Could not list directory: {type(e).__name__}: {e}")
-
-    for name in names:
-        child_wsl = _norm_posix(posixpath.join(current_wsl_path, name))
-        child_unc = _wsl_unc_path(child_wsl)
-        try:
-            items.append(_browser_entry_for_path(child_wsl))
-        except Exception:
-            continue
+    entries = _sort_browser_entries(entries, normalized_sort, normalized_order)
+
+    total = len(entries)
+    offset = _parse_browser_cursor(cursor)
+    page_size = max(0, min(int(limit or 0), FS_LIST_PAGE_MAX))
+    if page_size:
+        items = entries[offset:offset + page_size]
+        next_offset = offset + len(items)
+        next_cursor = str(next_offset) if next_offset < total else ""
+    else:
+        items = entries[offset:]
+        next_cursor = ""
 
     relative = ""
     if current_wsl_path != root["path"]:
@@ -8056,8 +11299,13 @@ def _list_browser_entries(root_id: str, relative_path: str = "") -> Dict[str, An
         "display_path": _display_path_for_wsl(current_wsl_path),
         "windows_path": _wsl_to_windows_path(current_wsl_path),
         "items": items,
+        "total": total,
+        "sort": normalized_sort,
+        "order": normalized_order,
+        "next_cursor": next_cursor,
     }
 
+
 def _is_valid_auth_token(token: str) -> bool:
     if not CODEX_AUTH_REQUIRED:
         return True
@@ -8583,6 +11831,29 @@ async def auth_middleware(request: Request, call_next):
     return await call_next(request)
 
 
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    # Registered after auth_middleware, so it wraps it and also times 401s.
+    if not METRICS.enabled:
+        return await call_next(request)
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = int(getattr(response, "status_code", 200) or 200)
+        return response
+    finally:
+        route = request.scope.get("route")
+        template = str(getattr(route, "path", "") or "") or "unmatched"
+        METRICS.observe(
+            "codrex_http_request_seconds",
+            time.perf_counter() - started,
+            method=request.method,
+            route=template,
+            status=f"{status // 100}xx",
+        )
+
+
 @app.get("/app/health")
 def app_health():
     payload = _built_ui_health_payload()
@@ -8594,11 +11865,11 @@ def app_health():
 @app.get("/app/runtime")
 def app_runtime(request: Request):
     payload = _built_ui_health_payload()
-    session = _read_json_file(APP_RUNTIME_SESSION_FILE)
+    session = _read_json_file_cached(APP_RUNTIME_SESSION_FILE)
     if not session:
-        session = _read_json_file(LEGACY_APP_RUNTIME_SESSION_FILE)
-    persisted = _read_json_file(os.path.join(APP_ROOT_DIR, "controller.config.json"))
-    local_cfg = _read_json_file(os.path.join(CODEX_RUNTIME_STATE_DIR, "controller.config.local.json"))
+        session = _read_json_file_cached(LEGACY_APP_RUNTIME_SESSION_FILE)
+    persisted = _read_json_file_cached(os.path.join(APP_ROOT_DIR, "controller.config.json"))
+    local_cfg = _read_json_file_cached(os.path.join(CODEX_RUNTIME_STATE_DIR, "controller.config.local.json"))
     controller_port = None
     try:
         controller_port = int(getattr(request.url, "port", None) or 0) or None
@@ -8629,7 +11900,8 @@ def app_runtime(request: Request):
         net_info,
         request_host=request_host,
     )
-    sessions_runtime = _wsl_runtime_status_payload()
+    sessions_runtime = _wsl_runtime_status()
+    sessions_runtime.pop("changes", None)
 
     return {
         **payload,
@@ -8657,22 +11929,19 @@ def app_runtime(request: Request):
         "sessions_runtime_distro": sessions_runtime.get("distro"),
         "sessions_runtime_can_start": bool(sessions_runtime.get("can_start")),
         "sessions_runtime_can_stop": bool(sessions_runtime.get("can_stop")),
+        "sessions_runtime_transition": sessions_runtime.get("transition") or "",
+        "sessions_runtime_checked_at": sessions_runtime.get("checked_at"),
         "config_port": (persisted or {}).get("port"),
         "runtime_token_present": bool(str((local_cfg or {}).get("token") or "").strip()),
+        "media_stacks": _media_stacks_snapshot(),
         **_desktop_stream_transport_payload(),
     }
 
 
 @app.get("/assets/{asset_path:path}")
-def app_asset(asset_path: str):
-    target = os.path.join(UI_DIST_ASSETS_DIR, asset_path or "")
-    safe_target = os.path.abspath(target)
-    safe_root = os.path.abspath(UI_DIST_ASSETS_DIR)
-    if not safe_target.startswith(safe_root + os.sep):
-        raise HTTPException(status_code=404, detail="asset_not_found")
-    if not os.path.isfile(safe_target):
-        raise HTTPException(status_code=404, detail="asset_not_found")
-    return FileResponse(safe_target)
+def app_asset(request: Request, asset_path: str):
+    # Only files indexed from ui/dist are served, so "../" paths simply miss.
+    return _ui_assets().response(request, posixpath.join("assets", asset_path or ""))
 
 
 @app.get("/manifest.webmanifest")
@@ -8686,12 +11955,12 @@ def app_asset(asset_path: str):
 @app.get("/icon-maskable-512.png")
 @app.get("/icon-maskable.svg")
 def app_root_file(request: Request):
-    return _serve_built_ui_root_file(request.url.path.lstrip("/"))
+    return _serve_built_ui_root_file(request.url.path.lstrip("/"), request)
 
 
 @app.get("/workbox-{suffix:path}")
-def app_workbox_asset(suffix: str):
-    return _serve_built_ui_root_file(f"workbox-{suffix}")
+def app_workbox_asset(request: Request, suffix: str):
+    return _serve_built_ui_root_file(f"workbox-{suffix}", request)
 
 
 @app.get("/mobile")
@@ -9170,6 +12439,7 @@ def _desktop_apply_display_layout(layout: Dict[str, Any], primary_device_name: s
         if commit_result != DISP_CHANGE_SUCCESSFUL:
             return {"ok": False, "detail": f"layout_commit_failed:{commit_result}"}
         time.sleep(0.6)
+        _desktop_invalidate_topology("display_change")
         _desktop_clear_cached_capture_handles()
         return {"ok": True, "detail": "", "primary_device_name": target_primary}
     except Exception as exc:
@@ -9209,46 +12479,45 @@ def _desktop_match_mss_monitor_index(
 
 
 def _desktop_monitor() -> Dict[str, int]:
-    targets = _desktop_target_items()
+    snapshot = _desktop_topology_snapshot()
+    targets = _desktop_target_items(snapshot)
     selected_target = next((dict(item) for item in targets if item.get("selected")), dict(targets[0]) if targets else {})
-    with mss() as sct:
-        monitor_items = sct.monitors[1:] if len(sct.monitors) > 1 else sct.monitors
-        if not monitor_items:
-            raise HTTPException(status_code=500, detail="No desktop displays were detected.")
-        chosen = monitor_items[_desktop_match_mss_monitor_index(
-            monitor_items,
-            target_id=str(selected_target.get("id") or ""),
-            target_left=selected_target.get("left"),
-            target_top=selected_target.get("top"),
-            target_width=selected_target.get("width"),
-            target_height=selected_target.get("height"),
-        )]
-        mon = chosen
-        return {
-            "left": int(mon.get("left", 0)),
-            "top": int(mon.get("top", 0)),
-            "width": int(mon.get("width", 0)),
-            "height": int(mon.get("height", 0)),
-        }
+    monitor_items = list(snapshot["monitors"])
+    if not monitor_items:
+        raise HTTPException(status_code=500, detail="No desktop displays were detected.")
+    mon = monitor_items[_desktop_match_mss_monitor_index(
+        monitor_items,
+        target_id=str(selected_target.get("id") or ""),
+        target_left=selected_target.get("left"),
+        target_top=selected_target.get("top"),
+        target_width=selected_target.get("width"),
+        target_height=selected_target.get("height"),
+    )]
+    return {
+        "left": int(mon.get("left", 0)),
+        "top": int(mon.get("top", 0)),
+        "width": int(mon.get("width", 0)),
+        "height": int(mon.get("height", 0)),
+    }
 
 
 def _desktop_selected_output_index() -> Optional[int]:
-    targets = _desktop_target_items()
+    snapshot = _desktop_topology_snapshot()
+    targets = _desktop_target_items(snapshot)
     if not targets:
         return None
     selected_target = next((dict(item) for item in targets if item.get("selected")), dict(targets[0]))
-    with mss() as sct:
-        monitor_items = sct.monitors[1:] if len(sct.monitors) > 1 else sct.monitors
-        if not monitor_items:
-            return None
-        return _desktop_match_mss_monitor_index(
-            monitor_items,
-            target_id=str(selected_target.get("id") or ""),
-            target_left=selected_target.get("left"),
-            target_top=selected_target.get("top"),
-            target_width=selected_target.get("width"),
-            target_height=selected_target.get("height"),
-        )
+    monitor_items = list(snapshot["monitors"])
+    if not monitor_items:
+        return None
+    return _desktop_match_mss_monitor_index(
+        monitor_items,
+        target_id=str(selected_target.get("id") or ""),
+        target_left=selected_target.get("left"),
+        target_top=selected_target.get("top"),
+        target_width=selected_target.get("width"),
+        target_height=selected_target.get("height"),
+    )
 
 
 def _desktop_clear_current_thread_capture_handles() -> None:
@@ -9344,20 +12613,52 @@ def _desktop_clear_cached_capture_handles() -> None:
     setattr(DESKTOP_CAPTURE_TLS, "capture_generation", generation)
 
 
-def _desktop_target_items() -> List[Dict[str, Any]]:
-    with DESKTOP_TARGET_LOCK:
-        selected_id = DESKTOP_TARGET_SELECTED_ID
-    targets: List[Dict[str, Any]] = []
-    windows_displays = _desktop_windows_display_info()
-    if windows_displays:
-        ordered_windows_displays = sorted(
-            list(windows_displays),
-            key=lambda item: _desktop_device_name_sort_key(str(item.get("device_name") or "")),
+def _desktop_display_signature() -> Optional[Tuple[int, ...]]:
+    # Cheap display-change signal: monitor count plus the virtual-screen rectangle.
+    if os.name != "nt" or not getattr(ctypes, "windll", None):
+        return None
+    try:
+        metrics = ctypes.windll.user32.GetSystemMetrics  # type: ignore[attr-defined]
+        return tuple(
+            int(metrics(index))
+            for index in (SM_CMONITORS, SM_XVIRTUALSCREEN, SM_YVIRTUALSCREEN, SM_CXVIRTUALSCREEN, SM_CYVIRTUALSCREEN)
         )
-        for index, mon in enumerate(ordered_windows_displays, start=1):
-            target_id = f"display-{index}"
-            device_name = str(mon.get("device_name") or "").strip().lower()
-            monitor_id = str(mon.get("monitor_id") or "").strip().lower()
+    except Exception:
+        return None
+
+
+def _desktop_read_display_topology() -> Dict[str, Any]:
+    enumerator = DESKTOP_TOPOLOGY_ENUMERATOR
+    if enumerator is not None:
+        return enumerator()
+    windows_displays = _desktop_windows_display_info()
+    _load_media_stack("mss", required=True)
+    with mss() as sct:
+        monitor_items = sct.monitors[1:] if len(sct.monitors) > 1 else sct.monitors
+        monitors = [
+            {
+                "left": int((mon or {}).get("left", 0)),
+                "top": int((mon or {}).get("top", 0)),
+                "width": int((mon or {}).get("width", 0)),
+                "height": int((mon or {}).get("height", 0)),
+            }
+            for mon in monitor_items
+        ]
+    return {"windows_displays": windows_displays, "monitors": monitors}
+
+
+def _desktop_build_topology_targets(raw: Dict[str, Any]) -> List[Dict[str, Any]]:
+    targets: List[Dict[str, Any]] = []
+    windows_displays = list(raw.get("windows_displays") or [])
+    if windows_displays:
+        ordered_windows_displays = sorted(
+            list(windows_displays),
+            key=lambda item: _desktop_device_name_sort_key(str(item.get("device_name") or "")),
+        )
+        for index, mon in enumerate(ordered_windows_displays, start=1):
+            target_id = f"display-{index}"
+            device_name = str(mon.get("device_name") or "").strip().lower()
+            monitor_id = str(mon.get("monitor_id") or "").strip().lower()
             is_primary = bool(mon.get("primary")) if index != 1 else bool(mon.get("primary", True))
             is_virtual = bool(mon.get("virtual"))
             if DESKTOP_TARGET_VIRTUAL_HINT:
@@ -9371,7 +12672,6 @@ def _desktop_target_items() -> List[Dict[str, Any]]:
                 "virtual": is_virtual,
                 "physical": not is_virtual,
                 "primary": is_primary,
-                "selected": target_id == selected_id if selected_id else is_primary,
                 "device_name": str(mon.get("device_name") or "").strip(),
                 "adapter_name": str(mon.get("adapter_name") or "").strip(),
                 "adapter_id": str(mon.get("adapter_id") or "").strip(),
@@ -9384,25 +12684,104 @@ def _desktop_target_items() -> List[Dict[str, Any]]:
             })
         if targets:
             return targets
-    with mss() as sct:
-        monitor_items = sct.monitors[1:] if len(sct.monitors) > 1 else sct.monitors
-        for index, mon in enumerate(monitor_items, start=1):
-            target_id = f"display-{index}"
-            is_primary = index == 1
-            is_virtual = bool(DESKTOP_TARGET_VIRTUAL_HINT and target_id == DESKTOP_TARGET_VIRTUAL_HINT)
-            targets.append({
-                "id": target_id,
-                "label": f"{'Primary' if is_primary else 'Display'} {index}",
-                "kind": "virtual" if is_virtual else "physical",
-                "virtual": is_virtual,
-                "physical": not is_virtual,
-                "primary": is_primary,
-                "selected": target_id == selected_id if selected_id else is_primary,
-                "left": int(mon.get("left", 0)),
-                "top": int(mon.get("top", 0)),
-                "width": int(mon.get("width", 0)),
-                "height": int(mon.get("height", 0)),
-            })
+    for index, mon in enumerate(list(raw.get("monitors") or []), start=1):
+        target_id = f"display-{index}"
+        is_primary = index == 1
+        is_virtual = bool(DESKTOP_TARGET_VIRTUAL_HINT and target_id == DESKTOP_TARGET_VIRTUAL_HINT)
+        targets.append({
+            "id": target_id,
+            "label": f"{'Primary' if is_primary else 'Display'} {index}",
+            "kind": "virtual" if is_virtual else "physical",
+            "virtual": is_virtual,
+            "physical": not is_virtual,
+            "primary": is_primary,
+            "left": int(mon.get("left", 0)),
+            "top": int(mon.get("top", 0)),
+            "width": int(mon.get("width", 0)),
+            "height": int(mon.get("height", 0)),
+        })
+    return targets
+
+
+def _desktop_invalidate_topology(reason: str) -> None:
+    with DESKTOP_TOPOLOGY_LOCK:
+        DESKTOP_TOPOLOGY["dirty"] = True
+        DESKTOP_TOPOLOGY["dirty_reason"] = str(reason or "invalidated")
+
+
+def _desktop_topology_snapshot() -> Dict[str, Any]:
+    """
+    Return the cached display topology. Snapshots are replaced wholesale, never
+    mutated, and only re-enumerated when invalidated (target switch, capture
+    failure), when the display signature changes, or after the max age.
+    """
+    now = time.time()
+    changed = False
+    with DESKTOP_TOPOLOGY_LOCK:
+        snapshot = DESKTOP_TOPOLOGY.get("snapshot")
+        refresh = snapshot is None or bool(DESKTOP_TOPOLOGY.get("dirty"))
+        signature = DESKTOP_TOPOLOGY.get("signature")
+        if not refresh and now - float(DESKTOP_TOPOLOGY.get("checked_at") or 0.0) >= DESKTOP_TOPOLOGY_CHECK_INTERVAL_S:
+            DESKTOP_TOPOLOGY["checked_at"] = now
+            signature = _desktop_display_signature()
+            if signature != DESKTOP_TOPOLOGY.get("signature"):
+                refresh = True
+                DESKTOP_TOPOLOGY["dirty_reason"] = "display_change"
+            elif now - float(snapshot.get("refreshed_at") or 0.0) >= DESKTOP_TOPOLOGY_MAX_AGE_S:
+                refresh = True
+                DESKTOP_TOPOLOGY["dirty_reason"] = "max_age"
+        if refresh:
+            if snapshot is None or DESKTOP_TOPOLOGY.get("dirty"):
+                signature = _desktop_display_signature()
+            raw = _desktop_read_display_topology()
+            DESKTOP_TOPOLOGY["enumerations"] = int(DESKTOP_TOPOLOGY.get("enumerations") or 0) + 1
+            targets = tuple(_desktop_build_topology_targets(raw))
+            monitors = tuple(dict(mon) for mon in (raw.get("monitors") or []))
+            generation = int(DESKTOP_TOPOLOGY.get("generation") or 0)
+            if snapshot is None or snapshot.get("targets") != targets or snapshot.get("monitors") != monitors:
+                changed = snapshot is not None
+                generation += 1
+            snapshot = {
+                "generation": generation,
+                "targets": targets,
+                "monitors": monitors,
+                "refreshed_at": now,
+                "reason": str(DESKTOP_TOPOLOGY.get("dirty_reason") or ""),
+            }
+            DESKTOP_TOPOLOGY["snapshot"] = snapshot
+            DESKTOP_TOPOLOGY["generation"] = generation
+            DESKTOP_TOPOLOGY["signature"] = signature
+            DESKTOP_TOPOLOGY["checked_at"] = now
+            DESKTOP_TOPOLOGY["dirty"] = False
+            DESKTOP_TOPOLOGY["dirty_reason"] = ""
+    if changed:
+        # Display layout moved under us; capture handles bound to the old outputs are stale.
+        _desktop_clear_cached_capture_handles()
+    return snapshot
+
+
+def _desktop_topology_stats() -> Dict[str, Any]:
+    with DESKTOP_TOPOLOGY_LOCK:
+        snapshot = DESKTOP_TOPOLOGY.get("snapshot") or {}
+        return {
+            "generation": int(DESKTOP_TOPOLOGY.get("generation") or 0),
+            "enumerations": int(DESKTOP_TOPOLOGY.get("enumerations") or 0),
+            "refreshed_at": float(snapshot.get("refreshed_at") or 0.0),
+            "dirty": bool(DESKTOP_TOPOLOGY.get("dirty")),
+            "display_count": len(snapshot.get("targets") or ()),
+        }
+
+
+def _desktop_target_items(snapshot: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    with DESKTOP_TARGET_LOCK:
+        selected_id = DESKTOP_TARGET_SELECTED_ID
+    if snapshot is None:
+        snapshot = _desktop_topology_snapshot()
+    targets: List[Dict[str, Any]] = []
+    for item in snapshot.get("targets") or ():
+        target = dict(item)
+        target["selected"] = target["id"] == selected_id if selected_id else bool(target.get("primary"))
+        targets.append(target)
     return targets
 
 
@@ -9432,6 +12811,7 @@ def _desktop_targets_payload() -> Dict[str, Any]:
         "ok": True,
         "targets": targets,
         "active_target": active,
+        "topology_generation": _desktop_topology_stats()["generation"],
         "virtual_supported": bool(virtual_target),
         "virtual_enabled": bool(virtual_target and active.get("id") == virtual_target.get("id")),
         "detail": (
@@ -9472,6 +12852,7 @@ def _desktop_select_target(target_id: str) -> Dict[str, Any]:
         changed = DESKTOP_TARGET_SELECTED_ID != selected
         DESKTOP_TARGET_SELECTED_ID = selected
     if changed:
+        _desktop_invalidate_topology("target_switch")
         _desktop_clear_cached_capture_handles()
     return _desktop_targets_payload()
 
@@ -9485,7 +12866,7 @@ def _desktop_capture_backend() -> str:
 
 def _desktop_dxcam() -> Any:
     global DESKTOP_DXCAM_CAMERA, DESKTOP_DXCAM_OUTPUT_IDX, DESKTOP_DXCAM_GENERATION
-    if not DXCAM_AVAILABLE or dxcam is None or os.name != "nt":
+    if not DXCAM_AVAILABLE or os.name != "nt" or not _load_media_stack("dxcam"):
         raise RuntimeError("dxcam desktop capture is not available on this host.")
     output_idx = _desktop_selected_output_index()
     generation = int(DESKTOP_CAPTURE_GENERATION)
@@ -9645,7 +13026,7 @@ def _resize_rgb_to_target(
     size: Tuple[int, int],
     target_size: Optional[Tuple[int, int]],
 ) -> Tuple[bytes, Tuple[int, int]]:
-    if not target_size or not PILLOW_AVAILABLE:
+    if not target_size or not _load_media_stack("pillow"):
         return rgb_bytes, size
     src_w, src_h = int(size[0]), int(size[1])
     target_w, target_h = int(target_size[0]), int(target_size[1])
@@ -9779,15 +13160,21 @@ def _desktop_capture_rgb(
                 flush=True,
             )
             traceback.print_exc()
-
-    if sct_instance is not None:
-        return _capture(sct_instance)
-
-    thread_local_sct = getattr(DESKTOP_CAPTURE_TLS, "sct", None)
-    if thread_local_sct is None:
-        thread_local_sct = mss()
-        DESKTOP_CAPTURE_TLS.sct = thread_local_sct
-    return _capture(thread_local_sct)
+            _desktop_invalidate_topology("capture_failure")
+
+    sct = sct_instance
+    if sct is None:
+        sct = getattr(DESKTOP_CAPTURE_TLS, "sct", None)
+        if sct is None:
+            _load_media_stack("mss", required=True)
+            sct = mss()
+            DESKTOP_CAPTURE_TLS.sct = sct
+    try:
+        return _capture(sct)
+    except Exception:
+        # A vanished or resized display surfaces here first; re-enumerate on the next frame.
+        _desktop_invalidate_topology("capture_failure")
+        raise
 
 
 def _desktop_stream_format(value: Optional[str]) -> str:
@@ -9812,23 +13199,280 @@ def _desktop_encode_frame(
     png_level: int,
     jpeg_quality: int,
 ) -> Tuple[bytes, str]:
-    if stream_format == "jpeg":
-        image = Image.frombytes("RGB", (int(out_size[0]), int(out_size[1])), rgb)
-        buffer = io.BytesIO()
-        image.save(
-            buffer,
-            format="JPEG",
-            quality=jpeg_quality,
-            optimize=False,
-            progressive=False,
-            subsampling=0,
-        )
-        return buffer.getvalue(), "image/jpeg"
-    return to_png(rgb, out_size, level=png_level), "image/png"
+    with METRICS.time("codrex_desktop_encode_seconds", format="jpeg" if stream_format == "jpeg" else "png"):
+        if stream_format == "jpeg" and _load_media_stack("pillow"):
+            image = Image.frombytes("RGB", (int(out_size[0]), int(out_size[1])), rgb)
+            buffer = io.BytesIO()
+            image.save(
+                buffer,
+                format="JPEG",
+                quality=jpeg_quality,
+                optimize=False,
+                progressive=False,
+                subsampling=0,
+            )
+            return buffer.getvalue(), "image/jpeg"
+        _load_media_stack("mss", required=True)
+        return to_png(rgb, out_size, level=png_level), "image/png"
+
+
+def _desktop_tile_hashes(rgb: bytes, size: Tuple[int, int], tile_size: int) -> List[int]:
+    """CRC32 per tile, built row by row over memoryview slices (no frame copies)."""
+    width, height = int(size[0]), int(size[1])
+    tile = max(8, int(tile_size or DESKTOP_STREAM_TILE_SIZE))
+    if width <= 0 or height <= 0:
+        return []
+    channels = max(1, len(rgb) // (width * height)) if rgb else 3
+    cols = (width + tile - 1) // tile
+    rows = (height + tile - 1) // tile
+    hashes = [0] * (cols * rows)
+    view = memoryview(rgb)
+    stride = width * channels
+    tile_bytes = tile * channels
+    crc32 = zlib.crc32
+    for y in range(height):
+        base_index = (y // tile) * cols
+        row_start = y * stride
+        row_end = row_start + stride
+        start = row_start
+        for col in range(cols):
+            end = min(start + tile_bytes, row_end)
+            index = base_index + col
+            hashes[index] = crc32(view[start:end], hashes[index])
+            start = end
+    return hashes
+
+
+class _DesktopFrameChangeDetector:
+    """
+    Tile-hash change detection for one desktop stream. Identical frames are
+    caught with a single buffer compare; only changed frames pay for tile
+    hashing. Consecutive idle frames stretch the capture interval.
+    """
+
+    def __init__(self, kind: str, *, tile_size: int = DESKTOP_STREAM_TILE_SIZE) -> None:
+        self.kind = str(kind or "stream")
+        self.tile_size = max(8, int(tile_size or DESKTOP_STREAM_TILE_SIZE))
+        self.created_at = time.time()
+        self._prev_rgb: Optional[bytes] = None
+        self._prev_size: Optional[Tuple[int, int]] = None
+        self._prev_hashes: List[int] = []
+        self.idle_streak = 0
+        self.last_capture_at = 0.0
+        self.last_ratio = 1.0
+        self.avg_ratio = 1.0
+        self.counters: Dict[str, int] = {
+            "captured": 0,
+            "changed": 0,
+            "sent": 0,
+            "skipped": 0,
+            "keepalive": 0,
+            "reused": 0,
+        }
+
+    def update(self, rgb: bytes, size: Tuple[int, int]) -> Dict[str, Any]:
+        frame_size = (int(size[0]), int(size[1]))
+        self.counters["captured"] += 1
+        self.last_capture_at = time.time()
+        if self._prev_rgb is not None and self._prev_size == frame_size and rgb == self._prev_rgb:
+            changed_tiles = 0
+            total_tiles = len(self._prev_hashes)
+        else:
+            hashes = _desktop_tile_hashes(rgb, frame_size, self.tile_size)
+            total_tiles = len(hashes)
+            if self._prev_size != frame_size or len(self._prev_hashes) != total_tiles:
+                changed_tiles = total_tiles
+            else:
+                changed_tiles = sum(1 for old, new in zip(self._prev_hashes, hashes) if old != new)
+            self._prev_hashes = hashes
+        self._prev_rgb = rgb
+        self._prev_size = frame_size
+        ratio = (float(changed_tiles) / float(total_tiles)) if total_tiles else 0.0
+        changed = changed_tiles > 0 or self.counters["captured"] == 1
+        if changed:
+            self.idle_streak = 0
+            self.counters["changed"] += 1
+        else:
+            self.idle_streak += 1
+        self.last_ratio = ratio
+        self.avg_ratio = (self.avg_ratio * 0.8) + (ratio * 0.2)
+        return {
+            "changed": changed,
+            "changed_tiles": changed_tiles,
+            "total_tiles": total_tiles,
+            "ratio": ratio,
+        }
+
+    def note(self, outcome: str) -> None:
+        if outcome in self.counters:
+            self.counters[outcome] += 1
+
+    def next_delay_s(self, base_delay_s: float) -> float:
+        base = max(0.001, float(base_delay_s))
+        if self.idle_streak < DESKTOP_STREAM_IDLE_FRAMES:
+            return base
+        steps = (self.idle_streak - DESKTOP_STREAM_IDLE_FRAMES) // DESKTOP_STREAM_IDLE_FRAMES + 1
+        factor = min(DESKTOP_STREAM_IDLE_BACKOFF_MAX, 2 ** min(steps, 8))
+        return min(base * factor, max(base, DESKTOP_STREAM_IDLE_MAX_DELAY_S))
+
+    def capture_due(self, now: float, base_delay_s: float) -> bool:
+        if self._prev_rgb is None or self.idle_streak < DESKTOP_STREAM_IDLE_FRAMES:
+            return True
+        return now - self.last_capture_at >= self.next_delay_s(base_delay_s)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "tile_size": self.tile_size,
+            "changed_tile_ratio": round(self.last_ratio, 4),
+            "changed_tile_ratio_avg": round(self.avg_ratio, 4),
+            "idle_streak": self.idle_streak,
+            "started_at": self.created_at,
+            **self.counters,
+        }
+
+
+class _DesktopStreamRateController:
+    """
+    AIMD controller for one multipart stream. Each observation is the time the
+    previous part took to drain into the socket; a drain longer than a share of
+    the frame interval halves fps and trims JPEG quality, and only once both are
+    at their floor does the downscale factor grow. A run of clean frames undoes
+    one step at a time (scale, then quality, then fps).
+    """
+
+    def __init__(
+        self,
+        *,
+        fps: float,
+        quality: int,
+        scale: int,
+        tune_quality: bool = True,
+        min_fps: float = DESKTOP_STREAM_ADAPTIVE_MIN_FPS,
+        min_quality: int = DESKTOP_STREAM_ADAPTIVE_MIN_QUALITY,
+        max_scale: int = DESKTOP_STREAM_ADAPTIVE_MAX_SCALE,
+    ) -> None:
+        self.max_fps = float(fps)
+        self.fps = float(fps)
+        self.min_fps = min(float(min_fps), self.max_fps)
+        self.max_quality = int(quality)
+        self.quality = int(quality)
+        self.min_quality = min(int(min_quality), self.max_quality)
+        self.min_scale = int(scale)
+        self.scale = int(scale)
+        self.max_scale = max(int(max_scale), self.min_scale)
+        self.tune_quality = bool(tune_quality)
+        self.clean_streak = 0
+        self.cooldown = 0
+        self.frames = 0
+        self.decreases = 0
+        self.increases = 0
+        self.drain_ema_s = 0.0
+        self.bytes_ema = 0.0
+        self.throughput_ema_bps = 0.0
+
+    def observe(self, drain_s: float, frame_bytes: int) -> bool:
+        drain = max(0.0, float(drain_s))
+        interval = 1.0 / max(0.001, self.fps)
+        self.frames += 1
+        weight = 1.0 if self.frames == 1 else 0.25
+        self.drain_ema_s += (drain - self.drain_ema_s) * weight
+        self.bytes_ema += (float(frame_bytes) - self.bytes_ema) * weight
+        throughput = float(frame_bytes) / max(drain, interval)
+        self.throughput_ema_bps += (throughput - self.throughput_ema_bps) * weight
+        if self.cooldown > 0:
+            self.cooldown -= 1
+        if drain > interval * DESKTOP_STREAM_ADAPTIVE_CONGESTION_RATIO:
+            self.clean_streak = 0
+            if self.cooldown > 0:
+                return False
+            # Let the new settings reach the wire before judging them.
+            self.cooldown = DESKTOP_STREAM_ADAPTIVE_COOLDOWN_FRAMES
+            return self._decrease()
+        self.clean_streak += 1
+        if self.clean_streak < DESKTOP_STREAM_ADAPTIVE_INCREASE_FRAMES:
+            return False
+        self.clean_streak = 0
+        return self._increase()
+
+    def _decrease(self) -> bool:
+        changed = False
+        if self.fps > self.min_fps:
+            self.fps = max(self.min_fps, round(self.fps * 0.5, 3))
+            changed = True
+        if self.tune_quality and self.quality > self.min_quality:
+            self.quality = max(self.min_quality, int(self.quality * 0.85))
+            changed = True
+        if not changed and self.scale < self.max_scale:
+            self.scale += 1
+            changed = True
+        if changed:
+            self.decreases += 1
+        return changed
+
+    def _increase(self) -> bool:
+        if self.scale > self.min_scale:
+            self.scale -= 1
+        elif self.tune_quality and self.quality < self.max_quality:
+            self.quality = min(self.max_quality, self.quality + 4)
+        elif self.fps < self.max_fps:
+            self.fps = min(self.max_fps, self.fps + 1.0)
+        else:
+            return False
+        self.increases += 1
+        return True
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "fps": round(self.fps, 3),
+            "quality": self.quality,
+            "scale": self.scale,
+            "bounds": {
+                "fps": [self.min_fps, self.max_fps],
+                "quality": [self.min_quality, self.max_quality],
+                "scale": [self.min_scale, self.max_scale],
+            },
+            "drain_ms_avg": round(self.drain_ema_s * 1000.0, 2),
+            "frame_bytes_avg": int(self.bytes_ema),
+            "throughput_bps": int(self.throughput_ema_bps),
+            "observed": self.frames,
+            "decreases": self.decreases,
+            "increases": self.increases,
+        }
+
+
+def _desktop_stream_activity_open(
+    detector: _DesktopFrameChangeDetector,
+    controller: Optional[_DesktopStreamRateController] = None,
+) -> str:
+    stream_id = uuid.uuid4().hex[:12]
+    with DESKTOP_STREAM_ACTIVITY_LOCK:
+        DESKTOP_STREAM_ACTIVITY[stream_id] = (detector, controller)
+    return stream_id
+
+
+def _desktop_stream_activity_close(stream_id: str) -> None:
+    with DESKTOP_STREAM_ACTIVITY_LOCK:
+        DESKTOP_STREAM_ACTIVITY.pop(stream_id, None)
+
+
+def _desktop_stream_activity_snapshot() -> List[Dict[str, Any]]:
+    with DESKTOP_STREAM_ACTIVITY_LOCK:
+        items = list(DESKTOP_STREAM_ACTIVITY.items())
+    return [
+        {
+            "id": stream_id,
+            **detector.snapshot(),
+            "adaptive": controller.snapshot() if controller is not None else None,
+        }
+        for stream_id, (detector, controller) in items
+    ]
+
 
+def _build_desktop_video_track_class(base: Any) -> Any:
+    """Defined once aiortc is loaded, since the class derives from its VideoStreamTrack."""
 
-if AIORTC_AVAILABLE:
-    class DesktopVideoTrack(VideoStreamTrack):
+    class DesktopVideoTrack(base):
         def __init__(
             self,
             fps: float,
@@ -9851,6 +13495,9 @@ if AIORTC_AVAILABLE:
             self._timestamp_step = max(1, int(round(self._clock_rate / self._fps)))
             self._started_at: Optional[float] = None
             self._timestamp = 0
+            self._change = _DesktopFrameChangeDetector("webrtc")
+            self._activity_id = _desktop_stream_activity_open(self._change)
+            self._last_frame: Any = None
 
         async def _next_frame_timestamp(self) -> Tuple[int, Fraction]:
             if self._started_at is None:
@@ -9869,30 +13516,42 @@ if AIORTC_AVAILABLE:
                 raise MediaStreamError
 
             pts, time_base = await self._next_frame_timestamp()
-            capture_started = time.perf_counter()
-            rgb, out_size = await asyncio.to_thread(
-                _desktop_capture_rgb,
-                self._scale_factor,
-                self._grayscale,
-                None,
-                self._aspect_ratio,
-                self._layout_mode,
-                self._target_size,
-            )
-            capture_ms = (time.perf_counter() - capture_started) * 1000.0
-            frame_array = np.frombuffer(rgb, dtype=np.uint8).reshape((int(out_size[1]), int(out_size[0]), 3))
-            frame = VideoFrame.from_ndarray(frame_array, format="rgb24")
+            frame = self._last_frame
+            if frame is None or self._change.capture_due(time.time(), 1.0 / self._fps):
+                rgb, out_size = await asyncio.to_thread(
+                    _desktop_capture_rgb,
+                    self._scale_factor,
+                    self._grayscale,
+                    None,
+                    self._aspect_ratio,
+                    self._layout_mode,
+                    self._target_size,
+                )
+                change = self._change.update(rgb, out_size)
+                if change["changed"] or frame is None:
+                    frame_array = np.frombuffer(rgb, dtype=np.uint8).reshape((int(out_size[1]), int(out_size[0]), 3))
+                    frame = VideoFrame.from_ndarray(frame_array, format="rgb24")
+                    self._last_frame = frame
+                    self._change.note("sent")
+                else:
+                    self._change.note("reused")
+            else:
+                # Idle desktop: keep the RTP clock running on the last frame without capturing.
+                self._change.note("reused")
             frame.pts = pts
             frame.time_base = time_base
             self._frames_sent += 1
             return frame
 
         def stop(self) -> None:
+            _desktop_stream_activity_close(self._activity_id)
             super().stop()
 
+    return DesktopVideoTrack
 
-def _desktop_point(x: int, y: int) -> Dict[str, int]:
-    mon = _desktop_monitor()
+
+def _desktop_point(x: int, y: int, monitor: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+    mon = monitor or _desktop_monitor()
     if mon["width"] <= 0 or mon["height"] <= 0:
         raise HTTPException(status_code=500, detail="Invalid desktop monitor size.")
     sx = _clamp(int(x), 0, mon["width"] - 1)
@@ -10218,8 +13877,406 @@ def _ps_single_quote(value: str) -> str:
     return "'" + str(value or "").replace("'", "''") + "'"
 
 
-def _run_powershell(script: str, timeout_s: int = 10, sta: bool = False) -> Dict[str, Any]:
-    _ensure_windows_host()
+# -------------------------
+# PowerShell host worker
+# -------------------------
+# C# helper shared by the selected-paths probe and the worker preload. Add-Type
+# skips a definition whose source it has already compiled in this process, so
+# keeping both copies byte-identical is what makes the preload pay off.
+CODREX_WIN32_TYPE_SOURCE = r"""using System;
+using System.Runtime.InteropServices;
+using System.Text;
+public static class CodrexWin32 {
+  [DllImport("user32.dll")]
+  public static extern IntPtr GetForegroundWindow();
+  [DllImport("user32.dll")]
+  public static extern IntPtr GetAncestor(IntPtr hWnd, uint gaFlags);
+  [DllImport("user32.dll")]
+  [return: MarshalAs(UnmanagedType.Bool)]
+  public static extern bool IsWindowVisible(IntPtr hWnd);
+  [DllImport("user32.dll")]
+  [return: MarshalAs(UnmanagedType.Bool)]
+  public static extern bool IsIconic(IntPtr hWnd);
+  [DllImport("user32.dll", CharSet = CharSet.Unicode)]
+  public static extern int GetClassName(IntPtr hWnd, StringBuilder lpClassName, int nMaxCount);
+  [DllImport("user32.dll")]
+  public static extern uint GetWindowThreadProcessId(IntPtr hWnd, out uint processId);
+}"""
+
+# Worker loop: one JSON request per stdin line ({"id", "script"}), one JSON
+# response per stdout line ({"id", "exit_code", "stdout", "stderr"}). Each
+# request runs in a fresh runspace (pre-opened while idle) so variables never
+# leak between callers, while assemblies and Add-Type helpers stay loaded in
+# the process. `exit N` inside a request ends that request with $LASTEXITCODE.
+POWERSHELL_WORKER_SCRIPT = r"""
+$ErrorActionPreference = 'Continue'
+$utf8 = New-Object System.Text.UTF8Encoding $false
+[Console]::InputEncoding = $utf8
+[Console]::OutputEncoding = $utf8
+$workerSta = __CODREX_WORKER_STA__
+try { Add-Type -AssemblyName System.Windows.Forms } catch {}
+try { Add-Type -AssemblyName System.Drawing } catch {}
+try {
+  Add-Type @"
+__CODREX_WIN32_TYPE_SOURCE__
+"@
+} catch {}
+
+function New-CodrexRunspace {
+  $rs = [runspacefactory]::CreateRunspace()
+  if ($workerSta) { $rs.ApartmentState = [System.Threading.ApartmentState]::STA }
+  $rs.ThreadOptions = [System.Management.Automation.Runspaces.PSThreadOptions]::ReuseThread
+  $rs.Open()
+  return $rs
+}
+
+function Write-CodrexLine($payload) {
+  [Console]::Out.WriteLine(($payload | ConvertTo-Json -Compress))
+  [Console]::Out.Flush()
+}
+
+$spare = New-CodrexRunspace
+Write-CodrexLine @{ ready = $true; pid = $PID }
+while ($true) {
+  $line = [Console]::In.ReadLine()
+  if ($null -eq $line) { break }
+  if (-not $line.Trim()) { continue }
+  try { $request = $line | ConvertFrom-Json } catch { continue }
+  $rs = $spare
+  $ps = [powershell]::Create()
+  $ps.Runspace = $rs
+  $output = New-Object 'System.Management.Automation.PSDataCollection[psobject]'
+  $exitCode = 0
+  $stderr = ''
+  try {
+    [void]$ps.AddScript([string]$request.script).AddCommand('Out-String').AddParameter('Stream')
+    [void]$ps.Invoke($null, $output)
+    if ($ps.HadErrors) {
+      $stderr = ((@($ps.Streams.Error) | ForEach-Object { $_.ToString() }) -join "`n")
+    }
+    $lastExit = $rs.SessionStateProxy.GetVariable('LASTEXITCODE')
+    if ($null -ne $lastExit) { $exitCode = [int]$lastExit }
+  } catch {
+    $err = $_.Exception
+    if ($err.InnerException) { $err = $err.InnerException }
+    $exitCode = 1
+    $stderr = [string]$err.Message
+  }
+  $stdout = ((@($output) | ForEach-Object { [string]$_ }) -join "`n")
+  Write-CodrexLine @{ id = $request.id; exit_code = $exitCode; stdout = $stdout; stderr = $stderr }
+  try { $ps.Dispose() } catch {}
+  try { $rs.Dispose() } catch {}
+  $spare = New-CodrexRunspace
+}
+"""
+
+
+class _PowerShellWorkerError(RuntimeError):
+    pass
+
+
+class _PowerShellWorkerTransport(abc.ABC):
+    """Line-oriented pipe to one worker process; subclasses supply the process."""
+
+    @abc.abstractmethod
+    def start(self) -> None: ...
+
+    @abc.abstractmethod
+    def write_line(self, line: str) -> None: ...
+
+    @abc.abstractmethod
+    def read_line(self) -> Optional[str]:
+        """Next line without its newline, or None once the worker has gone away."""
+
+    @abc.abstractmethod
+    def alive(self) -> bool: ...
+
+    @abc.abstractmethod
+    def close(self) -> None: ...
+
+
+class _SubprocessPowerShellWorkerTransport(_PowerShellWorkerTransport):
+    def __init__(self, argv: List[str]) -> None:
+        self.argv = list(argv)
+        self.proc: Optional[subprocess.Popen] = None
+
+    def start(self) -> None:
+        kwargs: Dict[str, Any] = {}
+        if os.name == "nt":
+            kwargs["creationflags"] = getattr(subprocess, "CREATE_NO_WINDOW", 0)
+        self.proc = subprocess.Popen(
+            self.argv,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+            bufsize=1,
+            **kwargs,
+        )
+
+    def write_line(self, line: str) -> None:
+        proc = self.proc
+        if proc is None or proc.stdin is None:
+            raise BrokenPipeError("worker not started")
+        proc.stdin.write(line + "\n")
+        proc.stdin.flush()
+
+    def read_line(self) -> Optional[str]:
+        proc = self.proc
+        if proc is None or proc.stdout is None:
+            return None
+        try:
+            line = proc.stdout.readline()
+        except (OSError, ValueError):
+            return None
+        if not line:
+            return None
+        return line.rstrip("\r\n")
+
+    def alive(self) -> bool:
+        return self.proc is not None and self.proc.poll() is None
+
+    def close(self) -> None:
+        proc = self.proc
+        if proc is None:
+            return
+        try:
+            proc.kill()
+        except Exception:
+            pass
+        try:
+            proc.wait(timeout=2)
+        except Exception:
+            pass
+        for stream in (proc.stdin, proc.stdout):
+            try:
+                if stream is not None:
+                    stream.close()
+            except Exception:
+                pass
+
+
+class _PowerShellWorkerClient:
+    """
+    Runs scripts on one long-lived worker, one request in flight at a time.
+    A worker that exits fails its in-flight request with 125 and one that
+    overruns a request timeout is killed (124); either way the next request
+    starts a replacement. A request that finds the worker busy raises
+    _PowerShellWorkerError straight away, so _run_powershell() runs it as a
+    one-shot process instead of queueing behind a slow script.
+    """
+
+    def __init__(
+        self,
+        transport_factory: Callable[[], _PowerShellWorkerTransport],
+        *,
+        name: str = "powershell",
+        start_timeout_s: float = POWERSHELL_WORKER_START_TIMEOUT_S,
+        retry_after_s: float = POWERSHELL_WORKER_RETRY_AFTER_S,
+    ) -> None:
+        self.transport_factory = transport_factory
+        self.name = name
+        self.start_timeout_s = max(0.1, float(start_timeout_s))
+        self.retry_after_s = max(0.0, float(retry_after_s))
+        self._request_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._session: Optional[Dict[str, Any]] = None
+        self._next_id = 0
+        self._unavailable_until = 0.0
+        self._stats: Dict[str, Any] = {
+            "starts": 0,
+            "restarts": 0,
+            "requests": 0,
+            "completed": 0,
+            "timeouts": 0,
+            "busy_fallbacks": 0,
+            "crashes": 0,
+            "last_error": "",
+        }
+
+    def _read_loop(self, session: Dict[str, Any]) -> None:
+        transport: _PowerShellWorkerTransport = session["transport"]
+        while True:
+            line = transport.read_line()
+            if line is None:
+                break
+            try:
+                payload = json.loads(line)
+            except Exception:
+                continue
+            if not isinstance(payload, dict):
+                continue
+            if payload.get("ready"):
+                session["ready"].set()
+                continue
+            with self._lock:
+                entry = session["pending"].pop(payload.get("id"), None)
+            if entry is None:
+                continue
+            entry["answered"] = True
+            entry["response"] = {
+                "exit_code": int(payload.get("exit_code") or 0),
+                "stdout": str(payload.get("stdout") or "").rstrip(),
+                "stderr": str(payload.get("stderr") or "").rstrip(),
+            }
+            entry["event"].set()
+        self._discard(session, "worker exited", crashed=True)
+
+    def _discard(self, session: Dict[str, Any], reason: str, *, crashed: bool = False) -> None:
+        with self._lock:
+            if session.get("closed"):
+                return
+            session["closed"] = True
+            pending = list(session["pending"].values())
+            session["pending"].clear()
+            if self._session is session:
+                self._session = None
+            if crashed:
+                self._stats["crashes"] += 1
+            self._stats["last_error"] = reason
+        for entry in pending:
+            entry["response"] = {"exit_code": 125, "stdout": "", "stderr": f"powershell worker: {reason}"}
+            entry["event"].set()
+        session["ready"].set()
+        try:
+            session["transport"].close()
+        except Exception:
+            pass
+
+    def _ensure_session(self) -> Dict[str, Any]:
+        # Called with _request_lock held, so at most one start runs at a time.
+        with self._lock:
+            session = self._session
+            if session is not None and not session["closed"] and session["transport"].alive():
+                return session
+            if time.monotonic() < self._unavailable_until:
+                raise _PowerShellWorkerError(self._stats["last_error"] or "worker unavailable")
+            restarting = self._stats["starts"] > 0
+        if session is not None:
+            self._discard(session, "worker exited", crashed=True)
+        transport = self.transport_factory()
+        session = {"transport": transport, "ready": threading.Event(), "pending": {}, "closed": False}
+        try:
+            transport.start()
+        except Exception as e:
+            with self._lock:
+                self._stats["last_error"] = f"start failed: {type(e).__name__}: {e}"
+                self._unavailable_until = time.monotonic() + self.retry_after_s
+            raise _PowerShellWorkerError(self._stats["last_error"])
+        threading.Thread(
+            target=self._read_loop,
+            args=(session,),
+            name=f"codrex-powershell-{self.name}",
+            daemon=True,
+        ).start()
+        if not session["ready"].wait(self.start_timeout_s) or session["closed"]:
+            self._discard(session, f"not ready after {self.start_timeout_s:g}s")
+            with self._lock:
+                self._unavailable_until = time.monotonic() + self.retry_after_s
+            raise _PowerShellWorkerError(f"worker not ready after {self.start_timeout_s:g}s")
+        with self._lock:
+            self._session = session
+            self._stats["starts"] += 1
+            if restarting:
+                self._stats["restarts"] += 1
+            self._unavailable_until = 0.0
+        return session
+
+    def request(self, script: str, timeout_s: float = 10) -> Dict[str, Any]:
+        timeout_s = max(0.01, float(timeout_s))
+        if not self._request_lock.acquire(blocking=False):
+            with self._lock:
+                self._stats["busy_fallbacks"] += 1
+            raise _PowerShellWorkerError("worker busy")
+        try:
+            session = self._ensure_session()
+            entry: Dict[str, Any] = {"event": threading.Event(), "response": None}
+            with self._lock:
+                self._next_id += 1
+                req_id = self._next_id
+                session["pending"][req_id] = entry
+                self._stats["requests"] += 1
+            try:
+                session["transport"].write_line(json.dumps({"id": req_id, "script": str(script or "")}))
+            except Exception as e:
+                self._discard(session, f"write failed: {type(e).__name__}: {e}", crashed=True)
+            if not entry["event"].wait(timeout_s):
+                with self._lock:
+                    self._stats["timeouts"] += 1
+                self._discard(session, f"request timed out after {timeout_s:g}s")
+                return {"exit_code": 124, "stdout": "", "stderr": f"timeout after {timeout_s:g}s"}
+            if entry.get("answered"):
+                with self._lock:
+                    self._stats["completed"] += 1
+            return entry["response"] or {"exit_code": 125, "stdout": "", "stderr": "powershell worker: no response"}
+        finally:
+            self._request_lock.release()
+
+    def close(self) -> None:
+        with self._lock:
+            session = self._session
+        if session is not None:
+            self._discard(session, "closed")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            session = self._session
+            return {
+                "name": self.name,
+                "running": bool(session is not None and not session["closed"]),
+                "busy": self._request_lock.locked(),
+                **self._stats,
+            }
+
+
+def _powershell_worker_argv(sta: bool) -> List[str]:
+    script = (
+        POWERSHELL_WORKER_SCRIPT
+        .replace("__CODREX_WORKER_STA__", "$true" if sta else "$false")
+        .replace("__CODREX_WIN32_TYPE_SOURCE__", CODREX_WIN32_TYPE_SOURCE)
+    )
+    encoded = base64.b64encode(script.encode("utf-16-le")).decode("ascii")
+    argv = ["powershell", "-NoProfile", "-NonInteractive"]
+    if sta:
+        argv.append("-STA")
+    argv.extend(["-EncodedCommand", encoded])
+    return argv
+
+
+def _powershell_worker(sta: bool = False) -> _PowerShellWorkerClient:
+    key = "sta" if sta else "mta"
+    with POWERSHELL_WORKER_LOCK:
+        client = POWERSHELL_WORKERS.get(key)
+        if client is None:
+            argv = _powershell_worker_argv(bool(sta))
+            client = _PowerShellWorkerClient(lambda: _SubprocessPowerShellWorkerTransport(argv), name=key)
+            POWERSHELL_WORKERS[key] = client
+        return client
+
+
+def _powershell_worker_stats() -> Dict[str, Any]:
+    with POWERSHELL_WORKER_LOCK:
+        clients = list(POWERSHELL_WORKERS.values())
+    return {
+        "enabled": POWERSHELL_WORKER_ENABLED,
+        "workers": [client.stats() for client in clients],
+    }
+
+
+def _shutdown_powershell_workers() -> None:
+    with POWERSHELL_WORKER_LOCK:
+        clients = list(POWERSHELL_WORKERS.values())
+        POWERSHELL_WORKERS.clear()
+    for client in clients:
+        client.close()
+
+
+atexit.register(_shutdown_powershell_workers)
+
+
+def _run_powershell_process(script: str, timeout_s: int = 10, sta: bool = False) -> Dict[str, Any]:
     try:
         cmd = ["powershell", "-NoProfile"]
         if sta:
@@ -10244,6 +14301,17 @@ def _run_powershell(script: str, timeout_s: int = 10, sta: bool = False) -> Dict
         return {"exit_code": 125, "stdout": "", "stderr": f"exception: {type(e).__name__}: {e}"}
 
 
+@_instrumented("codrex_subprocess_seconds", outcome=_subprocess_outcome, helper="powershell")
+def _run_powershell(script: str, timeout_s: int = 10, sta: bool = False) -> Dict[str, Any]:
+    _ensure_windows_host()
+    if POWERSHELL_WORKER_ENABLED:
+        try:
+            return _powershell_worker(sta).request(script, timeout_s=timeout_s)
+        except _PowerShellWorkerError:
+            pass
+    return _run_powershell_process(script, timeout_s=timeout_s, sta=sta)
+
+
 def _spawn_windows_background_process(args: List[str], *, detached: bool = True) -> Dict[str, Any]:
     _ensure_windows_host()
     kwargs: Dict[str, Any] = {
@@ -10961,7 +15029,7 @@ def _desktop_foreground_process_name() -> str:
 
 def _desktop_prepare_clipboard_image_file(path_for_windows: str) -> str:
     host_path = _normalize_host_path(path_for_windows)
-    if not PILLOW_AVAILABLE or Image is None:
+    if not _load_media_stack("pillow"):
         return host_path
     ext = os.path.splitext(host_path)[1].lower()
     if ext == ".bmp":
@@ -11342,29 +15410,7 @@ def _desktop_send_key(key: str) -> Dict[str, Any]:
 
 
 def _desktop_selected_paths() -> Dict[str, Any]:
-    script = r"""
-Add-Type @"
-using System;
-using System.Runtime.InteropServices;
-using System.Text;
-public static class CodrexWin32 {
-  [DllImport("user32.dll")]
-  public static extern IntPtr GetForegroundWindow();
-  [DllImport("user32.dll")]
-  public static extern IntPtr GetAncestor(IntPtr hWnd, uint gaFlags);
-  [DllImport("user32.dll")]
-  [return: MarshalAs(UnmanagedType.Bool)]
-  public static extern bool IsWindowVisible(IntPtr hWnd);
-  [DllImport("user32.dll")]
-  [return: MarshalAs(UnmanagedType.Bool)]
-  public static extern bool IsIconic(IntPtr hWnd);
-  [DllImport("user32.dll", CharSet = CharSet.Unicode)]
-  public static extern int GetClassName(IntPtr hWnd, StringBuilder lpClassName, int nMaxCount);
-  [DllImport("user32.dll")]
-  public static extern uint GetWindowThreadProcessId(IntPtr hWnd, out uint processId);
-}
-"@;
-$ErrorActionPreference = 'Stop'
+    script = "\nAdd-Type @\"\n" + CODREX_WIN32_TYPE_SOURCE + "\n\"@;\n" + r"""$ErrorActionPreference = 'Stop'
 $shell = New-Object -ComObject Shell.Application
 $GA_ROOT = [uint32]2
 $foregroundHandle = [CodrexWin32]::GetForegroundWindow()
@@ -11575,6 +15621,416 @@ if ($resultPaths.Count -gt 0) {
         "mode": str(payload.get("mode") or ""),
     }
 
+# -------------------------
+# Desktop input channel
+# -------------------------
+DESKTOP_INPUT_EVENT_ALIASES = {
+    "m": "move",
+    "c": "click",
+    "s": "scroll",
+    "k": "key",
+    "t": "text",
+    "e": "edit",
+}
+
+
+def _desktop_apply_click(
+    x: Any,
+    y: Any,
+    *,
+    button: str = "left",
+    double: bool = False,
+    action: str = "click",
+    monitor: Optional[Dict[str, int]] = None,
+) -> Dict[str, Any]:
+    alt_held_before_click = _desktop_alt_held()
+    screen_x = None
+    screen_y = None
+    via = "desktop"
+    if x is not None and y is not None:
+        p = _desktop_point(int(x), int(y), monitor=monitor)
+        screen_x = int(p["x"])
+        screen_y = int(p["y"])
+    if screen_x is not None and screen_y is not None:
+        caption_command = None
+        if button == "left" and not double and action == "click":
+            caption_command = _desktop_caption_syscommand_at(screen_x, screen_y)
+        if caption_command:
+            via = f"desktop_caption_{caption_command}"
+        else:
+            _desktop_click_at(screen_x, screen_y, button=button, double=double, action=action)
+    else:
+        _desktop_click(button=button, double=double, action=action)
+    logging.info(
+        "desktop_input_click x=%s y=%s screen_x=%s screen_y=%s button=%s action=%s via=%s",
+        x,
+        y,
+        screen_x,
+        screen_y,
+        button,
+        action,
+        via,
+    )
+    if alt_held_before_click:
+        _desktop_release_alt_if_held()
+    return {"button": button, "double": double, "action": action, "via": via}
+
+
+class _DesktopInputSink(abc.ABC):
+    """
+    Applies decoded input events in order. The native sink drives SendInput on the
+    Windows host; tests substitute a recording sink to check ordering and coalescing.
+    """
+
+    def ensure_ready(self) -> None:
+        return None
+
+    def begin_batch(self) -> None:
+        return None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {}
+
+    @abc.abstractmethod
+    def move(self, x: int, y: int) -> Dict[str, Any]: ...
+
+    @abc.abstractmethod
+    def click(self, x: Optional[int], y: Optional[int], button: str, double: bool, action: str) -> Dict[str, Any]: ...
+
+    @abc.abstractmethod
+    def scroll(self, delta: int) -> Dict[str, Any]: ...
+
+    @abc.abstractmethod
+    def key(self, key: str) -> Dict[str, Any]: ...
+
+    @abc.abstractmethod
+    def text(self, text: str) -> Dict[str, Any]: ...
+
+    @abc.abstractmethod
+    def edit(self, backspace: int, text: str) -> Dict[str, Any]: ...
+
+
+class _NativeDesktopInputSink(_DesktopInputSink):
+    def __init__(self) -> None:
+        self._monitor: Optional[Dict[str, int]] = None
+
+    def ensure_ready(self) -> None:
+        _ensure_windows_host()
+
+    def begin_batch(self) -> None:
+        # One display lookup and keep-awake pulse per drained batch instead of per event.
+        self._monitor = _desktop_monitor()
+        _host_keep_awake_pulse()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"alt_held": _desktop_alt_held()}
+
+    def move(self, x: int, y: int) -> Dict[str, Any]:
+        p = _desktop_point(x, y, monitor=self._monitor)
+        _desktop_move_abs(p["x"], p["y"])
+        return {"x": p["rel_x"], "y": p["rel_y"]}
+
+    def click(self, x: Optional[int], y: Optional[int], button: str, double: bool, action: str) -> Dict[str, Any]:
+        return _desktop_apply_click(x, y, button=button, double=double, action=action, monitor=self._monitor)
+
+    def scroll(self, delta: int) -> Dict[str, Any]:
+        _desktop_release_alt_if_held()
+        _desktop_scroll(delta)
+        return {"delta": delta}
+
+    def key(self, key: str) -> Dict[str, Any]:
+        r = _desktop_send_key(key)
+        if r.get("exit_code") != 0:
+            raise HTTPException(status_code=500, detail=str(r.get("stderr") or "key_failed"))
+        return {"key": key}
+
+    def text(self, text: str) -> Dict[str, Any]:
+        _desktop_release_alt_if_held()
+        return {"sent": _send_text_native_first(text, unicode_chunk_size=240)}
+
+    def edit(self, backspace: int, text: str) -> Dict[str, Any]:
+        _desktop_release_alt_if_held()
+        if backspace:
+            _send_vk_repeat(VK_BACK, backspace)
+        sent = _send_text_native_first(text, unicode_chunk_size=240) if text else 0
+        return {"backspace": backspace, "sent": sent}
+
+
+def _desktop_input_normalize_event(raw: Any) -> Dict[str, Any]:
+    if not isinstance(raw, dict):
+        raise ValueError("event must be an object.")
+    try:
+        seq = int(raw.get("seq"))
+    except (TypeError, ValueError):
+        raise ValueError("seq is required.")
+    if seq <= 0:
+        raise ValueError("seq must be positive.")
+    raw_type = str(raw.get("t") or raw.get("type") or "").strip().lower()
+    event_type = DESKTOP_INPUT_EVENT_ALIASES.get(raw_type, raw_type)
+    event: Dict[str, Any] = {"seq": seq, "type": event_type}
+    if event_type == "move":
+        event["x"] = int(raw.get("x", 0))
+        event["y"] = int(raw.get("y", 0))
+    elif event_type == "click":
+        x = raw.get("x")
+        y = raw.get("y")
+        event["x"] = int(x) if x is not None and y is not None else None
+        event["y"] = int(y) if x is not None and y is not None else None
+        event["button"] = str(raw.get("b") or raw.get("button") or "left").strip().lower()
+        event["double"] = bool(raw.get("d", raw.get("double", False)))
+        event["action"] = str(raw.get("a") or raw.get("action") or "click").strip().lower()
+        if event["button"] not in {"left", "right", "middle"}:
+            raise ValueError("Unsupported mouse button.")
+        if event["action"] not in {"click", "down", "up"}:
+            raise ValueError("Unsupported mouse action.")
+    elif event_type == "scroll":
+        event["delta"] = int(raw.get("d", raw.get("delta", 0)) or 0)
+        if event["delta"] == 0:
+            raise ValueError("delta is required.")
+    elif event_type == "key":
+        event["key"] = str(raw.get("k") or raw.get("key") or "").strip()
+        if not event["key"]:
+            raise ValueError("key is required.")
+    elif event_type == "text":
+        text = raw.get("s", raw.get("text"))
+        if not isinstance(text, str):
+            raise ValueError("text must be a string.")
+        if len(text) > 20000:
+            raise ValueError("text too long (max 20000).")
+        event["text"] = text
+    elif event_type == "edit":
+        text = raw.get("s", raw.get("text")) or ""
+        backspace = int(raw.get("bs", raw.get("backspace", 0)) or 0)
+        if not isinstance(text, str):
+            raise ValueError("text must be a string.")
+        if backspace < 0 or backspace > 200:
+            raise ValueError("backspace must be between 0 and 200.")
+        if len(text) > 500:
+            raise ValueError("text too long (max 500).")
+        event["backspace"] = backspace
+        event["text"] = text
+    else:
+        raise ValueError(f"Unsupported input event type: {raw_type or 'missing'}.")
+    return event
+
+
+def _desktop_input_decode_message(raw: str, last_seq: int) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], int]:
+    """
+    Decode one client frame into fresh events, per-event errors and the new
+    high-water sequence. Replayed sequences (<= last_seq) are dropped silently.
+    """
+    try:
+        parsed = json.loads(raw or "")
+    except ValueError:
+        return [], [{"seq": last_seq, "error": "invalid_json", "detail": "Input frames must be JSON."}], last_seq
+    if isinstance(parsed, dict) and isinstance(parsed.get("events"), list):
+        items = parsed["events"]
+    elif isinstance(parsed, list):
+        items = parsed
+    else:
+        items = [parsed]
+    if len(items) > DESKTOP_INPUT_MESSAGE_MAX_EVENTS:
+        detail = f"Too many events in one frame (max {DESKTOP_INPUT_MESSAGE_MAX_EVENTS})."
+        return [], [{"seq": last_seq, "error": "too_many_events", "detail": detail}], last_seq
+    events: List[Dict[str, Any]] = []
+    errors: List[Dict[str, Any]] = []
+    for item in items:
+        try:
+            event = _desktop_input_normalize_event(item)
+        except (TypeError, ValueError) as exc:
+            seq = item.get("seq") if isinstance(item, dict) else None
+            errors.append({"seq": seq, "error": "invalid_event", "detail": str(exc)})
+            continue
+        if event["seq"] <= last_seq:
+            continue
+        last_seq = event["seq"]
+        events.append(event)
+    return events, errors, last_seq
+
+
+def _desktop_input_discard_ack(_ack: Dict[str, Any]) -> None:
+    return None
+
+
+class _DesktopInputDispatcher:
+    """
+    Single-worker input pipeline shared by every input channel. Consecutive moves
+    from the same client that have not been applied yet collapse to the latest
+    position; everything else is applied strictly in arrival order.
+    """
+
+    def __init__(self, sink: _DesktopInputSink, *, queue_max: int = DESKTOP_INPUT_QUEUE_MAX) -> None:
+        self.sink = sink
+        self.queue_max = max(1, int(queue_max))
+        self._cond = threading.Condition()
+        self._pending: List[Dict[str, Any]] = []
+        self._thread: Optional[threading.Thread] = None
+        self.stats: Dict[str, int] = {
+            "received": 0,
+            "coalesced": 0,
+            "applied": 0,
+            "failed": 0,
+            "rejected": 0,
+            "dropped": 0,
+            "batches": 0,
+        }
+
+    def submit(
+        self,
+        client_id: str,
+        events: List[Dict[str, Any]],
+        on_ack: Callable[[Dict[str, Any]], None],
+        *,
+        start_worker: bool = True,
+    ) -> bool:
+        with self._cond:
+            if len(self._pending) + len(events) > self.queue_max:
+                self.stats["rejected"] += len(events)
+                return False
+            for event in events:
+                self.stats["received"] += 1
+                tail = self._pending[-1] if self._pending else None
+                if (
+                    event["type"] == "move"
+                    and tail is not None
+                    and tail["type"] == "move"
+                    and tail["client_id"] == client_id
+                ):
+                    tail["x"] = event["x"]
+                    tail["y"] = event["y"]
+                    tail["seq"] = event["seq"]
+                    tail["coalesced"] += 1
+                    self.stats["coalesced"] += 1
+                    continue
+                self._pending.append({**event, "client_id": client_id, "on_ack": on_ack, "coalesced": 0})
+            self._cond.notify()
+        if start_worker:
+            self._ensure_worker()
+        return True
+
+    def drop_client(self, client_id: str) -> int:
+        """
+        Forget events a disconnected client queued but the worker has not applied yet.
+        Button releases are kept so a drag cut short does not leave the button held.
+        """
+        with self._cond:
+            kept: List[Dict[str, Any]] = []
+            dropped = 0
+            for item in self._pending:
+                if item["client_id"] != client_id:
+                    kept.append(item)
+                elif item["type"] == "click" and item["action"] == "up":
+                    kept.append({**item, "on_ack": _desktop_input_discard_ack})
+                else:
+                    dropped += 1 + item["coalesced"]
+            self._pending = kept
+            self.stats["dropped"] += dropped
+            return dropped
+
+    def pending_count(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "pending": len(self._pending),
+                "queue_max": self.queue_max,
+                "worker_running": bool(self._thread and self._thread.is_alive()),
+                **self.stats,
+            }
+
+    def _apply(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        event_type = item["type"]
+        if event_type == "move":
+            return self.sink.move(item["x"], item["y"])
+        if event_type == "click":
+            return self.sink.click(item["x"], item["y"], item["button"], item["double"], item["action"])
+        if event_type == "scroll":
+            return self.sink.scroll(item["delta"])
+        if event_type == "key":
+            return self.sink.key(item["key"])
+        if event_type == "text":
+            return self.sink.text(item["text"])
+        if event_type == "edit":
+            return self.sink.edit(item["backspace"], item["text"])
+        raise ValueError(f"Unsupported input event type: {event_type}.")
+
+    def process_pending(self, timeout_s: Optional[float] = 0.0) -> int:
+        with self._cond:
+            if not self._pending and (timeout_s is None or timeout_s > 0):
+                self._cond.wait(timeout_s)
+            batch = self._pending
+            self._pending = []
+        if not batch:
+            return 0
+        acks: Dict[str, Dict[str, Any]] = {}
+        callbacks: Dict[str, Callable[[Dict[str, Any]], None]] = {}
+        batch_error = ""
+        try:
+            self.sink.begin_batch()
+        except Exception as exc:
+            batch_error = str(getattr(exc, "detail", "") or f"{type(exc).__name__}: {exc}")
+        for item in batch:
+            client_id = item["client_id"]
+            ack = acks.setdefault(
+                client_id,
+                {"ok": True, "type": "ack", "seq": 0, "applied": 0, "coalesced": 0, "errors": []},
+            )
+            callbacks[client_id] = item["on_ack"]
+            ack["seq"] = max(ack["seq"], item["seq"])
+            ack["coalesced"] += item["coalesced"]
+            error_detail = batch_error
+            if not error_detail:
+                try:
+                    self._apply(item)
+                except Exception as exc:
+                    error_detail = str(getattr(exc, "detail", "") or f"{type(exc).__name__}: {exc}")
+            if error_detail:
+                ack["ok"] = False
+                ack["errors"].append({"seq": item["seq"], "error": "input_failed", "detail": error_detail})
+            else:
+                ack["applied"] += 1
+        state: Dict[str, Any] = {}
+        try:
+            state = self.sink.snapshot()
+        except Exception:
+            state = {}
+        with self._cond:
+            self.stats["batches"] += 1
+            for ack in acks.values():
+                self.stats["applied"] += ack["applied"]
+                self.stats["failed"] += len(ack["errors"])
+        for client_id, ack in acks.items():
+            try:
+                callbacks[client_id]({**ack, **state})
+            except Exception:
+                continue
+        return len(batch)
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self.process_pending(timeout_s=None)
+            except Exception as exc:
+                print(f"Desktop input worker error: {type(exc).__name__}: {exc}", flush=True)
+                time.sleep(0.05)
+
+    def _ensure_worker(self) -> None:
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="codrex-desktop-input", daemon=True)
+            self._thread.start()
+
+
+def _desktop_input_dispatcher() -> _DesktopInputDispatcher:
+    global DESKTOP_INPUT_DISPATCHER
+    with DESKTOP_INPUT_LOCK:
+        if DESKTOP_INPUT_DISPATCHER is None:
+            DESKTOP_INPUT_DISPATCHER = _DesktopInputDispatcher(_NativeDesktopInputSink())
+        return DESKTOP_INPUT_DISPATCHER
+
 # -------------------------
 # Codex session helpers
 # -------------------------
@@ -11640,6 +16096,7 @@ def _infer_progress_state(text: str, current_command: str = "") -> str:
         return "running"
     return "idle"
 
+@_instrumented("codrex_tmux_capture_seconds", kind="snippet")
 def _capture_snippet(pane_id: str, lines: int = 60) -> str:
     pane_id = _validate_pane_id(pane_id)
     r = run_wsl_bash(f"tmux capture-pane -t {pane_id} -p -J -S -{int(lines)}", timeout_s=15)
@@ -11672,6 +16129,7 @@ def _session_summary_state(prev: Optional[Dict[str, Any]], current_command: str)
         return cached_state
     return inferred
 
+@_instrumented("codrex_tmux_capture_seconds", kind="full")
 def _capture_pane_full(pane_id: str, max_chars: int = 20000) -> str:
     pane_id = _validate_pane_id(pane_id)
     # Prefer alternate-screen, which is where TUIs (Codex) typically render.
@@ -11686,28 +16144,41 @@ def _capture_pane_full(pane_id: str, max_chars: int = 20000) -> str:
         txt = txt[-max_chars:]
     return txt.strip("\n")
 
-def _pane_is_codex_like(pane_id: str) -> bool:
+def _pane_is_codex_like(pane_id: str, *, max_age_s: Optional[float] = None) -> bool:
     """
     Best-effort detection for panes that are running the Codex TUI.
 
     Why: Codex uses multi-line input where submission is "Enter on an empty line",
     which often needs an extra Enter (and a tiny delay). Regular shells generally
     want a single Enter.
+
+    Verdicts for every listed pane are cached, so a verdict younger than
+    max_age_s (default CODEX_TMUX_CODEX_LIKE_TTL_S) skips the tmux listing.
     """
+    ttl_s = TMUX_CODEX_LIKE_TTL_S if max_age_s is None else max(0.0, float(max_age_s))
+    now = time.monotonic()
+    with TMUX_CODEX_LIKE_LOCK:
+        cached = TMUX_CODEX_LIKE_CACHE.get(pane_id)
+    if cached is not None and (now - cached[1]) <= ttl_s:
+        return cached[0]
     try:
         panes = _tmux_list_panes()
     except Exception:
         panes = []
+    verdicts: Dict[str, bool] = {}
     for p in panes:
-        if p.get("pane_id") != pane_id:
+        pid = str(p.get("pane_id") or "")
+        if not pid:
             continue
         sess = (p.get("session") or "").strip().lower()
         cc = (p.get("current_command") or "").strip().lower()
-        if sess.startswith("codex"):
-            return True
-        if cc == "codex":
-            return True
-    return False
+        verdicts[pid] = sess.startswith("codex") or cc == "codex"
+    with TMUX_CODEX_LIKE_LOCK:
+        if panes:
+            TMUX_CODEX_LIKE_CACHE.clear()
+            for pid, verdict in verdicts.items():
+                TMUX_CODEX_LIKE_CACHE[pid] = (verdict, now)
+    return verdicts.get(pane_id, False)
 
 def _safe_name(name: str) -> str:
     x = re.sub(r"[^A-Za-z0-9._-]+", "_", (name or "").strip())
@@ -11855,57 +16326,139 @@ def diag_js():
     return HTMLResponse(content=html, headers={"Cache-Control": "no-store"})
 
 @app.get("/", response_class=HTMLResponse)
-def app_entry():
+def app_entry(request: Request):
     if not _built_ui_present():
         return _built_ui_missing_response()
-    return FileResponse(_built_ui_index_path(), headers={"Cache-Control": "no-store"})
+    return _ui_assets().response(request, "index.html")
 
 
-@app.get("/legacy", response_class=HTMLResponse)
-@app.get("/legacy/", response_class=HTMLResponse)
-def legacy_index(request: Request):
-    root = CODEX_FILE_ROOT
-    workdir = CODEX_WORKDIR
-    distro = WSL_DISTRO
-    desktop_enabled = _desktop_enabled_from_request(request)
-    authenticated = _is_valid_auth_token(_auth_token_from_request(request))
-    desktop_native_w = 1366
-    desktop_native_h = 768
-    if os.name == "nt":
-        try:
-            mon = _desktop_monitor()
-            w = int(mon.get("width") or 0)
-            h = int(mon.get("height") or 0)
-            if w > 0:
-                desktop_native_w = w
-            if h > 0:
-                desktop_native_h = h
-        except Exception:
-            pass
-    desktop_tap_w = max(220, min(420, int(desktop_native_w)))
-    # Keep aspect ratio and avoid very short tap maps.
-    desktop_tap_h = max(140, int(round((desktop_native_h * desktop_tap_w) / max(1, desktop_native_w))))
-    desktop_stream_fps = max(0.5, min(float(DESKTOP_STREAM_FPS_DEFAULT), 8.0))
-    desktop_stream_level = _clamp(int(DESKTOP_STREAM_PNG_LEVEL_DEFAULT), 0, 9)
-    desktop_stream_url = f"/desktop/stream?fps={desktop_stream_fps:g}&level={desktop_stream_level}"
-    desktop_live_badge = f"Live stream: {desktop_stream_fps:g} fps"
-    desktop_mode_class = "desktop-on" if desktop_enabled else "desktop-off"
-    desktop_stream_active = desktop_enabled and (not CODEX_AUTH_REQUIRED or authenticated)
-    desktop_stream_src = desktop_stream_url if desktop_stream_active else BLANK_IMAGE_DATA_URL
-    desktop_mode_badge_class = "badge running" if desktop_enabled else "badge warn"
-    if desktop_stream_active:
-        desktop_mode_badge = desktop_live_badge
-    elif desktop_enabled and CODEX_AUTH_REQUIRED and not authenticated:
-        desktop_mode_badge = "Login required for desktop stream"
-    else:
-        desktop_mode_badge = "Desktop stream paused"
-    desktop_toggle_label = "Off" if desktop_enabled else "On"
-    compact_mode = _compact_enabled_from_request(request)
-    compact_mode_class = "compact-mode" if compact_mode else "full-mode"
-    compact_toggle_href = "/" if compact_mode else "/mobile"
-    compact_toggle_label = "Open Full" if compact_mode else "Open Compact"
-    compact_pill = "Compact layout" if compact_mode else "Full layout"
-    html = """
+# -------------------------
+# Precompiled HTML pages
+# -------------------------
+def _accept_encoding_weights(header: str) -> Dict[str, float]:
+    weights: Dict[str, float] = {}
+    for item in str(header or "").split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value.strip())
+                except ValueError:
+                    q = 0.0
+        weights[name] = q
+    return weights
+
+
+def _negotiate_content_encoding(header: str) -> str:
+    weights = _accept_encoding_weights(header)
+    wildcard = weights.get("*", 0.0)
+    best = "identity"
+    best_q = 0.0
+    for encoding in ("br", "gzip") if BROTLI_AVAILABLE else ("gzip",):
+        q = weights.get(encoding, wildcard)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    header = str(if_none_match or "").strip()
+    if not header:
+        return False
+    if header == "*":
+        return True
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return etag in candidates
+
+
+class _CompiledPage:
+    """
+    An HTML template split once at its placeholders. render() joins the static
+    segments with per-request values in a single pass; variant() caches the
+    encoded body, its strong ETag and lazily built gzip/br copies for each
+    distinct set of values, so a repeat request costs one dict lookup.
+    """
+
+    def __init__(self, template: str, placeholders: List[str], *, max_variants: int = 16) -> None:
+        self.placeholders = tuple(placeholders)
+        pattern = re.compile("|".join(re.escape(name) for name in sorted(self.placeholders, key=len, reverse=True)))
+        self._segments = pattern.split(template)
+        self._slots = pattern.findall(template)
+        self.max_variants = max(1, int(max_variants))
+        self._lock = threading.Lock()
+        self._variants: Dict[Tuple[str, ...], Dict[str, Any]] = {}
+
+    def render(self, values: Dict[str, str]) -> str:
+        out = [self._segments[0]]
+        for name, segment in zip(self._slots, self._segments[1:]):
+            out.append(values[name])
+            out.append(segment)
+        return "".join(out)
+
+    def variant(self, values: Dict[str, str]) -> Dict[str, Any]:
+        key = tuple(str(values[name]) for name in self.placeholders)
+        with self._lock:
+            cached = self._variants.get(key)
+            if cached is not None:
+                return cached
+        body = self.render(values).encode("utf-8")
+        variant = {"body": body, "digest": hashlib.sha256(body).hexdigest()[:32], "encoded": {"identity": body}}
+        with self._lock:
+            cached = self._variants.get(key)
+            if cached is not None:
+                return cached
+            while len(self._variants) >= self.max_variants:
+                self._variants.pop(next(iter(self._variants)))
+            self._variants[key] = variant
+        return variant
+
+    def encoded(self, variant: Dict[str, Any], encoding: str) -> bytes:
+        with self._lock:
+            body = variant["encoded"].get(encoding)
+        if body is not None:
+            return body
+        if encoding == "br":
+            body = brotli.compress(variant["body"], quality=11)
+        elif encoding == "gzip":
+            body = gzip.compress(variant["body"], compresslevel=9, mtime=0)
+        else:
+            raise ValueError(f"unsupported encoding: {encoding}")
+        with self._lock:
+            variant["encoded"][encoding] = body
+        return body
+
+    @staticmethod
+    def etag(variant: Dict[str, Any], encoding: str) -> str:
+        suffix = "" if encoding == "identity" else f"-{encoding}"
+        return f'"{variant["digest"]}{suffix}"'
+
+
+def _compiled_page_response(
+    request: Request,
+    page: _CompiledPage,
+    values: Dict[str, str],
+    *,
+    cache_control: str = "no-cache",
+) -> Response:
+    variant = page.variant(values)
+    headers = {"Cache-Control": cache_control, "Vary": "Accept-Encoding, Cookie"}
+    encoding = _negotiate_content_encoding(request.headers.get("accept-encoding", ""))
+    etag = page.etag(variant, encoding)
+    headers["ETag"] = etag
+    if _etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers=headers)
+    body = page.encoded(variant, encoding)
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="text/html; charset=utf-8", headers=headers)
+
+
+LEGACY_INDEX_TEMPLATE = """
 <!doctype html>
 <html>
 <head>
@@ -13726,7 +18279,7 @@ async function runExec() {
   }
 
   const id = j.id;
-  execStatusEl.textContent = `Running: ${id}`;
+  execStatusEl.textContent = j.status === "queued" ? `Queued: ${id} (#${j.queue_position})` : `Running: ${id}`;
 
   const poll = async () => {
     const rr = await apiFetch(`/codex/run/${id}`);
@@ -13738,7 +18291,7 @@ async function runExec() {
     }
     execStatusEl.textContent = `Status: ${jj.status}`;
     execOutEl.textContent = jj.output || "";
-    if (jj.status === "running") {
+    if (jj.status === "running" || jj.status === "queued") {
       setTimeout(poll, 1000);
     } else {
       execBtn.disabled = false;
@@ -14613,30 +19166,101 @@ autoLoginFromHash().finally(() => {
 </body>
 </html>
     """
-    content = (
-        html.replace("__CODEX_DISTRO__", distro)
-        .replace("__CODEX_WORKDIR__", workdir)
-        .replace("__CODEX_ROOT__", root)
-        .replace("__DESKTOP_MODE_CLASS__", desktop_mode_class)
-        .replace("__COMPACT_MODE_CLASS__", compact_mode_class)
-        .replace("__COMPACT_TOGGLE_HREF__", compact_toggle_href)
-        .replace("__COMPACT_TOGGLE_LABEL__", compact_toggle_label)
-        .replace("__COMPACT_PILL__", compact_pill)
-        .replace("__DESKTOP_MODE_ENABLED__", "true" if desktop_enabled else "false")
-        .replace("__DESKTOP_STREAM_URL__", desktop_stream_url)
-        .replace("__DESKTOP_STREAM_SRC__", desktop_stream_src)
-        .replace("__DESKTOP_LIVE_BADGE__", desktop_live_badge)
-        .replace("__DESKTOP_MODE_BADGE_CLASS__", desktop_mode_badge_class)
-        .replace("__DESKTOP_MODE_BADGE__", desktop_mode_badge)
-        .replace("__DESKTOP_TOGGLE_LABEL__", desktop_toggle_label)
-        .replace("__BLANK_IMAGE_DATA_URL__", BLANK_IMAGE_DATA_URL)
-        .replace("__DESKTOP_NATIVE_W__", str(desktop_native_w))
-        .replace("__DESKTOP_NATIVE_H__", str(desktop_native_h))
-        .replace("__DESKTOP_TAP_W__", str(desktop_tap_w))
-        .replace("__DESKTOP_TAP_H__", str(desktop_tap_h))
-    )
-    # Prevent sticky/cached UIs on mobile while we iterate quickly and fix auth issues.
-    return HTMLResponse(content=content, headers={"Cache-Control": "no-store"})
+LEGACY_INDEX_PAGE = _CompiledPage(
+    LEGACY_INDEX_TEMPLATE,
+    [
+        "__CODEX_DISTRO__",
+        "__CODEX_WORKDIR__",
+        "__CODEX_ROOT__",
+        "__DESKTOP_MODE_CLASS__",
+        "__COMPACT_MODE_CLASS__",
+        "__COMPACT_TOGGLE_HREF__",
+        "__COMPACT_TOGGLE_LABEL__",
+        "__COMPACT_PILL__",
+        "__DESKTOP_MODE_ENABLED__",
+        "__DESKTOP_STREAM_URL__",
+        "__DESKTOP_STREAM_SRC__",
+        "__DESKTOP_LIVE_BADGE__",
+        "__DESKTOP_MODE_BADGE_CLASS__",
+        "__DESKTOP_MODE_BADGE__",
+        "__DESKTOP_TOGGLE_LABEL__",
+        "__BLANK_IMAGE_DATA_URL__",
+        "__DESKTOP_NATIVE_W__",
+        "__DESKTOP_NATIVE_H__",
+        "__DESKTOP_TAP_W__",
+        "__DESKTOP_TAP_H__",
+    ],
+)
+
+
+@app.get("/legacy", response_class=HTMLResponse)
+@app.get("/legacy/", response_class=HTMLResponse)
+def legacy_index(request: Request):
+    root = CODEX_FILE_ROOT
+    workdir = CODEX_WORKDIR
+    distro = WSL_DISTRO
+    desktop_enabled = _desktop_enabled_from_request(request)
+    authenticated = _is_valid_auth_token(_auth_token_from_request(request))
+    desktop_native_w = 1366
+    desktop_native_h = 768
+    if os.name == "nt":
+        try:
+            mon = _desktop_monitor()
+            w = int(mon.get("width") or 0)
+            h = int(mon.get("height") or 0)
+            if w > 0:
+                desktop_native_w = w
+            if h > 0:
+                desktop_native_h = h
+        except Exception:
+            pass
+    desktop_tap_w = max(220, min(420, int(desktop_native_w)))
+    # Keep aspect ratio and avoid very short tap maps.
+    desktop_tap_h = max(140, int(round((desktop_native_h * desktop_tap_w) / max(1, desktop_native_w))))
+    desktop_stream_fps = max(0.5, min(float(DESKTOP_STREAM_FPS_DEFAULT), 8.0))
+    desktop_stream_level = _clamp(int(DESKTOP_STREAM_PNG_LEVEL_DEFAULT), 0, 9)
+    desktop_stream_url = f"/desktop/stream?fps={desktop_stream_fps:g}&level={desktop_stream_level}"
+    desktop_live_badge = f"Live stream: {desktop_stream_fps:g} fps"
+    desktop_mode_class = "desktop-on" if desktop_enabled else "desktop-off"
+    desktop_stream_active = desktop_enabled and (not CODEX_AUTH_REQUIRED or authenticated)
+    desktop_stream_src = desktop_stream_url if desktop_stream_active else BLANK_IMAGE_DATA_URL
+    desktop_mode_badge_class = "badge running" if desktop_enabled else "badge warn"
+    if desktop_stream_active:
+        desktop_mode_badge = desktop_live_badge
+    elif desktop_enabled and CODEX_AUTH_REQUIRED and not authenticated:
+        desktop_mode_badge = "Login required for desktop stream"
+    else:
+        desktop_mode_badge = "Desktop stream paused"
+    desktop_toggle_label = "Off" if desktop_enabled else "On"
+    compact_mode = _compact_enabled_from_request(request)
+    compact_mode_class = "compact-mode" if compact_mode else "full-mode"
+    compact_toggle_href = "/" if compact_mode else "/mobile"
+    compact_toggle_label = "Open Full" if compact_mode else "Open Compact"
+    compact_pill = "Compact layout" if compact_mode else "Full layout"
+    values = {
+        "__CODEX_DISTRO__": distro,
+        "__CODEX_WORKDIR__": workdir,
+        "__CODEX_ROOT__": root,
+        "__DESKTOP_MODE_CLASS__": desktop_mode_class,
+        "__COMPACT_MODE_CLASS__": compact_mode_class,
+        "__COMPACT_TOGGLE_HREF__": compact_toggle_href,
+        "__COMPACT_TOGGLE_LABEL__": compact_toggle_label,
+        "__COMPACT_PILL__": compact_pill,
+        "__DESKTOP_MODE_ENABLED__": "true" if desktop_enabled else "false",
+        "__DESKTOP_STREAM_URL__": desktop_stream_url,
+        "__DESKTOP_STREAM_SRC__": desktop_stream_src,
+        "__DESKTOP_LIVE_BADGE__": desktop_live_badge,
+        "__DESKTOP_MODE_BADGE_CLASS__": desktop_mode_badge_class,
+        "__DESKTOP_MODE_BADGE__": desktop_mode_badge,
+        "__DESKTOP_TOGGLE_LABEL__": desktop_toggle_label,
+        "__BLANK_IMAGE_DATA_URL__": BLANK_IMAGE_DATA_URL,
+        "__DESKTOP_NATIVE_W__": str(desktop_native_w),
+        "__DESKTOP_NATIVE_H__": str(desktop_native_h),
+        "__DESKTOP_TAP_W__": str(desktop_tap_w),
+        "__DESKTOP_TAP_H__": str(desktop_tap_h),
+    }
+    # Revalidate on every load (ETag) so phones never keep a stale UI around.
+    return _compiled_page_response(request, LEGACY_INDEX_PAGE, values, cache_control="no-cache")
 
 # -------------------------
 # Auth endpoints
@@ -14802,9 +19426,10 @@ def legacy_auth_logout(next: str = Form("/legacy")):
 # Pairing + QR endpoints
 # -------------------------
 def _power_status_payload() -> Dict[str, Any]:
-    mac_info = _wake_mac_info()
-    relay = _wake_relay_health()
-    local_wake = _wake_local_capabilities()
+    probes = _status_service().read_many(["wake_mac", "wake_relay", "wake_local"])
+    mac_info = probes["wake_mac"][0] or {}
+    relay = probes["wake_relay"][0] or {}
+    local_wake = probes["wake_local"][0] or {}
     wake_command = str(relay.get("wake_command") or CODEX_WAKE_TELEGRAM_COMMAND)
     wake_readiness = str(local_wake.get("wake_readiness") or "partial")
     wake_warning = str(local_wake.get("wake_warning") or "").strip()
@@ -14842,6 +19467,8 @@ def _power_status_payload() -> Dict[str, Any]:
         "primary_mac": str(mac_info.get("primary_mac") or ""),
         "wake_candidate_macs": list(mac_info.get("wake_candidate_macs") or []),
         "wake_supported": bool(mac_info.get("wake_supported")),
+        "stale": any(meta.get("stale") for _value, meta in probes.values()),
+        "probes": {name: meta for name, (_value, meta) in probes.items()},
     }
 
 
@@ -14852,8 +19479,8 @@ def net_info():
 
 
 @app.get("/codex/runtime/status")
-def codex_runtime_status():
-    status = _wsl_runtime_status_payload()
+def codex_runtime_status(force: bool = False):
+    status = _wsl_runtime_status(force=force)
     return {
         "ok": True,
         "state": status.get("state"),
@@ -14861,6 +19488,9 @@ def codex_runtime_status():
         "distro": status.get("distro"),
         "can_start": bool(status.get("can_start")),
         "can_stop": bool(status.get("can_stop")),
+        "transition": status.get("transition") or "",
+        "checked_at": status.get("checked_at"),
+        "changes": status.get("changes") or [],
     }
 
 
@@ -15248,6 +19878,10 @@ def desktop_info(request: Request):
         "perf_mode_active": _desktop_perf_snapshot().get("active", False),
         **_desktop_stream_transport_payload(),
         "active_target_id": str(_desktop_targets_payload().get("active_target", {}).get("id") or ""),
+        "input_channel": _desktop_input_dispatcher().snapshot(),
+        "topology": _desktop_topology_stats(),
+        "powershell": _powershell_worker_stats(),
+        "streams": _desktop_stream_activity_snapshot(),
         **mon,
     }
 
@@ -15356,10 +19990,13 @@ async def desktop_stream(
     layout_mode: Optional[str] = None,
     target_width: Optional[int] = None,
     target_height: Optional[int] = None,
+    adaptive: Optional[str] = None,
 ):
     """
     Continuous desktop stream using multipart/x-mixed-replace.
     This keeps updating even when client-side JS is disabled or broken.
+    The requested fps/quality/scale are ceilings; the adaptive controller backs
+    off from them when parts drain slowly (adaptive=0 pins them).
     """
     _ensure_windows_host()
     try:
@@ -15379,34 +20016,78 @@ async def desktop_stream(
     frame_delay = 1.0 / fps_val
     boundary = "frame"
 
+    adaptive_enabled = DESKTOP_STREAM_ADAPTIVE_DEFAULT if adaptive is None else _truthy_flag(adaptive)
+
     async def _gen():
-        with mss() as sct:
-            while True:
-                if await request.is_disconnected():
-                    break
-                rgb, out_size = _desktop_capture_rgb(
-                    scale_factor=scale_factor,
-                    grayscale=grayscale,
-                    sct_instance=sct,
-                    aspect_ratio=aspect_ratio,
-                    layout_mode=resolved_layout_mode,
-                    target_size=target_size,
-                )
-                frame_bytes, media_type = _desktop_encode_frame(
-                    rgb,
-                    out_size,
-                    stream_format,
-                    png_level,
-                    jpeg_quality,
-                )
-                chunk = (
-                    f"--{boundary}\r\n"
-                    f"Content-Type: {media_type}\r\n"
-                    "Cache-Control: no-store\r\n"
-                    f"Content-Length: {len(frame_bytes)}\r\n\r\n"
-                ).encode("utf-8") + frame_bytes + b"\r\n"
-                yield chunk
-                await asyncio.sleep(frame_delay)
+        detector = _DesktopFrameChangeDetector("multipart")
+        controller = (
+            _DesktopStreamRateController(
+                fps=fps_val,
+                quality=jpeg_quality,
+                scale=scale_factor,
+                tune_quality=stream_format == "jpeg",
+            )
+            if adaptive_enabled
+            else None
+        )
+        activity_id = _desktop_stream_activity_open(detector, controller)
+        last_chunk = b""
+        last_sent_at = 0.0
+
+        async def _send(chunk: bytes):
+            drain_started = time.perf_counter()
+            yield chunk
+            # The generator resumes only after the server has handed the part to
+            # the transport, so this is the per-part drain time.
+            if controller is not None:
+                controller.observe(time.perf_counter() - drain_started, len(chunk))
+
+        try:
+            _load_media_stack("mss", required=True)
+            with mss() as sct:
+                while True:
+                    if await request.is_disconnected():
+                        break
+                    rgb, out_size = _desktop_capture_rgb(
+                        scale_factor=controller.scale if controller is not None else scale_factor,
+                        grayscale=grayscale,
+                        sct_instance=sct,
+                        aspect_ratio=aspect_ratio,
+                        layout_mode=resolved_layout_mode,
+                        target_size=target_size,
+                    )
+                    change = detector.update(rgb, out_size)
+                    now = time.time()
+                    if change["changed"] or not last_chunk:
+                        frame_bytes, media_type = _desktop_encode_frame(
+                            rgb,
+                            out_size,
+                            stream_format,
+                            png_level,
+                            controller.quality if controller is not None else jpeg_quality,
+                        )
+                        last_chunk = (
+                            f"--{boundary}\r\n"
+                            f"Content-Type: {media_type}\r\n"
+                            "Cache-Control: no-store\r\n"
+                            f"Content-Length: {len(frame_bytes)}\r\n\r\n"
+                        ).encode("utf-8") + frame_bytes + b"\r\n"
+                        detector.note("sent")
+                        last_sent_at = now
+                        async for part in _send(last_chunk):
+                            yield part
+                    elif now - last_sent_at >= DESKTOP_STREAM_IDLE_KEEPALIVE_S:
+                        # Unchanged desktop: resend the cached part so proxies keep the stream open.
+                        detector.note("keepalive")
+                        last_sent_at = now
+                        async for part in _send(last_chunk):
+                            yield part
+                    else:
+                        detector.note("skipped")
+                    base_delay = (1.0 / controller.fps) if controller is not None else frame_delay
+                    await asyncio.sleep(detector.next_delay_s(base_delay))
+        finally:
+            _desktop_stream_activity_close(activity_id)
 
     headers = {
         "Cache-Control": "no-store",
@@ -15464,42 +20145,14 @@ def desktop_input_click(request: Request, payload: Dict[str, Any] = Body(...)):
     _ensure_windows_host()
     _require_desktop_enabled(request)
     _host_keep_awake_pulse(force=True)
-    alt_held_before_click = _desktop_alt_held()
-    x = payload.get("x")
-    y = payload.get("y")
-    button = (payload.get("button") or "left").strip().lower()
-    double = bool(payload.get("double", False))
-    action = (payload.get("action") or "click").strip().lower()
-    screen_x = None
-    screen_y = None
-    via = "desktop"
-    if x is not None and y is not None:
-        p = _desktop_point(int(x), int(y))
-        screen_x = int(p["x"])
-        screen_y = int(p["y"])
-    if screen_x is not None and screen_y is not None:
-        caption_command = None
-        if button == "left" and not double and action == "click":
-            caption_command = _desktop_caption_syscommand_at(screen_x, screen_y)
-        if caption_command:
-            via = f"desktop_caption_{caption_command}"
-        else:
-            _desktop_click_at(screen_x, screen_y, button=button, double=double, action=action)
-    else:
-        _desktop_click(button=button, double=double, action=action)
-    logging.info(
-        "desktop_input_click x=%s y=%s screen_x=%s screen_y=%s button=%s action=%s via=%s",
-        x,
-        y,
-        screen_x,
-        screen_y,
-        button,
-        action,
-        via,
+    result = _desktop_apply_click(
+        payload.get("x"),
+        payload.get("y"),
+        button=(payload.get("button") or "left").strip().lower(),
+        double=bool(payload.get("double", False)),
+        action=(payload.get("action") or "click").strip().lower(),
     )
-    if alt_held_before_click:
-        _desktop_release_alt_if_held()
-    return {"ok": True, "button": button, "double": double, "action": action, "via": via, "alt_held": _desktop_alt_held()}
+    return {"ok": True, **result, "alt_held": _desktop_alt_held()}
 
 @app.post("/desktop/input/scroll")
 def desktop_input_scroll(request: Request, payload: Dict[str, Any] = Body(...)):
@@ -15591,6 +20244,98 @@ def desktop_input_key(request: Request, payload: Dict[str, Any] = Body(...)):
     return {"ok": True, "key": key, "alt_held": bool(r.get("alt_held", _desktop_alt_held()))}
 
 
+@app.websocket("/desktop/input/ws")
+async def desktop_input_stream(websocket: WebSocket):
+    """
+    Persistent input channel: the client sends sequenced events (single objects or
+    {"events": [...]}) and receives cumulative acks per applied batch.
+    """
+    await websocket.accept()
+    if not _is_valid_auth_token(_auth_token_from_websocket(websocket)):
+        await websocket.send_json({"ok": False, "type": "error", "detail": "Login required."})
+        await websocket.close(code=4401)
+        return
+    dispatcher = _desktop_input_dispatcher()
+    try:
+        dispatcher.sink.ensure_ready()
+    except HTTPException as exc:
+        await websocket.send_json({"ok": False, "type": "error", "detail": exc.detail})
+        await websocket.close(code=4400)
+        return
+    if not _desktop_enabled_from_request(websocket):
+        await websocket.send_json({"ok": False, "type": "error", "detail": "Desktop control is disabled. Enable Desktop to continue."})
+        await websocket.close(code=4409)
+        return
+
+    loop = asyncio.get_running_loop()
+    outbound: "asyncio.Queue[Optional[Dict[str, Any]]]" = asyncio.Queue()
+    client_id = uuid.uuid4().hex[:12]
+
+    def _on_ack(payload: Dict[str, Any]) -> None:
+        try:
+            loop.call_soon_threadsafe(outbound.put_nowait, payload)
+        except RuntimeError:
+            # The event loop is gone; the client can no longer be acked.
+            return
+
+    async def _send_outbound() -> None:
+        while True:
+            payload = await outbound.get()
+            if payload is None:
+                return
+            try:
+                await websocket.send_json(payload)
+            except Exception:
+                return
+
+    await websocket.send_json(
+        {
+            "ok": True,
+            "type": "hello",
+            "client_id": client_id,
+            "max_events": DESKTOP_INPUT_MESSAGE_MAX_EVENTS,
+            "alt_held": _desktop_alt_held(),
+        }
+    )
+    sender_task = asyncio.create_task(_send_outbound())
+    last_seq = 0
+    try:
+        while True:
+            raw = await websocket.receive_text()
+            events, errors, last_seq = _desktop_input_decode_message(raw, last_seq)
+            if events and not _desktop_global_enabled():
+                errors.extend(
+                    {"seq": event["seq"], "error": "desktop_disabled", "detail": "Desktop control is disabled."}
+                    for event in events
+                )
+                events = []
+            if events and not dispatcher.submit(client_id, events, _on_ack):
+                errors.extend(
+                    {"seq": event["seq"], "error": "input_queue_full", "detail": "Desktop input queue is full."}
+                    for event in events
+                )
+            if errors:
+                outbound.put_nowait(
+                    {
+                        "ok": False,
+                        "type": "ack",
+                        "seq": last_seq,
+                        "applied": 0,
+                        "coalesced": 0,
+                        "errors": errors,
+                    }
+                )
+    except WebSocketDisconnect:
+        pass
+    finally:
+        dispatcher.drop_client(client_id)
+        outbound.put_nowait(None)
+        try:
+            await sender_task
+        except Exception:
+            pass
+
+
 @app.post("/desktop/selection/path")
 def desktop_selection_path(request: Request):
     _ensure_windows_host()
@@ -15616,6 +20361,9 @@ async def desktop_webrtc_offer(request: Request, payload: Optional[Dict[str, Any
     transport = _desktop_stream_transport_payload()
     if not transport["desktop_webrtc_enabled"]:
         raise HTTPException(status_code=503, detail=transport["desktop_webrtc_detail"])
+    # The first offer pays for importing numpy/PyAV/aiortc, off the event loop.
+    if not await asyncio.to_thread(_load_media_stack, "aiortc"):
+        raise HTTPException(status_code=503, detail=_desktop_stream_transport_payload()["desktop_webrtc_detail"])
     await _desktop_webrtc_evict_stale_sessions_for_new_offer()
     if len(DESKTOP_WEBRTC_SESSIONS) >= DESKTOP_WEBRTC_MAX_SESSIONS:
         raise HTTPException(status_code=429, detail="Too many active WebRTC desktop sessions.")
@@ -15951,11 +20699,13 @@ def thread_add_message(thread_id: str, payload: Dict[str, Any] = Body(...)):
 
 
 @app.get("/windows/runtime/status")
+@_host_agent_method("endpoint.windows_runtime_status")
 def windows_runtime_status():
     return {"ok": True, **_windows_runtime_status_payload()}
 
 
 @app.post("/windows/runtime/start")
+@_host_agent_method("endpoint.windows_runtime_start")
 def windows_runtime_start():
     if not _windows_runtime_supported():
         return {"ok": False, **_windows_runtime_status_payload()}
@@ -15966,6 +20716,7 @@ def windows_runtime_start():
 
 
 @app.post("/windows/runtime/stop")
+@_host_agent_method("endpoint.windows_runtime_stop")
 def windows_runtime_stop():
     if not _windows_runtime_supported():
         return {"ok": False, **_windows_runtime_status_payload()}
@@ -15977,6 +20728,7 @@ def windows_runtime_stop():
 
 
 @app.get("/windows/sessions")
+@_host_agent_method("endpoint.windows_sessions_live")
 def windows_sessions_live():
     _host_keep_awake_pulse()
     with WINDOWS_SESSIONS_LOCK:
@@ -16000,6 +20752,7 @@ def windows_sessions_live():
 
 
 @app.post("/windows/session")
+@_host_agent_method("endpoint.windows_session_create")
 def windows_session_create(payload: Optional[Dict[str, Any]] = Body(default=None)):
     payload = payload or {}
     status = _windows_runtime_status_payload()
@@ -16080,6 +20833,7 @@ def windows_session_create(payload: Optional[Dict[str, Any]] = Body(default=None
 
 
 @app.delete("/windows/session/{session}")
+@_host_agent_method("endpoint.windows_session_close")
 def windows_session_close(session: str):
     session_id = _validate_session_name(session)
     entry = _windows_session_entry(session_id)
@@ -16098,6 +20852,7 @@ def windows_session_close(session: str):
 
 
 @app.post("/windows/session/{session}/send")
+@_host_agent_method("endpoint.windows_session_send")
 def windows_session_send(session: str, body: str = Body(..., media_type="text/plain")):
     session_id = _validate_session_name(session)
     text = str(body or "").replace("\r\n", "\n")
@@ -16118,6 +20873,7 @@ def windows_session_send(session: str, body: str = Body(..., media_type="text/pl
 
 
 @app.post("/windows/session/{session}/enter")
+@_host_agent_method("endpoint.windows_session_enter")
 def windows_session_enter(session: str):
     session_id = _validate_session_name(session)
     _host_keep_awake_pulse(force=True)
@@ -16126,6 +20882,7 @@ def windows_session_enter(session: str):
 
 
 @app.post("/windows/session/{session}/key")
+@_host_agent_method("endpoint.windows_session_key")
 def windows_session_key(session: str, payload: Dict[str, Any] = Body(...)):
     session_id = _validate_session_name(session)
     raw_key = str((payload or {}).get("key") or "").strip().lower()
@@ -16149,6 +20906,7 @@ def windows_session_key(session: str, payload: Dict[str, Any] = Body(...)):
 
 
 @app.post("/windows/session/{session}/ctrlc")
+@_host_agent_method("endpoint.windows_session_ctrlc")
 def windows_session_ctrlc(session: str):
     session_id = _validate_session_name(session)
     entry = _windows_session_entry(session_id)
@@ -16166,6 +20924,7 @@ def windows_session_ctrlc(session: str):
 
 
 @app.post("/windows/session/{session}/interrupt")
+@_host_agent_method("endpoint.windows_session_interrupt")
 def windows_session_interrupt(session: str):
     session_id = _validate_session_name(session)
     _host_keep_awake_pulse(force=True)
@@ -16174,6 +20933,7 @@ def windows_session_interrupt(session: str):
 
 
 @app.get("/windows/session/{session}/screen")
+@_host_agent_method("endpoint.windows_session_screen")
 def windows_session_screen(session: str):
     session_id = _validate_session_name(session)
     _host_keep_awake_pulse(force=True)
@@ -16237,31 +20997,35 @@ async def windows_session_stream(websocket: WebSocket, session: str):
     interval_ms = _session_stream_interval_ms(selected_profile)
     last_keepalive = 0.0
 
+    sender = _StreamSendQueue(
+        websocket,
+        stream="windows",
+        session=session_id,
+        snapshot=lambda: _windows_session_stream_resync_snapshot(session_id, selected_profile),
+        policy=websocket.query_params.get("backpressure"),
+        since_seq=since_seq,
+    ).start()
+
     try:
         _host_keep_awake_pulse(force=True)
-        with WINDOWS_SESSION_STREAM_LOCK:
-            state = _windows_session_stream_state_unlocked(session_id)
-            hello_payload = _windows_session_stream_event_payload(
-                session=session_id,
-                seq=int(state.get("seq") or 0),
-                event_type="hello",
-                text="",
-                profile=selected_profile,
-                detail="connected",
-            )
-        await websocket.send_json({"ok": True, **hello_payload})
+        hello_payload = _windows_session_stream_event_payload(
+            session=session_id,
+            seq=await asyncio.to_thread(_windows_session_stream_seq, session_id),
+            event_type="hello",
+            text="",
+            profile=selected_profile,
+            detail="connected",
+        )
+        sender.put({"ok": True, **hello_payload})
 
-        replay_events, replay_snapshot = _windows_session_stream_replay(session_id, since_seq)
+        replay_events, replay_snapshot = await asyncio.to_thread(_windows_session_stream_replay, session_id, since_seq)
         for event in replay_events:
-            await websocket.send_json({"ok": True, **event})
+            sender.put({"ok": True, **event})
         if replay_snapshot:
-            await websocket.send_json({"ok": True, **replay_snapshot})
+            sender.put({"ok": True, **replay_snapshot})
 
         if not replay_events and not replay_snapshot:
-            try:
-                entry = _windows_session_entry(session_id)
-            except HTTPException:
-                entry = None
+            entry = await asyncio.to_thread(_windows_session_stream_entry, session_id)
             if entry is not None:
                 text = str(entry.get("last_text") or "")
                 current_command = str(entry.get("current_command") or "")
@@ -16274,28 +21038,21 @@ async def windows_session_stream(websocket: WebSocket, session: str):
                     current_command=current_command,
                 )
                 if event:
-                    await websocket.send_json({"ok": True, **event, "profile": selected_profile})
+                    sender.put({"ok": True, **event, "profile": selected_profile})
 
         while True:
+            if sender.closed:
+                return
             _host_keep_awake_pulse()
-            pending: List[Dict[str, Any]] = []
-            with WINDOWS_SESSION_STREAM_LOCK:
-                stream_state = _windows_session_stream_state_unlocked(session_id)
-                for event in stream_state.get("events") or []:
-                    if int(event.get("seq") or 0) > since_seq:
-                        pending.append(dict(event))
+            pending = await asyncio.to_thread(_windows_session_stream_events_since, session_id, since_seq)
             if pending:
                 for event in pending:
                     since_seq = max(since_seq, int(event.get("seq") or 0))
-                    await websocket.send_json({"ok": True, **event})
+                    sender.put({"ok": True, **event})
                 last_keepalive = time.time()
             elif time.time() - last_keepalive > 10:
-                entry = None
-                try:
-                    entry = _windows_session_entry(session_id)
-                except HTTPException:
-                    entry = None
-                await websocket.send_json(
+                entry = await asyncio.to_thread(_windows_session_stream_entry, session_id)
+                sender.put(
                     {
                         "ok": True,
                         **_windows_session_stream_event_payload(
@@ -16314,6 +21071,8 @@ async def windows_session_stream(websocket: WebSocket, session: str):
             await asyncio.sleep(interval_ms / 1000.0)
     except WebSocketDisconnect:
         return
+    finally:
+        await sender.aclose()
 
 
 @app.get("/desktop-codex/runtime/status")
@@ -16440,15 +21199,32 @@ async def desktop_codex_session_stream(websocket: WebSocket, session: str):
     last_state = ""
     last_keepalive = 0.0
 
+    latest_frame: Dict[str, Any] = {}
+
+    def _resync_frame() -> Optional[Dict[str, Any]]:
+        if not latest_frame:
+            return None
+        return {**latest_frame, "type": "snapshot", "detail": "backpressure", "ts": time.time()}
+
+    sender = _StreamSendQueue(
+        websocket,
+        stream="desktop",
+        session=session_id,
+        snapshot=_resync_frame,
+        policy=websocket.query_params.get("backpressure"),
+    ).start()
+
     try:
         while True:
+            if sender.closed:
+                return
             _host_keep_awake_pulse()
             transcript = await asyncio.to_thread(_desktop_codex_render_transcript, rollout_path)
             next_text = str(transcript.get("text") or "")
             next_state = str(transcript.get("state") or session_entry.get("state") or "idle")
             if next_text != last_text or next_state != last_state:
                 seq += 1
-                await websocket.send_json(
+                latest_frame.update(
                     {
                         "ok": True,
                         "session": session_id,
@@ -16462,11 +21238,12 @@ async def desktop_codex_session_stream(websocket: WebSocket, session: str):
                         "ts": time.time(),
                     }
                 )
+                sender.put(dict(latest_frame))
                 last_text = next_text
                 last_state = next_state
                 last_keepalive = time.time()
             elif time.time() - last_keepalive > 10.0:
-                await websocket.send_json(
+                sender.put(
                     {
                         "ok": True,
                         "session": session_id,
@@ -16484,6 +21261,8 @@ async def desktop_codex_session_stream(websocket: WebSocket, session: str):
             await asyncio.sleep(DESKTOP_CODEX_STREAM_POLL_SECONDS)
     except WebSocketDisconnect:
         return
+    finally:
+        await sender.aclose()
 
 
 @app.get("/codex/options")
@@ -16549,6 +21328,8 @@ def codex_session_create(payload: Optional[Dict[str, Any]] = Body(default=None))
             "resume_last": resume_last,
             "resume_id": resume_id,
         }
+        created = dict(SESSIONS[name])
+    _session_record_publish(name, created)
     with SESSION_HISTORY_LOCK:
         _upsert_session_history_unlocked(
             name,
@@ -16590,6 +21371,7 @@ def codex_session_close(session: str):
         return {"ok": False, "error": "close_failed", "raw": r}
     with SESSIONS_LOCK:
         SESSIONS.pop(session, None)
+    _session_record_publish(session, None)
     with SESSION_HISTORY_LOCK:
         _upsert_session_history_unlocked(
             session,
@@ -16673,6 +21455,7 @@ def _session_stream_event_payload(
     return payload
 
 
+@_host_agent_method("stream.publish")
 def _publish_session_stream_snapshot(
     session: str,
     pane_id: str,
@@ -16680,11 +21463,15 @@ def _publish_session_stream_snapshot(
     *,
     screen_state: str = "",
     current_command: str = "",
+    watched: bool = False,
 ) -> Optional[Dict[str, Any]]:
+    """watched=True marks a poll from a stream client (see _session_stream_watched)."""
     session_id = _validate_session_name(session)
     pane_value = _validate_pane_id(pane_id)
     with SESSION_STREAM_LOCK:
         stream_state = _session_stream_state_unlocked(session_id)
+        if watched:
+            stream_state["watched_at"] = time.time()
         previous = str(stream_state.get("last_text") or "")
         if text == previous:
             return None
@@ -16712,9 +21499,19 @@ def _publish_session_stream_snapshot(
         stream_state["events"].append(event)
         if len(stream_state["events"]) > SESSION_STREAM_REPLAY_MAX:
             stream_state["events"] = stream_state["events"][-SESSION_STREAM_REPLAY_MAX:]
-        return dict(event)
+        # Recorded under the stream lock so segments keep the publish order.
+        _session_recordings().record(event)
+    _host_agent_publish("stream", event)
+    return dict(event)
+
+
+@_host_agent_method("stream.seq")
+def _session_stream_seq(session: str) -> int:
+    with SESSION_STREAM_LOCK:
+        return int(_session_stream_state_unlocked(session).get("seq") or 0)
 
 
+@_host_agent_method("stream.replay")
 def _session_stream_replay(session: str, since_seq: int) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
     with SESSION_STREAM_LOCK:
         state = _session_stream_state_unlocked(session)
@@ -16741,6 +21538,788 @@ def _session_stream_replay(session: str, since_seq: int) -> Tuple[List[Dict[str,
         return [], snapshot
 
 
+@_host_agent_method("stream.resync")
+def _session_stream_resync_snapshot(session: str, profile: str = "") -> Optional[Dict[str, Any]]:
+    with SESSION_STREAM_LOCK:
+        state = _session_stream_state_unlocked(session)
+        seq = int(state.get("seq") or 0)
+        if seq <= 0:
+            return None
+        latest = (state.get("events") or [{}])[-1]
+        return {
+            "ok": True,
+            **_session_stream_event_payload(
+                session=session,
+                pane_id=str(latest.get("pane_id") or ""),
+                seq=seq,
+                event_type="snapshot",
+                text=str(state.get("last_text") or ""),
+                profile=profile,
+                detail="backpressure",
+                state=str(latest.get("state") or ""),
+                current_command=str(latest.get("current_command") or ""),
+            ),
+        }
+
+
+# -------------------------
+# Stream send queues
+# -------------------------
+SESSION_STREAM_SCREEN_EVENTS = frozenset({"snapshot", "append", "replace"})
+
+
+def _stream_send_encode(payload: Dict[str, Any]) -> Tuple[str, int]:
+    text = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+    return text, len(text.encode("utf-8"))
+
+
+def _stream_send_policy(raw: Any) -> str:
+    policy = str(raw or "").strip().lower()
+    return policy if policy in SESSION_STREAM_SEND_POLICIES else SESSION_STREAM_SEND_POLICY
+
+
+_STREAM_SEND_SNAPSHOT_MARK: Dict[str, Any] = {"type": "snapshot-pending"}
+
+
+class _StreamSendQueue:
+    """
+    Bounded outbound queue for one stream websocket. Producers call put(),
+    which never awaits; a sender task drains the queue, so a slow client only
+    backs up its own queue instead of the poll loop that feeds it. When a put
+    would exceed max_events or max_bytes the policy decides what happens:
+
+    - collapse: queued screen frames are replaced by one fresh snapshot.
+    - drop: queued and incoming screen frames are dropped until the queue
+      drains, then a fresh snapshot is sent.
+    - disconnect: the queue is cleared and the client gets a `resume` frame
+      with the last delivered seq, then a 4408 close; reconnecting with
+      since_seq=<seq> replays the rest.
+
+    snapshot() returns the current full-screen frame (or None). It may block
+    (a host agent RPC in worker mode), so only the sender task calls it, in a
+    thread. Keepalives are skipped while frames are queued.
+    """
+
+    def __init__(
+        self,
+        websocket: Any,
+        *,
+        stream: str,
+        session: str,
+        snapshot: Callable[[], Optional[Dict[str, Any]]],
+        policy: str = "",
+        max_events: int = SESSION_STREAM_SEND_MAX_EVENTS,
+        max_bytes: int = SESSION_STREAM_SEND_MAX_BYTES,
+        since_seq: int = 0,
+    ) -> None:
+        self.websocket = websocket
+        self.stream = stream
+        self.session = session
+        self.snapshot = snapshot
+        self.policy = _stream_send_policy(policy)
+        self.max_events = max(2, int(max_events))
+        self.max_bytes = max(1, int(max_bytes))
+        self.client = uuid.uuid4().hex[:12]
+        self.connected_at = time.time()
+        self.closed = False
+        self._closing = False
+        self._resync = False
+        self._floor_seq = 0
+        self._queue: "collections.deque[Tuple[Dict[str, Any], str, int, float]]" = collections.deque()
+        self._bytes = 0
+        self._wake = asyncio.Event()
+        self._task: Optional["asyncio.Task[None]"] = None
+        self.delivered_seq = max(0, int(since_seq or 0))
+        self.sent = 0
+        self.sent_bytes = 0
+        self.drops = 0
+        self.collapses = 0
+        self.high_water = 0
+        self.high_water_bytes = 0
+        self.last_send_ms = 0.0
+
+    def start(self) -> "_StreamSendQueue":
+        self._task = asyncio.create_task(self.run())
+        with SESSION_STREAM_CLIENTS_LOCK:
+            SESSION_STREAM_CLIENTS[self.client] = self
+        return self
+
+    async def aclose(self) -> None:
+        self.closed = True
+        with SESSION_STREAM_CLIENTS_LOCK:
+            SESSION_STREAM_CLIENTS.pop(self.client, None)
+        task = self._task
+        if task is not None and not task.done():
+            if self._closing:
+                # Let the resume frame and close go out.
+                try:
+                    await asyncio.wait_for(asyncio.shield(task), timeout=5.0)
+                except Exception:
+                    pass
+            task.cancel()
+            try:
+                await task
+            except BaseException:
+                pass
+
+    def put(self, payload: Dict[str, Any]) -> bool:
+        """Queues a frame; False once the client is gone or being disconnected."""
+        if self.closed:
+            return False
+        kind = str(payload.get("type") or "")
+        if kind in SESSION_STREAM_SCREEN_EVENTS:
+            if self._resync or int(payload.get("seq") or 0) <= self._floor_seq:
+                self.drops += 1
+                return True
+        elif kind == "keepalive" and self._queue:
+            return True
+        text, size = _stream_send_encode(payload)
+        if self._queue and (len(self._queue) >= self.max_events or self._bytes + size > self.max_bytes):
+            return self._overflow(payload, text, size)
+        self._push(payload, text, size)
+        return True
+
+    def _push(self, payload: Dict[str, Any], text: str, size: int) -> None:
+        self._queue.append((payload, text, size, time.monotonic()))
+        self._bytes += size
+        self.high_water = max(self.high_water, len(self._queue))
+        self.high_water_bytes = max(self.high_water_bytes, self._bytes)
+        self._wake.set()
+
+    def _shed(self, keep: Callable[[Dict[str, Any]], bool]) -> int:
+        kept = [item for item in self._queue if keep(item[0])]
+        dropped = len(self._queue) - len(kept)
+        self._queue = collections.deque(kept)
+        self._bytes = sum(item[2] for item in kept)
+        self.drops += dropped
+        return dropped
+
+    def _overflow(self, payload: Dict[str, Any], text: str, size: int) -> bool:
+        kind = str(payload.get("type") or "")
+        is_screen = kind in SESSION_STREAM_SCREEN_EVENTS
+        if self.policy == "disconnect":
+            self._shed(lambda _item: False)
+            self.drops += 1
+            METRICS.inc("codrex_stream_send_overflows_total", stream=self.stream, policy=self.policy)
+            frame = {
+                "ok": True,
+                "session": self.session,
+                "seq": self.delivered_seq,
+                "type": "resume",
+                "text": "",
+                "detail": "backpressure",
+                "ts": time.time(),
+            }
+            self._push(frame, *_stream_send_encode(frame))
+            self._closing = True
+            self.closed = True
+            return False
+        # Control frames (hello/status/error) survive; stale keepalives do not.
+        self._shed(lambda item: str(item.get("type") or "") not in SESSION_STREAM_SCREEN_EVENTS | {"keepalive"})
+        METRICS.inc("codrex_stream_send_overflows_total", stream=self.stream, policy=self.policy)
+        if self.policy == "collapse":
+            # A placeholder keeps the snapshot's place in the queue; the sender
+            # fetches it when it gets there and drops anything it covers.
+            if not any(item[0] is _STREAM_SEND_SNAPSHOT_MARK for item in self._queue):
+                self._push(_STREAM_SEND_SNAPSHOT_MARK, "", 0)
+            self._push(payload, text, size)
+            return True
+        # drop: shed until the client catches up.
+        if is_screen:
+            self.drops += 1
+            self._resync = True
+        else:
+            self._push(payload, text, size)
+        return True
+
+    async def _fetch_snapshot(self) -> Optional[Tuple[Dict[str, Any], str, int, float]]:
+        # Frames published while this runs are queued and filtered against the
+        # new floor when they are popped.
+        fresh = await asyncio.to_thread(self.snapshot)
+        if fresh is None:
+            return None
+        self.collapses += 1
+        self._floor_seq = max(self._floor_seq, int(fresh.get("seq") or 0))
+        return (fresh, *_stream_send_encode(fresh), time.monotonic())
+
+    async def _next(self) -> Optional[Tuple[Dict[str, Any], str, int, float]]:
+        while True:
+            if self._queue:
+                item = self._queue.popleft()
+                self._bytes -= item[2]
+                payload = item[0]
+                if payload is _STREAM_SEND_SNAPSHOT_MARK:
+                    fresh = await self._fetch_snapshot()
+                    if fresh is not None:
+                        return fresh
+                    continue
+                if str(payload.get("type") or "") in SESSION_STREAM_SCREEN_EVENTS and int(payload.get("seq") or 0) <= self._floor_seq:
+                    self.drops += 1
+                    continue
+                return item
+            if self._resync:
+                self._resync = False
+                fresh = await self._fetch_snapshot()
+                if fresh is not None:
+                    return fresh
+                continue
+            if self._closing or self.closed:
+                return None
+            self._wake.clear()
+            await self._wake.wait()
+
+    async def run(self) -> None:
+        try:
+            while True:
+                item = await self._next()
+                if item is None:
+                    break
+                payload, text, size, _queued_at = item
+                started = time.monotonic()
+                await self.websocket.send_text(text)
+                self.last_send_ms = (time.monotonic() - started) * 1000.0
+                self.sent += 1
+                self.sent_bytes += size
+                if str(payload.get("type") or "") in SESSION_STREAM_SCREEN_EVENTS:
+                    self.delivered_seq = max(self.delivered_seq, int(payload.get("seq") or 0))
+            if self._closing:
+                await self.websocket.close(code=4408)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            pass
+        finally:
+            self.closed = True
+
+    def stats(self) -> Dict[str, Any]:
+        oldest = self._queue[0][3] if self._queue else 0.0
+        return {
+            "client": self.client,
+            "stream": self.stream,
+            "session": self.session,
+            "policy": self.policy,
+            "connected_at": self.connected_at,
+            "depth": len(self._queue),
+            "bytes": self._bytes,
+            "lag_s": round(time.monotonic() - oldest, 3) if oldest else 0.0,
+            "high_water": self.high_water,
+            "high_water_bytes": self.high_water_bytes,
+            "max_events": self.max_events,
+            "max_bytes": self.max_bytes,
+            "sent": self.sent,
+            "sent_bytes": self.sent_bytes,
+            "drops": self.drops,
+            "collapses": self.collapses,
+            "delivered_seq": self.delivered_seq,
+            "last_send_ms": round(self.last_send_ms, 3),
+            "closing": self._closing,
+        }
+
+
+def _stream_send_clients_snapshot() -> List[Dict[str, Any]]:
+    with SESSION_STREAM_CLIENTS_LOCK:
+        clients = list(SESSION_STREAM_CLIENTS.values())
+    return sorted((client.stats() for client in clients), key=lambda item: item["connected_at"])
+
+
+# -------------------------
+# Session recordings
+# -------------------------
+class _SessionRecorder:
+    """
+    Writes one session's stream events (snapshot/append/replace with their
+    timestamps) to gzip segment files under root/<session>/. Events are
+    buffered into chunks of chunk_events or chunk_s, and each chunk is
+    appended to the open segment as its own gzip member that starts from the
+    full screen text, so a seek only decompresses the chunk holding the
+    target time. index.json lists the segments with the (ts, seq, offset,
+    length) of every chunk; segments rotate at segment_max_bytes or
+    segment_max_s.
+
+    record() runs under SESSION_STREAM_LOCK, so it only seals full chunks;
+    flush() and flush_if_due() (the recorder thread) compress and write them.
+    Sealed chunks stay readable from memory until they are on disk.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        session: str,
+        *,
+        chunk_events: int = SESSION_RECORDING_CHUNK_EVENTS,
+        chunk_s: float = SESSION_RECORDING_CHUNK_S,
+        segment_max_bytes: int = SESSION_RECORDING_SEGMENT_MAX_BYTES,
+        segment_max_s: float = SESSION_RECORDING_SEGMENT_MAX_S,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.session = session
+        self.dir = os.path.join(root, session)
+        self.index_path = os.path.join(self.dir, "index.json")
+        self.chunk_events = max(1, int(chunk_events))
+        self.chunk_s = max(0.1, float(chunk_s))
+        self.segment_max_bytes = max(1024, int(segment_max_bytes))
+        self.segment_max_s = max(1.0, float(segment_max_s))
+        self.clock = clock
+        self._lock = threading.Lock()
+        # Held while writing chunks or the index; taken before _lock.
+        self._io_lock = threading.Lock()
+        manifest = _read_json_file(self.index_path)
+        self.enabled = bool(manifest.get("enabled"))
+        self._segments: List[Dict[str, Any]] = [
+            {**segment, "chunks": [list(chunk) for chunk in segment.get("chunks") or []]}
+            for segment in manifest.get("segments") or []
+            if isinstance(segment, dict) and segment.get("file")
+        ]
+        # A segment left open by a previous run is finished as it is.
+        for segment in self._segments:
+            segment["closed"] = True
+        self._pending: List[Dict[str, Any]] = []
+        self._pending_events = 0
+        self._pending_started = 0.0
+        self._sealed: List[Tuple[List[Dict[str, Any]], int]] = []
+        self._text = ""
+
+    def _manifest_unlocked(self) -> Dict[str, Any]:
+        return {
+            "session": self.session,
+            "enabled": self.enabled,
+            "segments": [{**segment, "chunks": list(segment["chunks"])} for segment in self._segments],
+        }
+
+    def set_enabled(self, enabled: bool) -> None:
+        with self._io_lock:
+            with self._lock:
+                self.enabled = bool(enabled)
+                if not self.enabled:
+                    self._seal_unlocked()
+            if not enabled:
+                self._write_sealed()
+            with self._lock:
+                if not self.enabled and self._segments:
+                    self._segments[-1]["closed"] = True
+                manifest = self._manifest_unlocked()
+            _write_json_file(self.index_path, manifest)
+
+    def record(self, event: Dict[str, Any]) -> bool:
+        """Buffers one event; True when a chunk was sealed and is waiting for a flush."""
+        event_type = str(event.get("type") or "")
+        if event_type not in {"snapshot", "append", "replace"}:
+            return False
+        item = {key: event[key] for key in ("seq", "type", "text", "ts", "state") if key in event}
+        item["ts"] = float(item.get("ts") or self.clock())
+        with self._lock:
+            if not self.enabled:
+                return False
+            if self._pending and (
+                self._pending_events >= self.chunk_events or self.clock() - self._pending_started >= self.chunk_s
+            ):
+                self._seal_unlocked()
+            if not self._pending:
+                self._pending_started = self.clock()
+                if event_type == "append":
+                    self._pending.append(
+                        {"seq": int(item.get("seq") or 0) - 1, "type": "snapshot", "text": self._text, "ts": item["ts"], "keyframe": True}
+                    )
+            self._pending.append(item)
+            self._pending_events += 1
+            self._text = self._text + str(item.get("text") or "") if event_type == "append" else str(item.get("text") or "")
+            return bool(self._sealed)
+
+    def _seal_unlocked(self) -> None:
+        if not self._pending:
+            return
+        self._sealed.append((self._pending, self._pending_events))
+        self._pending = []
+        self._pending_events = 0
+
+    def has_sealed(self) -> bool:
+        with self._lock:
+            return bool(self._sealed)
+
+    def flush_if_due(self) -> None:
+        with self._io_lock:
+            with self._lock:
+                if self._pending and self.clock() - self._pending_started >= self.chunk_s:
+                    self._seal_unlocked()
+            self._write_sealed()
+
+    def flush(self) -> None:
+        with self._io_lock:
+            with self._lock:
+                self._seal_unlocked()
+            self._write_sealed()
+
+    def _write_sealed(self) -> None:
+        # Called with _io_lock held. A chunk leaves _sealed only once its
+        # segment entry lists it, so readers always find it somewhere.
+        wrote = False
+        while True:
+            with self._lock:
+                if not self._sealed:
+                    break
+                events, recorded = self._sealed[0]
+                first_ts = float(events[0]["ts"])
+                segment = self._segments[-1] if self._segments and not self._segments[-1].get("closed") else None
+                if segment is not None and (
+                    segment["bytes"] >= self.segment_max_bytes or first_ts - segment["started_at"] >= self.segment_max_s
+                ):
+                    segment["closed"] = True
+                    segment = None
+                if segment is None:
+                    segment = {
+                        "file": f"{int(first_ts * 1000)}-{uuid.uuid4().hex[:6]}.jsonl.gz",
+                        "started_at": first_ts,
+                        "ended_at": first_ts,
+                        "first_seq": int(events[0].get("seq") or 0),
+                        "last_seq": 0,
+                        "events": 0,
+                        "bytes": 0,
+                        "closed": False,
+                        "chunks": [],
+                    }
+                    self._segments.append(segment)
+            data = "".join(json.dumps(event, ensure_ascii=False) + "\n" for event in events).encode("utf-8")
+            blob = gzip.compress(data, compresslevel=6)
+            os.makedirs(self.dir, exist_ok=True)
+            with open(os.path.join(self.dir, segment["file"]), "ab") as f:
+                f.seek(0, os.SEEK_END)
+                offset = f.tell()
+                f.write(blob)
+            with self._lock:
+                segment["chunks"].append([first_ts, int(events[0].get("seq") or 0), offset, len(blob)])
+                segment["bytes"] = offset + len(blob)
+                segment["ended_at"] = float(events[-1]["ts"])
+                segment["last_seq"] = int(events[-1].get("seq") or 0)
+                segment["events"] += recorded
+                self._sealed.pop(0)
+            wrote = True
+        if wrote:
+            with self._lock:
+                manifest = self._manifest_unlocked()
+            _write_json_file(self.index_path, manifest)
+
+    def drop_segments(self, files: Set[str]) -> int:
+        """Deletes the named segments; returns the bytes freed."""
+        freed = 0
+        with self._io_lock:
+            with self._lock:
+                doomed = [segment for segment in self._segments if segment["file"] in files]
+                self._segments = [segment for segment in self._segments if segment["file"] not in files]
+                manifest = self._manifest_unlocked()
+            for segment in doomed:
+                try:
+                    os.remove(os.path.join(self.dir, segment["file"]))
+                except FileNotFoundError:
+                    pass
+                freed += int(segment.get("bytes") or 0)
+            _write_json_file(self.index_path, manifest)
+        return freed
+
+    def segments(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [
+                {
+                    "file": segment["file"],
+                    "started_at": segment["started_at"],
+                    "ended_at": segment["ended_at"],
+                    "first_seq": segment["first_seq"],
+                    "last_seq": segment["last_seq"],
+                    "events": segment["events"],
+                    "bytes": segment["bytes"],
+                    "chunks": len(segment["chunks"]),
+                    "closed": bool(segment.get("closed")),
+                }
+                for segment in self._segments
+            ]
+
+    def summary(self) -> Dict[str, Any]:
+        segments = self.segments()
+        with self._lock:
+            buffered = [events for events, _recorded in self._sealed] + ([self._pending] if self._pending else [])
+            pending = self._pending_events + sum(recorded for _events, recorded in self._sealed)
+            pending_range = (buffered[0][0]["ts"], buffered[-1][-1]["ts"]) if buffered else None
+        started = [segment["started_at"] for segment in segments] + ([pending_range[0]] if pending_range else [])
+        ended = [segment["ended_at"] for segment in segments] + ([pending_range[1]] if pending_range else [])
+        return {
+            "enabled": self.enabled,
+            "segments": segments,
+            "pending_events": pending,
+            "events": sum(segment["events"] for segment in segments) + pending,
+            "total_bytes": sum(segment["bytes"] for segment in segments),
+            "started_at": min(started) if started else None,
+            "ended_at": max(ended) if ended else None,
+        }
+
+    def _read_chunk(self, file_name: str, offset: int, length: int) -> List[Dict[str, Any]]:
+        with open(os.path.join(self.dir, file_name), "rb") as f:
+            f.seek(offset)
+            blob = f.read(length)
+        return [json.loads(line) for line in gzip.decompress(blob).decode("utf-8").splitlines() if line.strip()]
+
+    def _chunk_refs_unlocked(self) -> List[Tuple[float, str, int, int]]:
+        refs = [
+            (float(chunk[0]), segment["file"], int(chunk[2]), int(chunk[3]))
+            for segment in self._segments
+            for chunk in segment["chunks"]
+        ]
+        refs.sort(key=lambda ref: ref[0])
+        return refs
+
+    def iter_events(self, from_ts: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Yields a `snapshot` of the screen at from_ts (the recording start when
+        None), then every later event in order, ending with the chunks still
+        buffered in memory. Only the chunk that holds from_ts is decoded to
+        find the starting screen.
+        """
+        with self._lock:
+            refs = self._chunk_refs_unlocked()
+            buffered = [[dict(event) for event in events] for events, _recorded in self._sealed]
+            if self._pending:
+                buffered.append([dict(event) for event in self._pending])
+        starts = [ref[0] for ref in refs]
+        if from_ts is None:
+            from_ts = starts[0] if starts else (buffered[0][0]["ts"] if buffered else self.clock())
+        index = max(0, bisect.bisect_right(starts, from_ts) - 1)
+        sources: List[Any] = list(refs[index:]) + buffered
+        text = ""
+        seq = 0
+        started = False
+        for source in sources:
+            try:
+                events = source if isinstance(source, list) else self._read_chunk(source[1], source[2], source[3])
+            except (OSError, ValueError):
+                # Dropped by retention while playing.
+                continue
+            for event in events:
+                ts = float(event.get("ts") or 0.0)
+                if not started and ts <= from_ts:
+                    text = text + str(event.get("text") or "") if event.get("type") == "append" else str(event.get("text") or "")
+                    seq = int(event.get("seq") or 0)
+                    continue
+                if not started:
+                    started = True
+                    yield {"seq": seq, "type": "snapshot", "text": text, "ts": from_ts, "detail": "seek"}
+                if event.get("keyframe"):
+                    continue
+                yield dict(event)
+        if not started:
+            yield {"seq": seq, "type": "snapshot", "text": text, "ts": from_ts, "detail": "seek"}
+
+    def state_at(self, ts: float) -> Dict[str, Any]:
+        return next(self.iter_events(ts))
+
+
+class _SessionRecordings:
+    """
+    Opt-in recorders for all sessions, plus retention by age and total size
+    across every session under root. A background thread captures recorded
+    sessions every capture_interval_s, so runs nobody is watching still
+    produce stream events, and writes chunks as soon as record() seals them
+    or once they have gone quiet.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        *,
+        max_bytes: int = SESSION_RECORDING_MAX_BYTES,
+        max_age_s: float = SESSION_RECORDING_MAX_AGE_S,
+        capture_interval_s: float = SESSION_RECORDING_CAPTURE_S,
+        capture: Optional[Callable[[str], None]] = None,
+        recorder_factory: Optional[Callable[[str, str], _SessionRecorder]] = None,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.root = root
+        self.max_bytes = max(0, int(max_bytes))
+        self.max_age_s = max(0.0, float(max_age_s))
+        self.capture_interval_s = max(0.2, float(capture_interval_s))
+        self.capture = capture
+        self.recorder_factory = recorder_factory or (lambda root_dir, session: _SessionRecorder(root_dir, session, clock=clock))
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._recorders: Dict[str, _SessionRecorder] = {}
+        self._enabled: Set[str] = set()
+        self._thread: Optional[threading.Thread] = None
+        self._wake = threading.Event()
+        self._closed = False
+        self._last_retention = 0.0
+        try:
+            names = sorted(os.listdir(root))
+        except OSError:
+            names = []
+        for name in names:
+            if VALID_NAME_RE.match(name) and os.path.isfile(os.path.join(root, name, "index.json")):
+                recorder = self.recorder_factory(root, name)
+                self._recorders[name] = recorder
+                if recorder.enabled:
+                    self._enabled.add(name)
+        if self._enabled:
+            self._ensure_thread()
+
+    def recorder(self, session: str, *, create: bool = False) -> Optional[_SessionRecorder]:
+        with self._lock:
+            recorder = self._recorders.get(session)
+            if recorder is None and create:
+                recorder = self._recorders[session] = self.recorder_factory(self.root, session)
+            return recorder
+
+    def is_enabled(self, session: str) -> bool:
+        return session in self._enabled
+
+    def set_enabled(self, session: str, enabled: bool) -> _SessionRecorder:
+        recorder = self.recorder(session, create=True)
+        recorder.set_enabled(enabled)
+        with self._lock:
+            if enabled:
+                self._enabled.add(session)
+            else:
+                self._enabled.discard(session)
+        if enabled:
+            self._ensure_thread()
+        return recorder
+
+    def record(self, event: Dict[str, Any]) -> None:
+        session = str(event.get("session") or "")
+        if session not in self._enabled:
+            return
+        recorder = self.recorder(session)
+        if recorder is not None and recorder.record(event):
+            self._wake.set()
+
+    def enforce_retention(self) -> Dict[str, int]:
+        """Drops segments older than max_age_s, then the oldest until under max_bytes."""
+        now = self.clock()
+        with self._lock:
+            recorders = dict(self._recorders)
+        candidates = []
+        total = 0
+        for session, recorder in recorders.items():
+            for segment in recorder.segments():
+                total += segment["bytes"]
+                candidates.append((segment["ended_at"], session, segment))
+        candidates.sort(key=lambda item: item[0])
+        doomed: Dict[str, Set[str]] = {}
+        freed_estimate = 0
+        for ended_at, session, segment in candidates:
+            expired = self.max_age_s and ended_at < now - self.max_age_s
+            oversize = self.max_bytes and total - freed_estimate > self.max_bytes and segment["closed"]
+            if expired or oversize:
+                doomed.setdefault(session, set()).add(segment["file"])
+                freed_estimate += segment["bytes"]
+        freed = 0
+        dropped = 0
+        for session, files in doomed.items():
+            freed += recorders[session].drop_segments(files)
+            dropped += len(files)
+        self._last_retention = now
+        if dropped:
+            METRICS.inc("codrex_session_recording_segments_dropped_total", dropped)
+        return {"segments": dropped, "bytes": freed}
+
+    def _ensure_thread(self) -> None:
+        with self._lock:
+            if self._thread is not None or self._closed:
+                return
+            self._thread = threading.Thread(target=self._run, name="codrex-session-recorder", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        next_capture = 0.0
+        while True:
+            self._wake.clear()
+            with self._lock:
+                if self._closed:
+                    return
+                sessions = list(self._enabled)
+                recorders = list(self._recorders.values())
+            if time.monotonic() >= next_capture:
+                next_capture = time.monotonic() + self.capture_interval_s
+                for session in sessions:
+                    if self.capture is not None:
+                        try:
+                            self.capture(session)
+                        except Exception:
+                            pass
+            for recorder in recorders:
+                try:
+                    recorder.flush_if_due()
+                except Exception as e:
+                    print(f"Session recording flush failed session={recorder.session} error={type(e).__name__}: {e}", flush=True)
+            if self.clock() - self._last_retention >= 60.0:
+                try:
+                    self.enforce_retention()
+                except Exception:
+                    pass
+            self._wake.wait(max(0.0, next_capture - time.monotonic()))
+
+    def flush_all(self) -> None:
+        with self._lock:
+            recorders = list(self._recorders.values())
+        for recorder in recorders:
+            try:
+                recorder.flush()
+            except Exception:
+                pass
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+        self._wake.set()
+        self.flush_all()
+
+
+def _session_stream_watched(session: str) -> bool:
+    """True while a stream client polls the session, here or in a worker process."""
+    with SESSION_STREAM_CLIENTS_LOCK:
+        clients = list(SESSION_STREAM_CLIENTS.values())
+    if any(client.stream == "codex" and client.session == session and not client.closed for client in clients):
+        return True
+    with SESSION_STREAM_LOCK:
+        watched_at = float((SESSION_STREAM_STATES.get(session) or {}).get("watched_at") or 0.0)
+    return time.time() - watched_at < max(5.0, 2 * SESSION_RECORDING_CAPTURE_S)
+
+
+def _session_recording_capture(session: str) -> None:
+    # A live stream already publishes this session; capturing it again at a
+    # different size would turn every cycle into a full `replace`.
+    if _session_stream_watched(session):
+        return
+    pane = _session_pane(session)
+    if not pane:
+        return
+    capture = _stream_capture_pane_text(pane["pane_id"], _session_stream_max_chars("balanced"))
+    if not capture.get("ok"):
+        return
+    text = str(capture.get("text") or "")
+    current_command = str(pane.get("current_command") or "")
+    _publish_session_stream_snapshot(
+        session,
+        pane["pane_id"],
+        text,
+        screen_state=_infer_progress_state(text, current_command),
+        current_command=current_command,
+    )
+
+
+def _session_recordings() -> _SessionRecordings:
+    global SESSION_RECORDINGS
+    with SESSION_RECORDINGS_LOCK:
+        if SESSION_RECORDINGS is None:
+            SESSION_RECORDINGS = _SessionRecordings(SESSION_RECORDINGS_DIR, capture=_session_recording_capture)
+        return SESSION_RECORDINGS
+
+
+def _flush_session_recordings() -> None:
+    with SESSION_RECORDINGS_LOCK:
+        recordings = SESSION_RECORDINGS
+    if recordings is not None:
+        recordings.flush_all()
+
+
+atexit.register(_flush_session_recordings)
+
+
 def _maybe_repair_codex_session_reasoning(session: str, pane_id: str) -> Dict[str, Any]:
     """
     Some older sessions were started/applied with xhigh on codex-* models.
@@ -16782,6 +22361,8 @@ def _maybe_repair_codex_session_reasoning(session: str, pane_id: str) -> Dict[st
             "model": model,
             "reasoning_effort": normalized_effort,
         }
+        repaired = dict(SESSIONS[session])
+    _session_record_publish(session, repaired)
 
     return {
         "ok": True,
@@ -16792,27 +22373,88 @@ def _maybe_repair_codex_session_reasoning(session: str, pane_id: str) -> Dict[st
     }
 
 
-def _tmux_send_text(pane_id: str, text: str, *, codex_mode: Optional[bool] = None, timeout_s: int = 30) -> Dict[str, Any]:
-    pane_id = _validate_pane_id(pane_id)
-    if len(text) > 20000:
-        raise HTTPException(status_code=400, detail="Text too long (max 20000 chars).")
+class _TmuxPaneSendOrder:
+    """
+    FIFO turn-taking per pane: racing sends reach tmux in the order they
+    arrived and never interleave. A caller that gives up waiting leaves its
+    ticket behind, and the queue skips it.
+    """
 
-    use_codex = _pane_is_codex_like(pane_id) if codex_mode is None else bool(codex_mode)
-    for chunk in _iter_text_chunks(text, 400):
-        send_cmd = f"tmux send-keys -t {pane_id} -l " + _bash_quote(chunk)
-        send_result = run_wsl_bash(send_cmd, timeout_s=timeout_s)
-        if send_result.get("exit_code") != 0:
-            return send_result
-
-    if use_codex:
-        enter_cmd = (
+    def __init__(self) -> None:
+        self._cond = threading.Condition()
+        self._panes: Dict[str, Dict[str, Any]] = {}
+
+    def acquire(self, pane_id: str, timeout_s: float) -> bool:
+        deadline = time.monotonic() + max(0.0, float(timeout_s))
+        with self._cond:
+            state = self._panes.setdefault(pane_id, {"next": 0, "serving": 0, "abandoned": set()})
+            ticket = state["next"]
+            state["next"] += 1
+            while state["serving"] != ticket:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    state["abandoned"].add(ticket)
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def release(self, pane_id: str) -> None:
+        with self._cond:
+            state = self._panes.get(pane_id)
+            if state is None:
+                return
+            state["serving"] += 1
+            while state["serving"] in state["abandoned"]:
+                state["abandoned"].discard(state["serving"])
+                state["serving"] += 1
+            if state["serving"] >= state["next"]:
+                self._panes.pop(pane_id, None)
+            self._cond.notify_all()
+
+
+TMUX_PANE_SEND_ORDER = _TmuxPaneSendOrder()
+
+
+def _tmux_enter_command(pane_id: str, codex_mode: bool) -> str:
+    if codex_mode:
+        return (
             f"tmux send-keys -t {pane_id} Enter ; "
             f"sleep 0.2 ; "
             f"tmux send-keys -t {pane_id} Enter"
         )
-    else:
-        enter_cmd = f"tmux send-keys -t {pane_id} Enter"
-    return run_wsl_bash(enter_cmd, timeout_s=timeout_s)
+    return f"tmux send-keys -t {pane_id} Enter"
+
+
+def _tmux_paste_command(pane_id: str, buffer_name: str, *, codex_mode: bool) -> str:
+    # The payload arrives on stdin. paste-buffer -p only brackets the paste when the
+    # pane's application asked for bracketed paste; -d drops the buffer afterwards.
+    return (
+        f"tmux load-buffer -b {buffer_name} - && "
+        f"tmux paste-buffer -d -p -b {buffer_name} -t {pane_id} || "
+        f"{{ rc=$? ; tmux delete-buffer -b {buffer_name} 2>/dev/null ; exit $rc ; }} ; "
+        + _tmux_enter_command(pane_id, codex_mode)
+    )
+
+
+def _tmux_send_text(pane_id: str, text: str, *, codex_mode: Optional[bool] = None, timeout_s: int = 30) -> Dict[str, Any]:
+    pane_id = _validate_pane_id(pane_id)
+    if len(text) > 20000:
+        raise HTTPException(status_code=400, detail="Text too long (max 20000 chars).")
+
+    use_codex = _pane_is_codex_like(pane_id) if codex_mode is None else bool(codex_mode)
+    if not TMUX_PANE_SEND_ORDER.acquire(pane_id, timeout_s):
+        return {"exit_code": 124, "stdout": "", "stderr": f"timeout after {timeout_s}s waiting for earlier sends to {pane_id}"}
+    try:
+        if not text:
+            return run_wsl_bash(_tmux_enter_command(pane_id, use_codex), timeout_s=timeout_s)
+        buffer_name = f"codrex-{uuid.uuid4().hex[:12]}"
+        return run_wsl_bash(
+            _tmux_paste_command(pane_id, buffer_name, codex_mode=use_codex),
+            timeout_s=timeout_s,
+            input_bytes=text.encode("utf-8"),
+        )
+    finally:
+        TMUX_PANE_SEND_ORDER.release(pane_id)
 
 
 def _parse_share_command(raw_text: str) -> Dict[str, Any]:
@@ -16937,9 +22579,9 @@ def codex_session_send(session: str, text: str = Body(..., media_type="text/plai
         telegram_result = None
         detail = "Shared file added to mobile inbox."
         if share_cmd.get("send_telegram"):
-            telegram_result = _telegram_send_shared_item(item, caption_override=str(share_cmd.get("caption") or ""))
+            telegram_result = _telegram_enqueue_shared_item(item, caption_override=str(share_cmd.get("caption") or ""))
             if telegram_result.get("ok"):
-                detail = "Shared file added to mobile inbox and sent to Telegram."
+                detail = "Shared file added to mobile inbox and queued for Telegram."
             else:
                 detail = f"Shared file added to mobile inbox. Telegram send failed: {telegram_result.get('detail') or telegram_result.get('error') or 'unknown error'}"
         return {
@@ -16976,6 +22618,7 @@ def codex_session_send(session: str, text: str = Body(..., media_type="text/plai
         if resume_id:
             next_record["resume_id"] = resume_id
         SESSIONS[session] = next_record
+    _session_record_publish(session, next_record)
     with SESSION_HISTORY_LOCK:
         _upsert_session_history_unlocked(
             session,
@@ -17043,6 +22686,8 @@ def codex_session_apply_profile(session: str, payload: Optional[Dict[str, Any]]
             "model": model,
             "reasoning_effort": reasoning_effort,
         }
+        applied = dict(SESSIONS[session])
+    _session_record_publish(session, applied)
 
     return {
         "ok": True,
@@ -17140,28 +22785,31 @@ def codex_session_screen(session: str):
                     "state": "recovering",
                     "updated_at": time.time(),
                 }
-                with SESSION_HISTORY_LOCK:
-                    _upsert_session_history_unlocked(
-                        session,
-                        {
-                            **prev,
-                            "session": session,
-                            "state": "recovering",
-                            "updated_at": time.time(),
-                            "active": True,
-                        },
-                    )
-                cached_text = str(prev.get("last_text") or prev.get("snippet") or "")
-                return {
-                    "ok": True,
+                recovering = dict(SESSIONS[session])
+        if not prev:
+            return {"ok": False, "error": "not_found", "detail": f"Session '{session}' has no panes."}
+        _session_record_publish(session, recovering)
+        with SESSION_HISTORY_LOCK:
+            _upsert_session_history_unlocked(
+                session,
+                {
+                    **prev,
                     "session": session,
-                    "pane_id": str(prev.get("pane_id") or ""),
-                    "current_command": str(prev.get("current_command") or ""),
                     "state": "recovering",
-                    "text": cached_text,
-                    "detail": f"Session '{session}' has no panes. Returning cached screen while recovering.",
-                }
-        return {"ok": False, "error": "not_found", "detail": f"Session '{session}' has no panes."}
+                    "updated_at": time.time(),
+                    "active": True,
+                },
+            )
+        cached_text = str(prev.get("last_text") or prev.get("snippet") or "")
+        return {
+            "ok": True,
+            "session": session,
+            "pane_id": str(prev.get("pane_id") or ""),
+            "current_command": str(prev.get("current_command") or ""),
+            "state": "recovering",
+            "text": cached_text,
+            "detail": f"Session '{session}' has no panes. Returning cached screen while recovering.",
+        }
     # Full pane capture is needed for Codex because it renders in the alternate screen.
     text = _capture_pane_full(pane["pane_id"], max_chars=25000)
     snippet = _capture_snippet(pane["pane_id"], lines=80)
@@ -17183,6 +22831,7 @@ def codex_session_screen(session: str):
             "resume_id": resume_id or prev.get("resume_id") or "",
         }
         next_record = dict(SESSIONS[session])
+    _session_record_publish(session, next_record)
     with SESSION_HISTORY_LOCK:
         _upsert_session_history_unlocked(
             session,
@@ -17238,26 +22887,33 @@ async def codex_session_stream(websocket: WebSocket, session: str):
     last_keepalive = 0.0
     waiting_for_pane = False
 
+    sender = _StreamSendQueue(
+        websocket,
+        stream="codex",
+        session=session_id,
+        snapshot=lambda: _session_stream_resync_snapshot(session_id, selected_profile),
+        policy=websocket.query_params.get("backpressure"),
+        since_seq=since_seq,
+    ).start()
+
     try:
         _host_keep_awake_pulse(force=True)
-        with SESSION_STREAM_LOCK:
-            state = _session_stream_state_unlocked(session_id)
-            hello_payload = _session_stream_event_payload(
-                session=session_id,
-                pane_id="",
-                seq=int(state.get("seq") or 0),
-                event_type="hello",
-                text="",
-                profile=selected_profile,
-                detail="connected",
-            )
-        await websocket.send_json({"ok": True, **hello_payload})
+        hello_payload = _session_stream_event_payload(
+            session=session_id,
+            pane_id="",
+            seq=await asyncio.to_thread(_session_stream_seq, session_id),
+            event_type="hello",
+            text="",
+            profile=selected_profile,
+            detail="connected",
+        )
+        sender.put({"ok": True, **hello_payload})
 
-        replay_events, replay_snapshot = _session_stream_replay(session_id, since_seq)
+        replay_events, replay_snapshot = await asyncio.to_thread(_session_stream_replay, session_id, since_seq)
         for event in replay_events:
-            await websocket.send_json({"ok": True, **event})
+            sender.put({"ok": True, **event})
         if replay_snapshot:
-            await websocket.send_json({"ok": True, **replay_snapshot})
+            sender.put({"ok": True, **replay_snapshot})
 
         if not replay_events and not replay_snapshot:
             pane = _session_pane(session_id)
@@ -17273,17 +22929,20 @@ async def codex_session_stream(websocket: WebSocket, session: str):
                         current_text,
                         screen_state=current_state,
                         current_command=pane.get("current_command", ""),
+                        watched=True,
                     )
                     if event:
-                        await websocket.send_json({"ok": True, **event, "profile": selected_profile})
+                        sender.put({"ok": True, **event, "profile": selected_profile})
 
         while True:
+            if sender.closed:
+                return
             _host_keep_awake_pulse()
             pane = _session_pane(session_id)
             if not pane:
                 if not waiting_for_pane:
                     waiting_for_pane = True
-                    await websocket.send_json(
+                    sender.put(
                         {
                             "ok": True,
                             **_session_stream_event_payload(
@@ -17304,7 +22963,7 @@ async def codex_session_stream(websocket: WebSocket, session: str):
             waiting_for_pane = False
             capture = await asyncio.to_thread(_stream_capture_pane_text, pane["pane_id"], _session_stream_max_chars(selected_profile))
             if not capture.get("ok"):
-                await websocket.send_json(
+                sender.put(
                     {
                         "ok": False,
                         **_session_stream_event_payload(
@@ -17340,6 +22999,7 @@ async def codex_session_stream(websocket: WebSocket, session: str):
                     "model": prev.get("model") or CODEX_DEFAULT_MODEL,
                     "reasoning_effort": prev.get("reasoning_effort") or CODEX_DEFAULT_REASONING_EFFORT,
                 }
+                streamed = dict(SESSIONS[session_id])
             event = await asyncio.to_thread(
                 _publish_session_stream_snapshot,
                 session_id,
@@ -17347,14 +23007,16 @@ async def codex_session_stream(websocket: WebSocket, session: str):
                 text,
                 screen_state=current_state,
                 current_command=current_command,
+                watched=True,
             )
             if event:
-                await websocket.send_json({"ok": True, **event, "profile": selected_profile})
+                if CONTROLLER_ROLE == "worker":
+                    await asyncio.to_thread(_session_record_publish, session_id, streamed)
+                sender.put({"ok": True, **event, "profile": selected_profile})
                 last_keepalive = time.time()
             elif time.time() - last_keepalive > 10:
-                with SESSION_STREAM_LOCK:
-                    seq = int((_session_stream_state_unlocked(session_id).get("seq") or 0))
-                await websocket.send_json(
+                seq = await asyncio.to_thread(_session_stream_seq, session_id)
+                sender.put(
                     {
                         "ok": True,
                         **_session_stream_event_payload(
@@ -17374,6 +23036,211 @@ async def codex_session_stream(websocket: WebSocket, session: str):
             await asyncio.sleep(interval_ms / 1000.0)
     except WebSocketDisconnect:
         return
+    finally:
+        await sender.aclose()
+
+
+@app.get("/streams/clients")
+def stream_clients():
+    return {
+        "ok": True,
+        "policy": SESSION_STREAM_SEND_POLICY,
+        "policies": list(SESSION_STREAM_SEND_POLICIES),
+        "max_events": SESSION_STREAM_SEND_MAX_EVENTS,
+        "max_bytes": SESSION_STREAM_SEND_MAX_BYTES,
+        "clients": _stream_send_clients_snapshot(),
+    }
+
+
+@app.get("/codex/session/{session}/recording")
+@_host_agent_method("endpoint.codex_session_recording")
+def codex_session_recording(session: str):
+    session = _validate_session_name(session)
+    recordings = _session_recordings()
+    recorder = recordings.recorder(session)
+    summary = recorder.summary() if recorder is not None else {
+        "enabled": False,
+        "segments": [],
+        "pending_events": 0,
+        "events": 0,
+        "total_bytes": 0,
+        "started_at": None,
+        "ended_at": None,
+    }
+    return {
+        "ok": True,
+        "session": session,
+        **summary,
+        "retention": {"max_bytes": recordings.max_bytes, "max_age_s": recordings.max_age_s},
+    }
+
+
+@app.post("/codex/session/{session}/recording")
+@_host_agent_method("endpoint.codex_session_recording_set")
+def codex_session_recording_set(session: str, payload: Optional[Dict[str, Any]] = Body(default=None)):
+    session = _validate_session_name(session)
+    enabled = bool((payload or {}).get("enabled"))
+    recordings = _session_recordings()
+    recordings.set_enabled(session, enabled)
+    if enabled:
+        recordings.enforce_retention()
+    detail = "Recording started." if enabled else "Recording stopped."
+    return {**codex_session_recording(session), "detail": detail}
+
+
+@app.delete("/codex/session/{session}/recording")
+@_host_agent_method("endpoint.codex_session_recording_delete")
+def codex_session_recording_delete(session: str):
+    session = _validate_session_name(session)
+    recorder = _session_recordings().recorder(session)
+    freed = 0
+    if recorder is not None:
+        recorder.flush()
+        freed = recorder.drop_segments({segment["file"] for segment in recorder.segments()})
+    return {**codex_session_recording(session), "freed_bytes": freed, "detail": "Recording deleted."}
+
+
+def _session_recording_reader(session: str) -> Optional[_SessionRecorder]:
+    if _owns_host_singletons():
+        return _session_recordings().recorder(session)
+    # Workers read what the agent has flushed to disk so far.
+    if not os.path.isfile(os.path.join(SESSION_RECORDINGS_DIR, session, "index.json")):
+        return None
+    return _SessionRecorder(SESSION_RECORDINGS_DIR, session)
+
+
+def _recording_replay_speed(raw: Any, fallback: float = 1.0) -> float:
+    try:
+        speed = float(raw)
+    except (TypeError, ValueError):
+        return fallback
+    if not math.isfinite(speed):
+        return fallback
+    return min(float(SESSION_RECORDING_REPLAY_MAX_SPEED), max(1.0, speed))
+
+
+@app.websocket("/codex/session/{session}/recording/ws")
+async def codex_session_recording_replay(websocket: WebSocket, session: str):
+    """
+    Plays a recording back as session stream events at `speed` (1-32x),
+    starting at `from_ts` (epoch seconds; default the recording start).
+    `max_gap_s` caps idle gaps. The client can send {"action": "seek", "ts"},
+    {"action": "speed", "speed"}, {"action": "pause"} and {"action": "resume"};
+    a seek first sends a `snapshot` of the screen at that time. An `end`
+    event marks the end of the recording; seeks still work after it.
+    """
+    session_id = str(session or "").strip()
+    try:
+        session_id = _validate_session_name(session_id)
+    except HTTPException as exc:
+        await websocket.accept()
+        await websocket.send_json({"ok": False, "type": "error", "detail": exc.detail})
+        await websocket.close(code=4400)
+        return
+
+    await websocket.accept()
+    if not _is_valid_auth_token(_auth_token_from_websocket(websocket)):
+        await websocket.send_json({"ok": False, "type": "error", "detail": "Login required."})
+        await websocket.close(code=4401)
+        return
+    recorder = _session_recording_reader(session_id)
+    summary = recorder.summary() if recorder is not None else {}
+    if not summary.get("events"):
+        await websocket.send_json({"ok": False, "type": "error", "detail": f"Session '{session_id}' has no recording."})
+        await websocket.close(code=4404)
+        return
+
+    speed = _recording_replay_speed(websocket.query_params.get("speed"))
+    try:
+        max_gap_s = max(0.0, float(websocket.query_params.get("max_gap_s") or 0))
+    except (TypeError, ValueError):
+        max_gap_s = 0.0
+    try:
+        from_ts: Optional[float] = float(websocket.query_params.get("from_ts") or 0) or None
+    except (TypeError, ValueError):
+        from_ts = None
+
+    controls: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue()
+
+    async def _read_controls() -> None:
+        try:
+            while True:
+                raw = await websocket.receive_text()
+                try:
+                    message = json.loads(raw)
+                except ValueError:
+                    continue
+                if isinstance(message, dict):
+                    controls.put_nowait(message)
+        except Exception:
+            controls.put_nowait({"action": "disconnect"})
+
+    await websocket.send_json(
+        {
+            "ok": True,
+            "type": "hello",
+            "session": session_id,
+            "started_at": summary.get("started_at"),
+            "ended_at": summary.get("ended_at"),
+            "events": summary.get("events"),
+            "speed": speed,
+            "max_speed": SESSION_RECORDING_REPLAY_MAX_SPEED,
+        }
+    )
+    reader = asyncio.create_task(_read_controls())
+    events = recorder.iter_events(from_ts)
+    position = 0.0
+    upcoming: Optional[Dict[str, Any]] = None
+    paused = False
+    ended = False
+    try:
+        while True:
+            if upcoming is None and not ended:
+                upcoming = await asyncio.to_thread(next, events, None)
+                if upcoming is None:
+                    ended = True
+                    await websocket.send_json({"ok": True, "type": "end", "session": session_id, "ts": position})
+                elif upcoming.get("detail") == "seek":
+                    position = float(upcoming["ts"])
+            timeout: Optional[float] = None
+            if upcoming is not None and not paused:
+                gap = max(0.0, float(upcoming.get("ts") or 0.0) - position)
+                if max_gap_s:
+                    gap = min(gap, max_gap_s)
+                timeout = gap / speed
+            waited_from = time.monotonic()
+            try:
+                message = await asyncio.wait_for(controls.get(), timeout=timeout)
+            except asyncio.TimeoutError:
+                if upcoming is not None:
+                    position = float(upcoming.get("ts") or position)
+                    await websocket.send_json({"ok": True, **upcoming, "session": session_id, "replay": True, "speed": speed})
+                    upcoming = None
+                continue
+            if upcoming is not None and not paused:
+                position = min(float(upcoming.get("ts") or position), position + (time.monotonic() - waited_from) * speed)
+            action = str(message.get("action") or "").strip().lower()
+            if action == "disconnect":
+                return
+            if action == "seek":
+                try:
+                    target = float(message.get("ts"))
+                except (TypeError, ValueError):
+                    continue
+                events = recorder.iter_events(target)
+                upcoming = None
+                ended = False
+            elif action == "speed":
+                speed = _recording_replay_speed(message.get("speed"), speed)
+                await websocket.send_json({"ok": True, "type": "status", "session": session_id, "detail": "speed", "speed": speed, "ts": position})
+            elif action in {"pause", "resume"}:
+                paused = action == "pause"
+                await websocket.send_json({"ok": True, "type": "status", "session": session_id, "detail": action, "speed": speed, "ts": position})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        reader.cancel()
+
 
 @app.get("/codex/sessions")
 def codex_sessions_live():
@@ -17739,20 +23606,39 @@ async def desktop_paste_image(
 
 
 @app.get("/fs/list")
-def fs_list(root: str = "workspace", path: str = ""):
-    return _list_browser_entries(root, path)
+def fs_list(
+    root: str = "workspace",
+    path: str = "",
+    sort: str = "name",
+    order: str = "asc",
+    cursor: str = "",
+    limit: int = 0,
+):
+    return _list_browser_entries(root, path, sort=sort, order=order, cursor=cursor, limit=limit)
 
 
 @app.get("/codex/session/{session}/notes")
-def codex_session_notes_get(session: str):
+@_host_agent_method("endpoint.codex_session_notes_get")
+def codex_session_notes_get(session: str, offset: int = 0, limit: int = 0, cursor: str = ""):
+    """
+    Whole notes by default. With `limit`, `notes.content` is the char range
+    [offset, offset+limit) and `page.next_offset` points at the rest. With
+    `cursor` (the `next_cursor` of an earlier call, or "0"), only the segments
+    appended since then are returned as `entries`.
+    """
     session = _validate_session_name(session)
     with SESSION_NOTES_LOCK:
         _load_session_notes_unlocked()
+        if cursor:
+            return {"ok": True, "session": session, **_session_note_entries_unlocked(session, cursor=cursor, limit=limit)}
+        if limit or offset:
+            return {"ok": True, "session": session, **_session_note_page_unlocked(session, offset=offset, limit=limit)}
         note = _get_session_note_unlocked(session)
     return {"ok": True, "session": session, "notes": note}
 
 
 @app.post("/codex/session/{session}/notes")
+@_host_agent_method("endpoint.codex_session_notes_save")
 def codex_session_notes_save(session: str, payload: Optional[Dict[str, Any]] = Body(default=None)):
     session = _validate_session_name(session)
     payload = payload or {}
@@ -17767,7 +23653,12 @@ def codex_session_notes_save(session: str, payload: Optional[Dict[str, Any]] = B
 
 
 @app.post("/codex/session/{session}/notes/append-latest")
+@_host_agent_method("endpoint.codex_session_notes_append_latest")
 def codex_session_notes_append_latest(session: str):
+    """
+    Returns only the appended segment as `entries`, in the same shape as a
+    `cursor` read, so the cost does not grow with the stored notes.
+    """
     session = _validate_session_name(session)
     pane = _session_pane(session)
     if not pane:
@@ -17778,11 +23669,14 @@ def codex_session_notes_append_latest(session: str):
         raise HTTPException(status_code=409, detail="No recent assistant response available.")
     with SESSION_NOTES_LOCK:
         _load_session_notes_unlocked()
-        note = _append_session_note_snapshot_unlocked(session, compact)
+        entry = _session_note_entry_unlocked(session)
+        cursor = str(entry["next_seq"] - 1) if entry else "0"
+        _append_session_note_snapshot_unlocked(session, compact)
+        appended = _session_note_entries_unlocked(session, cursor=cursor)
     return {
         "ok": True,
         "session": session,
-        "notes": note,
+        **appended,
         "appended_text": compact,
         "detail": "Latest assistant response appended to notes.",
     }
@@ -17874,15 +23768,17 @@ def codex_session_files_telegram(session: str, file_id: str, payload: Optional[D
         item = _find_session_file_unlocked(session, file_id)
         if not item:
             raise HTTPException(status_code=404, detail="Session file not found.")
+        if _share_expired(item):
+            raise HTTPException(status_code=410, detail="Session file has expired.")
         snap = json.loads(json.dumps(item))
-    telegram_result = _telegram_send_shared_item(snap, caption_override=caption)
+    telegram_result = _telegram_enqueue_shared_item(snap, caption_override=caption)
     return {
         "ok": bool(telegram_result.get("ok")),
         "session": session,
         "item": _public_session_file_item(session, snap),
         "telegram": telegram_result,
         "detail": (
-            "Sent to Telegram."
+            "Queued for Telegram."
             if telegram_result.get("ok")
             else (telegram_result.get("detail") or telegram_result.get("error") or "Telegram send failed.")
         ),
@@ -18252,6 +24148,7 @@ def legacy_codex_screen(session: str = ""):
 # -------------------------
 @app.get("/shot")
 def shot():
+    _load_media_stack("mss", required=True)
     with mss() as sct:
         mon = _desktop_monitor()
         img = sct.grab(mon)
@@ -18412,6 +24309,8 @@ def pane_screen(pane_id: str):
 
     return {"ok": False, "error": "capture_failed", "raw": r}
 
+@_host_agent_method("tmux.capture_stream")
+@_instrumented("codrex_tmux_capture_seconds", kind="stream")
 def _stream_capture_pane_text(pane_id: str, max_chars: int) -> Dict[str, Any]:
     """
     Capture the tmux pane as plain text (alternate-screen preferred).
@@ -18573,9 +24472,18 @@ def telegram_status():
         "bot_token_masked": _mask_sensitive(token) if token else "",
         "api_base": TELEGRAM_API_BASE,
         "max_file_mb": max(1, TELEGRAM_MAX_FILE_MB),
+        "send_queue": _telegram_send_queue_snapshot(),
     }
 
 
+@app.get("/telegram/jobs/{job_id}")
+def telegram_job_status(job_id: str):
+    job = _telegram_send_job_status(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Telegram job not found.")
+    return {"ok": True, "job": job}
+
+
 @app.post("/telegram/send-text")
 def telegram_send_text(payload: Optional[Dict[str, Any]] = Body(default=None)):
     payload = payload or {}
@@ -18595,6 +24503,7 @@ def telegram_send_text(payload: Optional[Dict[str, Any]] = Body(default=None)):
 
 
 @app.get("/loop/status")
+@_host_agent_method("endpoint.loop_status")
 def loop_status():
     _ensure_loop_control_worker()
     with LOOP_CONTROL_LOCK:
@@ -18610,11 +24519,15 @@ def loop_status():
             "last_telegram_poll_at": int(worker.get("last_telegram_poll_at") or 0),
             "last_error": str(worker.get("last_error") or ""),
             "last_error_at": int(worker.get("last_error_at") or 0),
+            "last_telegram_error": str(worker.get("last_telegram_error") or ""),
+            "last_telegram_error_at": int(worker.get("last_telegram_error_at") or 0),
         },
+        "checks": _loop_check_jobs_snapshot(),
     }
 
 
 @app.post("/loop/settings")
+@_host_agent_method("endpoint.loop_settings_update")
 def loop_settings_update(payload: Optional[Dict[str, Any]] = Body(default=None)):
     payload = payload or {}
     default_prompt = payload.get("default_prompt")
@@ -18661,11 +24574,14 @@ def loop_settings_update(payload: Optional[Dict[str, Any]] = Body(default=None))
             "last_telegram_poll_at": int(worker.get("last_telegram_poll_at") or 0),
             "last_error": str(worker.get("last_error") or ""),
             "last_error_at": int(worker.get("last_error_at") or 0),
+            "last_telegram_error": str(worker.get("last_telegram_error") or ""),
+            "last_telegram_error_at": int(worker.get("last_telegram_error_at") or 0),
         },
     }
 
 
 @app.post("/loop/session/{session}/mode")
+@_host_agent_method("endpoint.loop_session_mode_update")
 def loop_session_mode_update(session: str, payload: Optional[Dict[str, Any]] = Body(default=None)):
     session = _validate_session_name(session)
     payload = payload or {}
@@ -18713,14 +24629,14 @@ def shares_send_telegram(share_id: str, payload: Optional[Dict[str, Any]] = Body
         if _share_expired(item):
             raise HTTPException(status_code=410, detail="Share has expired.")
         snap = json.loads(json.dumps(item))
-    telegram_result = _telegram_send_shared_item(snap, caption_override=caption)
+    telegram_result = _telegram_enqueue_shared_item(snap, caption_override=caption)
     return {
         "ok": bool(telegram_result.get("ok")),
         "share_id": share_id,
         "shared_file": _public_shared_item(snap),
         "telegram": telegram_result,
         "detail": (
-            "Sent to Telegram."
+            "Queued for Telegram."
             if telegram_result.get("ok")
             else (telegram_result.get("detail") or telegram_result.get("error") or "Telegram send failed.")
         ),
@@ -18939,39 +24855,385 @@ async def wsl_upload(file: UploadFile = File(...), dest: str = Form("")):
 # -------------------------
 # codex exec endpoints
 # -------------------------
-def _count_running_runs() -> int:
-    with RUNS_LOCK:
-        return sum(1 for rr in RUNS.values() if rr.get("status") == "running")
-
-def _store_run(run_id: str, run: Dict[str, Any]) -> None:
-    with RUNS_LOCK:
-        RUNS[run_id] = run
-        RUNS_ORDER.insert(0, run_id)
-        while len(RUNS_ORDER) > MAX_RUNS_KEEP:
-            old = RUNS_ORDER.pop()
-            RUNS.pop(old, None)
-
-def _run_codex_exec_in_thread(run_id: str, prompt: str):
-    start = time.time()
-    cmd = f"codex exec --cd {CODEX_WORKDIR} " + _bash_quote(prompt)
-    r = run_wsl_bash(cmd, timeout_s=900)
-
-    duration = round(time.time() - start, 1)
-    output_parts = []
-    if r.get("stdout"):
-        output_parts.append(r["stdout"])
-    if r.get("stderr"):
-        output_parts.append("\n[stderr]\n" + r["stderr"])
-    output = "\n".join(output_parts).strip()
-
-    with RUNS_LOCK:
-        rr = RUNS.get(run_id, {})
-        rr["status"] = "done" if r.get("exit_code") == 0 else "error"
-        rr["exit_code"] = r.get("exit_code")
-        rr["duration_s"] = duration
-        rr["output"] = output
-        rr["finished_at"] = time.time()
-        RUNS[run_id] = rr
+CODEX_RUN_STATUSES_ACTIVE = {"queued", "running"}
+
+
+def _codex_exec_argv(command: str) -> List[str]:
+    return [_wsl_executable(), "-d", WSL_DISTRO, "--", "bash", "-lc", command]
+
+
+def _codex_exec_command(prompt: str) -> str:
+    return f"codex exec --cd {CODEX_WORKDIR} " + _bash_quote(prompt)
+
+
+def _utf8_complete_length(data: bytes) -> int:
+    """Length of the longest prefix of data that does not end mid-character."""
+    end = len(data)
+    for back in range(1, min(4, end) + 1):
+        byte = data[end - back]
+        if byte & 0xC0 == 0x80:
+            continue
+        if byte & 0x80 == 0:
+            return end
+        need = 2 if byte & 0xE0 == 0xC0 else 3 if byte & 0xF0 == 0xE0 else 4
+        return end if back >= need else end - back
+    return end
+
+
+class _CodexRunManager:
+    """
+    Owns `codex exec` runs. At most max_concurrent run at once; the rest wait
+    in a FIFO queue. Each run's merged stdout/stderr is appended to
+    <runs_dir>/<id>.log as it arrives, so clients can follow it by byte offset,
+    and its metadata sits next to it in <id>.json. After a restart, runs that
+    were mid-flight come back as interrupted errors and queued runs queue again.
+    """
+
+    def __init__(
+        self,
+        runs_dir: str,
+        *,
+        max_concurrent: int = MAX_CONCURRENT_RUNS,
+        max_keep: int = MAX_RUNS_KEEP,
+        timeout_s: float = CODEX_RUN_TIMEOUT_S,
+        argv_builder: Optional[Callable[[str], List[str]]] = None,
+    ) -> None:
+        self.runs_dir = os.path.abspath(runs_dir)
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.max_keep = max(1, int(max_keep))
+        self.timeout_s = max(0.1, float(timeout_s))
+        self.argv_builder = argv_builder or _codex_exec_argv
+        self._kill_argv_builder = argv_builder
+        self._lock = threading.Lock()
+        self._runs: Dict[str, Dict[str, Any]] = {}
+        self._order: List[str] = []
+        self._queue: List[str] = []
+        self._procs: Dict[str, subprocess.Popen] = {}
+        self._recover()
+
+    def _meta_path(self, run_id: str) -> str:
+        return os.path.join(self.runs_dir, f"{run_id}.json")
+
+    def log_path(self, run_id: str) -> str:
+        return os.path.join(self.runs_dir, f"{run_id}.log")
+
+    def _persist_unlocked(self, run: Dict[str, Any]) -> None:
+        try:
+            _write_json_file(self._meta_path(run["id"]), {k: v for k, v in run.items() if not k.startswith("_")})
+        except Exception:
+            pass
+
+    def pgid_path(self, run_id: str) -> str:
+        return posixpath.join(CODEX_RUN_PGID_DIR, f"codrex-run-{run_id}.pgid")
+
+    def _kill(self, run_id: str, proc: Optional[subprocess.Popen]) -> None:
+        _wsl_kill_process_group(self.pgid_path(run_id), argv_builder=self._kill_argv_builder)
+        if proc is not None:
+            _kill_process_tree(proc)
+
+    def _reap(self, run_ids: List[str]) -> None:
+        for run_id in run_ids:
+            self._kill(run_id, None)
+
+    def _delete_files(self, run_id: str) -> None:
+        for path in (self._meta_path(run_id), self.log_path(run_id)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _recover(self) -> None:
+        os.makedirs(self.runs_dir, exist_ok=True)
+        runs: List[Dict[str, Any]] = []
+        for name in os.listdir(self.runs_dir):
+            if not name.endswith(".json"):
+                continue
+            run = _read_json_file(os.path.join(self.runs_dir, name))
+            run_id = str(run.get("id") or "")
+            if not run_id or name != f"{run_id}.json" or not VALID_NAME_RE.match(run_id):
+                continue
+            runs.append(run)
+        runs.sort(key=lambda item: float(item.get("created_at") or 0), reverse=True)
+        for stale in runs[self.max_keep:]:
+            self._delete_files(stale["id"])
+        now = time.time()
+        interrupted: List[str] = []
+        with self._lock:
+            for run in runs[: self.max_keep]:
+                try:
+                    run["log_bytes"] = os.path.getsize(self.log_path(run["id"]))
+                except OSError:
+                    run["log_bytes"] = 0
+                if run.get("status") == "running":
+                    run["status"] = "error"
+                    run["interrupted"] = True
+                    run["detail"] = "Controller restarted while the run was in progress."
+                    run["finished_at"] = now
+                    self._persist_unlocked(run)
+                    interrupted.append(run["id"])
+                self._runs[run["id"]] = run
+                self._order.append(run["id"])
+            queued = [run for run in self._runs.values() if run.get("status") == "queued"]
+            queued.sort(key=lambda item: float(item.get("created_at") or 0))
+            self._queue = [run["id"] for run in queued]
+            self._pump_unlocked()
+        if interrupted:
+            # Their `codex exec` may have outlived the controller inside WSL.
+            threading.Thread(target=self._reap, args=(interrupted,), name="codrex-codex-run-reap", daemon=True).start()
+
+    def submit(self, prompt: str) -> Dict[str, Any]:
+        run_id = uuid.uuid4().hex[:10]
+        run: Dict[str, Any] = {
+            "id": run_id,
+            "status": "queued",
+            "prompt": prompt,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "exit_code": None,
+            "duration_s": None,
+            "log_bytes": 0,
+            "detail": "",
+        }
+        with self._lock:
+            self._runs[run_id] = run
+            self._order.insert(0, run_id)
+            self._queue.append(run_id)
+            self._persist_unlocked(run)
+            self._trim_unlocked()
+            self._pump_unlocked()
+            return self._public_unlocked(run)
+
+    def _trim_unlocked(self) -> None:
+        while len(self._order) > self.max_keep:
+            victim = next(
+                (rid for rid in reversed(self._order) if self._runs[rid].get("status") not in CODEX_RUN_STATUSES_ACTIVE),
+                None,
+            )
+            if victim is None:
+                return
+            self._order.remove(victim)
+            self._runs.pop(victim, None)
+            self._delete_files(victim)
+
+    def _pump_unlocked(self) -> None:
+        running = sum(1 for run in self._runs.values() if run.get("status") == "running")
+        while self._queue and running < self.max_concurrent:
+            run = self._runs.get(self._queue.pop(0))
+            if run is None or run.get("status") != "queued":
+                continue
+            run["status"] = "running"
+            run["started_at"] = time.time()
+            self._persist_unlocked(run)
+            threading.Thread(
+                target=self._execute,
+                args=(run["id"],),
+                name=f"codrex-codex-run-{run['id']}",
+                daemon=True,
+            ).start()
+            running += 1
+
+    def _execute(self, run_id: str) -> None:
+        with self._lock:
+            run = self._runs[run_id]
+            prompt = str(run.get("prompt") or "")
+        kwargs = _wsl_run_kwargs()
+        kwargs.pop("stdin", None)
+        if os.name != "nt":
+            kwargs["start_new_session"] = True
+        exit_code: Optional[int] = None
+        detail = ""
+        try:
+            with open(self.log_path(run_id), "ab") as log:
+                proc = subprocess.Popen(
+                    self.argv_builder(_wsl_group_command(_codex_exec_command(prompt), self.pgid_path(run_id))),
+                    stdin=subprocess.DEVNULL,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,
+                    **kwargs,
+                )
+                with self._lock:
+                    self._procs[run_id] = proc
+                    cancel_requested = bool(run.get("_cancel_requested"))
+                if cancel_requested:
+                    self._kill(run_id, proc)
+                timer = threading.Timer(self.timeout_s, self._expire, args=(run_id,))
+                timer.daemon = True
+                timer.start()
+                try:
+                    stream = proc.stdout
+                    while stream is not None:
+                        chunk = stream.read1(65536)
+                        if not chunk:
+                            break
+                        log.write(chunk)
+                        log.flush()
+                        with self._lock:
+                            run["log_bytes"] = int(run.get("log_bytes") or 0) + len(chunk)
+                    exit_code = proc.wait()
+                finally:
+                    timer.cancel()
+                    try:
+                        if proc.stdout is not None:
+                            proc.stdout.close()
+                    except Exception:
+                        pass
+        except Exception as e:
+            exit_code = 125
+            detail = f"exception: {type(e).__name__}: {e}"
+        with self._lock:
+            self._procs.pop(run_id, None)
+            finished = time.time()
+            run["finished_at"] = finished
+            run["duration_s"] = round(finished - float(run.get("started_at") or finished), 1)
+            if run.pop("_cancel_requested", False):
+                run["status"] = "cancelled"
+                run["exit_code"] = exit_code
+                run["detail"] = "Cancelled."
+            elif run.pop("_timed_out", False):
+                run["status"] = "error"
+                run["exit_code"] = 124
+                run["detail"] = f"timeout after {self.timeout_s:g}s"
+            else:
+                run["status"] = "done" if exit_code == 0 else "error"
+                run["exit_code"] = exit_code
+                run["detail"] = detail
+            self._persist_unlocked(run)
+            self._pump_unlocked()
+
+    def _expire(self, run_id: str) -> None:
+        with self._lock:
+            run = self._runs.get(run_id)
+            proc = self._procs.get(run_id)
+            if run is None or proc is None or run.get("_cancel_requested"):
+                return
+            run["_timed_out"] = True
+        self._kill(run_id, proc)
+
+    def cancel(self, run_id: str) -> Optional[Dict[str, Any]]:
+        proc: Optional[subprocess.Popen] = None
+        with self._lock:
+            run = self._runs.get(run_id)
+            if run is None:
+                return None
+            if run.get("status") == "queued":
+                if run_id in self._queue:
+                    self._queue.remove(run_id)
+                run["status"] = "cancelled"
+                run["finished_at"] = time.time()
+                run["detail"] = "Cancelled before it started."
+                self._persist_unlocked(run)
+            elif run.get("status") == "running" and not run.get("_timed_out"):
+                run["_cancel_requested"] = True
+                proc = self._procs.get(run_id)
+            public = self._public_unlocked(run)
+        if proc is not None:
+            self._kill(run_id, proc)
+        return public
+
+    def _public_unlocked(self, run: Dict[str, Any]) -> Dict[str, Any]:
+        out = {k: v for k, v in run.items() if not k.startswith("_")}
+        out["queue_position"] = (self._queue.index(run["id"]) + 1) if run["id"] in self._queue else None
+        return out
+
+    def get(self, run_id: str, *, output_max_bytes: int = 0) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            run = self._runs.get(run_id)
+            if run is None:
+                return None
+            out = self._public_unlocked(run)
+        if output_max_bytes > 0:
+            start = max(0, int(out.get("log_bytes") or 0) - output_max_bytes)
+            data, _next_offset = self.read_log(run_id, start, output_max_bytes)
+            out["output"] = data.decode("utf-8", errors="replace").strip()
+        return out
+
+    def read_log(self, run_id: str, offset: int, max_bytes: int = 65536) -> Tuple[bytes, int]:
+        """Read up to max_bytes of the run log from offset, never ending mid-character while the run is live."""
+        with self._lock:
+            run = self._runs.get(run_id)
+            available = int(run.get("log_bytes") or 0) if run else 0
+            live = bool(run) and run.get("status") in CODEX_RUN_STATUSES_ACTIVE
+        offset = max(0, min(int(offset), available))
+        if offset >= available:
+            return b"", offset
+        try:
+            with open(self.log_path(run_id), "rb") as fh:
+                fh.seek(offset)
+                data = fh.read(min(max(1, int(max_bytes)), available - offset))
+        except OSError:
+            return b"", offset
+        if live or len(data) == max_bytes:
+            data = data[: _utf8_complete_length(data)]
+        return data, offset + len(data)
+
+    def list(self, limit: int = 20) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [self._public_unlocked(self._runs[rid]) for rid in self._order[: max(0, int(limit))]]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "running": sum(1 for run in self._runs.values() if run.get("status") == "running"),
+                "queued": len(self._queue),
+                "max_concurrent": self.max_concurrent,
+                "kept": len(self._order),
+            }
+
+
+def _codex_run_manager() -> _CodexRunManager:
+    global CODEX_RUN_MANAGER
+    with CODEX_RUN_MANAGER_LOCK:
+        if CODEX_RUN_MANAGER is None:
+            if not _owns_host_singletons():
+                # Recovery and trimming assume one owner of CODEX_RUNS_DIR.
+                raise RuntimeError("Codex runs are owned by the host agent.")
+            CODEX_RUN_MANAGER = _CodexRunManager(CODEX_RUNS_DIR)
+        return CODEX_RUN_MANAGER
+
+
+@_host_agent_method("runs.submit")
+def _codex_run_submit(prompt: str) -> Dict[str, Any]:
+    return _codex_run_manager().submit(prompt)
+
+
+@_host_agent_method("runs.get")
+def _codex_run_get(run_id: str, output_max_bytes: int = 0) -> Optional[Dict[str, Any]]:
+    return _codex_run_manager().get(run_id, output_max_bytes=output_max_bytes)
+
+
+@_host_agent_method("runs.cancel")
+def _codex_run_cancel(run_id: str) -> Optional[Dict[str, Any]]:
+    return _codex_run_manager().cancel(run_id)
+
+
+@_host_agent_method("runs.list")
+def _codex_run_list(limit: int = 20) -> Dict[str, Any]:
+    manager = _codex_run_manager()
+    return {"runs": manager.list(limit), **manager.stats()}
+
+
+@_host_agent_method("runs.stats")
+def _codex_run_stats() -> Dict[str, Any]:
+    manager = CODEX_RUN_MANAGER
+    return manager.stats() if manager is not None else {}
+
+
+@_host_agent_method("runs.read_log")
+def _codex_run_read_log(run_id: str, offset: int, max_bytes: int) -> Tuple[str, int]:
+    data, next_offset = _codex_run_manager().read_log(run_id, offset, max_bytes)
+    return data.decode("utf-8", errors="replace"), next_offset
+
+
+def _codex_run_summary(run: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": run.get("id"),
+        "status": run.get("status"),
+        "duration_s": run.get("duration_s"),
+        "prompt": run.get("prompt", ""),
+        "queue_position": run.get("queue_position"),
+    }
+
 
 @app.post("/codex/exec")
 def codex_exec(payload: Dict[str, Any] = Body(...)):
@@ -18981,47 +25243,939 @@ def codex_exec(payload: Dict[str, Any] = Body(...)):
     if len(prompt) > 20000:
         raise HTTPException(status_code=400, detail="Prompt too long (max 20000 chars).")
 
-    if _count_running_runs() >= MAX_CONCURRENT_RUNS:
-        return {"ok": False, "error": "too_many_running", "detail": f"Max concurrent runs is {MAX_CONCURRENT_RUNS}."}
-
-    run_id = uuid.uuid4().hex[:10]
-    run = {
-        "id": run_id,
-        "status": "running",
-        "prompt": prompt,
-        "created_at": time.time(),
-        "output": "",
-        "exit_code": None,
-        "duration_s": None,
-    }
-    _store_run(run_id, run)
-
-    t = threading.Thread(target=_run_codex_exec_in_thread, args=(run_id, prompt), daemon=True)
-    t.start()
-
-    return {"ok": True, "id": run_id}
+    run = _codex_run_submit(prompt)
+    _event_hub_poke("runs")
+    return {"ok": True, "id": run["id"], "status": run["status"], "queue_position": run["queue_position"]}
 
 @app.get("/codex/run/{run_id}")
 def codex_run(run_id: str):
-    with RUNS_LOCK:
-        rr = RUNS.get(run_id)
-        if not rr:
-            return {"ok": False, "error": "not_found"}
-        return {"ok": True, **rr}
+    rr = _codex_run_get(run_id, CODEX_RUN_OUTPUT_MAX_BYTES)
+    if not rr:
+        return {"ok": False, "error": "not_found"}
+    return {"ok": True, **rr}
+
+@app.post("/codex/run/{run_id}/cancel")
+def codex_run_cancel(run_id: str):
+    rr = _codex_run_cancel(run_id)
+    _event_hub_poke("runs")
+    if not rr:
+        return {"ok": False, "error": "not_found"}
+    return {"ok": True, **rr}
+
+@app.get("/codex/run/{run_id}/stream")
+async def codex_run_stream(request: Request, run_id: str, offset: int = 0):
+    """
+    SSE stream of a codex exec run's output log.
+
+    `output` events carry the text between byte `offset` and `next_offset`; a
+    client that drops can reconnect with `?offset=<next_offset>` and resume where
+    it left off. `status` events report queue/run transitions and `end` closes
+    the stream once the run has finished and the log is drained.
+    """
+    if await asyncio.to_thread(_codex_run_get, run_id) is None:
+        return {"ok": False, "error": "not_found"}
+    try:
+        offset = max(0, int(offset or 0))
+    except Exception:
+        offset = 0
+
+    async def _gen():
+        position = offset
+        last_state: Optional[Tuple[Any, Any]] = None
+        last_send = time.time()
+        while True:
+            if await request.is_disconnected():
+                break
+            run = await asyncio.to_thread(_codex_run_get, run_id)
+            if run is None:
+                yield _sse_event_bytes("error", {"ok": False, "error": "not_found", "id": run_id})
+                break
+            state = (run.get("status"), run.get("queue_position"))
+            if state != last_state:
+                last_state = state
+                last_send = time.time()
+                yield _sse_event_bytes("status", {"ok": True, **run})
+            text, next_offset = await asyncio.to_thread(_codex_run_read_log, run_id, position, CODEX_RUN_STREAM_CHUNK_BYTES)
+            if next_offset > position:
+                last_send = time.time()
+                yield _sse_event_bytes(
+                    "output",
+                    {
+                        "ok": True,
+                        "id": run_id,
+                        "offset": position,
+                        "next_offset": next_offset,
+                        "text": text,
+                    },
+                )
+                position = next_offset
+                continue
+            if run.get("status") not in CODEX_RUN_STATUSES_ACTIVE and position >= int(run.get("log_bytes") or 0):
+                yield _sse_event_bytes("end", {"ok": True, **run, "next_offset": position})
+                break
+            if time.time() - last_send > 10:
+                yield _sse_event_bytes("ping", {"ok": True, "id": run_id, "ts": time.time()})
+                last_send = time.time()
+            await asyncio.sleep(CODEX_RUN_STREAM_POLL_S)
+
+    headers = {
+        "Cache-Control": "no-cache",
+        "Connection": "keep-alive",
+        "X-Accel-Buffering": "no",
+    }
+    return StreamingResponse(_gen(), media_type="text/event-stream", headers=headers)
 
 @app.get("/codex/runs")
 def codex_runs():
-    with RUNS_LOCK:
-        items = []
-        for rid in RUNS_ORDER[:20]:
-            rr = RUNS.get(rid, {})
-            items.append({
-                "id": rr.get("id"),
-                "status": rr.get("status"),
-                "duration_s": rr.get("duration_s"),
-                "prompt": rr.get("prompt", ""),
-            })
-        return {"ok": True, "runs": items}
+    listed = _codex_run_list(20)
+    return {"ok": True, **listed, "runs": [_codex_run_summary(rr) for rr in listed["runs"]]}
+
+
+# -------------------------
+# Server-push state channel
+# -------------------------
+def _event_fingerprint(value: Any) -> str:
+    def _strip(item: Any) -> Any:
+        if isinstance(item, dict):
+            return {k: _strip(v) for k, v in item.items() if k not in EVENT_VOLATILE_KEYS}
+        if isinstance(item, (list, tuple)):
+            return [_strip(v) for v in item]
+        return item
+
+    encoded = json.dumps(_strip(value), sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def _event_delta(previous: Any, current: Any) -> Optional[Dict[str, Any]]:
+    """Top-level key delta between two dict payloads, or None when only a full snapshot fits."""
+    if not isinstance(previous, dict) or not isinstance(current, dict):
+        return None
+    changed = {
+        key: value
+        for key, value in current.items()
+        if key not in previous or _event_fingerprint(previous[key]) != _event_fingerprint(value)
+    }
+    removed = [key for key in previous if key not in current]
+    return {"set": changed, "unset": removed}
+
+
+class _EventSubscription:
+    def __init__(self, topics: List[str], notify: Callable[[], None]) -> None:
+        self.topics = list(dict.fromkeys(topics))
+        self.notify = notify
+        self.sent: Dict[str, int] = {}
+
+
+class _EventHub:
+    """
+    Fans out controller state to `/events` subscribers. Each topic
+    ("sessions", "screen:<session>", "runs", ...) has exactly one producer
+    thread while anyone subscribes to it, however many clients that is. The
+    producer polls on its interval and bumps the topic version only when the
+    payload changed (ignoring EVENT_VOLATILE_KEYS); the snapshot and delta for
+    a version are encoded once and shared by every subscriber. A subscriber
+    that fell more than one version behind gets a fresh snapshot instead.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._families: Dict[str, Dict[str, Any]] = {}
+        self._topics: Dict[str, Dict[str, Any]] = {}
+
+    def register(
+        self,
+        family: str,
+        factory: Callable[[str], Callable[[], Any]],
+        *,
+        interval_s: float,
+        arg_pattern: Optional["re.Pattern[str]"] = None,
+    ) -> None:
+        with self._lock:
+            self._families[family] = {
+                "factory": factory,
+                "interval_s": max(0.01, float(interval_s)),
+                "arg_pattern": arg_pattern,
+            }
+
+    def validate(self, topic: str) -> str:
+        family, sep, arg = str(topic or "").strip().partition(":")
+        with self._lock:
+            spec = self._families.get(family)
+        if spec is None:
+            raise ValueError(f"Unknown topic '{family}'.")
+        pattern = spec["arg_pattern"]
+        if pattern is None:
+            if sep:
+                raise ValueError(f"Topic '{family}' takes no argument.")
+            return family
+        if not pattern.fullmatch(arg):
+            raise ValueError(f"Topic '{family}' needs a valid argument.")
+        return f"{family}:{arg}"
+
+    def subscribe(self, topics: List[str], notify: Callable[[], None]) -> _EventSubscription:
+        sub = _EventSubscription([self.validate(topic) for topic in topics], notify)
+        with self._lock:
+            for topic in sub.topics:
+                state = self._topics.get(topic)
+                if state is None:
+                    family, _, arg = topic.partition(":")
+                    spec = self._families[family]
+                    state = {
+                        "fn": spec["factory"](arg),
+                        "interval_s": spec["interval_s"],
+                        "version": 0,
+                        "value": None,
+                        "fingerprint": None,
+                        "delta": None,
+                        "encoded": {},
+                        "subscribers": set(),
+                        "thread": None,
+                        "wake": threading.Event(),
+                        "runs": 0,
+                        "changes": 0,
+                        "encodes": 0,
+                        "last_error": "",
+                    }
+                    self._topics[topic] = state
+                state["subscribers"].add(sub)
+                if state["thread"] is None:
+                    state["thread"] = threading.Thread(
+                        target=self._produce,
+                        args=(topic, state),
+                        name=f"codrex-events-{topic}",
+                        daemon=True,
+                    )
+                    state["thread"].start()
+        return sub
+
+    def unsubscribe(self, sub: _EventSubscription) -> None:
+        with self._lock:
+            for topic in sub.topics:
+                state = self._topics.get(topic)
+                if state is not None:
+                    state["subscribers"].discard(sub)
+                    if not state["subscribers"]:
+                        state["wake"].set()
+
+    def poke(self, topic: str) -> None:
+        """Ask a topic's producer to look again now instead of at its next interval."""
+        with self._lock:
+            state = self._topics.get(topic)
+            if state is not None:
+                state["wake"].set()
+
+    def _produce(self, topic: str, state: Dict[str, Any]) -> None:
+        while True:
+            with self._lock:
+                if not state["subscribers"]:
+                    state["thread"] = None
+                    if self._topics.get(topic) is state:
+                        self._topics.pop(topic, None)
+                    return
+            error = ""
+            value: Any = None
+            try:
+                value = state["fn"]()
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            notify: List[_EventSubscription] = []
+            with self._lock:
+                state["runs"] += 1
+                state["last_error"] = error
+                if not error:
+                    fingerprint = _event_fingerprint(value)
+                    if fingerprint != state["fingerprint"]:
+                        state["delta"] = _event_delta(state["value"], value) if state["version"] else None
+                        state["value"] = value
+                        state["fingerprint"] = fingerprint
+                        state["version"] += 1
+                        state["changes"] += 1
+                        state["encoded"] = {}
+                        notify = list(state["subscribers"])
+            for sub in notify:
+                try:
+                    sub.notify()
+                except Exception:
+                    pass
+            state["wake"].wait(state["interval_s"])
+            state["wake"].clear()
+
+    def _encoded_unlocked(self, topic: str, state: Dict[str, Any], kind: str) -> bytes:
+        cached = state["encoded"].get(kind)
+        if cached is None:
+            payload: Dict[str, Any] = {"topic": topic, "version": state["version"]}
+            if kind == "delta":
+                payload["base_version"] = state["version"] - 1
+                payload.update(state["delta"])
+            else:
+                payload["data"] = state["value"]
+            cached = _sse_event_bytes(kind, payload)
+            state["encoded"][kind] = cached
+            state["encodes"] += 1
+        return cached
+
+    def pending(self, sub: _EventSubscription) -> List[bytes]:
+        out: List[bytes] = []
+        with self._lock:
+            for topic in sub.topics:
+                state = self._topics.get(topic)
+                if state is None or not state["version"]:
+                    continue
+                sent = sub.sent.get(topic, 0)
+                if sent == state["version"]:
+                    continue
+                kind = "delta" if sent and sent == state["version"] - 1 and state["delta"] is not None else "snapshot"
+                out.append(self._encoded_unlocked(topic, state, kind))
+                sub.sent[topic] = state["version"]
+        return out
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                topic: {
+                    "version": state["version"],
+                    "subscribers": len(state["subscribers"]),
+                    "runs": state["runs"],
+                    "changes": state["changes"],
+                    "encodes": state["encodes"],
+                    "last_error": state["last_error"],
+                }
+                for topic, state in self._topics.items()
+            }
+
+
+def _events_windows_producer(fn: Callable[[], Any]) -> Callable[[str], Callable[[], Any]]:
+    def _factory(_arg: str) -> Callable[[], Any]:
+        def _produce() -> Any:
+            _ensure_windows_host()
+            return fn()
+        return _produce
+    return _factory
+
+
+def _event_hub() -> _EventHub:
+    global EVENT_HUB
+    with EVENT_HUB_LOCK:
+        if EVENT_HUB is None:
+            hub = _EventHub()
+            hub.register("sessions", lambda _arg: codex_sessions_live, interval_s=EVENT_SESSIONS_INTERVAL_S)
+            hub.register(
+                "screen",
+                lambda session: (lambda: codex_session_screen(session)),
+                interval_s=EVENT_SCREEN_INTERVAL_S,
+                arg_pattern=VALID_NAME_RE,
+            )
+            hub.register("runs", lambda _arg: codex_runs, interval_s=EVENT_RUNS_INTERVAL_S)
+            hub.register(
+                "desktop_targets",
+                _events_windows_producer(_desktop_targets_payload),
+                interval_s=EVENT_DESKTOP_TARGETS_INTERVAL_S,
+            )
+            hub.register("power", _events_windows_producer(_power_status_payload), interval_s=EVENT_POWER_INTERVAL_S)
+            hub.register("runtime", lambda _arg: codex_runtime_status, interval_s=EVENT_RUNTIME_INTERVAL_S)
+            EVENT_HUB = hub
+        return EVENT_HUB
+
+
+def _event_hub_poke(topic: str, *, relay: bool = True) -> None:
+    with EVENT_HUB_LOCK:
+        hub = EVENT_HUB
+    if hub is not None:
+        hub.poke(topic)
+    if relay:
+        # Other controller processes have their own hubs.
+        _host_agent_publish("hub.poke", topic)
+
+
+@app.get("/events")
+async def events_stream(request: Request, topics: str = "sessions"):
+    """
+    SSE channel for controller state. `topics` is a comma-separated list of
+    sessions, screen:<session>, runs, desktop_targets, power and runtime.
+
+    Each topic first arrives as a `snapshot` event ({topic, version, data});
+    later changes arrive as `delta` events ({topic, version, base_version,
+    set, unset}) that replace/remove top-level keys. A client that sees a
+    version gap should reconnect for fresh snapshots.
+    """
+    hub = _event_hub()
+    requested = [item.strip() for item in str(topics or "").split(",") if item.strip()]
+    if not requested:
+        raise HTTPException(status_code=400, detail="No topics requested.")
+    if len(requested) > EVENT_MAX_TOPICS:
+        raise HTTPException(status_code=400, detail=f"Too many topics (max {EVENT_MAX_TOPICS}).")
+    try:
+        requested = [hub.validate(item) for item in requested]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def _gen():
+        loop = asyncio.get_running_loop()
+        wakeup = asyncio.Event()
+
+        def _notify() -> None:
+            try:
+                loop.call_soon_threadsafe(wakeup.set)
+            except RuntimeError:
+                pass
+
+        sub = hub.subscribe(requested, _notify)
+        try:
+            yield _sse_event_bytes("hello", {"ok": True, "topics": sub.topics})
+            last_send = time.time()
+            while True:
+                if await request.is_disconnected():
+                    break
+                wakeup.clear()
+                chunks = hub.pending(sub)
+                for chunk in chunks:
+                    yield chunk
+                if chunks:
+                    last_send = time.time()
+                elif time.time() - last_send > 10:
+                    yield _sse_event_bytes("ping", {"ok": True, "ts": time.time()})
+                    last_send = time.time()
+                try:
+                    await asyncio.wait_for(wakeup.wait(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            hub.unsubscribe(sub)
+
+    headers = {
+        "Cache-Control": "no-cache",
+        "Connection": "keep-alive",
+        "X-Accel-Buffering": "no",
+    }
+    return StreamingResponse(_gen(), media_type="text/event-stream", headers=headers)
+
+# -------------------------
+# Host agent (multi-process mode)
+# -------------------------
+def _host_agent_encode(message: Dict[str, Any]) -> bytes:
+    return (json.dumps(message, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def _host_agent_socket(address: str) -> Tuple[socket.socket, Any]:
+    kind, _, target = str(address or "").partition(":")
+    if kind == "unix" and target and hasattr(socket, "AF_UNIX"):
+        return socket.socket(socket.AF_UNIX, socket.SOCK_STREAM), target
+    if kind == "tcp" and target:
+        host, _, port = target.rpartition(":")
+        return socket.socket(socket.AF_INET, socket.SOCK_STREAM), (host or "127.0.0.1", int(port))
+    raise ValueError(f"Unsupported host agent address: {address!r}")
+
+
+def _host_agent_token() -> str:
+    token = str(os.environ.get("CODEX_HOST_AGENT_TOKEN") or "").strip()
+    if token:
+        return token
+    try:
+        with open(HOST_AGENT_TOKEN_FILE, "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+class _HostAgentServer:
+    """
+    The host agent's end of the worker socket. The wire format is one JSON
+    object per line: a `hello` with the shared token, then `call` (run a
+    HOST_AGENT_METHODS entry and answer with a `result` of the same id),
+    `subscribe` (topics) and `publish` (relay to every other connection
+    subscribed to the topic as an `event`). Calls run on their own threads so
+    a slow capture does not hold up the rest of that worker's calls.
+    """
+
+    def __init__(self, address: str, token: str, methods: Optional[Dict[str, Callable[..., Any]]] = None) -> None:
+        self.address = address
+        self.token = str(token or "")
+        self.methods = HOST_AGENT_METHODS if methods is None else methods
+        self._lock = threading.Lock()
+        self._conns: List[Dict[str, Any]] = []
+        self._listener: Optional[socket.socket] = None
+        self._closed = threading.Event()
+
+    def start(self) -> "_HostAgentServer":
+        listener, target = _host_agent_socket(self.address)
+        try:
+            if isinstance(target, str):
+                parent = os.path.dirname(target)
+                if parent:
+                    os.makedirs(parent, exist_ok=True)
+                if os.path.exists(target):
+                    # Left behind by an agent that did not shut down cleanly.
+                    os.remove(target)
+                listener.bind(target)
+                os.chmod(target, 0o600)
+            else:
+                listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                listener.bind(target)
+                host, port = listener.getsockname()[:2]
+                self.address = f"tcp:{host}:{port}"
+            listener.listen(64)
+            listener.settimeout(0.5)
+        except BaseException:
+            listener.close()
+            raise
+        self._listener = listener
+        threading.Thread(target=self._accept_loop, name="codrex-host-agent", daemon=True).start()
+        return self
+
+    def close(self) -> None:
+        self._closed.set()
+        listener = self._listener
+        self._listener = None
+        if listener is not None:
+            listener.close()
+        with self._lock:
+            conns = list(self._conns)
+            self._conns.clear()
+        for conn in conns:
+            self._drop(conn)
+        kind, _, target = self.address.partition(":")
+        if kind == "unix":
+            try:
+                os.remove(target)
+            except OSError:
+                pass
+
+    def _accept_loop(self) -> None:
+        while not self._closed.is_set():
+            listener = self._listener
+            if listener is None:
+                return
+            try:
+                sock, _addr = listener.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                if self._closed.is_set():
+                    return
+                time.sleep(0.1)
+                continue
+            sock.settimeout(None)
+            threading.Thread(target=self._serve, args=(sock,), name="codrex-host-agent-conn", daemon=True).start()
+
+    def _send(self, conn: Dict[str, Any], data: bytes) -> bool:
+        try:
+            with conn["send_lock"]:
+                conn["sock"].sendall(data)
+            return True
+        except OSError:
+            self._drop(conn)
+            return False
+
+    def _drop(self, conn: Dict[str, Any]) -> None:
+        with self._lock:
+            if conn in self._conns:
+                self._conns.remove(conn)
+        try:
+            conn["sock"].close()
+        except OSError:
+            pass
+
+    def _serve(self, sock: socket.socket) -> None:
+        conn: Dict[str, Any] = {"sock": sock, "send_lock": threading.Lock(), "topics": set()}
+        reader = sock.makefile("rb")
+        try:
+            try:
+                hello = json.loads(reader.readline() or b"null")
+            except ValueError:
+                hello = None
+            token = str(hello.get("token") or "") if isinstance(hello, dict) and hello.get("op") == "hello" else ""
+            if not self.token or not secrets.compare_digest(token, self.token):
+                self._send(conn, _host_agent_encode({"op": "hello", "ok": False, "detail": "Bad host agent token."}))
+                return
+            with self._lock:
+                self._conns.append(conn)
+            self._send(conn, _host_agent_encode({"op": "hello", "ok": True, "pid": os.getpid()}))
+            for line in reader:
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    continue
+                if not isinstance(message, dict):
+                    continue
+                op = message.get("op")
+                if op == "call":
+                    threading.Thread(target=self._call, args=(conn, message), name="codrex-host-agent-call", daemon=True).start()
+                elif op == "subscribe":
+                    with self._lock:
+                        conn["topics"].update(str(topic) for topic in message.get("topics") or [])
+                elif op == "publish":
+                    self.publish(str(message.get("topic") or ""), message.get("data"), exclude=conn)
+        except OSError:
+            pass
+        finally:
+            reader.close()
+            self._drop(conn)
+
+    def _call(self, conn: Dict[str, Any], message: Dict[str, Any]) -> None:
+        method = str(message.get("method") or "")
+        reply: Dict[str, Any] = {"op": "result", "id": message.get("id")}
+        try:
+            fn = self.methods.get(method)
+            if fn is None:
+                raise LookupError(f"Unknown host agent method: {method}")
+            with METRICS.time("codrex_host_agent_call_seconds", method=method):
+                result = fn(*(message.get("args") or []), **(message.get("kwargs") or {}))
+            reply.update(ok=True, result=result)
+        except HTTPException as exc:
+            reply.update(ok=False, status=exc.status_code, detail=exc.detail)
+        except Exception as exc:
+            reply.update(ok=False, status=None, detail=f"{type(exc).__name__}: {exc}")
+        try:
+            data = _host_agent_encode(reply)
+        except (TypeError, ValueError) as exc:
+            data = _host_agent_encode({"op": "result", "id": reply["id"], "ok": False, "status": None, "detail": f"Result is not JSON: {exc}"})
+        self._send(conn, data)
+
+    def publish(self, topic: str, data: Any, *, exclude: Optional[Dict[str, Any]] = None) -> int:
+        with self._lock:
+            targets = [conn for conn in self._conns if conn is not exclude and topic in conn["topics"]]
+        message = _host_agent_encode({"op": "event", "topic": topic, "data": data})
+        return sum(1 for conn in targets if self._send(conn, message))
+
+
+class _HostAgentClient:
+    """
+    A worker's connection to the host agent, shared by every thread. Each
+    call gets an id and waits for its `result`; a reader thread routes
+    results back and hands `event` messages to the topic's handlers. A lost
+    connection fails the calls in flight with 503; subscribers reconnect in
+    the background and calls reconnect on demand.
+    """
+
+    def __init__(
+        self,
+        address: str,
+        token_fn: Callable[[], str] = _host_agent_token,
+        *,
+        timeout_s: float = HOST_AGENT_CALL_TIMEOUT_S,
+        connect_timeout_s: float = HOST_AGENT_CONNECT_TIMEOUT_S,
+    ) -> None:
+        self.address = address
+        self.token_fn = token_fn
+        self.timeout_s = max(0.1, float(timeout_s))
+        self.connect_timeout_s = max(0.1, float(connect_timeout_s))
+        self._lock = threading.Lock()
+        self._sock: Optional[socket.socket] = None
+        self._next_id = 0
+        self._pending: Dict[int, Dict[str, Any]] = {}
+        self._handlers: Dict[str, List[Callable[[Any], None]]] = {}
+        self._reconnecting = False
+        self._closed = False
+
+    def _connect_unlocked(self) -> socket.socket:
+        if self._sock is not None:
+            return self._sock
+        if self._closed:
+            raise ConnectionError("Host agent client is closed.")
+        sock, target = _host_agent_socket(self.address)
+        try:
+            sock.settimeout(self.connect_timeout_s)
+            sock.connect(target)
+            sock.sendall(_host_agent_encode({"op": "hello", "token": self.token_fn()}))
+            reader = sock.makefile("rb")
+            hello = json.loads(reader.readline() or b"null")
+            if not isinstance(hello, dict) or not hello.get("ok"):
+                raise ConnectionError(str((hello or {}).get("detail") or "Host agent refused the connection."))
+            sock.settimeout(None)
+            if self._handlers:
+                sock.sendall(_host_agent_encode({"op": "subscribe", "topics": sorted(self._handlers)}))
+        except BaseException:
+            sock.close()
+            raise
+        self._sock = sock
+        threading.Thread(target=self._read_loop, args=(sock, reader), name="codrex-host-agent-client", daemon=True).start()
+        return sock
+
+    def _read_loop(self, sock: socket.socket, reader: Any) -> None:
+        try:
+            for line in reader:
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    continue
+                if not isinstance(message, dict):
+                    continue
+                if message.get("op") == "result":
+                    with self._lock:
+                        slot = self._pending.pop(message.get("id"), None)
+                    if slot is not None:
+                        slot["reply"] = message
+                        slot["done"].set()
+                elif message.get("op") == "event":
+                    with self._lock:
+                        handlers = list(self._handlers.get(str(message.get("topic") or "")) or [])
+                    for handler in handlers:
+                        try:
+                            handler(message.get("data"))
+                        except Exception:
+                            LOGGER.exception("Host agent event handler failed")
+        except (OSError, ValueError):
+            pass
+        finally:
+            with self._lock:
+                lost: List[Dict[str, Any]] = []
+                if self._sock is sock:
+                    self._sock = None
+                    lost = list(self._pending.values())
+                    self._pending.clear()
+                resubscribe = bool(self._handlers) and not self._closed
+            for slot in lost:
+                slot["done"].set()
+            try:
+                sock.close()
+            except OSError:
+                pass
+            if resubscribe:
+                self._reconnect_in_background()
+
+    def _reconnect_in_background(self) -> None:
+        with self._lock:
+            if self._reconnecting or self._closed:
+                return
+            self._reconnecting = True
+
+        def _run() -> None:
+            delay = 0.2
+            try:
+                while True:
+                    with self._lock:
+                        if self._closed or self._sock is not None:
+                            return
+                        try:
+                            self._connect_unlocked()
+                            return
+                        except (OSError, ValueError):
+                            pass
+                    time.sleep(delay)
+                    delay = min(5.0, delay * 2)
+            finally:
+                with self._lock:
+                    self._reconnecting = False
+
+        threading.Thread(target=_run, name="codrex-host-agent-reconnect", daemon=True).start()
+
+    def call(self, method: str, args: Any = (), kwargs: Optional[Dict[str, Any]] = None) -> Any:
+        slot: Dict[str, Any] = {"done": threading.Event(), "reply": None}
+        with self._lock:
+            self._next_id += 1
+            call_id = self._next_id
+        data = _host_agent_encode({"op": "call", "id": call_id, "method": method, "args": list(args), "kwargs": dict(kwargs or {})})
+        try:
+            with self._lock:
+                sock = self._connect_unlocked()
+                self._pending[call_id] = slot
+                sock.sendall(data)
+        except (OSError, ValueError) as exc:
+            with self._lock:
+                self._pending.pop(call_id, None)
+            raise HTTPException(status_code=503, detail=f"Host agent unavailable: {exc}")
+        if not slot["done"].wait(self.timeout_s):
+            with self._lock:
+                self._pending.pop(call_id, None)
+            raise HTTPException(status_code=504, detail=f"Host agent call timed out: {method}")
+        reply = slot["reply"]
+        if reply is None:
+            raise HTTPException(status_code=503, detail="Host agent connection lost.")
+        if reply.get("ok"):
+            return reply.get("result")
+        if reply.get("status") is not None:
+            raise HTTPException(status_code=int(reply["status"]), detail=reply.get("detail"))
+        raise RuntimeError(f"Host agent {method} failed: {reply.get('detail')}")
+
+    def subscribe(self, topic: str, handler: Callable[[Any], None]) -> None:
+        with self._lock:
+            self._handlers.setdefault(topic, []).append(handler)
+            sock = self._sock
+            if sock is not None:
+                try:
+                    sock.sendall(_host_agent_encode({"op": "subscribe", "topics": [topic]}))
+                except OSError:
+                    pass
+        if sock is None:
+            self._reconnect_in_background()
+
+    def publish(self, topic: str, data: Any) -> bool:
+        """Best effort: a message published while disconnected is dropped."""
+        try:
+            with self._lock:
+                sock = self._connect_unlocked()
+                sock.sendall(_host_agent_encode({"op": "publish", "topic": topic, "data": data}))
+            return True
+        except (OSError, ValueError):
+            return False
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            sock = self._sock
+            self._sock = None
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+
+
+def _host_agent_on_stream_event(event: Any) -> None:
+    if isinstance(event, dict) and event.get("session"):
+        _event_hub_poke(f"screen:{event['session']}", relay=False)
+
+
+def _host_agent_client() -> _HostAgentClient:
+    global HOST_AGENT_CLIENT
+    with HOST_AGENT_CLIENT_LOCK:
+        if HOST_AGENT_CLIENT is None:
+            client = _HostAgentClient(HOST_AGENT_ADDRESS)
+            client.subscribe("hub.poke", lambda topic: _event_hub_poke(str(topic or ""), relay=False))
+            client.subscribe("stream", _host_agent_on_stream_event)
+            HOST_AGENT_CLIENT = client
+        return HOST_AGENT_CLIENT
+
+
+def _host_agent_publish(topic: str, data: Any) -> None:
+    """Fan a message out to the other controller processes; a no-op in single mode."""
+    if CONTROLLER_ROLE == "worker":
+        _host_agent_client().publish(topic, data)
+    elif CONTROLLER_ROLE == "agent" and HOST_AGENT_SERVER is not None:
+        HOST_AGENT_SERVER.publish(topic, data)
+
+
+def _run_host_agent(stop: Optional[threading.Event] = None) -> None:
+    """
+    Serves HOST_AGENT_METHODS on HOST_AGENT_ADDRESS until SIGTERM/SIGINT (or
+    `stop`). Without CODEX_HOST_AGENT_TOKEN a fresh token is written to
+    HOST_AGENT_TOKEN_FILE for the workers to read.
+    """
+    global HOST_AGENT_SERVER
+    token = str(os.environ.get("CODEX_HOST_AGENT_TOKEN") or "").strip()
+    if not token:
+        token = secrets.token_urlsafe(32)
+        os.makedirs(os.path.dirname(HOST_AGENT_TOKEN_FILE), exist_ok=True)
+        fd = os.open(HOST_AGENT_TOKEN_FILE, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(token)
+    server = _HostAgentServer(HOST_AGENT_ADDRESS, token).start()
+    HOST_AGENT_SERVER = server
+    stop = stop or threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        try:
+            signal.signal(signum, lambda *_args: stop.set())
+        except ValueError:
+            # Not the main thread (tests); `stop` still works.
+            pass
+    print(f"Host agent listening on {server.address} pid={os.getpid()}", flush=True)
+    try:
+        while not stop.wait(1.0):
+            pass
+    finally:
+        HOST_AGENT_SERVER = None
+        server.close()
+        _flush_session_recordings()
+
+
+# -------------------------
+# Metrics
+# -------------------------
+def _metrics_session_stream_gauge() -> List[Tuple[Dict[str, Any], float]]:
+    with SESSION_STREAM_LOCK:
+        sessions = len(SESSION_STREAM_STATES)
+        buffered = sum(len(state.get("events") or []) for state in SESSION_STREAM_STATES.values())
+    with WINDOWS_SESSION_STREAM_LOCK:
+        windows_sessions = len(WINDOWS_SESSION_STREAM_STATES)
+    return [
+        ({"kind": "codex"}, sessions),
+        ({"kind": "windows"}, windows_sessions),
+        ({"kind": "codex_replay_events"}, buffered),
+    ]
+
+
+def _metrics_stream_send_queue_gauge() -> List[Tuple[Dict[str, Any], float]]:
+    totals: Dict[Tuple[str, str], float] = {}
+    for client in _stream_send_clients_snapshot():
+        for kind, value in (("clients", 1), ("queued_frames", client["depth"]), ("queued_bytes", client["bytes"])):
+            key = (client["stream"], kind)
+            totals[key] = totals.get(key, 0) + value
+    return [({"stream": stream, "kind": kind}, value) for (stream, kind), value in sorted(totals.items())]
+
+
+def _metrics_expiry_gauge() -> List[Tuple[Dict[str, Any], float]]:
+    sweeper = EXPIRY_SWEEPER
+    if sweeper is None:
+        return []
+    return [({"kind": kind}, count) for kind, count in sorted(sweeper.snapshot()["scheduled"].items())]
+
+
+def _metrics_desktop_stream_gauge() -> List[Tuple[Dict[str, Any], float]]:
+    counts: Dict[str, int] = {"multipart": 0, "webrtc": 0}
+    with DESKTOP_STREAM_ACTIVITY_LOCK:
+        for detector, _controller in DESKTOP_STREAM_ACTIVITY.values():
+            counts[detector.kind] = counts.get(detector.kind, 0) + 1
+    return [({"transport": kind}, count) for kind, count in sorted(counts.items())]
+
+
+def _metrics_webrtc_peer_gauge() -> float:
+    with DESKTOP_WEBRTC_SESSION_LOCK:
+        return len(DESKTOP_WEBRTC_SESSIONS)
+
+
+def _metrics_codex_run_gauge() -> List[Tuple[Dict[str, Any], float]]:
+    try:
+        stats = _codex_run_stats()
+    except Exception:
+        stats = {}
+    return [({"status": "running"}, stats.get("running", 0)), ({"status": "queued"}, stats.get("queued", 0))]
+
+
+def _metrics_event_subscriber_gauge() -> List[Tuple[Dict[str, Any], float]]:
+    hub = EVENT_HUB
+    if hub is None:
+        return []
+    return [({"topic": topic}, item["subscribers"]) for topic, item in sorted(hub.stats().items())]
+
+
+METRICS.gauge("codrex_session_streams", "Tracked session stream states and buffered replay events.", _metrics_session_stream_gauge)
+METRICS.gauge("codrex_stream_send_queues", "Stream websocket clients and their queued frames/bytes by stream.", _metrics_stream_send_queue_gauge)
+METRICS.gauge("codrex_expiry_scheduled", "Heap entries waiting for the expiry sweeper, by store.", _metrics_expiry_gauge)
+METRICS.gauge("codrex_desktop_streams", "Open desktop streams (multipart MJPEG/PNG clients and WebRTC tracks).", _metrics_desktop_stream_gauge)
+METRICS.gauge("codrex_webrtc_peers", "Open desktop WebRTC peer connections.", _metrics_webrtc_peer_gauge)
+METRICS.gauge("codrex_codex_runs", "Codex exec runs by live status.", _metrics_codex_run_gauge)
+METRICS.gauge("codrex_event_subscribers", "/events subscribers per topic.", _metrics_event_subscriber_gauge)
+METRICS.gauge("codrex_uptime_seconds", "Seconds since the controller started.", lambda: time.time() - START_TIME)
+
+
+@app.get("/metrics")
+def metrics_prometheus():
+    return Response(
+        content=METRICS.render_prometheus(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+        headers={"Cache-Control": "no-store"},
+    )
+
+
+@app.get("/metrics/summary")
+def metrics_summary():
+    return {"ok": True, **METRICS.summary()}
 
 
 _ensure_loop_control_worker()
+if os.path.isdir(SESSION_RECORDINGS_DIR) and _owns_host_singletons():
+    # Resume recordings that were on before a restart.
+    _session_recordings()
+if _owns_host_singletons() and (os.path.exists(SHARED_OUTBOX_FILE) or os.path.exists(SESSION_FILES_FILE)):
+    # Loading schedules every item, so ones that expired while the controller was down are reaped now.
+    with SHARED_OUTBOX_LOCK:
+        _load_shared_outbox_unlocked()
+    with SESSION_FILES_LOCK:
+        _load_session_files_unlocked()
+
+if __name__ == "__main__":
+    # The host agent process of multi-process mode (tools/codrex-controller.py).
+    if CONTROLLER_ROLE != "agent":
+        raise SystemExit("Run with CODEX_CONTROLLER_ROLE=agent to start the host agent.")
+    _run_host_agent()
@@ -1,6 +1,8 @@
 import importlib.util
 import os
 import tempfile
+import threading
+import time
 import unittest
 import urllib.error
 from pathlib import Path
@@ -20,6 +22,17 @@ codrex_send = _load_module()
 
 
 class CodrexSendConfigTests(unittest.TestCase):
+    def setUp(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        env_patch = mock.patch.dict(
+            os.environ,
+            {"CODREX_SEND_CACHE_PATH": str(Path(cache_dir.name) / "controller-endpoints.json")},
+            clear=False,
+        )
+        env_patch.start()
+        self.addCleanup(env_patch.stop)
+
     def test_merge_controller_configs_keeps_main_when_local_blank(self):
         merged = codrex_send._merge_controller_configs(
             {"token": "main-token", "port": 8787},
@@ -170,5 +183,120 @@ class CodrexSendConfigTests(unittest.TestCase):
         self.assertIn("windows_bridge=Windows bridge unreachable", response.get("detail", ""))
 
 
+class CodrexSendDiscoveryTests(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = Path(tmp.name)
+        self.config_path = self.root / "controller.config.json"
+        self.config_path.write_text('{"port": 48787, "token": "tok"}', encoding="utf-8")
+        env_patch = mock.patch.dict(
+            os.environ,
+            {
+                "CODREX_CONTROLLER_CONFIG": str(self.config_path),
+                "CODREX_SEND_CACHE_PATH": str(self.root / "cache" / "controller-endpoints.json"),
+                "CODREX_SEND_CACHE_TTL_S": "300",
+            },
+            clear=False,
+        )
+        env_patch.start()
+        self.addCleanup(env_patch.stop)
+        appdata_patch = mock.patch.object(codrex_send, "_windows_local_appdata_wsl", return_value=None)
+        appdata_patch.start()
+        self.addCleanup(appdata_patch.stop)
+
+    def test_probe_runs_candidates_concurrently_and_returns_first_healthy(self):
+        started = []
+        lock = threading.Lock()
+
+        def fake_reachable(base, token):
+            with lock:
+                started.append(base)
+            if base.endswith(":3"):
+                return True
+            time.sleep(0.4)
+            return False
+
+        candidates = ["http://10.0.0.1:1", "http://10.0.0.2:2", "http://10.0.0.3:3"]
+        with mock.patch.object(codrex_send, "_controller_reachable", side_effect=fake_reachable):
+            started_at = time.monotonic()
+            base = codrex_send._probe_controller_candidates(candidates, "tok")
+            elapsed = time.monotonic() - started_at
+
+        self.assertEqual(base, "http://10.0.0.3:3")
+        self.assertLess(elapsed, 0.35)
+        self.assertEqual(sorted(started), sorted(candidates))
+
+    def test_probe_returns_empty_when_nothing_answers(self):
+        with mock.patch.object(codrex_send, "_controller_reachable", return_value=False):
+            self.assertEqual(codrex_send._probe_controller_candidates(["http://a:1", "http://b:2"], "tok"), "")
+
+    def test_last_good_endpoint_is_cached_per_config(self):
+        candidates = ["http://127.0.0.1:48787", "http://100.64.0.9:48787"]
+        reachable = mock.Mock(side_effect=lambda base, token: base == "http://100.64.0.9:48787")
+        with mock.patch.object(codrex_send, "_build_controller_candidates", return_value=candidates), \
+             mock.patch.object(codrex_send, "_controller_reachable", reachable):
+            first, _token, _cfg = codrex_send._get_controller_defaults()
+            probes_after_first = reachable.call_count
+            second, _token, _cfg = codrex_send._get_controller_defaults()
+
+        self.assertEqual(first, "http://100.64.0.9:48787")
+        self.assertEqual(second, "http://100.64.0.9:48787")
+        self.assertEqual(reachable.call_count, probes_after_first)
+
+        other_config = self.root / "other.config.json"
+        other_config.write_text('{"port": 48787, "token": "tok"}', encoding="utf-8")
+        with mock.patch.dict(os.environ, {"CODREX_CONTROLLER_CONFIG": str(other_config)}, clear=False), \
+             mock.patch.object(codrex_send, "_build_controller_candidates", return_value=candidates), \
+             mock.patch.object(codrex_send, "_controller_reachable", return_value=False) as other_probe:
+            other_base, _token, _cfg = codrex_send._get_controller_defaults()
+
+        self.assertEqual(other_base, "http://127.0.0.1:48787")
+        self.assertTrue(other_probe.called)
+
+    def test_cached_endpoint_expires_after_ttl(self):
+        candidates = ["http://127.0.0.1:48787", "http://100.64.0.9:48787"]
+        cache_key = codrex_send._controller_cache_key(self.config_path, "tok")
+        codrex_send._store_cached_controller_base(cache_key, "http://100.64.0.9:48787")
+        self.assertEqual(codrex_send._load_cached_controller_base(cache_key, candidates), "http://100.64.0.9:48787")
+
+        with mock.patch.object(codrex_send.time, "time", return_value=time.time() + 301):
+            self.assertEqual(codrex_send._load_cached_controller_base(cache_key, candidates), "")
+        # A cached base that is no longer a candidate is ignored as well.
+        self.assertEqual(codrex_send._load_cached_controller_base(cache_key, ["http://127.0.0.1:48787"]), "")
+
+        with mock.patch.object(codrex_send.os, "replace", wraps=os.replace) as replace:
+            codrex_send._forget_cached_controller_base(cache_key)
+        replace.assert_called_once()
+        self.assertEqual(codrex_send._load_cached_controller_base(cache_key, candidates), "")
+        cache_path = codrex_send._controller_cache_path()
+        self.assertEqual(list(cache_path.parent.glob(f"{cache_path.name}.*.tmp")), [])
+
+    def test_stage_file_links_on_same_filesystem(self):
+        share_root = self.root / "codrex-work"
+        source = self.root / "external" / "report.bin"
+        source.parent.mkdir(parents=True, exist_ok=True)
+        source.write_bytes(b"payload" * 64)
+
+        with mock.patch.object(codrex_send.shutil, "copy2", side_effect=AssertionError("copy2 should not run")):
+            staged = codrex_send._stage_file_into_share_root(source, share_root)
+
+        self.assertEqual(staged.read_bytes(), source.read_bytes())
+        self.assertTrue(codrex_send._path_within_root(staged, share_root))
+
+    def test_stage_file_falls_back_to_copy_when_linking_fails(self):
+        share_root = self.root / "codrex-work"
+        source = self.root / "external" / "report.bin"
+        source.parent.mkdir(parents=True, exist_ok=True)
+        source.write_bytes(b"payload")
+
+        with mock.patch.object(codrex_send, "_reflink_file", return_value=False), \
+             mock.patch.object(codrex_send.os, "link", side_effect=OSError(18, "Invalid cross-device link")):
+            staged = codrex_send._stage_file_into_share_root(source, share_root)
+
+        self.assertEqual(staged.read_bytes(), b"payload")
+        self.assertNotEqual(staged.stat().st_ino, source.stat().st_ino)
+
+
 if __name__ == "__main__":
     unittest.main()
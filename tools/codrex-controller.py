@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Codrex launcher for multi-process mode: one host agent plus N uvicorn HTTP workers.
+
+The host agent (`python -m app.server` with CODEX_CONTROLLER_ROLE=agent) owns
+tmux capture, winpty sessions, loop control, Telegram and the stream state;
+the workers (CODEX_CONTROLLER_ROLE=worker) serve HTTP and forward to it over
+CODEX_HOST_AGENT_ADDRESS. Stopping either side stops both.
+
+Usage:
+  python tools/codrex-controller.py --workers 4 --host 0.0.0.0 --port 48787
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import pathlib
+import secrets
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+AGENT_READY_TIMEOUT_S = 30.0
+STOP_GRACE_S = 10.0
+
+
+def _die(msg: str, code: int = 1) -> "None":
+    print(msg, file=sys.stderr)
+    raise SystemExit(code)
+
+
+def _default_agent_address() -> str:
+    if os.name == "nt" or not hasattr(socket, "AF_UNIX"):
+        return "tcp:127.0.0.1:48789"
+    return "unix:" + os.path.join(tempfile.gettempdir(), f"codrex-host-agent-{os.getpid()}.sock")
+
+
+def _agent_reachable(address: str) -> bool:
+    kind, _, target = address.partition(":")
+    try:
+        if kind == "unix":
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            endpoint: object = target
+        else:
+            host, _, port = target.rpartition(":")
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            endpoint = (host or "127.0.0.1", int(port))
+    except (OSError, ValueError):
+        return False
+    try:
+        sock.settimeout(1.0)
+        sock.connect(endpoint)
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+
+def _stop(proc: Optional[subprocess.Popen]) -> None:
+    if proc is None or proc.poll() is not None:
+        return
+    proc.terminate()
+    try:
+        proc.wait(timeout=STOP_GRACE_S)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run Codrex as N HTTP workers plus one host agent.")
+    parser.add_argument("--workers", type=int, default=2, help="uvicorn worker processes (default 2)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=48787)
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        _die("--workers must be at least 1.", 2)
+
+    root = pathlib.Path(__file__).resolve().parent.parent
+    env: Dict[str, str] = dict(os.environ)
+    address = str(env.get("CODEX_HOST_AGENT_ADDRESS") or "").strip() or _default_agent_address()
+    env["CODEX_HOST_AGENT_ADDRESS"] = address
+    env.setdefault("CODEX_HOST_AGENT_TOKEN", secrets.token_urlsafe(32))
+
+    agent: Optional[subprocess.Popen] = None
+    workers: Optional[subprocess.Popen] = None
+    stopping = {"requested": False}
+
+    def _request_stop(*_args: object) -> None:
+        stopping["requested"] = True
+
+    signal.signal(signal.SIGINT, _request_stop)
+    signal.signal(signal.SIGTERM, _request_stop)
+    try:
+        agent = subprocess.Popen(
+            [sys.executable, "-m", "app.server"],
+            cwd=str(root),
+            env={**env, "CODEX_CONTROLLER_ROLE": "agent"},
+        )
+        deadline = time.monotonic() + AGENT_READY_TIMEOUT_S
+        while not _agent_reachable(address):
+            if agent.poll() is not None:
+                _die(f"Host agent exited with code {agent.returncode} before it was ready.")
+            if stopping["requested"]:
+                return 0
+            if time.monotonic() > deadline:
+                _die(f"Host agent did not listen on {address} within {AGENT_READY_TIMEOUT_S:g}s.")
+            time.sleep(0.2)
+        workers = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "uvicorn",
+                "app.server:app",
+                "--host",
+                str(args.host),
+                "--port",
+                str(args.port),
+                "--workers",
+                str(args.workers),
+            ],
+            cwd=str(root),
+            env={**env, "CODEX_CONTROLLER_ROLE": "worker"},
+        )
+        while not stopping["requested"]:
+            if agent.poll() is not None:
+                print(f"Host agent exited with code {agent.returncode}; stopping workers.", file=sys.stderr)
+                return agent.returncode or 1
+            if workers.poll() is not None:
+                print(f"Workers exited with code {workers.returncode}; stopping host agent.", file=sys.stderr)
+                return workers.returncode or 1
+            time.sleep(0.5)
+        return 0
+    finally:
+        _stop(workers)
+        _stop(agent)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -10,6 +10,8 @@ from __future__ import annotations
 
 import argparse
 import base64
+import concurrent.futures
+import hashlib
 import json
 import os
 import pathlib
@@ -22,6 +24,12 @@ import urllib.error
 import urllib.request
 from typing import Any, Dict, List, Optional, Tuple
 
+CONTROLLER_PROBE_TIMEOUT_S = 1.5
+CONTROLLER_PROBE_MAX_WORKERS = 8
+CONTROLLER_CACHE_TTL_S = 300.0
+# Linux FICLONE ioctl (btrfs/xfs/bcachefs copy-on-write clone).
+_FICLONE = 0x40049409
+
 
 def _die(msg: str, code: int = 1) -> "None":
     print(msg, file=sys.stderr)
@@ -190,7 +198,7 @@ def _controller_reachable(base_url: str, token: str) -> bool:
         headers["x-auth-token"] = token
     req = urllib.request.Request(url, method="GET", headers=headers)
     try:
-        with urllib.request.urlopen(req, timeout=1.5) as resp:
+        with urllib.request.urlopen(req, timeout=CONTROLLER_PROBE_TIMEOUT_S) as resp:
             if int(getattr(resp, "status", 0) or 0) != 200:
                 return False
             raw = resp.read().decode("utf-8", errors="replace")
@@ -200,6 +208,117 @@ def _controller_reachable(base_url: str, token: str) -> bool:
         return False
 
 
+def _probe_controller_candidates(candidates: List[str], token: str) -> str:
+    # Probe every candidate at once and take the first healthy answer, so stale
+    # LAN/Tailscale entries cost one probe timeout in total instead of one each.
+    bases: List[str] = []
+    for raw in candidates:
+        base = _normalize_base_url(raw)
+        if base and base not in bases:
+            bases.append(base)
+    if not bases:
+        return ""
+    if len(bases) == 1:
+        return bases[0] if _controller_reachable(bases[0], token) else ""
+    workers = max(1, min(CONTROLLER_PROBE_MAX_WORKERS, len(bases)))
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="codrex-send-probe")
+    try:
+        futures = {pool.submit(_controller_reachable, base, token): base for base in bases}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                if future.result():
+                    return futures[future]
+            except Exception:
+                continue
+    finally:
+        # Do not wait for slower probes once a winner is known; their sockets
+        # time out on their own.
+        pool.shutdown(wait=False, cancel_futures=True)
+    return ""
+
+
+def _controller_cache_path() -> pathlib.Path:
+    override = (os.environ.get("CODREX_SEND_CACHE_PATH") or "").strip()
+    if override:
+        return pathlib.Path(_win_to_wsl_path(override)).expanduser()
+    base = (os.environ.get("XDG_CACHE_HOME") or "").strip() or str(pathlib.Path.home() / ".cache")
+    return pathlib.Path(base).expanduser() / "codrex-send" / "controller-endpoints.json"
+
+
+def _controller_cache_ttl_s() -> float:
+    raw = (os.environ.get("CODREX_SEND_CACHE_TTL_S") or "").strip()
+    if not raw:
+        return CONTROLLER_CACHE_TTL_S
+    try:
+        return max(0.0, float(raw))
+    except ValueError:
+        return CONTROLLER_CACHE_TTL_S
+
+
+def _controller_cache_key(config_path: pathlib.Path, token: str) -> str:
+    # Keyed per config file; the token digest keeps a rotated token from reusing
+    # an endpoint that was only validated with the old one.
+    token_digest = hashlib.sha256((token or "").encode("utf-8")).hexdigest()[:16]
+    return f"{config_path.expanduser().absolute()}|{token_digest}"
+
+
+def _load_cached_controller_base(cache_key: str, candidates: List[str]) -> str:
+    ttl_s = _controller_cache_ttl_s()
+    if ttl_s <= 0:
+        return ""
+    entry = _read_json_file(_controller_cache_path()).get(cache_key)
+    if not isinstance(entry, dict):
+        return ""
+    base = _normalize_base_url(str(entry.get("base") or ""))
+    try:
+        checked_at = float(entry.get("checked_at") or 0)
+    except (TypeError, ValueError):
+        return ""
+    if not base or base not in candidates:
+        return ""
+    if time.time() - checked_at > ttl_s:
+        return ""
+    return base
+
+
+def _store_cached_controller_base(cache_key: str, base: str) -> None:
+    if _controller_cache_ttl_s() <= 0:
+        return
+    cache_path = _controller_cache_path()
+    data = _read_json_file(cache_path)
+    now = time.time()
+    ttl_s = _controller_cache_ttl_s()
+    data = {
+        key: value
+        for key, value in data.items()
+        if isinstance(value, dict) and now - float(value.get("checked_at") or 0) <= ttl_s
+    }
+    data[cache_key] = {"base": base, "checked_at": now}
+    _write_controller_cache(cache_path, data)
+
+
+def _forget_cached_controller_base(cache_key: str) -> None:
+    cache_path = _controller_cache_path()
+    data = _read_json_file(cache_path)
+    if cache_key not in data:
+        return
+    data.pop(cache_key, None)
+    _write_controller_cache(cache_path, data)
+
+
+def _write_controller_cache(cache_path: pathlib.Path, data: Dict[str, Any]) -> None:
+    # Concurrent senders share this file, so swap it in whole rather than
+    # letting a reader see a half-written one.
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps(data, indent=2), encoding="utf-8")
+        os.replace(tmp_path, cache_path)
+    except Exception:
+        # The cache is only a shortcut; never fail a share because of it.
+        return
+
+
 def _running_in_wsl() -> bool:
     if os.environ.get("WSL_DISTRO_NAME"):
         return True
@@ -325,6 +444,13 @@ def _build_controller_candidates(env_base: str, cfg: Dict[str, Any], port: int)
     return candidates
 
 
+def _resolve_controller_config_path() -> pathlib.Path:
+    config_env = (os.environ.get("CODREX_CONTROLLER_CONFIG") or "").strip()
+    if config_env:
+        return pathlib.Path(_win_to_wsl_path(config_env)).expanduser()
+    return _default_config_path()
+
+
 def _get_controller_details() -> Tuple[str, str, Dict[str, Any], List[str]]:
     # Priority:
     # 1) explicit env
@@ -332,11 +458,7 @@ def _get_controller_details() -> Tuple[str, str, Dict[str, Any], List[str]]:
     env_base = (os.environ.get("CODREX_CONTROLLER_URL") or "").strip().rstrip("/")
     env_token = (os.environ.get("CODREX_AUTH_TOKEN") or "").strip()
 
-    config_env = (os.environ.get("CODREX_CONTROLLER_CONFIG") or "").strip()
-    if config_env:
-        config_path = pathlib.Path(_win_to_wsl_path(config_env)).expanduser()
-    else:
-        config_path = _default_config_path()
+    config_path = _resolve_controller_config_path()
     local_config_path = _local_config_path_for(config_path)
 
     cfg_main = _read_controller_config(config_path)
@@ -355,10 +477,16 @@ def _get_controller_details() -> Tuple[str, str, Dict[str, Any], List[str]]:
     token = env_token or str(cfg.get("token") or "").strip()
     candidates = _build_controller_candidates(env_base, cfg, port)
     base = candidates[0] if candidates else f"http://127.0.0.1:{port}"
-    for candidate in candidates:
-        if _controller_reachable(candidate, token):
-            base = candidate
-            break
+    cache_key = _controller_cache_key(config_path, token)
+    cached = _load_cached_controller_base(cache_key, candidates)
+    if cached:
+        # Requests still fall back through the full candidate list, and main()
+        # refreshes the cache with whichever base actually answered.
+        return cached, token, cfg, candidates
+    reachable = _probe_controller_candidates(candidates, token)
+    if reachable:
+        base = reachable
+        _store_cached_controller_base(cache_key, base)
     return base, token, cfg, candidates
 
 
@@ -386,6 +514,48 @@ def _resolve_share_root(cfg: Dict[str, Any]) -> pathlib.Path:
     return pathlib.Path("/home/megha/codrex-work")
 
 
+def _reflink_file(source_path: pathlib.Path, dest: pathlib.Path) -> bool:
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    with open(source_path, "rb") as src, open(dest, "xb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+            cloned = True
+        except OSError:
+            cloned = False
+    if not cloned:
+        dest.unlink()
+        return False
+    try:
+        shutil.copystat(source_path, dest)
+    except OSError:
+        pass
+    return True
+
+
+def _link_or_copy_file(source_path: pathlib.Path, dest: pathlib.Path) -> str:
+    # Same filesystem: prefer a copy-on-write clone (a true snapshot), then a
+    # hardlink; only fall back to a byte copy across devices or when both fail.
+    try:
+        same_device = source_path.stat().st_dev == dest.parent.stat().st_dev
+    except OSError:
+        same_device = False
+    if same_device:
+        if _reflink_file(source_path, dest):
+            return "reflink"
+        try:
+            os.link(source_path, dest)
+            return "hardlink"
+        except FileExistsError:
+            raise
+        except OSError:
+            pass
+    shutil.copy2(source_path, dest)
+    return "copy"
+
+
 def _stage_file_into_share_root(source_path: pathlib.Path, share_root: pathlib.Path) -> pathlib.Path:
     staging_dir = share_root / "output" / ".codrex-share-staging"
     staging_dir.mkdir(parents=True, exist_ok=True)
@@ -394,7 +564,7 @@ def _stage_file_into_share_root(source_path: pathlib.Path, share_root: pathlib.P
     dest = staging_dir / f"{stamp}_{safe_name}"
     if dest.exists():
         dest = staging_dir / f"{stamp}_{os.getpid()}_{safe_name}"
-    shutil.copy2(source_path, dest)
+    _link_or_copy_file(source_path, dest)
     return dest
 
 
@@ -497,6 +667,11 @@ def main(argv: list[str]) -> int:
         share_payload["title"] = args.title.strip()
 
     share, base_used = _request_json_with_fallback(request_bases, "POST", "/shares", share_payload, token)
+    cache_key = _controller_cache_key(_resolve_controller_config_path(), token)
+    if share.get("error") == "request_failed":
+        _forget_cached_controller_base(cache_key)
+    elif base_used and base_used != base_url:
+        _store_cached_controller_base(cache_key, base_used)
     if not share.get("ok"):
         _die(f"Share failed: {share.get('detail') or share.get('error') or 'unknown error'}", code=2)
 
@@ -519,7 +694,11 @@ def main(argv: list[str]) -> int:
         tg, _tg_base = _request_json_with_fallback(request_bases, "POST", f"/shares/{share_id}/telegram", tg_payload, token)
         if not tg.get("ok"):
             _die(f"Telegram failed: {tg.get('detail') or tg.get('error') or 'unknown error'}", code=3)
-        print("Telegram: sent")
+        tg_result = tg.get("telegram") if isinstance(tg.get("telegram"), dict) else {}
+        if tg_result.get("queued"):
+            print(f"Telegram: queued ({tg_result.get('job_id') or 'pending'})")
+        else:
+            print("Telegram: sent")
 
     return 0
 
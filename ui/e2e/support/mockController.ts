@@ -145,6 +145,7 @@ export async function installMockController(
   const promptRequests: PromptRequest[] = [];
   const telegramSendRequests: TelegramSendRequest[] = [];
   const notesBySession = new Map<string, string>();
+  const notesSeqBySession = new Map<string, number>();
   const sessionFilesBySession = new Map(
     Object.entries(options.sessionFiles ?? {}),
   );
@@ -497,16 +498,24 @@ export async function installMockController(
     const sessionName = decodeSessionName(route.request().url());
     const screenText = screenTextBySession.get(sessionName) ?? "";
     const compact = screenText.split(/\r?\n/).map((line) => line.trimEnd()).filter(Boolean).slice(-24).join("\n");
-    const existing = notesBySession.get(sessionName)?.trim();
-    const next = existing ? `${existing}\n\n${compact}` : compact;
+    const existing = notesBySession.get(sessionName) ?? "";
+    const text = existing ? `${"\n\n".slice(existing.length - existing.replace(/\n+$/, "").length)}${compact}` : compact;
+    const next = existing + text;
     notesBySession.set(sessionName, next);
+    const seq = (notesSeqBySession.get(sessionName) ?? 0) + 1;
+    notesSeqBySession.set(sessionName, seq);
     await json(route, {
       ok: true,
       session: sessionName,
       appended_text: compact,
+      entries: [{ seq, at: Date.now(), start: existing.length, text }],
+      reset: !existing,
+      total_chars: next.length,
+      next_cursor: String(seq),
+      has_more: false,
       notes: {
         session: sessionName,
-        content: next,
+        content: "",
         created_at: Date.now(),
         updated_at: Date.now(),
         last_response_snapshot: compact,
@@ -4,8 +4,10 @@ import codrexLogoHero from "./assets/codrex-logo-hero.png";
 import {
   addThreadRecordMessage,
   appendLatestSessionNotes,
+  buildCodexRunStreamUrl,
   buildDesktopShotUrl,
   buildDesktopStreamUrl,
+  buildEventsUrl,
   buildPairConsumeUrl,
   buildPairQrPngUrl,
   buildSessionStreamUrl,
@@ -20,6 +22,7 @@ import {
   createSessionWithOptions,
   createTmuxSession,
   createPairCode,
+  connectDesktopInput,
   desktopMove,
   detectControllerPort,
   deleteThreadRecord,
@@ -28,6 +31,7 @@ import {
   desktopScroll,
   desktopSendKey,
   desktopSendText,
+  disconnectDesktopInput,
   ctrlcSession,
   exchangePairCode,
   enterSession,
@@ -36,10 +40,12 @@ import {
     getAppRuntime,
     getDesktopInfo,
     getAuthStatus,
+  cancelCodexRun,
   getCodexOptions,
   getCodexRuntimeStatus,
   getCodexRun,
   getCodexRuns,
+  getMetricsSummary,
     getNetInfo,
     getLoopStatus,
     getPowerStatus,
@@ -85,20 +91,28 @@ import type {
   AppRuntimeResult,
   AuthStatus,
   CodexRunDetail,
+  CodexRunStreamOutput,
   CodexRuntimeStatusResult,
   CodexRunSummary,
+  CodexRunsResult,
     DesktopInfoResult,
     DesktopTargetInfo,
+    DesktopTargetsResult,
     DesktopWebrtcSessionDescription,
     LoopPreset,
     LoopStatusResult,
     LoopOverrideMode,
+    MetricsSummaryResult,
     NetInfo,
   PowerStatusResult,
   SessionInfo,
+  SessionsResult,
+  SessionScreenResult,
   SessionNoteInfo,
   SharedFileInfo,
   SessionStreamEvent,
+  EventTopicDelta,
+  EventTopicSnapshot,
   ThreadInfo,
   ThreadMessageInfo,
   TmuxPaneInfo,
@@ -295,6 +309,10 @@ const REMOTE_POLL_MS = 3500;
 const REMOTE_HIDDEN_POLL_MS = 7000;
 const DEFAULT_BACKGROUND_POLL_MS = 5000;
 const SESSION_MUTATION_REVALIDATE_MS = 900;
+const RUN_STREAM_RETRY_MS = 2000;
+// Log bytes re-read when a stream takes over from a polled run detail, whose output is trimmed.
+const RUN_STREAM_BACKFILL_BYTES = 64 * 1024;
+const RUN_OUTPUT_MAX_CHARS = 200_000;
 const DESKTOP_REMOTE_CLIPBOARD_GRACE_MS = 15000;
 const POWER_ACTION_LABELS: Record<"lock" | "sleep" | "hibernate" | "restart" | "shutdown", string> = {
   lock: "Lock",
@@ -861,6 +879,8 @@ export default function App() {
   const [pageVisible, setPageVisible] = useState(() =>
     typeof document === "undefined" ? true : !document.hidden,
   );
+  const [liveEventTopics, setLiveEventTopics] = useState<string[]>([]);
+  const [eventsReconnectKey, setEventsReconnectKey] = useState(0);
 
   const [threads, setThreads] = useState<ChatThread[]>(() => {
     const stored = parseThreads(safeStorageGet(THREADS_STORAGE));
@@ -985,9 +1005,16 @@ export default function App() {
   const [eventLog, setEventLog] = useState<AppEventItem[]>([]);
   const [debugRuns, setDebugRuns] = useState<CodexRunSummary[]>([]);
   const [debugLoading, setDebugLoading] = useState(true);
+  const [debugMetrics, setDebugMetrics] = useState<MetricsSummaryResult | null>(null);
   const [selectedRunId, setSelectedRunId] = useState("");
   const [selectedRun, setSelectedRun] = useState<CodexRunDetail | null>(null);
   const [selectedRunLoading, setSelectedRunLoading] = useState(false);
+  const [selectedRunStreamLive, setSelectedRunStreamLive] = useState(false);
+  const [selectedRunCancelling, setSelectedRunCancelling] = useState(false);
+  const [runStreamReconnectKey, setRunStreamReconnectKey] = useState(0);
+  // Log offset the selected run's output reaches, and whether that output came from a polled detail.
+  const selectedRunOffsetRef = useRef(0);
+  const selectedRunOutputPolledRef = useRef(true);
   const screenShellRef = useRef<HTMLElement | null>(null);
   const sessionOutputRef = useRef<HTMLPreElement | null>(null);
   const sessionTranscriptRef = useRef<TranscriptChunk[]>([]);
@@ -1040,6 +1067,7 @@ export default function App() {
   const threadMigrationAttemptedRef = useRef(false);
   const localBootstrapAttemptedRef = useRef(false);
   const sessionImageInputRef = useRef<HTMLInputElement | null>(null);
+  const sessionNotesSyncedRef = useRef("");
 
   const backendPort = useMemo(parsePort, []);
   const browserHostname = typeof window !== "undefined" ? window.location.hostname || "127.0.0.1" : "127.0.0.1";
@@ -1340,6 +1368,8 @@ export default function App() {
         distro: response.sessions_runtime_distro,
         can_start: response.sessions_runtime_can_start,
         can_stop: response.sessions_runtime_can_stop,
+        transition: response.sessions_runtime_transition,
+        checked_at: response.sessions_runtime_checked_at,
       });
     } catch (error) {
       addEvent("error", `Could not read app runtime: ${(error as Error).message}`);
@@ -1394,6 +1424,24 @@ export default function App() {
     }
   }, [addEvent]);
 
+  const applySessionsResult = useCallback((response: SessionsResult) => {
+    const nextSessions = response.sessions || [];
+    const nextRecentClosed = response.recent_closed || [];
+    setSessionsMeta(response.meta || null);
+    setSessions(nextSessions);
+    setRecentClosedSessions(nextRecentClosed);
+    setSelectedSession((current) => {
+      if (current && nextSessions.some((s) => s.session === current)) {
+        return current;
+      }
+      const stored = safeStorageGet(SESSION_SELECTED_STORAGE);
+      if (stored && nextSessions.some((s) => s.session === stored)) {
+        return stored;
+      }
+      return nextSessions[0]?.session || "";
+    });
+  }, []);
+
   const refreshSessions = useCallback(async () => {
     if (sessionsRefreshInFlightRef.current) {
       return;
@@ -1404,21 +1452,7 @@ export default function App() {
       if (!response.ok) {
         throw new Error(response.detail || response.error || "Failed to read sessions.");
       }
-      const nextSessions = response.sessions || [];
-      const nextRecentClosed = response.recent_closed || [];
-      setSessionsMeta(response.meta || null);
-      setSessions(nextSessions);
-      setRecentClosedSessions(nextRecentClosed);
-      setSelectedSession((current) => {
-        if (current && nextSessions.some((s) => s.session === current)) {
-          return current;
-        }
-        const stored = safeStorageGet(SESSION_SELECTED_STORAGE);
-        if (stored && nextSessions.some((s) => s.session === stored)) {
-          return stored;
-        }
-        return nextSessions[0]?.session || "";
-      });
+      applySessionsResult(response);
     } catch (error) {
       const detail = (error as Error).message || "";
       const lowered = detail.toLowerCase();
@@ -1432,7 +1466,7 @@ export default function App() {
       sessionsRefreshInFlightRef.current = false;
       setSessionsLoading(false);
     }
-  }, [setError, setStatus]);
+  }, [applySessionsResult, setError, setStatus]);
 
   const refreshLoopStatus = useCallback(async () => {
     try {
@@ -1551,6 +1585,7 @@ export default function App() {
 
   const refreshSessionNotes = useCallback(async (session: string) => {
     if (!session) {
+      sessionNotesSyncedRef.current = "";
       setSessionNotes("");
       setSessionNotesInfo(null);
       setSessionNotesLoading(false);
@@ -1561,10 +1596,12 @@ export default function App() {
       if (!response.ok || !response.notes) {
         throw new Error(response.detail || response.error || "Failed to read session notes.");
       }
-      setSessionNotes(response.notes.content || "");
+      sessionNotesSyncedRef.current = response.notes.content || "";
+      setSessionNotes(sessionNotesSyncedRef.current);
       setSessionNotesInfo(response.notes);
     } catch (error) {
       addEvent("error", `Could not load session notes: ${(error as Error).message}`);
+      sessionNotesSyncedRef.current = "";
       setSessionNotes("");
       setSessionNotesInfo(null);
     } finally {
@@ -1647,20 +1684,24 @@ export default function App() {
     }
   }, [addEvent]);
 
+  const applyCodexRunsResult = useCallback((response: CodexRunsResult) => {
+    const nextRuns = response.runs || [];
+    setDebugRuns(nextRuns);
+    setSelectedRunId((current) => {
+      if (current && nextRuns.some((run) => run.id === current)) {
+        return current;
+      }
+      return nextRuns[0]?.id || "";
+    });
+  }, []);
+
   const refreshDebugRuns = useCallback(async () => {
     try {
       const response = await getCodexRuns();
       if (!response.ok) {
         throw new Error(response.detail || response.error || "Failed to read run history.");
       }
-      const nextRuns = response.runs || [];
-      setDebugRuns(nextRuns);
-      setSelectedRunId((current) => {
-        if (current && nextRuns.some((run) => run.id === current)) {
-          return current;
-        }
-        return nextRuns[0]?.id || "";
-      });
+      applyCodexRunsResult(response);
     } catch (error) {
       const detail = (error as Error).message || "";
       const lowered = detail.toLowerCase();
@@ -1673,7 +1714,18 @@ export default function App() {
     } finally {
       setDebugLoading(false);
     }
-  }, [setError, setStatus]);
+  }, [applyCodexRunsResult, setError, setStatus]);
+
+  const refreshDebugMetrics = useCallback(async () => {
+    try {
+      const response = await getMetricsSummary();
+      if (response.ok) {
+        setDebugMetrics(response);
+      }
+    } catch {
+      // Metrics are diagnostic only; the run list reports auth and network errors.
+    }
+  }, []);
 
   const refreshTmuxState = useCallback(async () => {
     try {
@@ -1746,6 +1798,16 @@ export default function App() {
     }
   }, []);
 
+  const applyDesktopTargetsResult = useCallback((response: DesktopTargetsResult) => {
+    if (!response.ok) {
+      setDesktopTargets([]);
+      setDesktopTargetsDetail(`Desktop targets unavailable: ${response.detail || response.error || "unknown error"}`);
+      return;
+    }
+    setDesktopTargets(response.targets || []);
+    setDesktopTargetsDetail(response.detail || "");
+  }, []);
+
   const refreshDesktopTargets = useCallback(async () => {
     setDesktopTargetsBusy(true);
     try {
@@ -1753,15 +1815,14 @@ export default function App() {
       if (!response.ok) {
         throw new Error(response.detail || response.error || "Desktop targets unavailable.");
       }
-      setDesktopTargets(response.targets || []);
-      setDesktopTargetsDetail(response.detail || "");
+      applyDesktopTargetsResult(response);
     } catch (error) {
       setDesktopTargets([]);
       setDesktopTargetsDetail(`Desktop targets unavailable: ${(error as Error).message}`);
     } finally {
       setDesktopTargetsBusy(false);
     }
-  }, []);
+  }, [applyDesktopTargetsResult]);
 
   const onSelectDesktopTarget = useCallback(async (targetId: string) => {
     const nextTarget = targetId.trim();
@@ -1831,6 +1892,19 @@ export default function App() {
     }
   }, []);
 
+  useEffect(() => {
+    // Pointer/key/text events share one socket while control is live; the input
+    // helpers fall back to per-event POSTs whenever it is not open.
+    if (activeTab !== "remote" || !pageVisible || !desktopEnabled) {
+      disconnectDesktopInput();
+      return;
+    }
+    connectDesktopInput();
+    return () => {
+      disconnectDesktopInput();
+    };
+  }, [activeTab, desktopEnabled, pageVisible]);
+
   useEffect(() => {
     const prefersWebrtc = (desktopInfo || appRuntime)?.desktop_stream_transport === "webrtc";
     if (!prefersWebrtc) {
@@ -1992,6 +2066,8 @@ export default function App() {
       if (!response.ok) {
         throw new Error(response.detail || response.error || "Failed to read run details.");
       }
+      selectedRunOffsetRef.current = response.log_bytes || 0;
+      selectedRunOutputPolledRef.current = true;
       setSelectedRun(response);
     } catch (error) {
       setError(`Could not read run detail: ${(error as Error).message}`);
@@ -2001,6 +2077,21 @@ export default function App() {
     }
   }, [setError]);
 
+  const applySessionScreenText = useCallback((session: string, nextText: string) => {
+    const previousText = sessionTranscriptCacheTextRef.current[session] || "";
+    if (nextText === previousText) {
+      setSessionUnreadCount(0);
+      return;
+    }
+    const nextChunks = chunkTranscript(nextText);
+    sessionTranscriptCacheRef.current[session] = nextChunks;
+    sessionTranscriptCacheTextRef.current[session] = nextText;
+    if (session === selectedSession) {
+      setSessionTranscriptChunks(nextChunks);
+    }
+    setSessionUnreadCount(0);
+  }, [selectedSession]);
+
   const refreshScreen = useCallback(async (session: string) => {
     if (!session) {
       setSessionTranscriptChunks([]);
@@ -2017,25 +2108,13 @@ export default function App() {
       if (!response.ok) {
         throw new Error(response.detail || response.error || "Failed to read session screen.");
       }
-      const nextText = response.text || "";
-      const previousText = sessionTranscriptCacheTextRef.current[session] || "";
-      if (nextText === previousText) {
-        setSessionUnreadCount(0);
-        return;
-      }
-      const nextChunks = chunkTranscript(nextText);
-      sessionTranscriptCacheRef.current[session] = nextChunks;
-      sessionTranscriptCacheTextRef.current[session] = nextText;
-      if (session === selectedSession) {
-        setSessionTranscriptChunks(nextChunks);
-      }
-      setSessionUnreadCount(0);
+      applySessionScreenText(session, response.text || "");
     } catch (error) {
       setError(`Could not read screen: ${(error as Error).message}`);
     } finally {
       sessionScreenRefreshInFlightRef.current.delete(session);
     }
-  }, [selectedSession, setError]);
+  }, [applySessionScreenText, setError]);
 
   const shouldUseLiveSessionStream = useCallback((session: string) => {
     return (
@@ -2143,11 +2222,12 @@ export default function App() {
     }
     if (activeTab === "debug") {
       void refreshDebugRuns();
+      void refreshDebugMetrics();
     }
     if (activeTab === "remote" || activeTab === "settings") {
       void refreshDesktopTargets();
     }
-  }, [activeTab, refreshDebugRuns, refreshDesktopTargets, refreshSessions, refreshSessionsRuntime, refreshThreads, refreshTmuxState]);
+  }, [activeTab, refreshDebugMetrics, refreshDebugRuns, refreshDesktopTargets, refreshSessions, refreshSessionsRuntime, refreshThreads, refreshTmuxState]);
 
   useEffect(() => {
     if (typeof window === "undefined") {
@@ -2570,6 +2650,100 @@ export default function App() {
     };
   }, [activeTab, addEvent]);
 
+  const eventTopicsKey = useMemo(() => {
+    if (!pageVisible || typeof window === "undefined" || typeof window.EventSource !== "function") {
+      return "";
+    }
+    const topics: string[] = [];
+    if (activeTab === "sessions") {
+      topics.push("runtime");
+    }
+    if (activeTab === "sessions" && sessionsRuntime?.state === "running") {
+      topics.push("sessions");
+      if (selectedSession) {
+        topics.push(`screen:${selectedSession}`);
+      }
+    }
+    if (activeTab === "debug") {
+      topics.push("runs");
+    }
+    if (activeTab === "remote") {
+      topics.push("desktop_targets");
+    }
+    return topics.join(",");
+  }, [activeTab, pageVisible, selectedSession, sessionsRuntime?.state]);
+
+  // Latest appliers for pushed topic state; kept in a ref so the channel is not reopened on every render.
+  const eventTopicHandlersRef = useRef<(topic: string, data: unknown) => void>(() => undefined);
+  eventTopicHandlersRef.current = (topic: string, data: unknown) => {
+    if (topic === "sessions") {
+      const response = data as SessionsResult;
+      if (response.ok) {
+        applySessionsResult(response);
+      }
+    } else if (topic === "runs") {
+      const response = data as CodexRunsResult;
+      if (response.ok) {
+        applyCodexRunsResult(response);
+      }
+    } else if (topic === "runtime") {
+      const response = data as CodexRuntimeStatusResult;
+      if (response.ok) {
+        setSessionsRuntime(response);
+      }
+    } else if (topic === "desktop_targets") {
+      applyDesktopTargetsResult(data as DesktopTargetsResult);
+    } else if (topic.startsWith("screen:")) {
+      const response = data as SessionScreenResult;
+      if (response.ok) {
+        applySessionScreenText(topic.slice("screen:".length), response.text || "");
+      }
+    }
+  };
+
+  useEffect(() => {
+    if (!eventTopicsKey) {
+      setLiveEventTopics([]);
+      return;
+    }
+    const topics = eventTopicsKey.split(",");
+    const source = new EventSource(buildEventsUrl(topics));
+    const values: Record<string, Record<string, unknown>> = {};
+    const versions: Record<string, number> = {};
+    source.addEventListener("hello", () => {
+      setLiveEventTopics(topics);
+    });
+    source.addEventListener("snapshot", (event) => {
+      const payload = JSON.parse((event as MessageEvent<string>).data) as EventTopicSnapshot<Record<string, unknown>>;
+      values[payload.topic] = payload.data || {};
+      versions[payload.topic] = payload.version;
+      eventTopicHandlersRef.current(payload.topic, values[payload.topic]);
+    });
+    source.addEventListener("delta", (event) => {
+      const payload = JSON.parse((event as MessageEvent<string>).data) as EventTopicDelta;
+      if (versions[payload.topic] !== payload.base_version || !values[payload.topic]) {
+        // Missed a version: reopen for fresh snapshots.
+        setEventsReconnectKey((current) => current + 1);
+        return;
+      }
+      const next = { ...values[payload.topic], ...payload.set };
+      payload.unset.forEach((key) => {
+        delete next[key];
+      });
+      values[payload.topic] = next;
+      versions[payload.topic] = payload.version;
+      eventTopicHandlersRef.current(payload.topic, next);
+    });
+    source.onerror = () => {
+      // EventSource retries on its own; the interval polls cover the gap until the next hello.
+      setLiveEventTopics([]);
+    };
+    return () => {
+      source.close();
+      setLiveEventTopics([]);
+    };
+  }, [eventTopicsKey, eventsReconnectKey]);
+
   useEffect(() => {
     const intervalMs =
       !pageVisible
@@ -2582,7 +2756,8 @@ export default function App() {
             ? SESSION_SUMMARY_POLL_MS
             : DEFAULT_BACKGROUND_POLL_MS;
     const interval = window.setInterval(() => {
-      const shouldPollSessions = activeTab === "sessions" && sessionsRuntime?.state === "running";
+      const shouldPollSessions =
+        activeTab === "sessions" && sessionsRuntime?.state === "running" && !liveEventTopics.includes("sessions");
       if (shouldPollSessions) {
         void refreshSessions();
       }
@@ -2596,14 +2771,17 @@ export default function App() {
           streamEnabled &&
           !!selectedSession &&
           (outputFeedState === "connecting" || outputFeedState === "live");
-        if (selectedSession && !liveStreamActive) {
+        if (selectedSession && !liveStreamActive && !liveEventTopics.includes(`screen:${selectedSession}`)) {
           void refreshScreen(selectedSession);
         }
       }
 
       if (activeTab === "debug") {
-        void refreshDebugRuns();
-        if (selectedRunId) {
+        if (!liveEventTopics.includes("runs")) {
+          void refreshDebugRuns();
+        }
+        void refreshDebugMetrics();
+        if (selectedRunId && !selectedRunStreamLive) {
           void refreshRunDetail(selectedRunId);
         }
       }
@@ -2616,14 +2794,18 @@ export default function App() {
       }
       if (activeTab === "remote") {
         void refreshDesktopState();
-        void refreshDesktopTargets();
+        if (!liveEventTopics.includes("desktop_targets")) {
+          void refreshDesktopTargets();
+        }
       }
     }, intervalMs);
     return () => window.clearInterval(interval);
   }, [
     activeTab,
+    liveEventTopics,
     outputFeedState,
     refreshDesktopState,
+    refreshDebugMetrics,
     refreshDebugRuns,
     refreshRunDetail,
     refreshScreen,
@@ -2632,6 +2814,7 @@ export default function App() {
     refreshTmuxScreen,
     refreshTmuxState,
     selectedRunId,
+    selectedRunStreamLive,
     selectedSession,
     selectedTmuxPane,
     sessionsRuntime?.state,
@@ -2768,6 +2951,12 @@ export default function App() {
           setOutputFeedState("connecting");
         } else if (payload.type === "keepalive") {
           setOutputFeedState("live");
+        } else if (payload.type === "resume") {
+          // The controller dropped this slow client; reconnecting resumes after payload.seq.
+          if (payload.seq > 0) {
+            sessionStreamSeqRef.current[payload.session] = payload.seq;
+          }
+          setOutputFeedState("connecting");
         } else if (payload.type === "error" || payload.ok === false) {
           setOutputFeedState("error");
         } else {
@@ -2850,6 +3039,94 @@ export default function App() {
     void refreshRunDetail(selectedRunId);
   }, [refreshRunDetail, selectedRunId]);
 
+  const selectedRunStreamable =
+    activeTab === "debug" &&
+    pageVisible &&
+    !!selectedRun &&
+    selectedRun.id === selectedRunId &&
+    (selectedRun.status === "queued" || selectedRun.status === "running");
+
+  useEffect(() => {
+    if (!selectedRunStreamable || typeof window === "undefined" || typeof window.EventSource !== "function") {
+      setSelectedRunStreamLive(false);
+      return;
+    }
+    const runId = selectedRunId;
+    // A polled detail only carries the trimmed tail, so re-read that tail and replace it.
+    let replaceOutput = selectedRunOutputPolledRef.current;
+    const offset = replaceOutput
+      ? Math.max(0, selectedRunOffsetRef.current - RUN_STREAM_BACKFILL_BYTES)
+      : selectedRunOffsetRef.current;
+    const source = new EventSource(buildCodexRunStreamUrl(runId, offset));
+    let expectedOffset = offset;
+    let retryTimer: number | null = null;
+    const mergeRun = (patch: Partial<CodexRunDetail>, text?: string, replace = false) => {
+      setSelectedRun((current) => {
+        if (!current || current.id !== runId) {
+          return current;
+        }
+        const output = text === undefined ? current.output : (replace ? text : `${current.output || ""}${text}`).slice(-RUN_OUTPUT_MAX_CHARS);
+        return { ...current, ...patch, output };
+      });
+    };
+    source.onopen = () => {
+      setSelectedRunStreamLive(true);
+    };
+    source.addEventListener("status", (event) => {
+      mergeRun(JSON.parse((event as MessageEvent<string>).data) as CodexRunDetail);
+    });
+    source.addEventListener("output", (event) => {
+      const payload = JSON.parse((event as MessageEvent<string>).data) as CodexRunStreamOutput;
+      if (payload.offset !== expectedOffset) {
+        return;
+      }
+      expectedOffset = payload.next_offset;
+      mergeRun({ log_bytes: payload.next_offset }, payload.text, replaceOutput);
+      replaceOutput = false;
+      selectedRunOffsetRef.current = payload.next_offset;
+      selectedRunOutputPolledRef.current = false;
+    });
+    source.addEventListener("end", (event) => {
+      const run = JSON.parse((event as MessageEvent<string>).data) as CodexRunDetail;
+      source.close();
+      setSelectedRunStreamLive(false);
+      mergeRun(run);
+    });
+    source.onerror = () => {
+      // Reopen from the last offset rather than let EventSource replay the original URL.
+      source.close();
+      setSelectedRunStreamLive(false);
+      retryTimer = window.setTimeout(() => setRunStreamReconnectKey((current) => current + 1), RUN_STREAM_RETRY_MS);
+    };
+    return () => {
+      if (retryTimer != null) {
+        window.clearTimeout(retryTimer);
+      }
+      source.close();
+      setSelectedRunStreamLive(false);
+    };
+  }, [runStreamReconnectKey, selectedRunId, selectedRunStreamable]);
+
+  const onCancelSelectedRun = useCallback(async () => {
+    if (!selectedRunId) {
+      return;
+    }
+    setSelectedRunCancelling(true);
+    try {
+      const response = await cancelCodexRun(selectedRunId);
+      if (!response.ok) {
+        throw new Error(response.detail || response.error || "Failed to cancel run.");
+      }
+      setSelectedRun((current) => (current && current.id === response.id ? { ...current, ...response, output: current.output } : current));
+      setStatus("Run cancelled.");
+      void refreshDebugRuns();
+    } catch (error) {
+      setError(`Could not cancel run: ${(error as Error).message}`);
+    } finally {
+      setSelectedRunCancelling(false);
+    }
+  }, [refreshDebugRuns, selectedRunId, setError, setStatus]);
+
   useEffect(() => {
     if (controllerBase.trim()) {
       safeStorageSet(CONTROLLER_BASE_STORAGE, controllerBase.trim());
@@ -3001,12 +3278,16 @@ export default function App() {
     }
     void refreshScreen(selectedSession);
     void refreshSessions();
+    if (liveEventTopics.includes("sessions") && liveEventTopics.includes(`screen:${selectedSession}`)) {
+      // Pushed over /events while it is connected; no need for the 500 ms poll.
+      return;
+    }
     const interval = window.setInterval(() => {
       void refreshScreen(selectedSession);
       void refreshSessions();
     }, 500);
     return () => window.clearInterval(interval);
-  }, [activeTab, outputFeedState, pageVisible, refreshScreen, refreshSessions, selectedSession, selectedSessionInfo?.state, streamEnabled]);
+  }, [activeTab, liveEventTopics, outputFeedState, pageVisible, refreshScreen, refreshSessions, selectedSession, selectedSessionInfo?.state, streamEnabled]);
   const authSummary = authLoading
     ? "Checking auth..."
     : auth?.auth_required
@@ -3218,7 +3499,7 @@ export default function App() {
       refreshDesktopTargets(),
       ...(runtime?.state === "running" ? [refreshSessions()] : []),
       ...(activeTab === "threads" ? [refreshThreads(), refreshTmuxState()] : []),
-      ...(activeTab === "debug" ? [refreshDebugRuns()] : []),
+      ...(activeTab === "debug" ? [refreshDebugRuns(), refreshDebugMetrics()] : []),
     ]);
     if (selectedSession) {
       await refreshScreen(selectedSession);
@@ -3227,11 +3508,11 @@ export default function App() {
     if (selectedTmuxPane) {
       await refreshTmuxScreen(selectedTmuxPane);
     }
-    if (selectedRunId) {
+    if (selectedRunId && !selectedRunStreamLive) {
       await refreshRunDetail(selectedRunId);
     }
     setStatus("Synced.");
-  }, [activeTab, refreshAppRuntime, refreshAuth, refreshCodexOptions, refreshDebugRuns, refreshDesktopState, refreshDesktopTargets, refreshNet, refreshPowerStatus, refreshRunDetail, refreshScreen, refreshSessionNotes, refreshSessions, refreshSessionsRuntime, refreshSharedFiles, refreshTelegramStatus, refreshThreads, refreshTmuxScreen, refreshTmuxState, selectedRunId, selectedSession, selectedTmuxPane, setStatus]);
+  }, [activeTab, refreshAppRuntime, refreshAuth, refreshCodexOptions, refreshDebugMetrics, refreshDebugRuns, refreshDesktopState, refreshDesktopTargets, refreshNet, refreshPowerStatus, refreshRunDetail, refreshScreen, refreshSessionNotes, refreshSessions, refreshSessionsRuntime, refreshSharedFiles, refreshTelegramStatus, refreshThreads, refreshTmuxScreen, refreshTmuxState, selectedRunId, selectedRunStreamLive, selectedSession, selectedTmuxPane, setStatus]);
 
   const onLogin = useCallback(async () => {
     if (!tokenInput.trim()) {
@@ -3738,7 +4019,8 @@ export default function App() {
       if (!response.ok || !response.notes) {
         throw new Error(response.detail || response.error || "Could not save session notes.");
       }
-      setSessionNotes(response.notes.content || "");
+      sessionNotesSyncedRef.current = response.notes.content || "";
+      setSessionNotes(sessionNotesSyncedRef.current);
       setSessionNotesInfo(response.notes);
       setStatus(`Notes saved for ${selectedSession}.`);
     } catch (error) {
@@ -3759,15 +4041,31 @@ export default function App() {
       if (!response.ok || !response.notes) {
         throw new Error(response.detail || response.error || "Could not append latest response.");
       }
-      setSessionNotes(response.notes.content || "");
-      setSessionNotesInfo(response.notes);
+      // Only the new segment comes back. Apply it when it starts exactly where the
+      // last server copy ends and nothing was edited since; otherwise reload.
+      const entries = response.entries || [];
+      const appended = entries.map((entry) => entry.text).join("");
+      const base = response.reset ? "" : sessionNotesSyncedRef.current;
+      const inSync =
+        entries.length > 0 &&
+        typeof response.total_chars === "number" &&
+        entries[0].start === base.length &&
+        base.length + appended.length === response.total_chars &&
+        sessionNotes === sessionNotesSyncedRef.current;
+      if (inSync) {
+        sessionNotesSyncedRef.current = base + appended;
+        setSessionNotes(sessionNotesSyncedRef.current);
+        setSessionNotesInfo(response.notes);
+      } else {
+        await refreshSessionNotes(selectedSession);
+      }
       setStatus(response.detail || `Latest response appended to ${selectedSession} notes.`);
     } catch (error) {
       setError(`Append latest failed: ${(error as Error).message}`);
     } finally {
       setSessionNotesBusy(false);
     }
-  }, [selectedSession, setError, setStatus]);
+  }, [refreshSessionNotes, selectedSession, sessionNotes, setError, setStatus]);
 
   const submitPromptText = useCallback(async (
     userPrompt: string,
@@ -7381,6 +7679,8 @@ export default function App() {
               debugRuns={debugRuns}
               debugLoading={debugLoading}
               refreshDebugRuns={() => void refreshDebugRuns()}
+              debugMetrics={debugMetrics}
+              refreshDebugMetrics={() => void refreshDebugMetrics()}
               selectedRunId={selectedRunId}
               setSelectedRunId={setSelectedRunId}
               eventLog={eventLog}
@@ -7397,6 +7697,9 @@ export default function App() {
               onCopySelectedIpc={() => void onCopySelectedIpc()}
               selectedRunLoading={selectedRunLoading}
               selectedRun={selectedRun}
+              selectedRunStreamLive={selectedRunStreamLive}
+              selectedRunCancelling={selectedRunCancelling}
+              onCancelSelectedRun={() => void onCancelSelectedRun()}
               formatClock={formatClock}
             />
           </Suspense>
@@ -7,9 +7,11 @@ import {
   buildSuggestedControllerUrl,
   createSessionWithOptions,
   createSharedFile,
+  connectDesktopInput,
   desktopMove,
   detectControllerPort,
   deleteSharedFile,
+  disconnectDesktopInput,
   getAppRuntime,
   getPowerStatus,
   getSessionNotes,
@@ -499,3 +501,75 @@ describe("shared files API", () => {
     );
   });
 });
+
+describe("desktop input channel", () => {
+  const fetchMock = vi.fn();
+
+  class FakeSocket {
+    static OPEN = 1;
+    static last: FakeSocket | null = null;
+    readyState = 1;
+    sent: string[] = [];
+    onmessage: ((message: { data: string }) => void) | null = null;
+    onclose: (() => void) | null = null;
+
+    constructor(public url: string) {
+      FakeSocket.last = this;
+    }
+
+    send(data: string) {
+      this.sent.push(data);
+    }
+
+    close() {
+      this.readyState = 3;
+      this.onclose?.();
+    }
+
+    receive(payload: unknown) {
+      this.onmessage?.({ data: JSON.stringify(payload) });
+    }
+  }
+
+  beforeEach(() => {
+    vi.stubGlobal("fetch", fetchMock);
+    vi.stubGlobal("WebSocket", FakeSocket);
+  });
+
+  afterEach(() => {
+    disconnectDesktopInput();
+    fetchMock.mockReset();
+    vi.unstubAllGlobals();
+  });
+
+  it("sends events over the socket once it says hello and resolves them by ack", async () => {
+    connectDesktopInput();
+    const socket = FakeSocket.last!;
+    socket.receive({ ok: true, type: "hello", client_id: "abc", max_events: 64 });
+
+    const moved = desktopMove(10, 20);
+    const second = desktopMove(11, 21);
+    socket.receive({ ok: false, type: "ack", seq: 2, applied: 1, coalesced: 0, errors: [{ seq: 2, error: "input_failed", detail: "boom" }], alt_held: false });
+
+    expect(socket.url).toContain("/desktop/input/ws");
+    expect(socket.sent.map((frame) => JSON.parse(frame))).toEqual([
+      { t: "m", x: 10, y: 20, seq: 1 },
+      { t: "m", x: 11, y: 21, seq: 2 },
+    ]);
+    await expect(moved).resolves.toMatchObject({ ok: true });
+    await expect(second).resolves.toMatchObject({ ok: false, error: "input_failed", detail: "boom" });
+    expect(fetchMock).not.toHaveBeenCalled();
+  });
+
+  it("falls back to POST until the socket has said hello", async () => {
+    fetchMock.mockResolvedValue({ ok: true, status: 200, text: async () => JSON.stringify({ ok: true }) });
+    connectDesktopInput();
+    const socket = FakeSocket.last!;
+
+    const response = await desktopMove(1, 1);
+
+    expect(socket.sent).toEqual([]);
+    expect(response.ok).toBe(true);
+    expect(fetchMock).toHaveBeenCalledWith("/desktop/input/move", expect.objectContaining({ method: "POST" }));
+  });
+});
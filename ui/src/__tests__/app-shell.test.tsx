@@ -17,9 +17,11 @@ vi.mock("../api", async (importOriginal) => {
     buildSessionStreamUrl: vi.fn(() => "ws://controller/codex/session/codex_demo/ws?profile=balanced"),
     buildSuggestedControllerUrl: vi.fn(() => "http://127.0.0.1:8787"),
     buildWslDownloadUrl: vi.fn(() => "/wsl/file?path=/tmp/demo.txt"),
+    cancelCodexRun: vi.fn(),
     closeDesktopWebrtcSession: vi.fn(),
     closeSession: vi.fn(),
     closeTmuxSession: vi.fn(),
+    connectDesktopInput: vi.fn(),
     createDesktopWebrtcOffer: vi.fn(),
     createPairCode: vi.fn(),
     createSessionWithOptions: vi.fn(),
@@ -33,6 +35,7 @@ vi.mock("../api", async (importOriginal) => {
     desktopScroll: vi.fn(),
     desktopSendKey: vi.fn(),
     desktopSendText: vi.fn(),
+    disconnectDesktopInput: vi.fn(),
     exchangePairCode: vi.fn(),
     getAppRuntime: vi.fn(),
     getAuthStatus: vi.fn(),
@@ -41,6 +44,7 @@ vi.mock("../api", async (importOriginal) => {
     getCodexRuns: vi.fn(),
     getCodexRuntimeStatus: vi.fn(),
     getDesktopInfo: vi.fn(),
+    getMetricsSummary: vi.fn(),
     getNetInfo: vi.fn(),
     getPowerStatus: vi.fn(),
     getSessionNotes: vi.fn(),
@@ -3,6 +3,7 @@ import type {
   AuthStatus,
   BasicResult,
   BrowserListResult,
+  BrowserSortKey,
   CodexOptionsResult,
   CodexRuntimeStatusResult,
   CodexExecStartResult,
@@ -12,6 +13,7 @@ import type {
   DesktopTargetsResult,
   DesktopWebrtcOfferResult,
   DesktopInfoResult,
+  DesktopInputAck,
   DesktopInputResult,
   DesktopPasteImageResult,
   DesktopModeResult,
@@ -19,6 +21,7 @@ import type {
   LoopOverrideMode,
   LoopPreset,
   LoopStatusResult,
+  MetricsSummaryResult,
   NetInfo,
   OpenPathResult,
   PairCreateResult,
@@ -30,6 +33,7 @@ import type {
   SessionProfileApplyResult,
   SessionImageResult,
   SessionNotesResult,
+  SessionRecordingResult,
   SessionCloseResult,
   SessionScreenResult,
   SessionsResult,
@@ -780,8 +784,22 @@ export function listSessionFiles(session: string): Promise<SessionFilesResult> {
   return requestJson<SessionFilesResult>(`/codex/session/${encodeURIComponent(session)}/files`);
 }
 
-export function getSessionNotes(session: string): Promise<SessionNotesResult> {
-  return requestJson<SessionNotesResult>(`/codex/session/${encodeURIComponent(session)}/notes`);
+export function getSessionNotes(
+  session: string,
+  page?: { offset?: number; limit?: number; cursor?: string },
+): Promise<SessionNotesResult> {
+  const query = new URLSearchParams();
+  if (page?.cursor) {
+    query.set("cursor", page.cursor);
+  }
+  if (page?.offset) {
+    query.set("offset", String(page.offset));
+  }
+  if (page?.limit) {
+    query.set("limit", String(page.limit));
+  }
+  const suffix = query.toString() ? `?${query.toString()}` : "";
+  return requestJson<SessionNotesResult>(`/codex/session/${encodeURIComponent(session)}/notes${suffix}`);
 }
 
 export function saveSessionNotes(
@@ -803,6 +821,45 @@ export function appendLatestSessionNotes(session: string): Promise<SessionNotesR
   });
 }
 
+export function getSessionRecording(session: string): Promise<SessionRecordingResult> {
+  return requestJson<SessionRecordingResult>(`/codex/session/${encodeURIComponent(session)}/recording`);
+}
+
+export function setSessionRecording(session: string, enabled: boolean): Promise<SessionRecordingResult> {
+  return requestJson<SessionRecordingResult>(`/codex/session/${encodeURIComponent(session)}/recording`, {
+    method: "POST",
+    headers: JSON_HEADERS,
+    body: JSON.stringify({ enabled }),
+  });
+}
+
+export function deleteSessionRecording(session: string): Promise<SessionRecordingResult> {
+  return requestJson<SessionRecordingResult>(`/codex/session/${encodeURIComponent(session)}/recording`, {
+    method: "DELETE",
+  });
+}
+
+export function buildSessionRecordingReplayUrl(
+  session: string,
+  options?: { speed?: number; from_ts?: number; max_gap_s?: number },
+): string {
+  const base =
+    typeof window !== "undefined" && window.location
+      ? `${window.location.protocol === "https:" ? "wss:" : "ws:"}//${window.location.host}`
+      : "ws://127.0.0.1";
+  const url = new URL(`/codex/session/${encodeURIComponent(session)}/recording/ws`, base);
+  if (options?.speed) {
+    url.searchParams.set("speed", String(options.speed));
+  }
+  if (options?.from_ts) {
+    url.searchParams.set("from_ts", String(options.from_ts));
+  }
+  if (options?.max_gap_s) {
+    url.searchParams.set("max_gap_s", String(options.max_gap_s));
+  }
+  return url.toString();
+}
+
 export function registerSessionFile(
   session: string,
   payload: { path: string; title?: string; allow_directory?: boolean; expires_hours?: number },
@@ -840,12 +897,28 @@ export function sendSessionFileToTelegram(session: string, fileId: string, capti
   });
 }
 
-export function listBrowseEntries(root = "workspace", path = ""): Promise<BrowserListResult> {
+export function listBrowseEntries(
+  root = "workspace",
+  path = "",
+  options: { sort?: BrowserSortKey; order?: "asc" | "desc"; cursor?: string; limit?: number } = {},
+): Promise<BrowserListResult> {
   const query = new URLSearchParams();
   query.set("root", root);
   if (path.trim()) {
     query.set("path", path.trim());
   }
+  if (options.sort) {
+    query.set("sort", options.sort);
+  }
+  if (options.order) {
+    query.set("order", options.order);
+  }
+  if (options.cursor) {
+    query.set("cursor", options.cursor);
+  }
+  if (options.limit && options.limit > 0) {
+    query.set("limit", String(Math.floor(options.limit)));
+  }
   return requestJson<BrowserListResult>(`/fs/list?${query.toString()}`);
 }
 
@@ -916,6 +989,10 @@ export function getCodexRuns(): Promise<CodexRunsResult> {
   return requestJson<CodexRunsResult>("/codex/runs");
 }
 
+export function getMetricsSummary(): Promise<MetricsSummaryResult> {
+  return requestJson<MetricsSummaryResult>("/metrics/summary");
+}
+
 export function getThreadStore(): Promise<ThreadsStoreResult> {
   return requestJson<ThreadsStoreResult>("/threads");
 }
@@ -957,6 +1034,17 @@ export function getCodexRun(runId: string): Promise<CodexRunDetail> {
   return requestJson<CodexRunDetail>(`/codex/run/${encodeURIComponent(runId)}`);
 }
 
+export function cancelCodexRun(runId: string): Promise<CodexRunDetail> {
+  return requestJson<CodexRunDetail>(`/codex/run/${encodeURIComponent(runId)}/cancel`, {
+    method: "POST",
+  });
+}
+
+export function buildCodexRunStreamUrl(runId: string, offset = 0): string {
+  const suffix = offset > 0 ? `?offset=${Math.floor(offset)}` : "";
+  return `/codex/run/${encodeURIComponent(runId)}/stream${suffix}`;
+}
+
 export function startCodexExec(prompt: string): Promise<CodexExecStartResult> {
   return requestJson<CodexExecStartResult>("/codex/exec", {
     method: "POST",
@@ -1099,6 +1187,133 @@ export function setDesktopPerfMode(enabled: boolean): Promise<DesktopModeResult>
   });
 }
 
+export function buildDesktopInputSocketUrl(): string {
+  const base =
+    typeof window !== "undefined" && window.location
+      ? `${window.location.protocol === "https:" ? "wss:" : "ws:"}//${window.location.host}`
+      : "ws://127.0.0.1";
+  return new URL("/desktop/input/ws", base).toString();
+}
+
+const DESKTOP_INPUT_RECONNECT_MS = 1500;
+
+interface DesktopInputWaiter {
+  seq: number;
+  resolve: (result: DesktopInputResult) => void;
+}
+
+interface DesktopInputChannelState {
+  wanted: boolean;
+  socket: WebSocket | null;
+  ready: boolean;
+  seq: number;
+  waiters: DesktopInputWaiter[];
+  reconnectTimer: number | null;
+}
+
+// One shared input socket; the desktop* helpers below use it while it is open
+// and fall back to the per-event POST routes otherwise.
+const desktopInputChannel: DesktopInputChannelState = {
+  wanted: false,
+  socket: null,
+  ready: false,
+  seq: 0,
+  waiters: [],
+  reconnectTimer: null,
+};
+
+function settleDesktopInputWaiters(ack: DesktopInputAck | null, detail: string): void {
+  const channel = desktopInputChannel;
+  const done = ack ? channel.waiters.filter((waiter) => waiter.seq <= ack.seq) : channel.waiters;
+  channel.waiters = ack ? channel.waiters.filter((waiter) => waiter.seq > ack.seq) : [];
+  for (const waiter of done) {
+    const failure = ack ? ack.errors.find((item) => item.seq === waiter.seq) : undefined;
+    if (ack && !failure) {
+      waiter.resolve({ ok: true, alt_held: ack.alt_held });
+    } else {
+      waiter.resolve({
+        ok: false,
+        error: failure?.error || "input_channel_closed",
+        detail: failure?.detail || detail,
+        alt_held: ack?.alt_held,
+      });
+    }
+  }
+}
+
+function openDesktopInputSocket(): void {
+  const channel = desktopInputChannel;
+  if (!channel.wanted || channel.socket || typeof WebSocket === "undefined") {
+    return;
+  }
+  const socket = new WebSocket(buildDesktopInputSocketUrl());
+  channel.socket = socket;
+  channel.ready = false;
+  channel.seq = 0;
+  socket.onmessage = (message) => {
+    let payload: { type?: string; seq?: number; detail?: string };
+    try {
+      payload = JSON.parse(String(message.data));
+    } catch {
+      return;
+    }
+    if (payload.type === "hello") {
+      channel.ready = true;
+    } else if (payload.type === "ack" && typeof payload.seq === "number") {
+      settleDesktopInputWaiters(payload as unknown as DesktopInputAck, "");
+    } else if (payload.type === "error") {
+      emitIpcEvent({ channel: "ws", direction: "error", path: "/desktop/input/ws", detail: payload.detail });
+    }
+  };
+  socket.onclose = () => {
+    if (channel.socket !== socket) {
+      return;
+    }
+    channel.socket = null;
+    channel.ready = false;
+    settleDesktopInputWaiters(null, "Desktop input channel closed before the event was acknowledged.");
+    if (channel.wanted && channel.reconnectTimer === null) {
+      channel.reconnectTimer = window.setTimeout(() => {
+        channel.reconnectTimer = null;
+        openDesktopInputSocket();
+      }, DESKTOP_INPUT_RECONNECT_MS);
+    }
+  };
+}
+
+export function connectDesktopInput(): void {
+  desktopInputChannel.wanted = true;
+  openDesktopInputSocket();
+}
+
+export function disconnectDesktopInput(): void {
+  const channel = desktopInputChannel;
+  channel.wanted = false;
+  if (channel.reconnectTimer !== null) {
+    window.clearTimeout(channel.reconnectTimer);
+    channel.reconnectTimer = null;
+  }
+  const socket = channel.socket;
+  channel.socket = null;
+  channel.ready = false;
+  settleDesktopInputWaiters(null, "Desktop input channel closed before the event was acknowledged.");
+  socket?.close();
+}
+
+function sendDesktopInputEvent(event: Record<string, unknown>): Promise<DesktopInputResult> | null {
+  const channel = desktopInputChannel;
+  const socket = channel.socket;
+  if (!channel.ready || !socket || socket.readyState !== WebSocket.OPEN) {
+    return null;
+  }
+  channel.seq += 1;
+  const seq = channel.seq;
+  socket.send(JSON.stringify({ ...event, seq }));
+  return new Promise((resolve) => {
+    channel.waiters.push({ seq, resolve });
+  });
+}
+
 export function desktopClick(params: {
   button?: "left" | "right";
   double?: boolean;
@@ -1106,6 +1321,17 @@ export function desktopClick(params: {
   y?: number;
   action?: "click" | "down" | "up";
 }): Promise<DesktopInputResult> {
+  const queued = sendDesktopInputEvent({
+    t: "c",
+    x: params.x,
+    y: params.y,
+    b: params.button || "left",
+    d: !!params.double,
+    a: params.action || "click",
+  });
+  if (queued) {
+    return queued;
+  }
   return requestJson<DesktopInputResult>("/desktop/input/click", {
     method: "POST",
     headers: JSON_HEADERS,
@@ -1120,6 +1346,10 @@ export function desktopClick(params: {
 }
 
 export function desktopMove(x: number, y: number): Promise<DesktopInputResult> {
+  const queued = sendDesktopInputEvent({ t: "m", x, y });
+  if (queued) {
+    return queued;
+  }
   return requestJson<DesktopInputResult>("/desktop/input/move", {
     method: "POST",
     headers: JSON_HEADERS,
@@ -1128,6 +1358,10 @@ export function desktopMove(x: number, y: number): Promise<DesktopInputResult> {
 }
 
 export function desktopScroll(delta: number): Promise<DesktopInputResult> {
+  const queued = sendDesktopInputEvent({ t: "scroll", d: delta });
+  if (queued) {
+    return queued;
+  }
   return requestJson<DesktopInputResult>("/desktop/input/scroll", {
     method: "POST",
     headers: JSON_HEADERS,
@@ -1137,6 +1371,10 @@ export function desktopScroll(delta: number): Promise<DesktopInputResult> {
 
 export function desktopSendText(text: string): Promise<DesktopInputResult> {
   // Real typing path (no clipboard paste, no Enter key submit).
+  const queued = sendDesktopInputEvent({ t: "text", s: text });
+  if (queued) {
+    return queued;
+  }
   return requestJson<DesktopInputResult>("/desktop/input/text", {
     method: "POST",
     headers: JSON_HEADERS,
@@ -1145,6 +1383,10 @@ export function desktopSendText(text: string): Promise<DesktopInputResult> {
 }
 
 export function desktopSendKey(key: string): Promise<DesktopInputResult> {
+  const queued = sendDesktopInputEvent({ t: "k", k: key });
+  if (queued) {
+    return queued;
+  }
   return requestJson<DesktopInputResult>("/desktop/input/key", {
     method: "POST",
     headers: JSON_HEADERS,
@@ -1160,6 +1402,12 @@ export function desktopGetSelectedPath(): Promise<DesktopInputResult> {
   });
 }
 
+export function buildEventsUrl(topics: string[]): string {
+  const query = new URLSearchParams();
+  query.set("topics", topics.join(","));
+  return `/events?${query.toString()}`;
+}
+
 export function buildDesktopStreamUrl(params?: {
   fps?: number;
   level?: number;
@@ -1,4 +1,4 @@
-import type { CodexRunDetail, CodexRunSummary } from "../types";
+import type { CodexRunDetail, CodexRunSummary, MetricsSummaryResult, MetricsTimerRow } from "../types";
 
 interface AppEventItem {
   id: string;
@@ -29,6 +29,8 @@ interface DebugTabProps {
   debugRuns: CodexRunSummary[];
   debugLoading: boolean;
   refreshDebugRuns: () => void;
+  debugMetrics: MetricsSummaryResult | null;
+  refreshDebugMetrics: () => void;
   selectedRunId: string;
   setSelectedRunId: (id: string) => void;
   eventLog: AppEventItem[];
@@ -45,9 +47,49 @@ interface DebugTabProps {
   onCopySelectedIpc: () => void;
   selectedRunLoading: boolean;
   selectedRun: CodexRunDetail | null;
+  selectedRunStreamLive: boolean;
+  selectedRunCancelling: boolean;
+  onCancelSelectedRun: () => void;
   formatClock: (value: number) => string;
 }
 
+const METRICS_TIMER_TITLES: Array<[string, string]> = [
+  ["codrex_http_request_seconds", "HTTP routes"],
+  ["codrex_subprocess_seconds", "Subprocess helpers"],
+  ["codrex_tmux_capture_seconds", "tmux captures"],
+  ["codrex_desktop_encode_seconds", "Desktop encode"],
+  ["codrex_store_write_seconds", "Store writes"],
+  ["codrex_telegram_call_seconds", "Telegram calls"],
+  ["codrex_loop_control_cycle_seconds", "Loop-control cycle"],
+];
+
+function metricsLabelText(labels: Record<string, string>): string {
+  return Object.entries(labels)
+    .map(([key, value]) => (key === "outcome" && value === "ok" ? "" : value))
+    .filter(Boolean)
+    .join(" ") || "all";
+}
+
+function metricsMs(value: number | null): string {
+  return value === null ? "-" : `${value < 10 ? value.toFixed(1) : Math.round(value)}ms`;
+}
+
+function MetricsTimerList({ title, rows }: { title: string; rows: MetricsTimerRow[] }) {
+  if (rows.length === 0) {
+    return null;
+  }
+  return (
+    <div className="stack">
+      <strong>{title}</strong>
+      {rows.slice(0, 8).map((row) => (
+        <p key={JSON.stringify(row.labels)} className="small">
+          {metricsLabelText(row.labels)} | n {row.count} | avg {metricsMs(row.avg_ms)} | p95 {metricsMs(row.p95_ms)} | p99 {metricsMs(row.p99_ms)}
+        </p>
+      ))}
+    </div>
+  );
+}
+
 export default function DebugTab({
   screenCardClassName,
   totalEvents,
@@ -55,6 +97,8 @@ export default function DebugTab({
   debugRuns,
   debugLoading,
   refreshDebugRuns,
+  debugMetrics,
+  refreshDebugMetrics,
   selectedRunId,
   setSelectedRunId,
   eventLog,
@@ -71,6 +115,9 @@ export default function DebugTab({
   onCopySelectedIpc,
   selectedRunLoading,
   selectedRun,
+  selectedRunStreamLive,
+  selectedRunCancelling,
+  onCancelSelectedRun,
   formatClock,
 }: DebugTabProps) {
   return (
@@ -208,6 +255,36 @@ export default function DebugTab({
         </div>
 
         <div className="debug-column">
+          <div className="debug-block">
+            <div className="card-head">
+              <h3>Controller Metrics</h3>
+              <button type="button" className="button soft compact" onClick={() => void refreshDebugMetrics()}>
+                Refresh
+              </button>
+            </div>
+            {!debugMetrics ? (
+              <p className="small">Metrics unavailable.</p>
+            ) : !debugMetrics.enabled ? (
+              <p className="small">Metrics are disabled (CODEX_METRICS=0).</p>
+            ) : (
+              <div className="stack">
+                <div className="row">
+                  {Object.entries(debugMetrics.gauges || {}).flatMap(([name, samples]) =>
+                    samples.map((sample) => (
+                      <span key={`${name}:${JSON.stringify(sample.labels)}`} className="badge muted">
+                        {name.replace(/^codrex_/, "")}
+                        {Object.keys(sample.labels).length ? ` ${Object.values(sample.labels).join(" ")}` : ""} {Math.round(sample.value)}
+                      </span>
+                    )),
+                  )}
+                </div>
+                {METRICS_TIMER_TITLES.map(([name, title]) => (
+                  <MetricsTimerList key={name} title={title} rows={debugMetrics.timers?.[name] || []} />
+                ))}
+              </div>
+            )}
+          </div>
+
           <div className="debug-block">
             <h3>Selected Run Detail</h3>
             {!selectedRunId ? (
@@ -223,7 +300,15 @@ export default function DebugTab({
               <div className="stack">
                 <p className="small">
                   Status: <strong>{selectedRun.status}</strong> | Exit: <strong>{selectedRun.exit_code ?? "-"}</strong> | Duration: <strong>{selectedRun.duration_s ?? "-"}</strong>
+                  {selectedRunStreamLive ? " | Live" : ""}
                 </p>
+                {selectedRun.status === "queued" || selectedRun.status === "running" ? (
+                  <div className="row">
+                    <button type="button" className="button soft compact" onClick={onCancelSelectedRun} disabled={selectedRunCancelling}>
+                      {selectedRunCancelling ? "Cancelling..." : "Cancel Run"}
+                    </button>
+                  </div>
+                ) : null}
                 <label className="field">
                   <span>Prompt</span>
                   <textarea readOnly rows={4} value={selectedRun.prompt || ""} />
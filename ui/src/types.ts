@@ -32,6 +32,8 @@ export interface LoopWorkerInfo {
   last_telegram_poll_at?: number;
   last_error?: string;
   last_error_at?: number;
+  last_telegram_error?: string;
+  last_telegram_error_at?: number;
 }
 
 export interface AuthStatus {
@@ -51,6 +53,15 @@ export interface RouteOriginInfo {
   private?: boolean;
 }
 
+export interface MediaStackStatus {
+  available: boolean;
+  loaded: boolean;
+  load_ms: number | null;
+  loaded_at: number | null;
+  error: string;
+  modules: string[];
+}
+
 export type AppRuntimeResult = Omit<BasicResult, "session_file"> & {
   version?: string;
   launcher_mode?: string;
@@ -79,6 +90,9 @@ export type AppRuntimeResult = Omit<BasicResult, "session_file"> & {
   sessions_runtime_distro?: string;
   sessions_runtime_can_start?: boolean;
   sessions_runtime_can_stop?: boolean;
+  sessions_runtime_transition?: RuntimeTransition;
+  sessions_runtime_checked_at?: number | null;
+  media_stacks?: Record<string, MediaStackStatus>;
 };
 
 export interface SharedFileInfo {
@@ -108,6 +122,10 @@ export interface TelegramDeliveryResult {
   chat_id?: string;
   file_name?: string;
   size_bytes?: number;
+  queued?: boolean;
+  job_id?: string;
+  status?: "queued" | "sending" | "retrying" | "sent" | "failed";
+  queue_position?: number;
 }
 
 export interface BasicResult {
@@ -132,6 +150,25 @@ export interface TelegramStatusResult extends BasicResult {
   bot_token_masked?: string;
   api_base?: string;
   max_file_mb?: number;
+  send_queue?: {
+    pending: number;
+    capacity: number;
+  };
+}
+
+export interface StatusProbeMeta {
+  ttl_s: number;
+  age_s: number | null;
+  stale: boolean;
+  pending: boolean;
+  refreshing: boolean;
+  refreshing_for_s: number | null;
+  next_refresh_in_s: number | null;
+  duration_ms: number | null;
+  last_error: string;
+  last_error_at: number | null;
+  runs: number;
+  failures: number;
 }
 
 export interface NetInfo {
@@ -146,6 +183,18 @@ export interface NetInfo {
   primary_mac?: string;
   wake_candidate_macs?: string[];
   wake_supported?: boolean;
+  stale?: boolean;
+  probe?: StatusProbeMeta;
+}
+
+export type RuntimeTransition = "" | "starting" | "stopping";
+
+export interface RuntimeStateChange {
+  from: string | null;
+  to: string;
+  detail: string;
+  at: number;
+  transition: RuntimeTransition;
 }
 
 export interface CodexRuntimeStatusResult extends BasicResult {
@@ -154,6 +203,9 @@ export interface CodexRuntimeStatusResult extends BasicResult {
   distro?: string;
   can_start?: boolean;
   can_stop?: boolean;
+  transition?: RuntimeTransition;
+  checked_at?: number | null;
+  changes?: RuntimeStateChange[];
   profiles?: string[];
   default_profile?: string;
   cwd?: string;
@@ -225,9 +277,30 @@ export interface SessionsResult extends BasicResult {
   meta?: SessionsMeta;
 }
 
+export interface LoopCheckProgress {
+  command: string;
+  state: "pending" | "running" | "passed" | "failed" | "timeout" | "cancelled" | "skipped";
+  exit_code: number | null;
+  detail: string;
+  elapsed_ms: number;
+  output_chars: number;
+  output_tail: string;
+}
+
+export interface LoopCheckJob {
+  state: "pending" | "running" | "passed" | "failed";
+  cwd: string;
+  parallelism: number;
+  fail_fast: boolean;
+  started_at: number;
+  finished_at: number;
+  checks: LoopCheckProgress[];
+}
+
 export interface LoopStatusResult extends BasicResult {
   settings?: LoopSettingsInfo;
   worker?: LoopWorkerInfo;
+  checks?: Record<string, LoopCheckJob>;
 }
 
 export interface SessionCreateResult extends BasicResult {
@@ -330,6 +403,69 @@ export interface DesktopInfoResult extends BasicResult {
   desktop_webrtc_available?: boolean;
   desktop_webrtc_enabled?: boolean;
   desktop_webrtc_detail?: string;
+  input_channel?: DesktopInputChannelStats;
+  topology?: DesktopTopologyStats;
+  streams?: DesktopStreamActivity[];
+}
+
+export interface DesktopStreamActivity {
+  id: string;
+  kind: string;
+  tile_size: number;
+  changed_tile_ratio: number;
+  changed_tile_ratio_avg: number;
+  idle_streak: number;
+  started_at: number;
+  captured: number;
+  changed: number;
+  sent: number;
+  skipped: number;
+  keepalive: number;
+  reused: number;
+  adaptive?: DesktopStreamAdaptiveState | null;
+}
+
+export interface DesktopStreamAdaptiveState {
+  fps: number;
+  quality: number;
+  scale: number;
+  bounds: { fps: [number, number]; quality: [number, number]; scale: [number, number] };
+  drain_ms_avg: number;
+  frame_bytes_avg: number;
+  throughput_bps: number;
+  observed: number;
+  decreases: number;
+  increases: number;
+}
+
+export interface DesktopTopologyStats {
+  generation: number;
+  enumerations: number;
+  refreshed_at: number;
+  dirty: boolean;
+  display_count: number;
+}
+
+export interface DesktopInputChannelStats {
+  pending: number;
+  queue_max: number;
+  worker_running: boolean;
+  received: number;
+  coalesced: number;
+  applied: number;
+  failed: number;
+  rejected: number;
+  batches: number;
+}
+
+export interface DesktopInputAck {
+  ok: boolean;
+  type: 'ack';
+  seq: number;
+  applied: number;
+  coalesced: number;
+  errors: Array<{ seq: number | null; error: string; detail: string }>;
+  alt_held?: boolean;
 }
 
 export interface DesktopTargetInfo {
@@ -349,6 +485,7 @@ export interface DesktopTargetInfo {
 export interface DesktopTargetsResult extends BasicResult {
   targets?: DesktopTargetInfo[];
   active_target?: DesktopTargetInfo | null;
+  topology_generation?: number;
   virtual_supported?: boolean;
   virtual_enabled?: boolean;
   detail?: string;
@@ -433,6 +570,8 @@ export interface PowerStatusResult extends BasicResult {
   primary_mac?: string;
   wake_candidate_macs?: string[];
   wake_supported?: boolean;
+  stale?: boolean;
+  probes?: Record<string, StatusProbeMeta>;
 }
 
 export interface PowerActionResult extends BasicResult {
@@ -479,10 +618,55 @@ export interface SessionNoteInfo {
   last_response_snapshot?: string;
 }
 
+export interface SessionRecordingSegment {
+  file: string;
+  started_at: number;
+  ended_at: number;
+  first_seq: number;
+  last_seq: number;
+  events: number;
+  bytes: number;
+  chunks: number;
+  closed: boolean;
+}
+
+export interface SessionRecordingResult extends BasicResult {
+  session?: string;
+  enabled?: boolean;
+  segments?: SessionRecordingSegment[];
+  pending_events?: number;
+  events?: number;
+  total_bytes?: number;
+  started_at?: number | null;
+  ended_at?: number | null;
+  retention?: { max_bytes: number; max_age_s: number };
+  freed_bytes?: number;
+}
+
+export interface SessionNotesPage {
+  offset: number;
+  limit: number;
+  total_chars: number;
+  next_offset: number | null;
+}
+
+export interface SessionNoteEntry {
+  seq: number;
+  at: number;
+  start: number;
+  text: string;
+}
+
 export interface SessionNotesResult extends BasicResult {
   session?: string;
   notes?: SessionNoteInfo;
   appended_text?: string;
+  page?: SessionNotesPage;
+  entries?: SessionNoteEntry[];
+  reset?: boolean;
+  total_chars?: number;
+  next_cursor?: string;
+  has_more?: boolean;
 }
 
 export interface BrowserRootInfo {
@@ -501,6 +685,8 @@ export interface BrowserEntryInfo {
   mtime: number;
 }
 
+export type BrowserSortKey = "name" | "mtime" | "size" | "kind";
+
 export interface BrowserListResult extends BasicResult {
   root?: BrowserRootInfo;
   roots?: BrowserRootInfo[];
@@ -509,9 +695,13 @@ export interface BrowserListResult extends BasicResult {
   display_path?: string;
   windows_path?: string;
   items?: BrowserEntryInfo[];
+  total?: number;
+  sort?: BrowserSortKey;
+  order?: "asc" | "desc";
+  next_cursor?: string;
 }
 
-export type SessionStreamEventType = "hello" | "snapshot" | "append" | "replace" | "status" | "keepalive" | "error";
+export type SessionStreamEventType = "hello" | "snapshot" | "append" | "replace" | "status" | "keepalive" | "resume" | "error";
 
 export interface SessionStreamEvent {
   ok?: boolean;
@@ -562,26 +752,79 @@ export interface ThreadMessageResult extends BasicResult {
   message?: ThreadMessageInfo;
 }
 
-export type CodexRunStatus = "running" | "done" | "error";
+export interface EventTopicSnapshot<T = unknown> {
+  topic: string;
+  version: number;
+  data: T;
+}
+
+export interface EventTopicDelta {
+  topic: string;
+  version: number;
+  base_version: number;
+  set: Record<string, unknown>;
+  unset: string[];
+}
+
+export interface MetricsTimerRow {
+  labels: Record<string, string>;
+  count: number;
+  sum_s: number;
+  avg_ms: number | null;
+  p50_ms: number | null;
+  p95_ms: number | null;
+  p99_ms: number | null;
+}
+
+export interface MetricsSample {
+  labels: Record<string, string>;
+  value: number;
+}
+
+export interface MetricsSummaryResult extends BasicResult {
+  enabled?: boolean;
+  timers?: Record<string, MetricsTimerRow[]>;
+  counters?: Record<string, MetricsSample[]>;
+  gauges?: Record<string, MetricsSample[]>;
+}
+
+export type CodexRunStatus = "queued" | "running" | "done" | "error" | "cancelled";
 
 export interface CodexRunSummary {
   id: string;
   status: CodexRunStatus;
   duration_s?: number | null;
   prompt?: string;
+  queue_position?: number | null;
 }
 
 export interface CodexRunsResult extends BasicResult {
   runs?: CodexRunSummary[];
+  running?: number;
+  queued?: number;
+  max_concurrent?: number;
+  kept?: number;
 }
 
 export interface CodexRunDetail extends BasicResult, CodexRunSummary {
   created_at?: number;
+  started_at?: number | null;
   output?: string;
   exit_code?: number | null;
   finished_at?: number | null;
+  log_bytes?: number;
+  interrupted?: boolean;
+}
+
+export interface CodexRunStreamOutput extends BasicResult {
+  id: string;
+  offset: number;
+  next_offset: number;
+  text: string;
 }
 
 export interface CodexExecStartResult extends BasicResult {
   id?: string;
+  status?: CodexRunStatus;
+  queue_position?: number | null;
 }
@@ -15,6 +15,7 @@ export default defineConfig({
       "/auth": backendOrigin,
       "/net": backendOrigin,
       "/codex": backendOrigin,
+      "/events": backendOrigin,
       "/legacy": backendOrigin,
       "/desktop": backendOrigin,
       "/tmux": backendOrigin,
@@ -29,6 +30,7 @@ export default defineConfig({
       "/auth": backendOrigin,
       "/net": backendOrigin,
       "/codex": backendOrigin,
+      "/events": backendOrigin,
       "/legacy": backendOrigin,
       "/desktop": backendOrigin,
       "/tmux": backendOrigin,